@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Full-Universe History Backfill
+Enumerates CN/HK symbols from the spot snapshot, downloads histories in parallel
+(each provider capped by QUANT_PROVIDER_CONCURRENCY, no polite sleeps) and writes
+them straight into the history store. A JSON checkpoint makes runs resumable.
+
+CLI: python -m api.backfill --market CN --market HK [--workers 8] [--name default] [--fresh]
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import config
+from .fetcher import DataFetcher
+from .security_master import security_master
+from .store import get_store
+
+logger = logging.getLogger(__name__)
+
+
+class Backfill:
+    """One named, resumable backfill run"""
+
+    def __init__(self, markets=("CN", "HK"), codes: list = None, workers: int = None,
+                 name: str = "default", resume: bool = True, store=None, flush_every: int = 50):
+        self.markets = [m.upper() for m in markets]
+        self.codes = codes  # Explicit [(code, market)] instead of the spot universe
+        self.workers = workers or config.BACKFILL_WORKERS
+        self.name = name
+        self.store = store or get_store()
+        self.flush_every = flush_every
+        self.checkpoint_path = config.data_path("backfill", f"{name}.json")
+        self.state = self._load_checkpoint() if resume else None
+        if not self.state:
+            self.state = {"name": name, "markets": self.markets, "done": {}, "failed": {}}
+
+    # --- Checkpoint ---
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as fh:
+                state = json.load(fh)
+            logger.info(f"Backfill '{self.name}' resuming: {len(state['done'])} symbols already done")
+            return state
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Backfill checkpoint unreadable ({e}), starting over")
+            return None
+
+    def _save_checkpoint(self):
+        self.state["updated_at"] = time.time()
+        tmp = f"{self.checkpoint_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.state, fh, ensure_ascii=False)
+        os.replace(tmp, self.checkpoint_path)
+
+    # --- Universe ---
+    @staticmethod
+    def universe(market: str) -> list:
+        """Codes in today's spot snapshot (security master when the spot dump is unavailable)"""
+        try:
+            DataFetcher._refresh_spot(market)
+            codes = list(DataFetcher._spot_cache[market]["data"].index)
+            if codes:
+                return codes
+        except Exception as e:
+            logger.warning(f"Spot universe for {market} unavailable: {e}")
+        return [s.code for s in security_master.securities() if s.market == market]
+
+    def pending(self) -> list:
+        """[(code, market)] not yet completed in this run (failed symbols are retried)"""
+        items = self.codes or [(code, m) for m in self.markets for code in self.universe(m)]
+        done = self.state["done"]
+        return [(code, market) for code, market in items if f"{market}:{code}" not in done]
+
+    # --- Run ---
+    @staticmethod
+    def _download(item):
+        DataFetcher._local.bulk = True  # Provider semaphores pace the run instead of sleeps
+        series = DataFetcher.download_history(*item)
+        if series is None or not len(series):
+            raise ValueError("No data from any source")
+        return series
+
+    def run(self, items: list = None, on_result=None) -> dict:
+        """
+        Download + store every pending symbol; on_result(result_dict) is called per symbol
+        (may raise to abort - progress so far stays checkpointed).
+        """
+        items = self.pending() if items is None else items
+        skipped = len(self.state["done"])
+        stats_before = DataFetcher.source_stats()
+        start = last_log = last_flush = time.time()
+        buffer, by_source, completed, failed = [], {}, 0, 0
+        logger.info(f"Backfill '{self.name}': {len(items)} symbols, {self.workers} workers ({skipped} done earlier)")
+
+        def _flush():
+            if buffer:
+                self.store.write_many(buffer)
+                for s in buffer:
+                    self.state["done"][f"{s.market}:{s.code}"] = s.source
+                    self.state["failed"].pop(f"{s.market}:{s.code}", None)
+                buffer.clear()
+            self._save_checkpoint()
+
+        pool = ThreadPoolExecutor(max_workers=max(self.workers, 1), thread_name_prefix="backfill")
+        try:
+            futures = {pool.submit(self._download, item): item for item in items}
+            for fut in as_completed(futures):
+                code, market = futures[fut]
+                key = f"{market}:{code}"
+                try:
+                    series = fut.result()
+                    buffer.append(series)
+                    by_source[series.source] = by_source.get(series.source, 0) + 1
+                    result = {"code": code, "market": market, "bars": len(series), "source": series.source}
+                except Exception as e:
+                    self.state["failed"][key] = str(e)
+                    failed += 1
+                    result = {"code": code, "market": market, "error": str(e)}
+                completed += 1
+
+                now = time.time()
+                if len(buffer) >= self.flush_every or now - last_flush >= 5:
+                    _flush()
+                    last_flush = now
+                if now - last_log >= 10:
+                    logger.info(f"Backfill '{self.name}': {completed}/{len(items)} "
+                                f"({completed / (now - start):.1f} symbols/s, {failed} failed)")
+                    last_log = now
+                if on_result:
+                    on_result(result)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            _flush()
+
+        elapsed = time.time() - start
+        stats_after = DataFetcher.source_stats()
+        source_errors = {family: stats["errors"] - stats_before.get(family, {}).get("errors", 0)
+                         for family, stats in stats_after.items()}
+        report = {
+            "name": self.name,
+            "symbols": len(items),
+            "completed": completed - failed,
+            "failed": failed,
+            "skipped": skipped,
+            "elapsed_s": round(elapsed, 1),
+            "symbols_per_sec": round(completed / elapsed, 2) if elapsed > 0 else 0.0,
+            "by_source": dict(sorted(by_source.items(), key=lambda kv: -kv[1])),
+            "source_errors": {k: v for k, v in sorted(source_errors.items()) if v},
+            "failed_symbols": sorted(self.state["failed"])[:50],
+        }
+        logger.info(f"Backfill '{self.name}' finished: {report}")
+        return report
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Backfill daily histories into the local history store")
+    parser.add_argument("--market", action="append", choices=["CN", "HK"], help="repeatable (default: CN and HK)")
+    parser.add_argument("--codes", default="", help="comma-separated codes instead of the full universe")
+    parser.add_argument("--workers", type=int, default=None, help=f"symbols in flight (default {config.BACKFILL_WORKERS})")
+    parser.add_argument("--name", default="default", help="checkpoint name (resume key)")
+    parser.add_argument("--fresh", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    markets = args.market or ["CN", "HK"]
+    codes = None
+    if args.codes:
+        codes = [(c.strip(), markets[0] if len(markets) == 1 else security_master.detect_market(c.strip()))
+                 for c in args.codes.split(",") if c.strip()]
+    report = Backfill(markets, codes=codes, workers=args.workers, name=args.name, resume=not args.fresh).run()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Vectorized Backtest
+Indicator columns for every bar in one pass (same formulas as calculate_technicals),
+then generate_signal() replayed per bar so live and backtest share one scoring rule.
+"""
+import numpy as np
+import pandas as pd
+
+from .ohlcv import OHLCVSeries
+from .quant import generate_signal, safe_round
+
+BUY_SCORE = 65  # generate_signal: "买入" and above
+
+
+def indicator_frame(df) -> pd.DataFrame:
+    """Per-bar technicals; row i equals calculate_technicals(df[:i+1]) before rounding"""
+    if isinstance(df, OHLCVSeries):
+        df = df.to_frame()
+    if not df['date'].is_monotonic_increasing:
+        df = df.sort_values('date')
+    closes = df['close'].astype(float).reset_index(drop=True)
+    highs = df['high'].astype(float).reset_index(drop=True)
+    lows = df['low'].astype(float).reset_index(drop=True)
+    volumes = df['volume'].astype(float).reset_index(drop=True)
+
+    out = pd.DataFrame({"date": df['date'].reset_index(drop=True), "current_price": closes,
+                        "high": highs, "low": lows})
+    for n in (5, 10, 20, 60):
+        out[f"ma{n}"] = closes.rolling(n).mean()
+    out["ema13"] = closes.ewm(span=13, adjust=False).mean()
+    out["ema26"] = closes.ewm(span=26, adjust=False).mean()
+
+    delta = closes.diff()
+    gain = delta.where(delta > 0, 0).rolling(14).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = 100 - 100 / (1 + gain / loss)
+    out["rsi14"] = np.where(loss == 0, np.where(gain > 0, 100.0, 50.0), rsi)
+
+    prev_close = closes.shift(1)
+    tr = pd.concat([highs - lows, (highs - prev_close).abs(), (lows - prev_close).abs()], axis=1).max(axis=1)
+    out["atr14"] = tr.rolling(14).mean()
+    out["bias_ma5"] = ((closes - out["ma5"]) / out["ma5"] * 100).fillna(0.0)
+    volume_ma5 = volumes.rolling(5).mean()
+    out["volume_ratio"] = np.where(volume_ma5 > 0, volumes / volume_ma5, 1.0)
+
+    ma5, ma10, ma20, ma60 = out["ma5"], out["ma10"], out["ma20"], out["ma60"]
+    out["ma_alignment"] = np.select(
+        [(ma5 > ma10) & (ma10 > ma20) & (ma20 > ma60), (ma5 < ma10) & (ma10 < ma20) & (ma20 < ma60),
+         (ma5 > ma10) & (ma10 > ma20) & ma60.notna(), (ma5 < ma10) & (ma10 < ma20) & ma60.notna()],
+        ["多头排列 📈", "空头排列 📉", "短期多头 📈", "短期空头 📉"], default="趋势不明 ⚖️")
+
+    macd_line = closes.ewm(span=12, adjust=False).mean() - out["ema26"]
+    macd_signal = macd_line.ewm(span=9, adjust=False).mean()
+    hist = macd_line - macd_signal
+    prev_hist = hist.shift(1)
+    out["macd"], out["macd_signal"], out["macd_hist"] = macd_line, macd_signal, hist
+    out["macd_cross"] = np.select([(prev_hist <= 0) & (hist > 0), (prev_hist >= 0) & (hist < 0)],
+                                  ["golden", "death"], default="none")
+
+    recent_lows = lows.rolling(20, min_periods=1).min()
+    out["support_level"] = np.where(ma20.notna(), np.fmax(recent_lows, ma20), recent_lows)
+    candidates = np.column_stack([highs.rolling(20, min_periods=1).max(), ma5, ma10])
+    above = np.where(candidates > closes.to_numpy()[:, None], candidates, np.inf)
+    nearest = above.min(axis=1)
+    out["resistance_level"] = np.where(np.isfinite(nearest), nearest, closes * 1.05)
+    return out
+
+
+_TECH_FIELDS = ("current_price", "ma5", "ma10", "ma20", "ma60", "ema13", "ema26", "rsi14", "atr14",
+                "bias_ma5", "volume_ratio", "support_level", "resistance_level")
+
+
+def _tech_at(cols: dict, i: int) -> dict:
+    """Same shape and rounding as calculate_technicals() for bar i"""
+    tech = {f: safe_round(cols[f][i]) for f in _TECH_FIELDS}
+    for f in ("macd", "macd_signal", "macd_hist"):
+        tech[f] = safe_round(cols[f][i], 4)
+    tech["ma_alignment"] = cols["ma_alignment"][i]
+    tech["macd_cross"] = cols["macd_cross"][i]
+    return tech
+
+
+def trade_exit(highs, lows, closes, i: int, stop: float, target: float, timeout: int, end: int) -> tuple:
+    """(exit bar, exit price, result) for an entry at bar i's close; bars from `end` on are unseen"""
+    window = slice(i + 1, min(i + 1 + timeout, end))
+    hit_stop = lows[window] <= stop
+    hit_target = highs[window] >= target
+    first_stop = int(np.argmax(hit_stop)) if hit_stop.any() else None
+    first_target = int(np.argmax(hit_target)) if hit_target.any() else None
+    if first_stop is not None and (first_target is None or first_stop <= first_target):
+        offset, price, result = first_stop, stop, "stop"
+    elif first_target is not None:
+        offset, price, result = first_target, target, "target"
+    else:
+        offset = window.stop - window.start - 1
+        price = closes[window.start + offset]
+        result = "timeout" if window.stop - window.start == timeout else "open"
+    return window.start + offset, price, result
+
+
+def run_backtest(series, is_hk: bool = False, min_score: int = BUY_SCORE,
+                 warmup: int = 60, timeout: int = None) -> dict:
+    """
+    Enter at the close of each buy-signal bar (one position at a time), exit at the
+    signal's stop / target (stop wins when both are touched intraday) or at the
+    close after `timeout` bars (settle_signals rule: 20 CN / 30 HK).
+    """
+    ind = indicator_frame(series)
+    n = len(ind)
+    timeout = timeout or (30 if is_hk else 20)
+    cols = {c: ind[c].to_numpy() for c in ind.columns}
+    highs, lows, closes = cols["high"], cols["low"], cols["current_price"]
+    dates = pd.to_datetime(ind["date"]).dt.strftime("%Y-%m-%d").to_numpy()
+
+    trades = []
+    i = warmup
+    while i < n - 1:
+        sig = generate_signal(_tech_at(cols, i), is_hk)
+        if sig["trend_score"] < min_score:
+            i += 1
+            continue
+        entry = closes[i]
+        exit_i, price, result = trade_exit(highs, lows, closes, i, sig["stop_loss"], sig["take_profit"],
+                                           timeout, n)
+        trades.append({
+            "entry_date": dates[i], "exit_date": dates[exit_i],
+            "entry": safe_round(entry), "exit": safe_round(price),
+            "result": result, "score": sig["trend_score"],
+            "bars_held": exit_i - i,
+            "pnl_percent": safe_round((price - entry) / entry * 100) if entry else 0.0,
+        })
+        i = exit_i + 1
+
+    return {"bars": n, "trades": trades, **_stats(trades, n - warmup)}
+
+
+def backtest_series(series, bars: int = 0, min_score: int = BUY_SCORE, timeout: int = None,
+                    include_trades: bool = False) -> dict:
+    """run_backtest over the last `bars` bars of one symbol (compute-backend kernel)"""
+    if not len(series):
+        raise ValueError("No data found")
+    if bars:
+        series = series.tail(bars)
+    result = run_backtest(series, series.market == "HK", min_score=min_score, timeout=timeout)
+    if not include_trades:
+        result.pop("trades")
+    return result
+
+
+def _stats(trades: list, bars: int) -> dict:
+    if not trades:
+        return {"trade_count": 0, "win_rate": 0.0, "avg_pnl_percent": 0.0,
+                "total_return_percent": 0.0, "max_drawdown_percent": 0.0, "exposure_percent": 0.0}
+    pnl = np.array([t["pnl_percent"] for t in trades]) / 100
+    equity = np.cumprod(1 + pnl)
+    peak = np.maximum.accumulate(np.concatenate([[1.0], equity]))[1:]
+    return {
+        "trade_count": len(trades),
+        "win_rate": safe_round((pnl > 0).mean() * 100),
+        "avg_pnl_percent": safe_round(pnl.mean() * 100),
+        "total_return_percent": safe_round((equity[-1] - 1) * 100),
+        "max_drawdown_percent": safe_round(((equity - peak) / peak).min() * 100),
+        "exposure_percent": safe_round(sum(t["bars_held"] for t in trades) / max(bars, 1) * 100),
+    }
@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Shared Cache Tier
+Byte-level cache shared by every uvicorn worker on the host (SQLite WAL:
+readers never block, one lease holder refreshes each key) or by every
+replica behind the load balancer (Redis protocol).
+"""
+import hashlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+
+_process_id = (None, "")  # (pid, "host:pid:nonce") - redrawn in forked children
+
+
+def _owner_id() -> str:
+    """Lease owner: unique per thread across hosts and containers (where PID 1 is common)"""
+    global _process_id
+    pid = os.getpid()
+    if _process_id[0] != pid:
+        _process_id = (pid, f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:12]}")
+    return f"{_process_id[1]}:{threading.get_ident()}"
+
+
+class CacheBackend:
+    """Interface: bytes in, bytes out; acquire/release = cross-worker refresh lease"""
+    name = "local"
+    enabled = False
+
+    def get(self, key: str):
+        return None
+
+    def set(self, key: str, value: bytes, ttl: float):
+        pass
+
+    def acquire(self, name: str, ttl: float) -> bool:
+        return True
+
+    def release(self, name: str):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class SQLiteBackend(CacheBackend):
+    """Same-host shared tier: one WAL database, one connection per thread"""
+    name = "sqlite"
+    enabled = True
+
+    def __init__(self, path: str = ""):
+        self.path = path or config.data_path("shared_cache.sqlite")
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        with self._conn() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY, value BLOB, updated_at REAL, expires_at REAL)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY, owner TEXT, expires_at REAL)""")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")    # Readers never wait for the writer
+            conn.execute("PRAGMA synchronous=NORMAL")  # Cache data: durability not required
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        row = self._conn().execute("SELECT value FROM kv WHERE key = ? AND expires_at > ?",
+                                   (key, time.time())).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        now = time.time()
+        self._conn().execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?, ?)",
+                             (key, sqlite3.Binary(value), now, now + ttl))
+
+    def acquire(self, name: str, ttl: float) -> bool:
+        now = time.time()
+        owner = _owner_id()
+        cur = self._conn().execute(
+            """INSERT INTO leases VALUES (?, ?, ?)
+               ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+               WHERE leases.expires_at < ? OR leases.owner = excluded.owner""",
+            (name, owner, now + ttl, now))
+        return cur.rowcount == 1
+
+    def release(self, name: str):
+        self._conn().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, _owner_id()))
+
+    def purge(self):
+        self._conn().execute("DELETE FROM kv WHERE expires_at <= ?", (time.time(),))
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "path": self.path, "hits": self.hits, "misses": self.misses}
+
+
+class CacheUnavailable(Exception):
+    """Backend down (connection refused / timeout); callers fall back to local"""
+
+
+class RedisReplyError(Exception):
+    """Error reply from the server (-ERR ...); the connection itself is fine"""
+
+
+class RedisBackend(CacheBackend):
+    """
+    Minimal RESP client (GET / SET PX / SET NX PX / DEL) - no client library needed.
+    On any socket error the backend is marked down for retry_after seconds and
+    every call raises CacheUnavailable immediately (no per-request timeouts).
+    """
+    name = "redis"
+    enabled = True
+    _RELEASE = b"if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+    def __init__(self, url: str = "", timeout: float = None, retry_after: float = None, prefix: str = "quant:"):
+        parsed = urlparse(url or config.REDIS_URL)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = config.REDIS_TIMEOUT if timeout is None else timeout
+        self.retry_after = config.CACHE_RETRY_AFTER if retry_after is None else retry_after
+        self.prefix = prefix
+        self._local = threading.local()
+        self._down_until = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    # --- RESP wire protocol ---
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.reader = sock.makefile("rb")
+        if self.password:
+            self._roundtrip(b"AUTH", self.password)
+        if self.db:
+            self._roundtrip(b"SELECT", str(self.db))
+
+    def _close(self):
+        for attr in ("reader", "sock"):
+            obj = getattr(self._local, attr, None)
+            if obj is not None:
+                try:
+                    obj.close()
+                except OSError:
+                    pass
+                setattr(self._local, attr, None)
+
+    def _roundtrip(self, *args):
+        parts = [a if isinstance(a, bytes) else str(a).encode() for a in args]
+        payload = b"*%d\r\n" % len(parts) + b"".join(b"$%d\r\n%s\r\n" % (len(p), p) for p in parts)
+        self._local.sock.sendall(payload)
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._local.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by cache server")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body
+        if kind == b"-":
+            raise RedisReplyError(body.decode(errors="ignore"))
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            size = int(body)
+            if size < 0:
+                return None
+            data = self._local.reader.read(size + 2)
+            return data[:-2]
+        if kind == b"*":
+            size = int(body)
+            return None if size < 0 else [self._read_reply() for _ in range(size)]
+        raise ConnectionError(f"Unexpected reply: {line[:20]!r}")
+
+    def _call(self, *args):
+        if time.time() < self._down_until:
+            raise CacheUnavailable(f"redis {self.host}:{self.port} marked down")
+        try:
+            if getattr(self._local, "sock", None) is None:
+                self._connect()
+            return self._roundtrip(*args)
+        except RedisReplyError:
+            raise
+        except (OSError, ConnectionError) as e:
+            self.errors += 1
+            self._close()
+            self._down_until = time.time() + self.retry_after
+            logger.warning(f"Redis cache down ({e}); local cache only for {self.retry_after:.0f}s")
+            raise CacheUnavailable(str(e))
+
+    # --- Backend interface ---
+    def get(self, key: str):
+        value = self._call(b"GET", self.prefix + key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self._call(b"SET", self.prefix + key, value, b"PX", max(int(ttl * 1000), 1))
+
+    def acquire(self, name: str, ttl: float) -> bool:
+        return self._call(b"SET", self.prefix + name, _owner_id(), b"NX", b"PX", max(int(ttl * 1000), 1)) == b"OK"
+
+    def release(self, name: str):
+        key, owner = self.prefix + name, _owner_id()
+        try:
+            self._call(b"EVAL", self._RELEASE, 1, key, owner)  # Atomic compare-and-delete
+        except RedisReplyError:
+            # Server without scripting: best effort (lease TTL bounds the race)
+            if self._call(b"GET", key) == owner.encode():
+                self._call(b"DEL", key)
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "server": f"{self.host}:{self.port}", "hits": self.hits,
+                "misses": self.misses, "errors": self.errors,
+                "available": time.time() >= self._down_until}
+
+
+def get_or_compute(backend: CacheBackend, key: str, ttl: float, compute, encode, decode,
+                   lease_ttl: float = 60, wait: float = None):
+    """
+    Read-through with single-flight refresh across workers:
+    hit -> decode; miss -> lease holder computes and publishes, others poll for the result.
+    compute() returning None is not cached (upstream failure).
+    """
+    if not backend.enabled:
+        return compute()
+    wait = config.CACHE_LEASE_WAIT if wait is None else wait
+    try:
+        raw = backend.get(key)
+        if raw is not None:
+            return decode(raw)
+        leased = backend.acquire(f"lease:{key}", lease_ttl)
+    except Exception as e:
+        logger.warning(f"Shared cache ({backend.name}) unavailable for {key}: {e}")
+        return compute()
+
+    if not leased:
+        deadline = time.time() + wait
+        while time.time() < deadline:
+            time.sleep(0.05)
+            try:
+                raw = backend.get(key)
+                if raw is not None:
+                    return decode(raw)
+            except Exception:
+                break
+        # Lease holder is slow or dead: fetch ourselves rather than fail the request
+
+    try:
+        value = compute()
+        if value is not None:
+            try:
+                backend.set(key, encode(value), ttl)
+            except Exception as e:
+                logger.warning(f"Shared cache ({backend.name}) write failed for {key}: {e}")
+        return value
+    finally:
+        if leased:
+            try:
+                backend.release(f"lease:{key}")
+            except Exception:
+                pass
+
+
+# --- Spot snapshot codec (slim frame: the columns lookups actually use) ---
+SPOT_COLUMNS = ['名称', '最新价', '涨跌幅']
+_FRAME_MAGIC = b"QSP1"
+_FRAME_HEADER = struct.Struct("<4sI")  # magic, JSON header length
+
+
+def encode_frame(df) -> bytes:
+    """
+    Data-only codec (payloads come back from a shared backend other hosts can write):
+    JSON header with codes and text columns, then one float64 block per numeric column
+    """
+    text = {col: df[col].fillna("").astype(str).tolist() for col in df.columns if col == '名称'}
+    numeric = [col for col in df.columns if col not in text]
+    header = json.dumps({"index": [str(c) for c in df.index], "index_name": df.index.name,
+                         "columns": [str(c) for c in df.columns], "text": text, "numeric": numeric},
+                        ensure_ascii=False).encode("utf-8")
+    blocks = [pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64).tobytes() for col in numeric]
+    return b"".join([_FRAME_HEADER.pack(_FRAME_MAGIC, len(header)), header] + blocks)
+
+
+def decode_frame(raw: bytes):
+    magic, header_len = _FRAME_HEADER.unpack_from(raw, 0)
+    if magic != _FRAME_MAGIC:
+        raise ValueError("Not a spot snapshot payload")
+    offset = _FRAME_HEADER.size
+    header = json.loads(bytes(raw[offset:offset + header_len]).decode("utf-8"))
+    offset += header_len
+    n = len(header["index"])
+    data = dict(header["text"])
+    for col in header["numeric"]:
+        data[col] = np.frombuffer(raw, dtype=np.float64, count=n, offset=offset).copy()
+        offset += n * 8
+    index = pd.Index(header["index"], dtype=object, name=header["index_name"])
+    return pd.DataFrame(data, index=index)[header["columns"]]
+
+
+class ResultCache:
+    """
+    Rendered response bodies keyed by a digest of every input that shapes them.
+    The digest doubles as the ETag: a matching If-None-Match needs no lookup at all.
+    Local LRU first, then the shared backend (other workers' results).
+    """
+
+    def __init__(self, backend: CacheBackend = None, max_entries: int = None, ttl: float = None,
+                 prefix: str = "result"):
+        self.backend = backend if backend is not None else CacheBackend()
+        self.max_entries = config.RESULT_CACHE_MAX if max_entries is None else max_entries
+        self.ttl = config.RESULT_CACHE_TTL if ttl is None else ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # etag -> (body, stored_at)
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    @staticmethod
+    def etag(*parts) -> str:
+        digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=12).hexdigest()
+        return f'"{digest}"'
+
+    def get(self, etag: str):
+        now = time.time()
+        with self._lock:
+            hit = self._entries.get(etag)
+            if hit and now - hit[1] <= self.ttl:
+                self._entries.move_to_end(etag)
+                self.hits += 1
+                return hit[0]
+        body = None
+        if self.backend.enabled:
+            try:
+                body = self.backend.get(f"{self.prefix}:{etag.strip(chr(34))}")
+            except Exception as e:
+                logger.debug(f"Result cache backend read failed: {e}")
+        if body is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(etag, body, now)
+        return body
+
+    def put(self, etag: str, body: bytes):
+        self._remember(etag, body, time.time())
+        if self.backend.enabled:
+            try:
+                self.backend.set(f"{self.prefix}:{etag.strip(chr(34))}", body, self.ttl)
+            except Exception as e:
+                logger.debug(f"Result cache backend write failed: {e}")
+
+    def _remember(self, etag: str, body: bytes, now: float):
+        with self._lock:
+            self._entries[etag] = (body, now)
+            self._entries.move_to_end(etag)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "not_modified": self.not_modified}
+
+
+def make_backend(kind: str) -> CacheBackend:
+    try:
+        if kind == "sqlite":
+            return SQLiteBackend()
+        if kind == "redis":
+            return RedisBackend()
+    except Exception as e:
+        logger.error(f"Shared cache backend {kind} failed to start, using local only: {e}")
+    return CacheBackend()
+
+
+shared_cache = make_backend(config.CACHE_BACKEND)
+analysis_cache = ResultCache(shared_cache, prefix="analysis")
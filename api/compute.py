@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Compute Backend
+Runs a per-symbol kernel (technicals, screening, backtests) over many series:
+- inline:  in the calling thread (default; no pool)
+- thread:  shards on a thread pool (helps only where NumPy releases the GIL)
+- process: shards on a process pool; each shard's OHLCV columns are packed once
+           into a shared-memory block and workers wrap views over it, so no
+           DataFrame is ever pickled - only the (small) kernel results come back
+Results are yielded in input order; a failing symbol yields its exception.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from . import config
+from .ohlcv import OHLCVSeries
+
+logger = logging.getLogger(__name__)
+
+MODES = ("inline", "thread", "process")
+_PRICES = ("open", "high", "low", "close", "volume")
+
+
+def _call(kernel, series: OHLCVSeries, params: dict):
+    try:
+        return kernel(series, **params)
+    except Exception as e:
+        return e
+
+
+def _run_local(kernel, shard: list, params: dict) -> list:
+    return [_call(kernel, s, params) for s in shard]
+
+
+# --- Shared-memory shard layout: days i4 (padded to 8 bytes) | o h l c v f8, all bars of the shard ---
+def _views(buf, bars: int) -> tuple:
+    days_bytes = (bars * 4 + 7) // 8 * 8
+    days = np.ndarray((bars,), dtype=np.int32, buffer=buf)
+    cols = np.ndarray((len(_PRICES), bars), dtype=np.float64, buffer=buf, offset=days_bytes)
+    return days, cols
+
+
+def _pack(shard: list):
+    """Copy a shard's columns into one new shared-memory block -> (block, layout)"""
+    lengths = [len(s) for s in shard]
+    bars = sum(lengths)
+    size = (bars * 4 + 7) // 8 * 8 + len(_PRICES) * bars * 8
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    days, cols = _views(block.buf, bars)
+    if bars:
+        np.concatenate([s.days for s in shard], out=days)
+        for row, f in enumerate(_PRICES):
+            np.concatenate([getattr(s, f) for s in shard], out=cols[row], casting="same_kind")
+    del days, cols  # Views must not outlive the mapping
+    meta = [(s.code, s.market, s.source) for s in shard]
+    return block, (bars, lengths, meta)
+
+
+def _run_shared(kernel, name: str, layout: tuple, params: dict) -> list:
+    """Worker side: wrap read-only views over the parent's block, run the kernel per series"""
+    bars, lengths, meta = layout
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        days, cols = _views(block.buf, bars)
+        days.flags.writeable = cols.flags.writeable = False
+        results, start, series = [], 0, None
+        for n, (code, market, source) in zip(lengths, meta):
+            series = OHLCVSeries.wrap(days[start:start + n], *(cols[row, start:start + n] for row in range(len(_PRICES))),
+                                      code=code, market=market, source=source)
+            results.append(_call(kernel, series, params))
+            start += n
+        del series, days, cols
+        return results
+    finally:
+        block.close()
+
+
+class ComputeBackend:
+    """Shards series across inline / thread / process execution; order-preserving map"""
+
+    def __init__(self, mode: str = None, workers: int = None, shard_size: int = None):
+        self.mode = (mode or config.COMPUTE_BACKEND).lower()
+        if self.mode not in MODES:
+            raise ValueError(f"Unknown compute backend '{self.mode}' ({' / '.join(MODES)})")
+        self.workers = workers or config.COMPUTE_WORKERS or multiprocessing.cpu_count()
+        self.shard_size = shard_size or config.COMPUTE_SHARD_SIZE
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self.series = 0
+        self.shards = 0
+        self.shared_bytes = 0
+
+    def _executor(self):
+        with self._pool_lock:
+            if self._pool is None:
+                if self.mode == "process":
+                    ctx = multiprocessing.get_context(config.COMPUTE_START_METHOD)
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="compute")
+            return self._pool
+
+    def map(self, kernel, series, **params):
+        """
+        Yield kernel(s, **params) for each series in order (the exception instead when it raises).
+        kernel must be a module-level function in process mode. Series are pulled from the
+        iterable lazily, at most 2 * workers shards ahead of the consumer.
+        """
+        if self.mode == "inline":
+            for s in series:
+                self.series += 1
+                yield _call(kernel, s, params)
+            return
+
+        pool = self._executor()
+        source = iter(series)
+        pending = []  # (future, shared block or None)
+        try:
+            while True:
+                while len(pending) < 2 * self.workers:
+                    shard = list(islice(source, self.shard_size))
+                    if not shard:
+                        break
+                    pending.append(self._submit(pool, kernel, shard, params))
+                if not pending:
+                    return
+                future, block = pending.pop(0)
+                try:
+                    results = future.result()
+                finally:
+                    self._release(block)
+                yield from results
+        finally:
+            # Consumer stopped early (cancelled job / error): drop queued shards, free their blocks
+            for future, block in pending:
+                future.cancel()
+                if future.cancelled():
+                    self._release(block)
+                else:
+                    future.add_done_callback(lambda _f, b=block: self._release(b))
+
+    def _submit(self, pool, kernel, shard: list, params: dict):
+        self.series += len(shard)
+        self.shards += 1
+        if self.mode == "thread":
+            return pool.submit(_run_local, kernel, shard, params), None
+        block, layout = _pack(shard)
+        self.shared_bytes += block.size
+        return pool.submit(_run_shared, kernel, block.name, layout, params), block
+
+    @staticmethod
+    def _release(block):
+        if block is not None:
+            block.close()
+            block.unlink()
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "workers": self.workers, "shard_size": self.shard_size,
+                "series": self.series, "shards": self.shards, "shared_mb": round(self.shared_bytes / 1e6, 1)}
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_compute_backend() -> ComputeBackend:
+    """Process-wide backend (pool started on first non-inline map)"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = ComputeBackend()
+        return _backend
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Adaptive Provider Concurrency
+One AIMD in-flight limit per upstream provider family: while calls come back
+fast and error-free the limit grows by about one slot per window of calls
+(additive increase); a timeout, throttling response or dropped connection
+cuts it by QUANT_PROVIDER_BACKOFF (multiplicative decrease), at most once per
+window so a burst of failures from the same wave counts as one signal.
+"""
+import threading
+import time
+
+import requests
+
+from . import config
+
+OK = "ok"
+ERROR = "error"          # Failed call that says nothing about load (bad symbol, schema, empty data)
+TIMEOUT = "timeout"
+THROTTLE = "throttle"    # HTTP 403 / 429 / 503 or an explicit rate-limit message
+TRANSPORT = "transport"  # Connection refused / reset - how IP bans usually show up
+CONGESTION = (TIMEOUT, THROTTLE, TRANSPORT)
+
+THROTTLE_STATUS = (403, 429, 503)
+EWMA = 0.1  # Weight of the newest call in the error-rate / baseline-latency averages
+
+
+def classify(exc: BaseException) -> str:
+    """Outcome kind of a failed upstream call"""
+    if isinstance(exc, (TimeoutError, requests.Timeout)):
+        return TIMEOUT
+    response = getattr(exc, "response", None)
+    if getattr(response, "status_code", None) in THROTTLE_STATUS:
+        return THROTTLE
+    text = str(exc).lower()
+    if "429" in text or "too many requests" in text or "rate limit" in text:
+        return THROTTLE
+    if isinstance(exc, (ConnectionError, requests.ConnectionError)):
+        return TRANSPORT
+    return ERROR
+
+
+class AdaptiveLimiter:
+    """In-flight limit for one provider family; fixed at `initial` when adaptive is off"""
+
+    def __init__(self, name: str, initial: int, ceiling: int, adaptive: bool = None):
+        self.name = name
+        self.ceiling = max(int(ceiling), 1)
+        self.limit = float(min(max(int(initial), 1), self.ceiling))
+        self.adaptive = config.PROVIDER_ADAPTIVE if adaptive is None else adaptive
+        self.in_flight = 0
+        self.baseline_ms = None
+        self.error_rate = 0.0
+        self._last_cut = 0.0
+        self._cond = threading.Condition()
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.waits = 0
+        self.increases = 0
+        self.decreases = 0
+        self.congested = {TIMEOUT: 0, THROTTLE: 0, TRANSPORT: 0}
+
+    @property
+    def slots(self) -> int:
+        return max(int(self.limit), 1)
+
+    def acquire(self) -> tuple:
+        """Block until a slot is free; returns the token release() needs"""
+        with self._cond:
+            if self.in_flight >= self.slots:
+                self.waits += 1
+                while self.in_flight >= self.slots:
+                    self._cond.wait()
+            self.in_flight += 1
+            return time.perf_counter(), self.in_flight >= self.slots
+
+    def release(self, token: tuple, outcome: str = OK):
+        start, saturated = token
+        now = time.perf_counter()
+        elapsed = (now - start) * 1000
+        with self._cond:
+            self.in_flight -= 1
+            self.calls += 1
+            self.total_ms += elapsed
+            if outcome == OK:
+                self.error_rate *= 1 - EWMA
+                # Baseline follows the fastest recent calls: drops at once, creeps up slowly
+                if self.baseline_ms is None or elapsed < self.baseline_ms:
+                    self.baseline_ms = elapsed
+                else:
+                    self.baseline_ms += EWMA * 0.5 * (elapsed - self.baseline_ms)
+                healthy = (elapsed <= self.baseline_ms * config.PROVIDER_LATENCY_FACTOR
+                           and self.error_rate < config.PROVIDER_ERROR_RATE)
+                # Grow only when the limit was actually the bottleneck (+1 slot per `limit` calls)
+                if self.adaptive and healthy and saturated and self.limit < self.ceiling:
+                    before = self.slots
+                    self.limit = min(self.limit + 1.0 / self.limit, float(self.ceiling))
+                    self.increases += self.slots > before
+            else:
+                self.errors += 1
+                self.error_rate = self.error_rate * (1 - EWMA) + EWMA
+                if outcome in CONGESTION:
+                    self.congested[outcome] += 1
+                    # One cut per window: calls admitted before the last cut already saw it
+                    if self.adaptive and start > self._last_cut:
+                        self.limit = max(self.limit * config.PROVIDER_BACKOFF, 1.0)
+                        self._last_cut = now
+                        self.decreases += 1
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"calls": self.calls, "errors": self.errors, "total_ms": self.total_ms,
+                    "limit": self.slots, "ceiling": self.ceiling, "in_flight": self.in_flight,
+                    "adaptive": self.adaptive, "error_rate": round(self.error_rate, 3),
+                    "baseline_ms": round(self.baseline_ms, 1) if self.baseline_ms is not None else None,
+                    "waits": self.waits, "increases": self.increases, "decreases": self.decreases,
+                    "timeouts": self.congested[TIMEOUT], "throttled": self.congested[THROTTLE],
+                    "dropped": self.congested[TRANSPORT]}
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Runtime Configuration
+All settings come from environment variables (same convention as API_KEY)
+"""
+import os
+
+# Root for every on-disk artefact (recordings, caches, stores, job tables)
+DATA_DIR = os.environ.get("QUANT_DATA_DIR", os.path.join(os.getcwd(), "data"))
+
+# --- Source record/replay ---
+RECORD_MODE = os.environ.get("QUANT_RECORD_MODE", "off").lower()  # off / record / replay
+RECORD_PATH = os.environ.get("QUANT_RECORD_PATH", "")
+REPLAY_SPEED = float(os.environ.get("QUANT_REPLAY_SPEED", "1.0"))  # 0 = no delay
+
+# --- History cache ---
+HISTORY_CACHE_TTL = float(os.environ.get("QUANT_HISTORY_TTL", "600"))      # seconds
+HISTORY_CACHE_MAX = int(os.environ.get("QUANT_HISTORY_CACHE_MAX", "6000"))  # symbols (whole market fits)
+PRICE_DTYPE = os.environ.get("QUANT_PRICE_DTYPE", "float64")               # float32 halves price memory
+HISTORY_STORE = os.environ.get("QUANT_HISTORY_STORE", "0").lower() in ("1", "true", "on")  # mmap column store
+ADJUST_CHECK_BARS = int(os.environ.get("QUANT_ADJUST_CHECK_BARS", "20"))  # recent bars compared to spot corporate actions
+
+# --- Trading calendar ---
+TRADING_CALENDAR = os.environ.get("QUANT_TRADING_CALENDAR", "1").lower() in ("1", "true", "on")  # session-aware TTLs
+CALENDAR_CLOSE_GRACE = float(os.environ.get("QUANT_CALENDAR_CLOSE_GRACE", "1200"))  # seconds after close until bars are final
+
+# --- Realtime quotes ---
+BATCH_QUOTE_RATIO = float(os.environ.get("QUANT_BATCH_QUOTE_RATIO", "0.2"))  # batched while symbols <= ratio * market size
+QUOTE_URL_MAX = int(os.environ.get("QUANT_QUOTE_URL_MAX", "2000"))           # chars per batched quote URL
+
+# --- Intraday minute bars ---
+INTRADAY_PERIOD = int(os.environ.get("QUANT_INTRADAY_PERIOD", "1"))            # 1 or 5 minute bars
+INTRADAY_RING = int(os.environ.get("QUANT_INTRADAY_RING", "1200"))             # bars kept per symbol
+INTRADAY_TTL = float(os.environ.get("QUANT_INTRADAY_TTL", "30"))               # seconds between pulls in session
+INTRADAY_MAX_SYMBOLS = int(os.environ.get("QUANT_INTRADAY_MAX_SYMBOLS", "500"))
+
+# --- Position monitor (SSE) ---
+MONITOR_INTERVAL = float(os.environ.get("QUANT_MONITOR_INTERVAL", "30"))       # seconds between evaluation cycles
+MONITOR_MAX_POSITIONS = int(os.environ.get("QUANT_MONITOR_MAX_POSITIONS", "2000"))  # per subscription
+MONITOR_BUFFER = int(os.environ.get("QUANT_MONITOR_BUFFER", "200"))            # events kept for reconnects
+MONITOR_HEARTBEAT = float(os.environ.get("QUANT_MONITOR_HEARTBEAT", "15"))     # SSE keepalive comment interval
+MONITOR_STREAM_MAX = float(os.environ.get("QUANT_MONITOR_STREAM_MAX", "900"))  # seconds before a stream ends (client reconnects)
+MONITOR_IDLE_TTL = float(os.environ.get("QUANT_MONITOR_IDLE_TTL", "3600"))     # unlistened subscriptions dropped after
+MONITOR_POLL = float(os.environ.get("QUANT_MONITOR_POLL", "1"))               # seconds between event polls per stream
+
+# --- Compute backend (screen / backtest jobs) ---
+COMPUTE_BACKEND = os.environ.get("QUANT_COMPUTE_BACKEND", "inline")            # inline / thread / process
+COMPUTE_WORKERS = int(os.environ.get("QUANT_COMPUTE_WORKERS", "0"))            # 0 = CPU count
+COMPUTE_SHARD_SIZE = int(os.environ.get("QUANT_COMPUTE_SHARD_SIZE", "64"))     # symbols per task / shared block
+COMPUTE_START_METHOD = os.environ.get("QUANT_COMPUTE_START_METHOD", "spawn")   # worker processes (server is threaded)
+OPTIMIZER_MAX_GRID = int(os.environ.get("QUANT_OPTIMIZER_MAX_GRID", "2000"))  # parameter sets per optimize job
+
+# --- Cross-sectional factors ---
+FACTOR_LOOKBACK = int(os.environ.get("QUANT_FACTOR_LOOKBACK", "260"))          # trading days in the panel
+FACTOR_MOMENTUM = os.environ.get("QUANT_FACTOR_MOMENTUM", "20,60,120")         # momentum windows (days)
+FACTOR_VOL_WINDOW = int(os.environ.get("QUANT_FACTOR_VOL_WINDOW", "20"))
+FACTOR_RS_WINDOW = int(os.environ.get("QUANT_FACTOR_RS_WINDOW", "60"))         # relative strength vs benchmark
+FACTOR_AMOUNT_WINDOW = int(os.environ.get("QUANT_FACTOR_AMOUNT_WINDOW", "20"))  # average traded value
+FACTOR_BENCHMARK_CN = os.environ.get("QUANT_FACTOR_BENCHMARK_CN", "sh000300")  # "" = equal-weight composite
+
+# --- Portfolio risk ---
+PORTFOLIO_COV_WINDOW = int(os.environ.get("QUANT_PORTFOLIO_COV_WINDOW", "120"))      # daily returns in the covariance
+PORTFOLIO_MAX_SYMBOLS = int(os.environ.get("QUANT_PORTFOLIO_MAX_SYMBOLS", "1000"))   # cached covariance universe
+PORTFOLIO_MAX_WEIGHT = float(os.environ.get("QUANT_PORTFOLIO_MAX_WEIGHT", "0.2"))    # position value / balance
+PORTFOLIO_MAX_RISK_SHARE = float(os.environ.get("QUANT_PORTFOLIO_MAX_RISK_SHARE", "0.25"))  # of portfolio ATR risk
+PORTFOLIO_MAX_ATR_RISK = float(os.environ.get("QUANT_PORTFOLIO_MAX_ATR_RISK", "0.03"))  # portfolio ATR risk / balance
+PORTFOLIO_CORR_ALERT = float(os.environ.get("QUANT_PORTFOLIO_CORR_ALERT", "0.8"))    # pairwise correlation warning
+
+# --- Signal settlement ---
+SETTLEMENT_STATE = os.environ.get("QUANT_SETTLEMENT_STATE", "1").lower() in ("1", "true", "on")  # incremental settle
+SETTLEMENT_RETENTION_DAYS = float(os.environ.get("QUANT_SETTLEMENT_RETENTION_DAYS", "120"))  # untouched states purged after
+
+# --- Startup warmup ---
+WARMUP_WATCHLIST = os.environ.get("QUANT_WARMUP_WATCHLIST", "")  # "600519,000001,HK:00700"
+WARMUP_WORKERS = int(os.environ.get("QUANT_WARMUP_WORKERS", "4"))
+WARMUP_RETRY = float(os.environ.get("QUANT_WARMUP_RETRY", "60"))  # Seconds between retries of failed required steps
+
+# --- Shared cache tier (multi-worker / multi-replica) ---
+CACHE_BACKEND = os.environ.get("QUANT_CACHE_BACKEND", "local").lower()  # local / sqlite / redis
+CACHE_LEASE_WAIT = float(os.environ.get("QUANT_CACHE_LEASE_WAIT", "15"))  # seconds to wait for another worker's refresh
+CACHE_RETRY_AFTER = float(os.environ.get("QUANT_CACHE_RETRY_AFTER", "30"))  # seconds a failed remote backend stays bypassed
+REDIS_URL = os.environ.get("QUANT_REDIS_URL", "redis://127.0.0.1:6379/0")
+REDIS_TIMEOUT = float(os.environ.get("QUANT_REDIS_TIMEOUT", "0.5"))
+
+# --- Analysis result cache (ETag) ---
+RESULT_CACHE_TTL = float(os.environ.get("QUANT_RESULT_CACHE_TTL", "3600"))  # seconds a rendered body is reused
+RESULT_CACHE_MAX = int(os.environ.get("QUANT_RESULT_CACHE_MAX", "2000"))    # bodies kept per process
+
+# --- Upstream providers ---
+PROVIDER_CONCURRENCY = os.environ.get("QUANT_PROVIDER_CONCURRENCY", "")  # "efinance=4,Tencent=8,Yahoo=2" (ceilings)
+PROVIDER_CONCURRENCY_DEFAULT = int(os.environ.get("QUANT_PROVIDER_CONCURRENCY_DEFAULT", "4"))  # starting (fixed) limit
+PROVIDER_ADAPTIVE = os.environ.get("QUANT_PROVIDER_ADAPTIVE", "1").lower() in ("1", "true", "on")  # AIMD limits
+PROVIDER_CONCURRENCY_MAX = int(os.environ.get("QUANT_PROVIDER_CONCURRENCY_MAX", "16"))  # ceiling for unlisted providers
+PROVIDER_BACKOFF = float(os.environ.get("QUANT_PROVIDER_BACKOFF", "0.5"))  # limit multiplier on timeout / throttle
+PROVIDER_LATENCY_FACTOR = float(os.environ.get("QUANT_PROVIDER_LATENCY_FACTOR", "3"))  # slower than x baseline = unhealthy
+PROVIDER_ERROR_RATE = float(os.environ.get("QUANT_PROVIDER_ERROR_RATE", "0.1"))  # recent error share that stops growth
+
+# --- Responses ---
+COMPRESSION = os.environ.get("QUANT_COMPRESSION", "1").lower() in ("1", "true", "on")  # br/gzip negotiation
+COMPRESS_MIN_SIZE = int(os.environ.get("QUANT_COMPRESS_MIN_SIZE", "1024"))  # bytes; smaller bodies go out raw
+GZIP_LEVEL = int(os.environ.get("QUANT_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("QUANT_BROTLI_QUALITY", "4"))  # 4-5: near-gzip-9 ratio at gzip-6 speed
+
+# --- Batch jobs ---
+JOB_WORKERS = int(os.environ.get("QUANT_JOB_WORKERS", "2"))                 # concurrent jobs per process
+JOB_RETENTION_DAYS = float(os.environ.get("QUANT_JOB_RETENTION_DAYS", "7"))  # finished jobs purged after
+
+# --- Backfill ---
+BACKFILL_WORKERS = int(os.environ.get("QUANT_BACKFILL_WORKERS", "8"))  # symbols in flight (providers cap each source)
+
+
+def data_path(*parts: str) -> str:
+    """Absolute path under DATA_DIR (parent directory is created)"""
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Cross-Sectional Factor Engine
+Every stored symbol of a market is aligned on one trading-day axis (store reads,
+no upstream calls) and all factors are computed in one vectorized pass over
+that panel. Cumulative sums of log returns, squared returns and traded value
+are built once and shared: momentum, volatility and relative strength are all
+differences of the same running sums. Percentile ranks are kept per market in
+a snapshot that lives until the next daily bar, so lookups are O(1).
+"""
+import datetime
+import logging
+import threading
+import time
+
+import akshare as ak
+import numpy as np
+import pandas as pd
+
+from . import config
+from .fetcher import DataFetcher
+from .store import get_store
+from .trading_calendar import TZ, trading_calendar
+
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS = 252
+
+
+def _windows(raw: str) -> list:
+    return sorted({int(w) for w in str(raw).split(",") if w.strip()})
+
+
+def factor_names() -> list:
+    return ([f"mom_{w}" for w in _windows(config.FACTOR_MOMENTUM)] + [f"vol_{config.FACTOR_VOL_WINDOW}",
+            f"rs_{config.FACTOR_RS_WINDOW}", f"amount_{config.FACTOR_AMOUNT_WINDOW}"])
+
+
+def align_panel(series_list: list, lookback: int) -> tuple:
+    """
+    (axis days, close S x L, traded value S x L) on the union of the last `lookback` bar days.
+    Suspended days carry the previous close forward with zero value; days before listing stay NaN.
+    """
+    tails = [s.days[-lookback:] for s in series_list if len(s)]
+    if not tails:
+        return np.empty(0, dtype=np.int32), np.empty((len(series_list), 0)), np.empty((len(series_list), 0))
+    axis = np.unique(np.concatenate(tails))[-lookback:]
+    close = np.full((len(series_list), len(axis)), np.nan)
+    value = np.zeros_like(close)
+    for i, s in enumerate(series_list):
+        if not len(s):
+            continue
+        days = s.days[-lookback:]
+        keep = days >= axis[0]
+        pos = np.searchsorted(axis, days[keep])
+        close[i, pos] = s.close[-lookback:][keep]
+        value[i, pos] = close[i, pos] * s.volume[-lookback:][keep]
+    # Forward fill along the axis (vectorized: index of the last valid column per cell)
+    cols = np.where(np.isnan(close), 0, np.arange(close.shape[1]))
+    np.maximum.accumulate(cols, axis=1, out=cols)
+    close = close[np.arange(close.shape[0])[:, None], cols]
+    return axis, close, value
+
+
+def _trailing(cum: np.ndarray, window: int) -> np.ndarray:
+    """Sum of the last `window` columns from a running sum with a leading zero column"""
+    if window >= cum.shape[-1]:
+        return np.full(cum.shape[:-1], np.nan)
+    return cum[..., -1] - cum[..., -1 - window]
+
+
+def compute_factors(close: np.ndarray, value: np.ndarray, benchmark: np.ndarray = None) -> dict:
+    """
+    Latest value of every factor per row. benchmark: log returns of the index on the same axis
+    (default: equal-weighted composite of the panel).
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = np.diff(np.log(close), axis=1)
+    valid = ~np.isnan(r)
+    rz = np.where(valid, r, 0.0)
+    zero = np.zeros((r.shape[0], 1))
+    c1 = np.concatenate([zero, np.cumsum(rz, axis=1)], axis=1)          # Shared by mom / vol / rs
+    c2 = np.concatenate([zero, np.cumsum(rz * rz, axis=1)], axis=1)
+    cn = np.concatenate([zero, np.cumsum(valid, axis=1)], axis=1)
+    if benchmark is None:
+        benchmark = rz.sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+    cb = np.concatenate([[0.0], np.cumsum(np.nan_to_num(benchmark))])
+
+    def _full(window: int) -> np.ndarray:
+        return _trailing(cn, window) == window  # Whole window inside the symbol's history
+
+    out = {}
+    for w in _windows(config.FACTOR_MOMENTUM):
+        out[f"mom_{w}"] = np.where(_full(w), np.expm1(_trailing(c1, w)) * 100, np.nan)
+    w = config.FACTOR_VOL_WINDOW
+    s1, s2 = _trailing(c1, w), _trailing(c2, w)
+    with np.errstate(invalid="ignore"):
+        var = np.maximum((s2 - s1 * s1 / w) / (w - 1), 0.0)
+    out[f"vol_{w}"] = np.where(_full(w), np.sqrt(var * TRADING_DAYS) * 100, np.nan)
+    w = config.FACTOR_RS_WINDOW
+    excess = _trailing(c1, w) - (_trailing(cb, w) if w < len(cb) else np.nan)
+    out[f"rs_{w}"] = np.where(_full(w), np.expm1(excess) * 100, np.nan)
+    w = config.FACTOR_AMOUNT_WINDOW
+    cv = np.concatenate([np.zeros((value.shape[0], 1)), np.cumsum(value, axis=1)], axis=1)
+    out[f"amount_{w}"] = np.where(_full(w), _trailing(cv, w) / w, np.nan)
+    return out
+
+
+def percentiles(values: np.ndarray) -> np.ndarray:
+    """Column-wise percentile rank 0-100 (ties averaged, NaN stays NaN)"""
+    return pd.DataFrame(values).rank(pct=True).to_numpy() * 100
+
+
+class FactorSnapshot:
+    """Factor values and percentile ranks of one market as of its latest bar"""
+
+    def __init__(self, market: str, codes: list, names: list, values: np.ndarray, as_of, benchmark: str):
+        self.market = market
+        self.codes = codes
+        self.names = names
+        self.values = values
+        self.pct = percentiles(values) if len(codes) else values
+        self.as_of = as_of
+        self.benchmark = benchmark
+        self.computed_at = time.time()
+        self._rows = {code: i for i, code in enumerate(codes)}
+
+    def _row(self, i: int) -> dict:
+        return {"values": {n: _clean(self.values[i, j], 4) for j, n in enumerate(self.names)},
+                "percentiles": {n: _clean(self.pct[i, j], 1) for j, n in enumerate(self.names)}}
+
+    def lookup(self, code: str) -> dict:
+        i = self._rows.get(code)
+        if i is None:
+            return None
+        return {"as_of": self.as_of, "universe": len(self.codes), "benchmark": self.benchmark, **self._row(i)}
+
+    def top(self, factor: str, n: int = 50, ascending: bool = False) -> list:
+        if factor not in self.names:
+            raise ValueError(f"Unknown factor '{factor}' ({' / '.join(self.names)})")
+        col = self.values[:, self.names.index(factor)]
+        order = np.argsort(np.where(np.isnan(col), np.inf, col if ascending else -col), kind="stable")
+        ranked = [i for i in order[:n] if not np.isnan(col[i])]
+        return [{"code": self.codes[i], **self._row(i)} for i in ranked]
+
+
+def _clean(value, digits: int):
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+class FactorEngine:
+    """
+    market -> FactorSnapshot, rebuilt once the daily bars it was built from can have moved.
+    Builds run outside the lock: a stale snapshot keeps serving while one background rebuild runs.
+    """
+
+    def __init__(self, store=None):
+        self._store = store
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._building = {}   # market -> Event set when the running build finishes
+        self._index = {}      # benchmark symbol -> (local day, bar days, closes)
+        self.builds = 0
+        self.failures = 0
+        self.last_build_ms = 0
+
+    @property
+    def store(self):
+        return self._store or get_store()
+
+    def _benchmark(self, market: str, axis: np.ndarray):
+        """(index log returns on axis, name); (None, "composite") for HK, when unset, or on failure"""
+        symbol = config.FACTOR_BENCHMARK_CN if market == "CN" else ""
+        if not symbol or len(axis) < 2:
+            return None, "composite"
+        try:
+            days, close = self._index_bars(symbol)
+            pos = np.searchsorted(days, axis, side="right") - 1
+            if (pos < 0).any():
+                return None, "composite"
+            return np.diff(np.log(close[pos])), symbol
+        except Exception as e:
+            logger.warning(f"Benchmark {symbol} unavailable, using the equal-weight composite: {e}")
+            return None, "composite"
+
+    def _index_bars(self, symbol: str) -> tuple:
+        """Index daily bars, downloaded at most once per local day"""
+        today = datetime.datetime.now(TZ).date()
+        hit = self._index.get(symbol)
+        if hit and hit[0] == today:
+            return hit[1], hit[2]
+        df = DataFetcher._source("AkShare-Index", symbol, ak.stock_zh_index_daily, symbol=symbol)
+        days = pd.to_datetime(df['date']).to_numpy().astype("datetime64[D]").astype(np.int32)
+        close = df['close'].to_numpy(dtype=np.float64)
+        self._index[symbol] = (today, days, close)
+        return days, close
+
+    def build(self, market: str) -> FactorSnapshot:
+        start = time.time()
+        store = self.store
+        codes, series = [], []
+        for code in store.symbols(market):
+            s = store.read(code, market)
+            if s is not None and len(s):
+                codes.append(code)
+                series.append(s)
+        axis, close, value = align_panel(series, config.FACTOR_LOOKBACK)
+        benchmark, name = self._benchmark(market, axis)
+        factors = compute_factors(close, value, benchmark) if codes else {}
+        names = factor_names()
+        values = np.column_stack([factors[n] for n in names]) if codes else np.empty((0, len(names)))
+        as_of = str(np.datetime64(int(axis[-1]), "D")) if len(axis) else None
+        snapshot = FactorSnapshot(market, codes, names, values, as_of, name)
+        self.builds += 1
+        self.last_build_ms = int((time.time() - start) * 1000)
+        logger.info(f"Factors built for {market}: {len(codes)} symbols in {self.last_build_ms}ms")
+        return snapshot
+
+    def _stale(self, snap: FactorSnapshot, market: str) -> bool:
+        return time.time() - snap.computed_at > trading_calendar.history_ttl(market, snap.computed_at)
+
+    def snapshot(self, market: str = "CN") -> FactorSnapshot:
+        """Current snapshot; a stale one is served while it is rebuilt, only a first build is waited for"""
+        with self._lock:
+            snap = self._snapshots.get(market)
+            if snap is not None and not self._stale(snap, market):
+                return snap
+            running = market in self._building
+            if not running:
+                self._building[market] = threading.Event()
+            done = self._building[market]
+        if snap is not None:
+            if not running:
+                threading.Thread(target=self._rebuild, args=(market, done), daemon=True,
+                                 name=f"factors-{market}").start()
+            return snap
+        if running:
+            done.wait()
+        else:
+            self._rebuild(market, done)
+        with self._lock:
+            snap = self._snapshots.get(market)
+        if snap is None:
+            raise RuntimeError(f"Factor snapshot for {market} unavailable")
+        return snap
+
+    def _rebuild(self, market: str, done: threading.Event):
+        try:
+            snap = self.build(market)
+            with self._lock:
+                self._snapshots[market] = snap
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Factor build for {market} failed: {e}")
+        finally:
+            with self._lock:
+                self._building.pop(market, None)
+            done.set()
+
+    def lookup(self, code: str, market: str = "CN") -> dict:
+        """Factor values + percentile ranks for one symbol (None when it is not in the store)"""
+        return self.snapshot(market).lookup(DataFetcher._normalize_code(code, market))
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+            self._index.clear()
+
+    def stats(self) -> dict:
+        return {"markets": {m: {"symbols": len(s.codes), "as_of": s.as_of, "benchmark": s.benchmark}
+                            for m, s in self._snapshots.items()},
+                "builds": self.builds, "failures": self.failures, "last_build_ms": self.last_build_ms,
+                "building": sorted(self._building)}
+
+
+factor_engine = FactorEngine()
@@ -8,12 +8,25 @@ import akshare as ak
 import requests
 import datetime
 import random
+import socket
 import time
 import logging
 import threading
+from collections import OrderedDict
+
+import numpy as np
 
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
+from .recorder import SourceRecorder
+from .ohlcv import OHLCVSeries
+from .security_master import security_master, classify
+from .store import get_store
+from .trading_calendar import trading_calendar
+from .cache import shared_cache, get_or_compute, encode_frame, decode_frame, SPOT_COLUMNS
+from .concurrency import AdaptiveLimiter, ERROR, OK, classify as classify_failure
+from . import config, parsers
+
 # Optional libraries
 try:
     import yfinance as yf
@@ -60,6 +73,127 @@ def get_headers():
     }
 
 
+# --- V15: Raw upstream calls (each returns a picklable payload for the recorder) ---
+def _get_json(url: str, timeout: int = 8):
+    r = requests.get(url, headers=get_headers(), timeout=timeout)
+    return r.json()
+
+
+def _tdx_bars(host: str, port: int, category: int, market_code: int, symbol: str, start: int, count: int):
+    from pytdx.hq import TdxHq_API
+    local_tdx = TdxHq_API()
+    with local_tdx.connect(host, port):
+        return local_tdx.get_security_bars(category, market_code, symbol, start, count)
+
+
+def _bs_history(bs_code: str, days: int = 365):
+    """Baostock daily qfq bars -> (fields, rows)"""
+    global _bs_logged_in
+    if not _bs_logged_in:
+        bs.login()
+        _bs_logged_in = True
+    try:
+        rs = bs.query_history_k_data_plus(bs_code,
+            "date,open,high,low,close,volume",
+            start_date=(datetime.date.today() - datetime.timedelta(days=days)).strftime('%Y-%m-%d'),
+            end_date=datetime.date.today().strftime('%Y-%m-%d'),
+            frequency="d", adjustflag="1")
+
+        data_list = []
+        while (rs.error_code == '0') & rs.next():
+            data_list.append(rs.get_row_data())
+        return rs.fields, data_list
+    finally:
+        bs.logout()
+        _bs_logged_in = False  # V14: Reset login flag after logout
+
+
+def _yf_history(y_symbol: str, period: str):
+    return yf.Ticker(y_symbol).history(period=period)
+
+
+def _yf_fast_price(yf_code: str) -> float:
+    return yf.Ticker(yf_code).fast_info['last_price']
+
+
+def _yf_last_price(yf_code: str) -> float:
+    ticker = yf.Ticker(yf_code)
+    try:
+        return ticker.fast_info['last_price']
+    except Exception:
+        hist = ticker.history(period="1d")
+        return float(hist['Close'].iloc[-1]) if not hist.empty else 0.0
+
+
+def _get_text(url: str, timeout: int = 8, encoding: str = "gbk") -> str:
+    r = requests.get(url, headers=get_headers(), timeout=timeout)
+    return r.content.decode(encoding, errors="ignore")
+
+
+def _parse_tencent_quotes(text: str) -> dict:
+    """v_sh600000="1~浦发银行~600000~10.52~..."; -> {'sh600000': 10.52} (field 3 = last price)"""
+    prices = {}
+    for line in text.split(";"):
+        line = line.strip()
+        if not line.startswith("v_") or "=" not in line:
+            continue
+        key, val = line.split("=", 1)
+        fields = val.strip('"').split("~")
+        if len(fields) > 3:
+            try:
+                price = float(fields[3])
+            except ValueError:
+                continue
+            if price > 0:
+                prices[key[2:]] = price
+    return prices
+
+
+def _yf_symbol(clean_code: str, market: str) -> str:
+    if market == "HK":
+        return f"{int(clean_code):04d}.HK" if clean_code.isdigit() else clean_code
+    if clean_code.startswith("6"): return f"{clean_code}.SS"
+    if clean_code.startswith(("0", "3")): return f"{clean_code}.SZ"
+    return f"{clean_code}.SS"
+
+
+def _yf_download_close(tickers: list) -> dict:
+    """One yf.download for many tickers -> {ticker: last close}"""
+    df = yf.download(tickers, period="5d", progress=False, group_by="column", threads=True)
+    if df.empty:
+        return {}
+    close = df["Close"]
+    if isinstance(close, pd.Series):
+        close = close.to_frame(tickers[0])
+    last = close.ffill().iloc[-1]
+    return {str(t): float(px) for t, px in last.items() if not pd.isna(px)}
+
+
+# --- Generic-cleaner inputs (schema drift fallback only) ---
+def _tencent_frame(k_data: list) -> pd.DataFrame:
+    df = pd.DataFrame(k_data)
+    if df.shape[1] < 6:
+        return pd.DataFrame()
+    df = df.iloc[:, :6]
+    df.columns = ['date', 'open', 'close', 'high', 'low', 'volume']
+    return df
+
+
+def _tdx_frame(data: list) -> pd.DataFrame:
+    df = pd.DataFrame(data)
+    df.rename(columns={'datetime': 'date', 'vol': 'volume'}, inplace=True)
+    return df
+
+
+def _yahoo_frame(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.reset_index()
+    df.rename(columns={'Date': 'date', 'Open': 'open', 'Close': 'close',
+                       'High': 'high', 'Low': 'low', 'Volume': 'volume'}, inplace=True)
+    if hasattr(df['date'].dt, 'tz') and df['date'].dt.tz is not None:
+        df['date'] = df['date'].dt.tz_localize(None)
+    return df
+
+
 class DataFetcher:
     """
     V9.0 Titan Hierarchy:
@@ -72,6 +206,78 @@ class DataFetcher:
     6. Sina (Legacy) - Backup
     7. Yahoo (International) - Last Resort
     """
+    # V15: Every upstream call goes through _source (record/replay choke point)
+    _recorder = SourceRecorder.from_env()
+    _local = threading.local()  # Per-thread: provider that served the last call, bulk mode
+    _provider_lock = threading.Lock()
+    _provider_limiters = {}  # provider family -> AdaptiveLimiter (in-flight calls)
+
+    @staticmethod
+    def _provider_family(provider: str) -> str:
+        """'Pytdx(119.147.212.81)' -> 'Pytdx' (one limit per upstream, not per server)"""
+        return provider.split("(", 1)[0]
+
+    @staticmethod
+    def _provider_limit(family: str) -> int:
+        """Configured limit: the ceiling when adaptive, the fixed limit otherwise"""
+        for item in config.PROVIDER_CONCURRENCY.split(","):
+            name, _, limit = item.partition("=")
+            if name.strip() == family and limit.strip().isdigit():
+                return max(int(limit), 1)
+        return config.PROVIDER_CONCURRENCY_MAX if config.PROVIDER_ADAPTIVE else config.PROVIDER_CONCURRENCY_DEFAULT
+
+    @staticmethod
+    def _limiter(family: str) -> AdaptiveLimiter:
+        with DataFetcher._provider_lock:
+            limiter = DataFetcher._provider_limiters.get(family)
+            if limiter is None:
+                ceiling = DataFetcher._provider_limit(family)
+                initial = min(config.PROVIDER_CONCURRENCY_DEFAULT, ceiling) if config.PROVIDER_ADAPTIVE else ceiling
+                limiter = DataFetcher._provider_limiters[family] = AdaptiveLimiter(family, initial, ceiling)
+            return limiter
+
+    @staticmethod
+    def _source(provider: str, symbol: str, func, *args, **kwargs):
+        """Invoke one raw upstream call (recorded / replayed when enabled, bounded per provider)"""
+        limiter = DataFetcher._limiter(DataFetcher._provider_family(provider))
+        token = limiter.acquire()
+        outcome = ERROR
+        try:
+            result = DataFetcher._recorder.call(provider, symbol, func, *args, **kwargs)
+            outcome = OK
+        except Exception as e:
+            outcome = classify_failure(e)
+            raise
+        finally:
+            limiter.release(token, outcome)
+        DataFetcher._local.provider = provider
+        return result
+
+    @staticmethod
+    def source_stats() -> dict:
+        """Snapshot of per-provider call counters and current in-flight limits"""
+        with DataFetcher._provider_lock:
+            limiters = dict(DataFetcher._provider_limiters)
+        return {family: limiter.stats() for family, limiter in limiters.items()}
+
+    @staticmethod
+    def _polite_sleep(low: float = 0.5, high: float = 1.5):
+        """Anti-ban jitter between upstream calls (skipped when replaying offline or in bulk mode)"""
+        if DataFetcher._recorder.mode != "replay" and not getattr(DataFetcher._local, "bulk", False):
+            time.sleep(random.uniform(low, high))
+
+    @staticmethod
+    def _parse(source: str, parser, generic, *raw) -> pd.DataFrame:
+        """
+        V15: Source-specific fast path; generic cleaner only on schema drift
+        generic: zero-arg callable building the DataFrame _clean_data expects
+        """
+        try:
+            return parsers.to_shares(parser(*raw), source)
+        except parsers.SchemaDrift as e:
+            logger.warning(f"{source} schema drift ({e}), using generic cleaner")
+            return parsers.to_shares(DataFetcher._clean_data(generic()), source)
+
     @staticmethod
     def _clean_data(df: pd.DataFrame) -> pd.DataFrame:
         """Standardize column names and types (Universal Gatekeeper V9.1)"""
@@ -119,7 +325,7 @@ class DataFetcher:
             
             df.dropna(subset=['open', 'close'], inplace=True)
             
-            return df[list(required)]
+            return df[parsers.COLUMNS].reset_index(drop=True)  # V15: Stable column order
         except Exception as e:
             logger.warning(f"Data Cleaning Failed: {e}")
             return pd.DataFrame()
@@ -130,9 +336,120 @@ class DataFetcher:
         """Generic retry wrapper"""
         return func(*args, **kwargs)
 
+    TDX_SERVERS = [
+        ('119.147.212.81', 7709),
+        ('114.80.63.12', 7709),
+        ('218.75.126.9', 7709),
+    ]
+
+    @staticmethod
+    def rank_tdx_servers(timeout: float = 2.0) -> list:
+        """V15: TCP connect probe; fastest Pytdx server first, unreachable last"""
+        timings = []
+        for host, port in DataFetcher.TDX_SERVERS:
+            start = time.perf_counter()
+            try:
+                with socket.create_connection((host, port), timeout=timeout):
+                    timings.append((time.perf_counter() - start, host, port))
+            except OSError:
+                timings.append((float("inf"), host, port))
+        timings.sort(key=lambda x: x[0])
+        DataFetcher.TDX_SERVERS = [(host, port) for _, host, port in timings]
+        return [{"host": h, "latency_ms": None if t == float("inf") else round(t * 1000, 1)} for t, h, _ in timings]
+
+    # --- V15: History Cache (compact OHLCVSeries, LRU + TTL) ---
+    _history_lock = threading.Lock()
+    _history_cache = OrderedDict()  # (market, code) -> (OHLCVSeries, fetched_at)
+
     @staticmethod
-    def get_a_share_history(code: str):
-        time.sleep(random.uniform(0.5, 1.5)) 
+    def _normalize_code(code: str, market: str) -> str:
+        clean_code = str(code).strip().upper().replace("HK", "").replace("SH", "").replace("SZ", "")
+        if market == "HK" and clean_code.isdigit():
+            clean_code = f"{int(clean_code):05d}"
+        return clean_code
+
+    @staticmethod
+    def peek_history_series(code: str, market: str = "CN") -> OHLCVSeries:
+        """Bars already in the in-process cache, whatever their age (never calls upstream); None if absent"""
+        key = (market, DataFetcher._normalize_code(code, market))
+        with DataFetcher._history_lock:
+            hit = DataFetcher._history_cache.get(key)
+        return hit[0] if hit else None
+
+    @staticmethod
+    def get_history_series(code: str, market: str = "CN") -> OHLCVSeries:
+        """Cached daily bars as OHLCVSeries (empty series when every source fails)"""
+        key = (market, DataFetcher._normalize_code(code, market))
+        with DataFetcher._history_lock:
+            hit = DataFetcher._history_cache.get(key)
+            # V15: No new bar can exist before the next close - outside sessions the TTL stretches to it
+            if hit and time.time() - hit[1] <= trading_calendar.history_ttl(market, hit[1]):
+                DataFetcher._history_cache.move_to_end(key)
+                DataFetcher._last_source = hit[0].source
+                return hit[0]
+
+        def _fetch():
+            return DataFetcher.download_history(code, market)
+
+        # V15: Memory-mapped store (backfilled or written through) serves zero-copy views
+        store = get_store() if config.HISTORY_STORE else None
+        stored = store.info(key[1], market) if store else None
+        if stored and time.time() - stored[2] <= trading_calendar.history_ttl(market, stored[2]):
+            series = store.read(key[1], market)
+        else:
+            # V15: Shared tier first (other workers may already hold it); one worker fetches per key
+            series = get_or_compute(shared_cache, f"hist:{market}:{key[1]}",
+                                    trading_calendar.history_ttl(market, time.time()), _fetch,
+                                    encode=OHLCVSeries.to_bytes, decode=OHLCVSeries.from_bytes)
+            if store and series is not None and len(series):
+                try:
+                    # V15: Only new bars / factor rows land in the store (stored history never moves)
+                    store.update(series)
+                    series = store.read(key[1], market)
+                except OSError as e:
+                    logger.warning(f"History store write failed for {key[1]}: {e}")
+            elif stored:
+                series = store.read(key[1], market)  # Every source failed: stale bars beat none
+                logger.warning(f"Serving stored history for {key[1]} ({(time.time() - stored[2]) / 3600:.1f}h old)")
+        if series is None:
+            return OHLCVSeries.empty(key[1], market)
+        DataFetcher._last_source = series.source
+
+        with DataFetcher._history_lock:
+            DataFetcher._history_cache[key] = (series, time.time())
+            DataFetcher._history_cache.move_to_end(key)
+            while len(DataFetcher._history_cache) > config.HISTORY_CACHE_MAX:
+                DataFetcher._history_cache.popitem(last=False)
+        return series
+
+    @staticmethod
+    def download_history(code: str, market: str = "CN"):
+        """Uncached walk of the source chain -> OHLCVSeries (None when every source fails)"""
+        DataFetcher._local.provider = ""
+        if market == "HK":
+            df = DataFetcher._fetch_hk_share_history(code)
+        else:
+            df = DataFetcher._fetch_a_share_history(code)
+        if df.empty:
+            return None
+        # Thread-local provider: _last_source is shared and races under parallel downloads
+        source = DataFetcher._local.provider or DataFetcher._last_source
+        return OHLCVSeries.from_frame(df, code=DataFetcher._normalize_code(code, market), market=market,
+                                      source=source, price_dtype=np.dtype(config.PRICE_DTYPE))
+
+    @staticmethod
+    def get_a_share_history(code: str) -> pd.DataFrame:
+        series = DataFetcher.get_history_series(code, "CN")
+        return series.to_frame() if len(series) else pd.DataFrame()
+
+    @staticmethod
+    def get_hk_share_history(code: str) -> pd.DataFrame:
+        series = DataFetcher.get_history_series(code, "HK")
+        return series.to_frame() if len(series) else pd.DataFrame()
+
+    @staticmethod
+    def _fetch_a_share_history(code: str):
+        DataFetcher._polite_sleep()
         
         symbol = code.replace("sh", "").replace("sz", "")
         market_prefix = "sh" if code.startswith("6") else "sz"
@@ -140,27 +457,25 @@ class DataFetcher:
         # 0. efinance (Priority 0)
         if ef:
             try:
-                df = ef.stock.get_quote_history(symbol)
+                df = DataFetcher._source("efinance", symbol, ef.stock.get_quote_history, symbol)
                 if not df.empty and len(df) > 30:
                     DataFetcher._last_source = "efinance"
-                    return DataFetcher._clean_data(df)
+                    return DataFetcher._parse("efinance", parsers.parse_eastmoney, lambda: df, df)
             except Exception as e:
                 logger.warning(f"efinance failed: {e}")
 
         # 1. AkShare (EastMoney)
         try:
-             df = ak.stock_zh_a_hist(symbol=symbol, period="daily", adjust="qfq")
+             df = DataFetcher._source("AkShare", symbol, ak.stock_zh_a_hist, symbol=symbol, period="daily", adjust="qfq")
              if not df.empty and len(df) > 30:
-                 df.rename(columns={'日期': 'date', '开盘': 'open', '收盘': 'close', 
-                                    '最高': 'high', '最低': 'low', '成交量': 'volume'}, inplace=True)
                  DataFetcher._last_source = "AkShare"
-                 return DataFetcher._clean_data(df)
+                 return DataFetcher._parse("AkShare", parsers.parse_eastmoney, lambda: df, df)
         except Exception as e:
              logger.warning(f"AkShare failed: {e}")
              try:
                  time.sleep(1)
-                 df = ak.stock_zh_a_hist(symbol=symbol, period="daily", adjust="qfq")
-                 if not df.empty: return DataFetcher._clean_data(df)
+                 df = DataFetcher._source("AkShare", symbol, ak.stock_zh_a_hist, symbol=symbol, period="daily", adjust="qfq")
+                 if not df.empty: return DataFetcher._parse("AkShare", parsers.parse_eastmoney, lambda: df, df)
              except Exception:
                  pass
 
@@ -168,18 +483,13 @@ class DataFetcher:
         try:
             full_code = f"{market_prefix}{symbol}"
             url = f"https://web.ifzq.gtimg.cn/appstock/app/fqkline/get?param={full_code},day,,,320,qfq" 
-            r = requests.get(url, headers=get_headers(), timeout=8)
-            data = r.json()
+            data = DataFetcher._source("Tencent", full_code, _get_json, url)
             if data and 'data' in data and full_code in data['data']:
                 qt_data = data['data'][full_code]
-                if 'day' in qt_data:
-                    k_data = qt_data['day']
-                    df = pd.DataFrame(k_data)
-                    if df.shape[1] >= 6:
-                        df = df.iloc[:, :6]
-                        df.columns = ['date', 'open', 'close', 'high', 'low', 'volume']
-                        DataFetcher._last_source = "Tencent"
-                        return DataFetcher._clean_data(df)
+                if 'day' in qt_data and qt_data['day']:
+                    DataFetcher._last_source = "Tencent"
+                    return DataFetcher._parse("Tencent", parsers.parse_tencent,
+                                              lambda: _tencent_frame(qt_data['day']), qt_data['day'])
         except Exception as e:
             logger.warning(f"Tencent failed: {e}")
 
@@ -187,7 +497,7 @@ class DataFetcher:
         if qs:
             try:
                 logger.info(f"Attempting Qstock-THS (#3) Fallback...")
-                df = qs.get_data(code_list=[code], start='20240101', end=datetime.date.today().strftime('%Y%m%d'), freq='d')
+                df = DataFetcher._source("Qstock", code, qs.get_data, code_list=[code], start='20240101', end=datetime.date.today().strftime('%Y%m%d'), freq='d')
                 if not df.empty:
                     if 'date' not in df.columns and isinstance(df.index, pd.DatetimeIndex):
                         df.reset_index(inplace=True)
@@ -196,47 +506,28 @@ class DataFetcher:
                     df.rename(columns={'日期': 'date', '开盘': 'open', '收盘': 'close', 
                                        '最高': 'high', '最低': 'low', '成交量': 'volume', '成交': 'volume'}, inplace=True)
                     DataFetcher._last_source = "Qstock"
-                    return DataFetcher._clean_data(df[['date', 'open', 'close', 'high', 'low', 'volume']])
+                    return parsers.to_shares(DataFetcher._clean_data(df[['date', 'open', 'close', 'high', 'low', 'volume']]),
+                                             "Qstock")
             except Exception as e:
                 logger.warning(f"Qstock failed: {e}")
 
-        # 4. Pytdx (TCP) - Multi-Server Failover
-
-        TDX_SERVERS = [
-
-            ('119.147.212.81', 7709),
+        # 4. Pytdx (TCP) - Multi-Server Failover (V15: ordered by warmup latency probe)
 
-            ('114.80.63.12', 7709),
-
-            ('218.75.126.9', 7709),
-
-        ]
-
-        for tdx_host, tdx_port in TDX_SERVERS:
+        for tdx_host, tdx_port in list(DataFetcher.TDX_SERVERS):
 
             try:
 
-                from pytdx.hq import TdxHq_API
-
-                local_tdx = TdxHq_API()
-
                 logger.info(f"Attempting Pytdx (#4 TCP) {tdx_host}...")
 
-                with local_tdx.connect(tdx_host, tdx_port):
-
-                    market_code = 1 if code.startswith("6") else 0
-
-                    data = local_tdx.get_security_bars(9, market_code, symbol, 0, 100)
+                market_code = 1 if code.startswith("6") else 0
 
-                    if data:
+                data = DataFetcher._source(f"Pytdx({tdx_host})", symbol, _tdx_bars, tdx_host, tdx_port, 9, market_code, symbol, 0, 100)
 
-                        df = local_tdx.to_df(data)
+                if data:
 
-                        df.rename(columns={'datetime': 'date', 'vol': 'volume'}, inplace=True)
+                    DataFetcher._last_source = f"Pytdx({tdx_host})"
 
-                        DataFetcher._last_source = f"Pytdx({tdx_host})"
-
-                        return DataFetcher._clean_data(df[['date', 'open', 'close', 'high', 'low', 'volume']])
+                    return DataFetcher._parse("Pytdx", parsers.parse_pytdx, lambda: _tdx_frame(data), data)
 
             except Exception as e:
 
@@ -248,27 +539,12 @@ class DataFetcher:
         # 5. Baostock (Official)
         if bs:
             try:
-                global _bs_logged_in
-                if not _bs_logged_in:
-                    bs.login()
-                    _bs_logged_in = True
-                rs = bs.query_history_k_data_plus(f"{market_prefix}.{symbol}",
-                    "date,open,high,low,close,volume",
-                    start_date=(datetime.date.today() - datetime.timedelta(days=365)).strftime('%Y-%m-%d'), 
-                    end_date=datetime.date.today().strftime('%Y-%m-%d'),
-                    frequency="d", adjustflag="1")
-                
-                data_list = []
-                while (rs.error_code == '0') & rs.next():
-                    data_list.append(rs.get_row_data())
-                
-                bs.logout()
-                _bs_logged_in = False  # V14: Reset login flag after logout
+                fields, data_list = DataFetcher._source("Baostock", f"{market_prefix}.{symbol}", _bs_history, f"{market_prefix}.{symbol}")
                 
                 if data_list:
-                    df = pd.DataFrame(data_list, columns=rs.fields)
                     DataFetcher._last_source = "Baostock"
-                    return DataFetcher._clean_data(df)
+                    return DataFetcher._parse("Baostock", parsers.parse_baostock,
+                                              lambda: pd.DataFrame(data_list, columns=fields), fields, data_list)
             except Exception as e:
                 logger.error(f"Baostock failed: {e}")
 
@@ -276,10 +552,10 @@ class DataFetcher:
         try:
             logger.info(f"Attempting Sina (#6) Fallback...")
             sina_symbol = f"{market_prefix}{symbol}"
-            df = ak.stock_zh_a_daily(symbol=sina_symbol, adjust="qfq")
+            df = DataFetcher._source("Sina", sina_symbol, ak.stock_zh_a_daily, symbol=sina_symbol, adjust="qfq")
             if not df.empty:
                 DataFetcher._last_source = "Sina"
-                return DataFetcher._clean_data(df)
+                return DataFetcher._parse("Sina", parsers.parse_english, lambda: df, df)
         except Exception as e:
             logger.error(f"Sina failed: {e}")
 
@@ -289,16 +565,11 @@ class DataFetcher:
                 logger.info(f"Attempting Yahoo (#7) Fallback...")
                 suffix = ".SS" if code.startswith("6") else ".SZ"
                 y_symbol = f"{symbol}{suffix}"
-                ticker = yf.Ticker(y_symbol)
-                df = ticker.history(period="1y")
+                df = DataFetcher._source("Yahoo", y_symbol, _yf_history, y_symbol, "1y")
                 
                 if not df.empty:
-                    df.reset_index(inplace=True)
-                    df.rename(columns={'Date': 'date', 'Open': 'open', 'Close': 'close', 
-                                       'High': 'high', 'Low': 'low', 'Volume': 'volume'}, inplace=True)
-                    df['date'] = df['date'].dt.tz_localize(None)
                     DataFetcher._last_source = "Yahoo"
-                    return DataFetcher._clean_data(df)
+                    return DataFetcher._parse("Yahoo", parsers.parse_yahoo, lambda: _yahoo_frame(df), df)
             except Exception as e:
                 logger.warning(f"Yahoo failed: {e}")
 
@@ -306,9 +577,9 @@ class DataFetcher:
 
 
     @staticmethod
-    def get_hk_share_history(code: str):
+    def _fetch_hk_share_history(code: str):
         try:
-            time.sleep(random.uniform(0.5, 1.5)) 
+            DataFetcher._polite_sleep()
             clean_code = str(code).strip().upper().replace("HK", "")
             if not clean_code.isdigit():
                  return pd.DataFrame()
@@ -318,12 +589,10 @@ class DataFetcher:
             # 1. Try AkShare (Eastmoney)
             try:
                 logger.info(f"Attempting AkShare HK (#1) for {code}...")
-                df = ak.stock_hk_daily(symbol=symbol, adjust="qfq")
+                df = DataFetcher._source("AkShare-HK", symbol, ak.stock_hk_daily, symbol=symbol, adjust="qfq")
                 if not df.empty:
-                    df.rename(columns={'日期': 'date', '开盘': 'open', '收盘': 'close', 
-                                       '最高': 'high', '最低': 'low', '成交量': 'volume'}, inplace=True)
                     DataFetcher._last_source = "AkShare-HK"
-                    return DataFetcher._clean_data(df)
+                    return DataFetcher._parse("AkShare-HK", parsers.parse_english, lambda: df, df)
             except Exception as e:
                 logger.warning(f"AkShare HK failed for {code}: {e}")
 
@@ -332,18 +601,13 @@ class DataFetcher:
                 logger.info(f"Attempting Tencent HK (#2) for {code}...")
                 tencent_code = f"hk{symbol}"
                 url = f"https://web.ifzq.gtimg.cn/appstock/app/fqkline/get?param={tencent_code},day,,,320,qfq"  # V14: HTTPS 
-                r = requests.get(url, headers=get_headers(), timeout=8)
-                data = r.json()
+                data = DataFetcher._source("Tencent-HK", tencent_code, _get_json, url)
                 if data and 'data' in data and tencent_code in data['data']:
                     qt_data = data['data'][tencent_code]
-                    if 'day' in qt_data:
-                        k_data = qt_data['day']
-                        df = pd.DataFrame(k_data)
-                        if df.shape[1] >= 6:
-                            df = df.iloc[:, :6]
-                            df.columns = ['date', 'open', 'close', 'high', 'low', 'volume']
-                            DataFetcher._last_source = "Tencent-HK"
-                            return DataFetcher._clean_data(df)
+                    if 'day' in qt_data and qt_data['day']:
+                        DataFetcher._last_source = "Tencent-HK"
+                        return DataFetcher._parse("Tencent-HK", parsers.parse_tencent,
+                                                  lambda: _tencent_frame(qt_data['day']), qt_data['day'])
             except Exception as e:
                 logger.warning(f"Tencent HK failed: {e}")
 
@@ -352,15 +616,10 @@ class DataFetcher:
                 try:
                     logger.info(f"Attempting Yahoo HK (#3) for {code}...")
                     y_symbol = f"{symbol}.HK"
-                    ticker = yf.Ticker(y_symbol)
-                    df = ticker.history(period="1y")
+                    df = DataFetcher._source("Yahoo-HK", y_symbol, _yf_history, y_symbol, "1y")
                     if not df.empty:
-                        df.reset_index(inplace=True)
-                        df.rename(columns={'Date': 'date', 'Open': 'open', 'Close': 'close', 
-                                           'High': 'high', 'Low': 'low', 'Volume': 'volume'}, inplace=True)
-                        df['date'] = df['date'].dt.tz_localize(None)
                         DataFetcher._last_source = "Yahoo-HK"
-                        return DataFetcher._clean_data(df)
+                        return DataFetcher._parse("Yahoo-HK", parsers.parse_yahoo, lambda: _yahoo_frame(df), df)
                 except Exception as e:
                     logger.warning(f"Yahoo HK failed: {e}")
 
@@ -369,6 +628,40 @@ class DataFetcher:
             logger.error(f"Critical HK Fetch Error: {e}")
             return pd.DataFrame()
 
+    # --- V15: Intraday minute bars (Tencent mkline, Pytdx fallback for CN) ---
+    TDX_MINUTE_CATEGORY = {1: 8, 5: 0}  # get_security_bars: 8 = 1-minute, 0 = 5-minute
+
+    @staticmethod
+    def get_minute_bars(code: str, market: str = "CN", period: int = 1, count: int = 320):
+        """Latest `count` 1-/5-minute bars as parsers.MinuteBars (None when every source fails)"""
+        clean_code = DataFetcher._normalize_code(code, market)
+        symbol = DataFetcher._tencent_symbol(clean_code, market)
+        key = f"m{period}"
+        try:
+            url = f"https://ifzq.gtimg.cn/appstock/app/kline/mkline?param={symbol},{key},,{count}"
+            data = DataFetcher._source("Tencent-Minute", symbol, _get_json, url)
+            rows = data.get("data", {}).get(symbol, {}).get(key) if isinstance(data, dict) else None
+            if rows:
+                bars = parsers.parse_tencent_minutes(rows)
+                # Same units as the daily bars they are folded into: CN minutes count lots
+                return bars._replace(volume=bars.volume * parsers.LOT_SHARES) if market == "CN" else bars
+        except Exception as e:
+            logger.warning(f"Tencent minute bars failed for {symbol}: {e}")
+
+        if market != "CN":
+            return None
+        for tdx_host, tdx_port in list(DataFetcher.TDX_SERVERS)[:2]:
+            try:
+                market_code = 1 if clean_code.startswith(("5", "6", "9")) else 0
+                rows = DataFetcher._source(f"Pytdx({tdx_host})", f"{clean_code}@{key}", _tdx_bars, tdx_host, tdx_port,
+                                           DataFetcher.TDX_MINUTE_CATEGORY[period], market_code, clean_code, 0, count)
+                if rows:
+                    bars = parsers.parse_pytdx_minutes(rows)
+                    return bars._replace(volume=bars.volume * parsers.LOT_SHARES)
+            except Exception as e:
+                logger.warning(f"Pytdx minute bars failed on {tdx_host}: {e}")
+        return None
+
     # --- V10.0 Real-time Spot Cache ---
     _spot_lock = threading.Lock()  # V13: Thread-safe cache
     _spot_cache = {
@@ -377,143 +670,252 @@ class DataFetcher:
     }
     _last_source = "AkShare"  # V13: Track last successful data source
 
-    @staticmethod
-    def get_realtime_price(code: str, market: str = "CN") -> float:
-        """
-        V10.0: Get real-time spot price efficiently with caching (TTL 30s)
-        """
-        try:
-            now = time.time()
-            cache = DataFetcher._spot_cache[market]
-            
-            # V13: Thread-safe cache refresh (double-checked locking)
-
-            if cache["data"].empty or (now - cache["time"] > 30):
-
-                with DataFetcher._spot_lock:
-
-                    cache = DataFetcher._spot_cache[market]
-
-                    if cache["data"].empty or (now - cache["time"] > 30):
-
-                        if market == "HK":
+    # --- V15: Batched quote cache (only the symbols we hold) ---
+    _quote_lock = threading.Lock()
+    _quote_cache = OrderedDict()  # (market, code) -> (price, fetched_at), LRU capped at HISTORY_CACHE_MAX
+    SPOT_TTL = 30
 
-                             df = ak.stock_hk_spot_em()
-
-                        else:
+    @staticmethod
+    def _spot_fresh(market: str, now: float) -> bool:
+        cache = DataFetcher._spot_cache[market]
+        # V15: Outside sessions the snapshot cannot move - idle until the next open
+        return not cache["data"].empty and \
+            now - cache["time"] <= trading_calendar.quote_ttl(market, cache["time"], DataFetcher.SPOT_TTL)
 
-                             df = ak.stock_zh_a_spot_em()
+    @staticmethod
+    def _refresh_spot(market: str):
+        """Full spot dump (thousands of rows) - only when cheaper than targeted quotes"""
+        now = time.time()
+        # V13: Thread-safe cache refresh (double-checked locking)
+        if DataFetcher._spot_fresh(market, now):
+            return
+        with DataFetcher._spot_lock:
+            if DataFetcher._spot_fresh(market, now):
+                return
+
+            def _fetch():
+                if market == "HK":
+                    df = DataFetcher._source("AkShare-Spot", "HK", ak.stock_hk_spot_em)
+                else:
+                    df = DataFetcher._source("AkShare-Spot", "CN", ak.stock_zh_a_spot_em)
+                if df.empty or '代码' not in df.columns or '最新价' not in df.columns:
+                    return None
+                df['代码'] = df['代码'].astype(str)
+                if market == "HK":
+                    df['代码'] = df['代码'].apply(lambda x: f"{int(x):05d}" if x.isdigit() else x)
+                # V15: Keep only the columns lookups use (smaller cache + shared payload)
+                return df.set_index('代码')[[c for c in SPOT_COLUMNS if c in df.columns]]
+
+            # V15: One worker downloads the dump, the others read the shared snapshot
+            df = get_or_compute(shared_cache, f"spot:{market}",
+                                trading_calendar.quote_ttl(market, now, DataFetcher.SPOT_TTL), _fetch,
+                                encode=encode_frame, decode=decode_frame)
+            if df is not None:
+                cache = DataFetcher._spot_cache[market]
+                cache["data"] = df
+                cache["time"] = now
 
-                        
+    @staticmethod
+    def _spot_lookup(clean_code: str, market: str):
+        df = DataFetcher._spot_cache[market]["data"]
+        if clean_code in df.index:
+            price = df.loc[clean_code]['最新价']
+            return float(price) if price and not pd.isna(price) else 0.0
+        return None
 
-                        if not df.empty:
+    @staticmethod
+    def _use_batched_quotes(count: int, market: str) -> bool:
+        """Targeted quotes while the watchlist is small relative to the market"""
+        universe = security_master.count(market) or (2600 if market == "HK" else 5400)
+        return count <= config.BATCH_QUOTE_RATIO * universe
 
-                            if '代码' in df.columns and '最新价' in df.columns:
+    @staticmethod
+    def _tencent_symbol(clean_code: str, market: str) -> str:
+        if market == "HK":
+            return f"hk{clean_code}"
+        if clean_code.startswith(("4", "8", "92")):
+            return f"bj{clean_code}"
+        return f"sh{clean_code}" if clean_code.startswith(("5", "6", "9")) else f"sz{clean_code}"
 
-                                 df['代码'] = df['代码'].astype(str)
+    @staticmethod
+    def _tencent_quotes(clean_codes: list, market: str) -> dict:
+        """qt.gtimg.cn multi-symbol quotes, chunked to stay under the URL length limit"""
+        base = "https://qt.gtimg.cn/q="
+        by_symbol = {DataFetcher._tencent_symbol(c, market): c for c in clean_codes}
+        chunks, chunk = [], []
+        for sym in by_symbol:
+            if chunk and len(base) + len(",".join(chunk + [sym])) > config.QUOTE_URL_MAX:
+                chunks.append(chunk)
+                chunk = []
+            chunk.append(sym)
+        if chunk:
+            chunks.append(chunk)
+
+        prices = {}
+        for chunk in chunks:
+            try:
+                text = DataFetcher._source("Tencent-Quote", ",".join(chunk), _get_text, base + ",".join(chunk))
+                prices.update({by_symbol[sym]: px for sym, px in _parse_tencent_quotes(text).items()
+                               if sym in by_symbol})
+            except Exception as e:
+                logger.warning(f"Tencent batch quote failed ({len(chunk)} symbols): {e}")
+        return prices
 
-                                 if market == "HK":
+    @staticmethod
+    def _yahoo_quotes(clean_codes: list, market: str) -> dict:
+        if not yf or not clean_codes:
+            return {}
+        by_ticker = {_yf_symbol(c, market): c for c in clean_codes}
+        try:
+            closes = DataFetcher._source("Yahoo-Quote", ",".join(by_ticker), _yf_download_close, list(by_ticker))
+            return {by_ticker[t]: px for t, px in closes.items() if t in by_ticker and px > 0}
+        except Exception as e:
+            logger.warning(f"YFinance batch quote failed ({len(by_ticker)} symbols): {e}")
+            return {}
 
-                                     df['代码'] = df['代码'].apply(lambda x: f"{int(x):05d}" if x.isdigit() else x)
+    @staticmethod
+    def get_realtime_prices(codes: list, market: str = "CN") -> dict:
+        """
+        V15: Realtime prices for many symbols -> {clean_code: price} (0.0 = unavailable)
+        Fresh spot snapshot > quote cache > Tencent batch > Yahoo batch > full spot dump > Yahoo single
+        """
+        now = time.time()
+        result, missing = {}, []
+        spot_fresh = DataFetcher._spot_fresh(market, now)
+        for code in codes:
+            clean_code = DataFetcher._normalize_code(code, market)
+            price = DataFetcher._spot_lookup(clean_code, market) if spot_fresh else None
+            if price is None:
+                key = (market, clean_code)
+                with DataFetcher._quote_lock:
+                    hit = DataFetcher._quote_cache.get(key)
+                    if hit and now - hit[1] <= trading_calendar.quote_ttl(market, hit[1], DataFetcher.SPOT_TTL):
+                        DataFetcher._quote_cache.move_to_end(key)
+                        price = hit[0]
+            if price is None:
+                missing.append(clean_code)
+            else:
+                result[clean_code] = price
+        missing = list(dict.fromkeys(missing))
+        if not missing:
+            return result
+
+        if DataFetcher._use_batched_quotes(len(missing), market):
+            fetched = DataFetcher._tencent_quotes(missing, market)
+            fetched.update(DataFetcher._yahoo_quotes([c for c in missing if c not in fetched], market))
+            with DataFetcher._quote_lock:
+                for clean_code, price in fetched.items():
+                    DataFetcher._quote_cache[(market, clean_code)] = (price, now)
+                    DataFetcher._quote_cache.move_to_end((market, clean_code))
+                while len(DataFetcher._quote_cache) > config.HISTORY_CACHE_MAX:
+                    DataFetcher._quote_cache.popitem(last=False)
+            result.update(fetched)
+            missing = [c for c in missing if c not in fetched]
+
+        if missing:
+            try:
+                DataFetcher._refresh_spot(market)
+                for clean_code in missing:
+                    price = DataFetcher._spot_lookup(clean_code, market)
+                    if price is not None:
+                        result[clean_code] = price
+            except Exception as e:
+                logger.warning(f"AkShare Spot fetch failed for {len(missing)} codes: {e}")
 
-                                 cache["data"] = df.set_index('代码')
+        # --- V12: Yahoo Finance Fallback (HK + CN) ---
+        for clean_code in missing:
+            if clean_code in result:
+                continue
+            result[clean_code] = 0.0
+            if yf:
+                try:
+                    yf_code = _yf_symbol(clean_code, market)
+                    price = DataFetcher._source("Yahoo-Spot", yf_code, _yf_last_price, yf_code)
+                    if price and price > 0: result[clean_code] = float(price)
+                except Exception as e:
+                    logger.warning(f"YFinance fallback failed for {clean_code}: {e}")
+        return result
 
-                                 cache["time"] = now
+    @staticmethod
+    def get_realtime_price(code: str, market: str = "CN") -> float:
+        """
+        V10.0: Get real-time spot price efficiently with caching (TTL 30s)
+        V15: Single-symbol case of get_realtime_prices (no full spot dump for one price)
+        """
+        clean_code = DataFetcher._normalize_code(code, market)
+        return DataFetcher.get_realtime_prices([code], market).get(clean_code, 0.0)
 
-            
-            # Lookup
-            df = cache["data"]
-            clean_code = str(code).strip().upper().replace("HK","").replace("SH","").replace("SZ","")
-            if market == "HK":
-                 clean_code = f"{int(clean_code):05d}" if clean_code.isdigit() else clean_code
-            
-            if clean_code in df.index:
-                price = df.loc[clean_code]['最新价']
-                return float(price) if price else 0.0
-                
+    @staticmethod
+    def refresh_security_master():
+        """
+        V15: Rebuild the security master (CN stocks + CN ETFs + HK) in one pass.
+        A failed segment keeps its previous rows.
+        """
+        segments = {}
+        try:
+            df = DataFetcher._source("AkShare-Names", "CN", ak.stock_info_a_code_name)
+            df.columns = [str(c).strip().lower() for c in df.columns]
+            code_col = 'code' if 'code' in df.columns else df.columns[0]
+            name_col = 'name' if 'name' in df.columns else df.columns[1]
+            segments[("CN", "stock")] = [classify(c, "CN", str(n)) for c, n in
+                                         zip(df[code_col].astype(str).str.strip(), df[name_col])]
         except Exception as e:
-            logger.warning(f"AkShare Spot fetch failed for {code}: {e}")
-        
-        # --- V12: Yahoo Finance Fallback (HK + CN) ---
-        if yf:
-            try:
-                clean_code = str(code).strip()
-                if market == "HK":
-                    yf_code = f"{int(clean_code):04d}.HK" if clean_code.isdigit() else clean_code
-                elif market == "CN":
-                    if clean_code.startswith("6"): yf_code = f"{clean_code}.SS"
-                    elif clean_code.startswith(("0", "3")): yf_code = f"{clean_code}.SZ"
-                    else: yf_code = f"{clean_code}.SS"
-                else:
-                    yf_code = clean_code
-                
-                ticker = yf.Ticker(yf_code)
-                try:
-                    price = ticker.fast_info['last_price']
-                    if price and price > 0: return float(price)
-                except:
-                    hist = ticker.history(period="1d")
-                    if not hist.empty:
-                        return float(hist['Close'].iloc[-1])
-            except Exception as e:
-                logger.warning(f"YFinance fallback failed for {code}: {e}")
+            logger.warning(f"Security master CN names failed: {e}")
+        try:
+            df = DataFetcher._source("AkShare-ETF", "CN", ak.fund_etf_spot_em)
+            segments[("CN", "etf")] = [classify(c, "CN", str(n), is_etf=True) for c, n in
+                                       zip(df['代码'].astype(str), df['名称'])]
+        except Exception as e:
+            logger.warning(f"Security master CN ETFs failed: {e}")
+        try:
+            df = DataFetcher._source("AkShare-Spot", "HK", ak.stock_hk_spot_em)
+            # Board lot only when the feed carries it; otherwise unknown (0), never a guessed 100
+            lot_col = next((c for c in ('每手股数', '每手') if c in df.columns), None)
+            lots = pd.to_numeric(df[lot_col], errors='coerce').fillna(0).astype(int) if lot_col else [0] * len(df)
+            segments[("HK", None)] = [classify(c, "HK", str(n), lot_size=lot) for c, n, lot in
+                                      zip(df['代码'].astype(str), df['名称'], lots)]
+        except Exception as e:
+            logger.warning(f"Security master HK list failed: {e}")
+
+        if not segments:
+            raise RuntimeError("All security master sources failed")
+
+        securities = []
+        for (market, kind), rows in segments.items():
+            securities.extend(rows)
+        # Carry over segments that failed this time
+        for sec in security_master.securities():
+            kind = None if sec.market == "HK" else sec.instrument_type
+            if (sec.market, kind) not in segments:
+                securities.append(sec)
+        # ETF list wins over the name list for codes present in both
+        securities.sort(key=lambda x: x.instrument_type == "etf")
+        security_master.replace(securities)
+        logger.info(f"Security master refreshed: {len(security_master)} securities")
 
-        return 0.0
+    @staticmethod
+    def refresh_trading_calendar():
+        """
+        V15: Replace CN calendar years from the exchange trade-date list (Sina via AkShare).
+        HK has no upstream list here - it keeps the seeded holidays.
+        """
+        df = DataFetcher._source("AkShare-Calendar", "CN", ak.tool_trade_date_hist_sina)
+        trade_days = set(pd.to_datetime(df['trade_date']).dt.date)
+        this_year = datetime.date.today().year
+        years = sorted({d.year for d in trade_days if d.year >= this_year - 1})
+        if not years:
+            raise RuntimeError("Trade date list has no current years")
+        holidays = [d.date() for d in pd.bdate_range(f"{years[0]}-01-01", f"{years[-1]}-12-31")
+                    if d.date() not in trade_days]
+        trading_calendar.replace_years("CN", years, holidays)
+        logger.info(f"Trading calendar refreshed: CN {years[0]}-{years[-1]}, {len(holidays)} weekday closures")
+        return years
 
     @staticmethod
     def get_stock_name(code: str, market: str = "CN") -> str:
         """
         V10.0: Get stock name from cached spot data
-        Same cache as get_realtime_price (TTL 30s works for names too)
+        V15: Security master only (O(1), no network on the request path); the code itself on a miss
         """
-        try:
-            DataFetcher.get_realtime_price(code, market) # Trigger cache refresh
-            cache = DataFetcher._spot_cache[market]["data"]
-            
-            clean_code = str(code).strip().upper().replace("HK","").replace("SH","").replace("SZ","")
-            if market == "HK":
-                 clean_code = f"{int(clean_code):05d}" if clean_code.isdigit() else clean_code
-            
-            if clean_code in cache.index:
-                return str(cache.loc[clean_code]['名称'])
-                
-        except Exception:
-            pass
-        
-        # --- V12: AkShare Lightweight Name Lookup (Chinese names) ---
-        if market == "CN":
-            try:
-                clean_code = str(code).strip().upper().replace("SH","").replace("SZ","")
-                name_df = ak.stock_info_a_code_name()
-                if not name_df.empty:
-                    # Normalize column names
-                    name_df.columns = [str(c).strip().lower() for c in name_df.columns]
-                    code_col = 'code' if 'code' in name_df.columns else name_df.columns[0]
-                    name_col = 'name' if 'name' in name_df.columns else name_df.columns[1]
-                    name_df[code_col] = name_df[code_col].astype(str).str.strip()
-                    match = name_df[name_df[code_col] == clean_code]
-                    if not match.empty:
-                        return str(match.iloc[0][name_col])
-            except Exception as e:
-                logger.warning(f"AkShare name lookup failed: {e}")
-        
-        # --- V10.2 YFinance Name Fallback (Last Resort) ---
-        if yf:
-            try:
-                clean_code = str(code).strip()
-                yf_code = code
-                
-                if market == "HK":
-                    yf_code = f"{int(clean_code):04d}.HK" if clean_code.isdigit() else clean_code
-                elif market == "CN":
-                     if clean_code.startswith("6"): yf_code = f"{clean_code}.SS"
-                     elif clean_code.startswith(("0", "3")): yf_code = f"{clean_code}.SZ"
-                     elif clean_code.startswith(("4", "8")): yf_code = f"{clean_code}.BJ"
-
-                ticker = yf.Ticker(yf_code)
-                name = ticker.info.get('shortName') or ticker.info.get('longName')
-                if name: return name
-            except:
-                pass
-
-        return code
+        sec = security_master.get(code, market)
+        return sec.name if sec and sec.name != sec.code else code
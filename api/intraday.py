@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Intraday Minute Bars
+1-/5-minute bars kept in a fixed-size ring per symbol. Completed minutes are
+folded into today's partial daily bar as they arrive, so re-evaluating a
+position intraday costs one small upstream pull plus O(1) aggregation instead
+of a full history refetch.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from . import config
+from .fetcher import DataFetcher
+from .ohlcv import OHLCVSeries
+from .parsers import MinuteBars, UTC_OFFSET
+from .trading_calendar import trading_calendar
+
+logger = logging.getLogger(__name__)
+
+PULL_MAX = 320  # Bars requested when a ring is empty (~ one CN session of 1-minute bars + margin)
+
+
+def local_day(ts) -> int:
+    """Epoch seconds -> exchange-local day index (days since 1970-01-01, as OHLCVSeries.days)"""
+    return (np.asarray(ts, dtype=np.int64) + UTC_OFFSET) // 86400
+
+
+class MinuteRing:
+    """Fixed-capacity ring of minute bars plus the running aggregate of today's completed bars"""
+
+    def __init__(self, capacity: int = None):
+        self.capacity = capacity or config.INTRADAY_RING
+        self._cols = [np.empty(self.capacity, dtype=np.int64)] + \
+                     [np.empty(self.capacity, dtype=np.float64) for _ in range(5)]
+        self._start = 0
+        self._len = 0
+        self._closed = None   # [day, open, high, low, volume] over completed bars of `day`
+        self._forming = None  # Last bar as a tuple; may still be revised upstream
+        self.updated_at = 0.0
+
+    def __len__(self) -> int:
+        return self._len
+
+    @property
+    def last_ts(self) -> int:
+        return self._forming[0] if self._forming else 0
+
+    def bars(self) -> MinuteBars:
+        idx = (self._start + np.arange(self._len)) % self.capacity
+        return MinuteBars(*(c[idx] for c in self._cols))
+
+    def extend(self, bars: MinuteBars) -> int:
+        """Append bars newer than the ring; a repeated last minute replaces the forming bar. Returns bars added"""
+        cols = list(bars)
+        if self._len:
+            keep = cols[0] >= self.last_ts
+            cols = [c[keep] for c in cols]
+        if not len(cols[0]):
+            return 0
+        if self._len and cols[0][0] == self.last_ts:
+            last = (self._start + self._len - 1) % self.capacity
+            for dst, src in zip(self._cols, cols):
+                dst[last] = src[0]
+            self._forming = tuple(c[0] for c in cols)
+            cols = [c[1:] for c in cols]
+            if not len(cols[0]):
+                return 0
+        # Everything before the newest bar is final now, including the previous forming one
+        if self._forming:
+            self._fold([np.array([v]) for v in self._forming])
+        if len(cols[0]) > 1:
+            self._fold([c[:-1] for c in cols])
+        self._forming = tuple(c[-1] for c in cols)
+        self._append(cols)
+        return len(cols[0])
+
+    def _append(self, cols: list):
+        k = len(cols[0])
+        if k >= self.capacity:
+            for dst, src in zip(self._cols, cols):
+                dst[:] = src[-self.capacity:]
+            self._start, self._len = 0, self.capacity
+            return
+        pos = (self._start + self._len + np.arange(k)) % self.capacity
+        for dst, src in zip(self._cols, cols):
+            dst[pos] = src
+        overflow = max(self._len + k - self.capacity, 0)
+        self._start = (self._start + overflow) % self.capacity
+        self._len = min(self._len + k, self.capacity)
+
+    def _fold(self, cols: list):
+        ts, o, h, l, _, v = cols
+        days = local_day(ts)
+        day = int(days[-1])
+        today = days == day
+        if self._closed is None or self._closed[0] != day:
+            self._closed = [day, float(o[today][0]), float(h[today].max()), float(l[today].min()),
+                            float(v[today].sum())]
+        else:
+            c = self._closed
+            c[2] = max(c[2], float(h[today].max()))
+            c[3] = min(c[3], float(l[today].min()))
+            c[4] += float(v[today].sum())
+
+    def partial_day(self) -> dict:
+        """Today's bar so far (day of the newest minute), or None when the ring is empty"""
+        if not self._forming:
+            return None
+        ts, o, h, l, c, v = self._forming
+        day = int(local_day(ts))
+        bar = {"day": day, "open": float(o), "high": float(h), "low": float(l), "close": float(c),
+               "volume": float(v), "last_ts": int(ts)}
+        closed = self._closed
+        if closed and closed[0] == day:
+            bar.update(open=closed[1], high=max(closed[2], bar["high"]), low=min(closed[3], bar["low"]),
+                       volume=closed[4] + bar["volume"])
+        return bar
+
+
+    def low_since(self, since: float, period: int = 60) -> float:
+        """Lowest low of today's bars that started at or after `since` (ts = bar end); None if none did"""
+        if not self._forming:
+            return None
+        bars = self.bars()
+        keep = (bars.ts - period >= since) & (local_day(bars.ts) == local_day(self.last_ts))
+        return float(bars.low[keep].min()) if keep.any() else None
+
+
+class IntradayFeed:
+    """(market, code) -> MinuteRing, refreshed at most every INTRADAY_TTL seconds in session"""
+
+    def __init__(self, period: int = None, capacity: int = None, max_symbols: int = None):
+        self.period = period or config.INTRADAY_PERIOD
+        if self.period not in DataFetcher.TDX_MINUTE_CATEGORY:
+            raise ValueError(f"Unsupported intraday period {self.period} (1 / 5)")
+        self.capacity = capacity or config.INTRADAY_RING
+        self.max_symbols = max_symbols or config.INTRADAY_MAX_SYMBOLS
+        self._lock = threading.Lock()
+        self._rings = OrderedDict()
+        self.pulls = 0
+        self.bars_added = 0
+        self.failures = 0
+
+    def ring(self, code: str, market: str = "CN", refresh: bool = True) -> MinuteRing:
+        key = (market, code)
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is None:
+                ring = self._rings[key] = MinuteRing(self.capacity)
+            self._rings.move_to_end(key)
+            while len(self._rings) > self.max_symbols:
+                self._rings.popitem(last=False)
+        if refresh:
+            self._refresh(ring, code, market)
+        return ring
+
+    def _refresh(self, ring: MinuteRing, code: str, market: str):
+        now = time.time()
+        if ring.updated_at and now - ring.updated_at < trading_calendar.quote_ttl(
+                market, ring.updated_at, config.INTRADAY_TTL):
+            return
+        # Only ask for the minutes missed since the newest bar (plus the forming one)
+        count = PULL_MAX
+        if len(ring):
+            count = int(min(max((now - ring.last_ts) // (60 * self.period) + 2, 2), PULL_MAX))
+        self.pulls += 1
+        bars = DataFetcher.get_minute_bars(code, market, self.period, count)
+        with self._lock:
+            if bars is None:
+                self.failures += 1
+            else:
+                self.bars_added += ring.extend(bars)
+            ring.updated_at = now
+
+    def partial_bar(self, code: str, market: str = "CN") -> dict:
+        """Today's partial daily bar from minute data; None before the first bar or on a non-trading day"""
+        bar = self.ring(code, market).partial_day()
+        if not bar or bar["day"] != int(local_day(time.time())):
+            return None
+        return bar
+
+    def session_low(self, code: str, market: str = "CN", since: float = 0) -> float:
+        """Today's low over the minutes since `since` (e.g. when a stop was last moved)"""
+        bar = self.partial_bar(code, market)
+        if bar is None:
+            return None
+        return self.ring(code, market, refresh=False).low_since(since, 60 * self.period)
+
+    def live_series(self, code: str, market: str = "CN") -> OHLCVSeries:
+        """Daily history with today's partial bar appended (or replacing today's provisional bar)"""
+        daily = DataFetcher.get_history_series(code, market)
+        bar = self.partial_bar(code, market)
+        if bar is None:
+            return daily
+        n = len(daily)
+        if n and int(daily.days[-1]) > bar["day"]:
+            return daily
+        keep = n - 1 if n and int(daily.days[-1]) == bar["day"] else n
+        row = (bar["day"], bar["open"], bar["high"], bar["low"], bar["close"], bar["volume"])
+        return OHLCVSeries.wrap(*(np.append(getattr(daily, f)[:keep], v).astype(getattr(daily, f).dtype)
+                                  for f, v in zip(OHLCVSeries.FIELDS, row)),
+                                code=code, market=market, source=daily.source)
+
+    def clear(self):
+        with self._lock:
+            self._rings.clear()
+
+    def stats(self) -> dict:
+        return {"symbols": len(self._rings), "period": self.period, "pulls": self.pulls,
+                "bars_added": self.bars_added, "failures": self.failures}
+
+
+intraday_feed = IntradayFeed()
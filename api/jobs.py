@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Batch Job Manager
+Long-running scans/backfills run on an in-process worker pool; status, progress
+and partial results live in a SQLite job table so any uvicorn worker can answer
+GET /jobs/{id} and a cancel request reaches the worker that owns the job.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+# kind -> handler(ctx: JobContext, params: dict) -> summary dict
+JOB_KINDS = {}
+
+
+def job_kind(name: str):
+    """Decorator registering a job handler (endpoints module declares the kinds)"""
+    def _register(handler):
+        JOB_KINDS[name] = handler
+        return handler
+    return _register
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler at the next check() after a cancel request"""
+
+
+def _json_default(value):
+    # NumPy scalars / datetimes leaking out of indicator code
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, default=_json_default)
+
+
+class JobContext:
+    """Handed to job handlers: progress, partial results, cooperative cancellation"""
+
+    def __init__(self, manager: "JobManager", job_id: str):
+        self.manager = manager
+        self.job_id = job_id
+        self.total = 0
+        self.done = 0
+        self._seq = 0
+        self._checked_at = 0.0
+
+    def set_total(self, total: int):
+        self.total = total
+        self.manager._update(self.job_id, total=total)
+
+    def advance(self, n: int = 1):
+        self.done += n
+        self.manager._update(self.job_id, done=self.done)
+
+    def emit(self, result: dict):
+        """Append one partial result (visible to pollers immediately)"""
+        self.manager._conn().execute("INSERT INTO job_results VALUES (?, ?, ?)",
+                                     (self.job_id, self._seq, _dumps(result)))
+        self._seq += 1
+
+    def check(self):
+        """Raise JobCancelled if cancellation was requested (DB polled at most once per second)"""
+        now = time.time()
+        if now - self._checked_at < 1.0:
+            return
+        self._checked_at = now
+        row = self.manager._conn().execute("SELECT cancel_requested FROM jobs WHERE id = ?",
+                                           (self.job_id,)).fetchone()
+        if row and row[0]:
+            raise JobCancelled(self.job_id)
+
+    def each(self, items: list, func, label=str) -> dict:
+        """Run func(item) per item: emits non-None results, records per-item errors, honours cancel"""
+        if not self.total:
+            self.set_total(len(items))
+        emitted = errors = 0
+        for item in items:
+            self.check()
+            try:
+                result = func(item)
+                if result is not None:
+                    self.emit(result)
+                    emitted += 1
+            except JobCancelled:
+                raise
+            except Exception as e:
+                logger.warning(f"Job {self.job_id} item {label(item)} failed: {e}")
+                self.emit({"item": label(item), "error": str(e)})
+                errors += 1
+            self.advance()
+        return {"processed": len(items), "emitted": emitted, "errors": errors}
+
+
+class JobManager:
+    """Worker pool + persistent job table over the JOB_KINDS registry"""
+
+    def __init__(self, path: str = "", workers: int = None, handlers: dict = None):
+        self.path = path or config.data_path("jobs.sqlite")
+        self.workers = workers or config.JOB_WORKERS
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._handlers = JOB_KINDS if handlers is None else handlers
+        self._local = threading.local()
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY, kind TEXT, params TEXT, status TEXT, owner TEXT,
+            total INTEGER DEFAULT 0, done INTEGER DEFAULT 0, summary TEXT, error TEXT,
+            cancel_requested INTEGER DEFAULT 0,
+            created_at REAL, started_at REAL, finished_at REAL)""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS job_results (
+            job_id TEXT, seq INTEGER, payload TEXT, PRIMARY KEY (job_id, seq))""")
+        self._recover()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _recover(self):
+        """Jobs owned by a dead process on this host will never finish: mark them failed"""
+        host = socket.gethostname()
+        conn = self._conn()
+        rows = conn.execute("SELECT id, owner FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)).fetchall()
+        for job_id, owner in rows:
+            owner_host, _, pid = (owner or "").rpartition(":")
+            if owner_host != host or not pid.isdigit():
+                continue
+            if int(pid) != os.getpid() and self._alive(int(pid)):
+                continue
+            conn.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                         (FAILED, "Interrupted by restart", time.time(), job_id))
+            logger.warning(f"Job {job_id} interrupted by restart")
+        cutoff = time.time() - config.JOB_RETENTION_DAYS * 86400
+        old = [r[0] for r in conn.execute("SELECT id FROM jobs WHERE finished_at < ?", (cutoff,))]
+        for job_id in old:
+            conn.execute("DELETE FROM job_results WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    @staticmethod
+    def _alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _update(self, job_id: str, **fields):
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        self._conn().execute(f"UPDATE jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+
+    # --- Public API ---
+    @property
+    def kinds(self) -> list:
+        return sorted(self._handlers)
+
+    def submit(self, kind: str, params: dict = None) -> dict:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind '{kind}' (available: {', '.join(self.kinds)})")
+        params = params or {}
+        job_id = uuid.uuid4().hex[:16]
+        self._conn().execute(
+            "INSERT INTO jobs (id, kind, params, status, owner, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, kind, _dumps(params), QUEUED, self.owner, time.time()))
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+            self._pool.submit(self._run, job_id, kind, params)
+        logger.info(f"Job {job_id} ({kind}) queued")
+        return self.get(job_id, limit=0)
+
+    def cancel(self, job_id: str) -> bool:
+        """Queued jobs stop immediately; running jobs stop at their next check()"""
+        conn = self._conn()
+        conn.execute("UPDATE jobs SET status = ?, cancel_requested = 1, finished_at = ? WHERE id = ? AND status = ?",
+                     (CANCELLED, time.time(), job_id, QUEUED))
+        cur = conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING))
+        row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is not None and (cur.rowcount == 1 or row[0] == CANCELLED)
+
+    def get(self, job_id: str, offset: int = 0, limit: int = None):
+        """Job status + partial results [offset, offset+limit) (None if unknown)"""
+        conn = self._conn()
+        row = conn.execute("""SELECT id, kind, params, status, total, done, summary, error, cancel_requested,
+                                     created_at, started_at, finished_at FROM jobs WHERE id = ?""",
+                           (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = self._row(row)
+        if limit != 0:
+            results = conn.execute(
+                "SELECT seq, payload FROM job_results WHERE job_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+                (job_id, offset, -1 if limit is None else limit)).fetchall()
+            job["results"] = [json.loads(p) for _, p in results]
+            job["next_offset"] = results[-1][0] + 1 if results else offset
+        return job
+
+    def list(self, limit: int = 50) -> list:
+        rows = self._conn().execute("""SELECT id, kind, params, status, total, done, summary, error,
+                                              cancel_requested, created_at, started_at, finished_at
+                                       FROM jobs ORDER BY created_at DESC LIMIT ?""", (limit,)).fetchall()
+        return [self._row(r) for r in rows]
+
+    @staticmethod
+    def _row(row) -> dict:
+        (job_id, kind, params, status, total, done, summary, error, cancel_requested,
+         created_at, started_at, finished_at) = row
+        end = finished_at or time.time()
+        return {
+            "id": job_id, "kind": kind, "status": status,
+            "params": json.loads(params or "{}"),
+            "progress": {"done": done, "total": total,
+                         "percent": round(done / total * 100, 1) if total else 0.0},
+            "summary": json.loads(summary) if summary else None,
+            "error": error,
+            "cancel_requested": bool(cancel_requested),
+            "created_at": created_at, "started_at": started_at, "finished_at": finished_at,
+            "elapsed_ms": int((end - started_at) * 1000) if started_at else 0,
+        }
+
+    def _run(self, job_id: str, kind: str, params: dict):
+        conn = self._conn()
+        cur = conn.execute("UPDATE jobs SET status = ?, started_at = ? WHERE id = ? AND status = ?",
+                           (RUNNING, time.time(), job_id, QUEUED))
+        if cur.rowcount != 1:
+            return  # Cancelled while queued
+        ctx = JobContext(self, job_id)
+        try:
+            summary = self._handlers[kind](ctx, params)
+            self._update(job_id, status=SUCCEEDED, summary=_dumps(summary), finished_at=time.time())
+            logger.info(f"Job {job_id} ({kind}) succeeded: {summary}")
+        except JobCancelled:
+            self._update(job_id, status=CANCELLED, finished_at=time.time())
+            logger.info(f"Job {job_id} ({kind}) cancelled at {ctx.done}/{ctx.total}")
+        except Exception as e:
+            logger.error(f"Job {job_id} ({kind}) failed: {traceback.format_exc()}")
+            self._update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+
+    def wait(self, job_id: str, timeout: float = 30) -> dict:
+        """Poll until the job finishes (tests / CLI)"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = self.get(job_id, limit=0)
+            if job is None or job["status"] in FINISHED:
+                return job
+            time.sleep(0.02)
+        return self.get(job_id, limit=0)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """Process-wide manager (job table opened on first use)"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
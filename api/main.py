@@ -5,20 +5,40 @@ import datetime
 import traceback
 import logging
 import math
-import random
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
 # V10.0 Modular Imports
-from .fetcher import DataFetcher
+from .fetcher import DataFetcher, _yf_history, _yf_fast_price
 from .quant import (
     calculate_technicals, 
     generate_signal, 
+    evaluate_position,
+    position_size,
+    screen_series,
     detect_etf, 
     safe_round, 
     get_stock_name
 )
+from .security_master import security_master
+from .trading_calendar import trading_calendar, TZ
+from .warmup import warmup
+from .cache import shared_cache, analysis_cache
+from .timeframes import multi_timeframe, timeframe_cache
+from .intraday import intraday_feed
+from .monitor import position_monitor
+from .jobs import get_job_manager, job_kind
+from .backtest import backtest_series, BUY_SCORE
+from .compute import get_compute_backend
+from .optimizer import run_optimizer, walk_forward_folds
+from .factors import factor_engine, factor_names
+from .portfolio import assess_portfolio, covariance_cache
+from .settlement import day_index, day_str, get_settlement_store, initial_state, scan
+from .backfill import Backfill
+from .serialization import FastJSONResponse, CompressionMiddleware, dumps
+from . import config
 
 # Optional libraries for health check only
 try:
@@ -47,13 +67,23 @@ except ImportError:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="AkShare Quant API V14.0", version="14.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # V15: Warmup (security master + quotes + names + watchlist histories), then daily master refresh
+    warmup.start()
+    yield
+
+# V15: orjson-backed responses by default; br/gzip negotiated for large bodies
+app = FastAPI(title="AkShare Quant API V14.0", version="14.0", lifespan=lifespan,
+              default_response_class=FastJSONResponse)
+if config.COMPRESSION:
+    app.add_middleware(CompressionMiddleware)
 
 # --- V10.0: API Key Authentication ---
 API_KEY = os.environ.get("API_KEY")
 if not API_KEY:
     logger.warning("⚠️ API_KEY not set! All non-public endpoints will reject requests.")
-PUBLIC_PATHS = {"/health", "/docs", "/openapi.json", "/redoc", "/health/reset"}
+PUBLIC_PATHS = {"/health", "/ready", "/docs", "/openapi.json", "/redoc", "/health/reset"}
 
 @app.middleware("http")
 async def verify_api_key(request: Request, call_next):
@@ -104,6 +134,8 @@ class AnalyzeRequest(BaseModel):
     market: str = ""  # V13: Optional explicit market ("CN"/"HK"), auto-detect if empty
     balance: float = 100000.0
     risk: float = 0.01
+    mtf: bool = False  # V15: Add weekly/monthly confirmation block (resampled, no extra fetch)
+    factors: bool = False  # V15: Add cross-sectional factor values + percentile ranks (cached snapshot)
 
 class PositionItem(BaseModel):
     code: str
@@ -113,6 +145,7 @@ class PositionItem(BaseModel):
     target_price: float
     shares: int = 0
     record_id: str = ""
+    stop_set_at: str = ""  # ISO time current_stop was last moved (intraday stop-touch check); "" = unknown
 
 class PositionCheckRequest(BaseModel):
     positions: list[PositionItem]
@@ -130,6 +163,36 @@ class SignalItem(BaseModel):
 class SignalSettleRequest(BaseModel):
     signals: list[SignalItem]
 
+class AnalyzeBatchRequest(BaseModel):
+    codes: list[str]
+    market: str = ""  # Applies to every code; auto-detect per code if empty
+    balance: float = 100000.0
+    risk: float = 0.01
+    mtf: bool = False
+    factors: bool = False
+
+class HoldingItem(BaseModel):
+    code: str
+    market: str = ""  # Auto-detect if empty
+    shares: int
+    current_stop: float = 0.0
+
+class CandidateItem(BaseModel):
+    code: str
+    market: str = ""
+    entry_price: float = 0.0  # 0 = current price
+    stop_loss: float = 0.0    # 0 = signal stop (generate_signal)
+
+class PortfolioRiskRequest(BaseModel):
+    positions: list[HoldingItem] = []
+    candidates: list[CandidateItem] = []
+    balance: float = 100000.0
+    risk: float = 0.01
+
+class JobRequest(BaseModel):
+    kind: str  # V15: analyze / screen / backtest / backfill
+    params: dict = {}
+
 # --- Endpoints ---
 
 @app.get("/health")
@@ -161,6 +224,20 @@ def health_check():
         "qstock": qs is not None
     }
     
+    # 3. V15: 共享缓存层
+    checks["cache"] = shared_cache.stats()
+    checks["result_cache"] = analysis_cache.stats()
+    checks["trading_calendar"] = trading_calendar.stats()
+    checks["timeframes"] = timeframe_cache.stats()
+    checks["intraday"] = intraday_feed.stats()
+    checks["monitor"] = position_monitor.stats()
+    checks["compute"] = get_compute_backend().stats()
+    checks["factors"] = factor_engine.stats()
+    checks["covariance"] = covariance_cache.stats()
+    checks["providers"] = DataFetcher.source_stats()
+    if config.SETTLEMENT_STATE:
+        checks["settlement"] = get_settlement_store().stats()
+    
     latency_ms = int((time.time() - start_time) * 1000)
     
     return {
@@ -171,6 +248,16 @@ def health_check():
         "version": "14.1"
     }
 
+@app.get("/ready")
+def readiness():
+    """
+    V15: 就绪检查 (预热完成前、或行情/历史预热失败时返回 503)
+    - steps: 各预热步骤耗时与结果
+    - histories: 关注列表历史数据预加载进度
+    """
+    snap = warmup.snapshot()
+    return JSONResponse(status_code=200 if snap["ready"] else 503, content=snap)
+
 @app.post("/health/reset")
 def reset_health():
     reset_circuit_breaker()
@@ -182,11 +269,11 @@ def get_market_context():
     V10.0: 增强版大盘状态 (A股 + 港股 + 涨跌家数)
     """
     try:
-        time.sleep(random.uniform(0.5, 1.0))
+        DataFetcher._polite_sleep(0.5, 1.0)
         import akshare as ak
         
         # A股指数数据
-        index_df = ak.stock_zh_index_daily(symbol="sh000001")
+        index_df = DataFetcher._source("AkShare-Index", "sh000001", ak.stock_zh_index_daily, symbol="sh000001")
         if index_df.empty:
             raise ValueError("Index Data Empty")
         price = float(index_df['close'].iloc[-1])
@@ -206,7 +293,7 @@ def get_market_context():
         hk_ma20 = 0
         try:
             # Method 1: Index History (Stable)
-            hk_df = ak.index_zh_a_hist(symbol="HSI", period="daily")
+            hk_df = DataFetcher._source("AkShare-Index", "HSI", ak.index_zh_a_hist, symbol="HSI", period="daily")
             if not hk_df.empty:
                 hk_price = float(hk_df['收盘'].iloc[-1])
                 hk_ma20 = float(hk_df['收盘'].rolling(20).mean().iloc[-1])
@@ -221,7 +308,7 @@ def get_market_context():
             logger.warning(f"HK index (Method 1) failed: {e}")
             try:
                 # Method 2: HK Index Daily (Fallback)
-                hk_df = ak.stock_hk_index_daily_em(symbol="HSI")
+                hk_df = DataFetcher._source("AkShare-Index-EM", "HSI", ak.stock_hk_index_daily_em, symbol="HSI")
                 if not hk_df.empty:
                     hk_price = float(hk_df['close'].iloc[-1])
                     hk_ma20 = float(hk_df['close'].rolling(20).mean().iloc[-1])
@@ -232,16 +319,14 @@ def get_market_context():
         # Method 3: Yahoo Finance (V10.2 Fallback)
         if hk_status == "Unknown" and yf:
             try:
-                hsi = yf.Ticker("^HSI")
-                
                 # Try fast_info
                 try:
-                    hk_price = hsi.fast_info['last_price']
+                    hk_price = DataFetcher._source("Yahoo-Spot", "^HSI", _yf_fast_price, "^HSI")
                 except:
                     hk_price = 0
                 
                 # Get History for MA20
-                hsi_hist = hsi.history(period="1mo")
+                hsi_hist = DataFetcher._source("Yahoo", "^HSI", _yf_history, "^HSI", "1mo")
                 if not hsi_hist.empty:
                     hk_ma20 = float(hsi_hist['Close'].rolling(20).mean().iloc[-1])
                     if hk_price <= 0:
@@ -254,7 +339,7 @@ def get_market_context():
         # 涨跌家数统计
         up_count, down_count, flat_count = 0, 0, 0
         try:
-            stats = ak.stock_zh_a_spot_em()
+            stats = DataFetcher._source("AkShare-Spot", "CN", ak.stock_zh_a_spot_em)
             if not stats.empty and '涨跌幅' in stats.columns:
                 up_count = len(stats[stats['涨跌幅'] > 0])
                 down_count = len(stats[stats['涨跌幅'] < 0])
@@ -288,293 +373,654 @@ def get_market_context():
         record_error(str(e))
         return {"market_status": "Correction", "error": str(e), "is_frozen": False}
 
+def resolve_market(code: str, market: str = "") -> str:
+    # V13: Explicit market param takes priority over auto-detection
+    if market and market.upper() in ("HK", "CN"):
+        return market.upper()
+    # V15: Security master lookup (falls back to the 5-digit rule)
+    return security_master.detect_market(code)
+
+def analyze_symbol(code: str, market: str = "", balance: float = 100000.0, risk: float = 0.01,
+                   mtf: bool = False, factors: bool = False) -> dict:
+    """Full single-symbol analysis (shared by /analyze_full and analyze jobs); raises on failure"""
+    market = resolve_market(code, market)
+    is_hk = (market == "HK")
+    
+    if is_hk:
+        df = DataFetcher.get_hk_share_history(code)
+    else:
+        df = DataFetcher.get_a_share_history(code)
+        
+    if df.empty:
+        raise ValueError("No data found")
+        
+    tech = calculate_technicals(df)
+    sig = generate_signal(tech, is_hk)
+    tech['trend_score'] = sig['trend_score']
+    
+    # Risk Logic
+    risk_per_share = tech['current_price'] - sig['stop_loss']
+    if risk_per_share <= 0: risk_per_share = tech['atr14']
+    
+    account_risk_money = balance * risk
+    
+    # V15: Round to the instrument's board lot (STAR 200, default 100); no suggestion when the lot is unknown
+    lot_size = security_master.lot_size(code, market)
+    suggested_shares = position_size(account_risk_money, risk_per_share, lot_size) if lot_size else None
+    
+    # V10.0: Use Cached Name & Realtime Price
+    stock_name = DataFetcher.get_stock_name(code, market)
+    is_etf = detect_etf(code, market)
+    
+    realtime_price = DataFetcher.get_realtime_price(code, market)
+    if realtime_price > 0:
+        tech['current_price'] = realtime_price
+    
+    result = {
+        "date": datetime.datetime.now().strftime("%Y-%m-%d"),
+        "market": market,
+        "code": code,
+        "name": stock_name,
+        "is_etf": is_etf,
+        "data_source": DataFetcher._last_source,
+
+        "signal_type": sig['signal'],
+        "trend_score": sig['trend_score'],
+        "current_price": tech['current_price'],
+        "atr14": tech['atr14'],
+        "bias_ma5": tech['bias_ma5'],
+        "rsi14": tech['rsi14'],
+        "volume_ratio": tech['volume_ratio'],
+        "ma_alignment": tech['ma_alignment'],
+        "macd": tech.get('macd', 0),
+        "macd_signal": tech.get('macd_signal', 0),
+        "macd_hist": tech.get('macd_hist', 0),
+        "macd_cross": tech.get('macd_cross', 'none'),
+        "signal_reasons": sig.get('signal_reasons', []),
+        "suggested_buy": sig['suggested_buy'],
+        "stop_loss": sig['stop_loss'],
+        "take_profit": sig['take_profit'],
+        "support_level": sig['support_level'],
+        "resistance_level": sig['resistance_level'],
+        "technical": tech,
+        "signal": sig,
+        "risk_ctrl": {
+            "risk_per_share": safe_round(risk_per_share),
+            "suggested_position": suggested_shares,
+            "lot_size": lot_size or None
+        },
+        "prompt_data": {
+            "price_info": f"现价: {tech['current_price']}, MA20: {tech['ma20']}",
+            "market_stat": market,
+            "volume_info": f"量比: {tech['volume_ratio']}, 均线: {tech['ma_alignment']}",
+            "levels_info": f"支撑: {sig['support_level']}, 压力: {sig['resistance_level']}",
+            "macd_info": f"MACD: {tech.get('macd', 0)}, 信号线: {tech.get('macd_signal', 0)}, 柱状: {tech.get('macd_hist', 0)}, 交叉: {tech.get('macd_cross', 'none')}"
+        }
+    }
+    if not lot_size:
+        # Risk cap in single shares: round down to the board lot before trading
+        result["risk_ctrl"]["max_shares"] = position_size(account_risk_money, risk_per_share, 1)
+    if mtf:
+        # V15: Weekly/monthly from the same cached dailies (LRU hit, no upstream call)
+        result["mtf"] = multi_timeframe(DataFetcher.get_history_series(code, market), is_hk, sig['trend_score'])
+    if factors:
+        # V15: Percentile ranks from the market-wide snapshot (built once per daily bar)
+        result["factors"] = factor_engine.lookup(code, market)
+    return result
+
+def compact_analysis(result: dict) -> dict:
+    """V15: profile=compact - drop signal/prompt_data (repeat the flat fields), keep only unflattened technicals"""
+    out = {k: v for k, v in result.items() if k not in ("technical", "signal", "prompt_data")}
+    out["technical"] = {k: v for k, v in result.get("technical", {}).items() if k not in out}
+    return out
+
+def shape_analysis(result: dict, profile: str) -> dict:
+    return compact_analysis(result) if profile == "compact" and "technical" in result else result
+
+def _if_none_match(request: Request) -> set:
+    raw = request.headers.get("if-none-match", "")
+    return {tag.strip().removeprefix("W/") for tag in raw.split(",") if tag.strip()}
+
 @app.post("/analyze_full")
-def analyze_full(req: AnalyzeRequest):
+def analyze_full(req: AnalyzeRequest, request: Request, profile: str = "full"):
+    """
+    profile=compact: ~half the bytes, no duplicated technical/signal/prompt_data blocks
+    V15: ETag = digest of (code, market, last bar, realtime price, balance, risk, profile, day);
+    If-None-Match -> 304, repeated inputs -> cached body (X-Cache: HIT)
+    """
     try:
-        code = req.code
-        # V13: Explicit market param takes priority over auto-detection
-        if req.market and req.market.upper() in ("HK", "CN"):
-            market = req.market.upper()
-            is_hk = (market == "HK")
-        else:
-            is_hk = len(str(code)) == 5
-            market = "HK" if is_hk else "CN"
+        market = resolve_market(req.code, req.market)
+        series = DataFetcher.get_history_series(req.code, market)
+        etag = None
+        if len(series):
+            price = DataFetcher.get_realtime_price(req.code, market)
+            etag = analysis_cache.etag(req.code, market, str(series.last_date), round(price, 3), req.balance,
+                                       req.risk, profile, req.mtf, req.factors,
+                                       datetime.date.today().isoformat())
+            headers = {"ETag": etag, "Cache-Control": "no-cache"}
+            if etag in _if_none_match(request) or "*" in _if_none_match(request):
+                analysis_cache.not_modified += 1
+                return Response(status_code=304, headers=headers)
+            body = analysis_cache.get(etag)
+            if body is not None:
+                return Response(body, media_type="application/json", headers={**headers, "X-Cache": "HIT"})
+        # V15: Return the response directly - skips FastAPI's jsonable_encoder pass
+        response = FastJSONResponse(shape_analysis(
+            analyze_symbol(req.code, market, req.balance, req.risk, mtf=req.mtf, factors=req.factors), profile))
+        if etag:
+            response.headers.update({"ETag": etag, "Cache-Control": "no-cache", "X-Cache": "MISS"})
+            analysis_cache.put(etag, response.body)
+        return response
+    except Exception as e:
+        logger.error(traceback.format_exc())
+        record_error(str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/factors")
+def get_factors(market: str = "CN", code: str = "", factor: str = "", top: int = 50, ascending: bool = False):
+    """
+    V15: 横截面因子 (动量 / 波动率 / 相对强弱 / 成交额) 与百分位排名
+    - code: 单只股票的因子值 + 百分位
+    - factor: 按该因子排序的前 top 只
+    """
+    market = market.upper()
+    snapshot = factor_engine.snapshot(market)
+    if code:
+        row = snapshot.lookup(DataFetcher._normalize_code(code, market))
+        if row is None:
+            raise HTTPException(status_code=404, detail=f"{code} not in the {market} factor universe")
+        return {"code": code, "market": market, **row}
+    out = {"market": market, "as_of": snapshot.as_of, "universe": len(snapshot.codes),
+           "benchmark": snapshot.benchmark, "factors": snapshot.names}
+    if factor:
+        try:
+            out["ranked"] = snapshot.top(factor, top, ascending)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return out
+
+def prefetch_quotes(items: list):
+    """V15: One batched quote round per market; per-symbol lookups then hit the quote cache"""
+    by_market = {}
+    for code, market in items:
+        m = "HK" if (market or "").upper() == "HK" or security_master.detect_market(code) == "HK" else "CN"
+        by_market.setdefault(m, []).append(code)
+    for m, codes in by_market.items():
+        try:
+            DataFetcher.get_realtime_prices(codes, m)
+        except Exception as e:
+            logger.warning(f"Quote prefetch failed for {m}: {e}")
+
+# --- V15: NDJSON streaming (opt-in per request) ---
+NDJSON = "application/x-ndjson"
+
+def wants_stream(request: Request, stream: bool) -> bool:
+    return stream or NDJSON in request.headers.get("accept", "")
+
+def ndjson_response(results) -> StreamingResponse:
+    """One JSON line per result as soon as it is computed, then {"done": true, "count": N, "timestamp": ...}"""
+    def _lines():
+        count = 0
+        for item in results:
+            count += 1
+            yield dumps(item) + b"\n"
+        yield dumps({"done": True, "count": count, "timestamp": datetime.datetime.now().isoformat()}) + b"\n"
+    return StreamingResponse(_lines(), media_type=NDJSON, headers={"X-Accel-Buffering": "no"})
+
+def _stop_set_ts(stop_set_at: str):
+    """PositionItem.stop_set_at -> epoch seconds (naive times are exchange-local); None when unknown"""
+    if not stop_set_at:
+        return None
+    try:
+        when = datetime.datetime.fromisoformat(stop_set_at)
+    except ValueError:
+        return None
+    return (when if when.tzinfo else when.replace(tzinfo=TZ)).timestamp()
+
+def check_position(pos: PositionItem, intraday: bool = False) -> dict:
+    """
+    Trailing stop / take-profit evaluation for one position (errors become an ERROR row).
+    intraday=True evaluates on dailies + today's partial bar from minute data, and
+    also fires the stop when a minute low since pos.stop_set_at has already touched it.
+    """
+    try:
+        code = pos.code
+        is_hk = pos.market.upper() == "HK" or security_master.detect_market(code) == "HK"
+        session = None
+        session_low = None
         
-        if is_hk:
+        if intraday:
+            market = "HK" if is_hk else "CN"
+            session = intraday_feed.partial_bar(code, market)
+            stop_since = _stop_set_ts(pos.stop_set_at)
+            # Only minutes after the stop was last moved can have touched it
+            if session and stop_since is not None:
+                session_low = intraday_feed.session_low(code, market, stop_since)
+            df = intraday_feed.live_series(code, market).to_frame()
+        elif is_hk:
             df = DataFetcher.get_hk_share_history(code)
         else:
             df = DataFetcher.get_a_share_history(code)
-            
-        if df.empty:
-            raise ValueError("No data found")
-            
-        tech = calculate_technicals(df)
-        sig = generate_signal(tech, is_hk)
-        tech['trend_score'] = sig['trend_score']
-        
-        # Risk Logic
-        risk_per_share = tech['current_price'] - sig['stop_loss']
-        if risk_per_share <= 0: risk_per_share = tech['atr14']
         
-        account_risk_money = req.balance * req.risk
+        # V10.3: Spot-Only Fallback Logic
+        realtime_price = DataFetcher.get_realtime_price(code, "HK" if is_hk else "CN")
         
-        if risk_per_share <= 0.0001:
-            suggested_shares = 0
+        if df.empty:
+            if realtime_price > 0:
+                current_price = realtime_price
+                atr = current_price * 0.03 # Default ATR
+            else:
+                return {
+                    "code": code,
+                    "action": "ERROR",
+                    "reason": "无法获取数据 (History & Spot Failed)",
+                    "current_price": None,
+                    "new_stop": None
+                }
         else:
-            raw_shares = account_risk_money / risk_per_share / 100
-            suggested_shares = int(raw_shares) * 100
-            
-        if suggested_shares < 100: suggested_shares = 0
-        
-        # V10.0: Use Cached Name & Realtime Price
-        stock_name = DataFetcher.get_stock_name(code, market)
-        is_etf = detect_etf(code, market)
+            current_price = float(df['close'].iloc[-1])
+            tech = calculate_technicals(df)
+            atr = tech.get('atr14', 0)
+            if not atr or atr <= 0:
+                atr = current_price * 0.03
         
-        realtime_price = DataFetcher.get_realtime_price(code, market)
+        # Use Realtime if available (Overwrite History Close)
         if realtime_price > 0:
-            tech['current_price'] = realtime_price
+            current_price = realtime_price
+        
+        result = evaluate_position(pos, current_price, atr, is_hk, session_low=session_low)
+        if result["new_stop"] and result["new_stop"] > round(pos.current_stop, 2):
+            result["stop_set_at"] = datetime.datetime.now(TZ).isoformat(timespec="seconds")
+        if session:
+            result["session"] = {k: safe_round(session[k]) for k in ("open", "high", "low", "close")}
+            result["session"]["as_of"] = datetime.datetime.fromtimestamp(session["last_ts"], TZ).isoformat()
+        return result
         
+    except Exception as e:
+        logger.error(f"Position check error for {pos.code}: {e}")
         return {
-            "date": datetime.datetime.now().strftime("%Y-%m-%d"),
-            "market": market,
-            "code": code,
-            "name": stock_name,
-            "is_etf": is_etf,
-            "data_source": DataFetcher._last_source,
-
-            "signal_type": sig['signal'],
-            "trend_score": sig['trend_score'],
-            "current_price": tech['current_price'],
-            "atr14": tech['atr14'],
-            "bias_ma5": tech['bias_ma5'],
-            "rsi14": tech['rsi14'],
-            "volume_ratio": tech['volume_ratio'],
-            "ma_alignment": tech['ma_alignment'],
-            "macd": tech.get('macd', 0),
-            "macd_signal": tech.get('macd_signal', 0),
-            "macd_hist": tech.get('macd_hist', 0),
-            "macd_cross": tech.get('macd_cross', 'none'),
-            "signal_reasons": sig.get('signal_reasons', []),
-            "suggested_buy": sig['suggested_buy'],
-            "stop_loss": sig['stop_loss'],
-            "take_profit": sig['take_profit'],
-            "support_level": sig['support_level'],
-            "resistance_level": sig['resistance_level'],
-            "technical": tech,
-            "signal": sig,
-            "risk_ctrl": {
-                "risk_per_share": safe_round(risk_per_share),
-                "suggested_position": suggested_shares
-            },
-            "prompt_data": {
-                "price_info": f"现价: {tech['current_price']}, MA20: {tech['ma20']}",
-                "market_stat": market,
-                "volume_info": f"量比: {tech['volume_ratio']}, 均线: {tech['ma_alignment']}",
-                "levels_info": f"支撑: {sig['support_level']}, 压力: {sig['resistance_level']}",
-                "macd_info": f"MACD: {tech.get('macd', 0)}, 信号线: {tech.get('macd_signal', 0)}, 柱状: {tech.get('macd_hist', 0)}, 交叉: {tech.get('macd_cross', 'none')}"
-            }
+            "code": pos.code,
+            "action": "ERROR",
+            "reason": str(e),
+            "current_price": None,
+            "new_stop": None
         }
-    except Exception as e:
-        logger.error(traceback.format_exc())
-        record_error(str(e))
-        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _iter_positions(positions: list, intraday: bool = False):
+    prefetch_quotes([(p.code, p.market) for p in positions])
+    for pos in positions:
+        yield check_position(pos, intraday=intraday)
 
 @app.post("/check_positions")
-def check_positions(req: PositionCheckRequest):
-    results = []
-    for pos in req.positions:
+def check_positions(req: PositionCheckRequest, request: Request, stream: bool = False, intraday: bool = False):
+    """
+    V15: stream=true (or Accept: application/x-ndjson) emits one NDJSON line per position;
+    intraday=true re-evaluates on minute bars aggregated into today's partial daily bar
+    """
+    if wants_stream(request, stream):
+        return ndjson_response(_iter_positions(req.positions, intraday))
+    return FastJSONResponse({"positions": list(_iter_positions(req.positions, intraday)),
+                             "timestamp": datetime.datetime.now().isoformat()})
+
+@app.post("/portfolio_risk")
+def portfolio_risk(req: PortfolioRiskRequest):
+    """
+    V15: 组合风险 (持仓 + 候选)
+    - 基于缓存历史的收益协方差 (滚动窗口, 按日增量更新)
+    - 候选按与组合的相关性缩减仓位, 组合 ATR 风险, 集中度警告
+    """
+    try:
+        result = assess_portfolio(req.positions, req.candidates, req.balance, req.risk)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result["timestamp"] = datetime.datetime.now().isoformat()
+    return result
+
+# --- V15: Position monitor (register once, server-sent events on state changes) ---
+@app.post("/monitor/subscriptions")
+def create_subscription(req: PositionCheckRequest):
+    """Register positions; SELL_STOP / SELL_TARGET / STOP_RAISED are pushed on the events stream"""
+    if not req.positions:
+        raise HTTPException(status_code=400, detail="No positions")
+    if len(req.positions) > config.MONITOR_MAX_POSITIONS:
+        raise HTTPException(status_code=400, detail=f"At most {config.MONITOR_MAX_POSITIONS} positions per subscription")
+    sub = position_monitor.subscribe(req.positions)
+    return {**sub.summary(), "events": f"/monitor/subscriptions/{sub.id}/events",
+            "interval": position_monitor.interval}
+
+def _subscription(sub_id: str):
+    sub = position_monitor.get(sub_id)
+    if sub is None:
+        raise HTTPException(status_code=404, detail=f"Subscription {sub_id} not found")
+    return sub
+
+@app.get("/monitor/subscriptions/{sub_id}")
+def get_subscription(sub_id: str):
+    return _subscription(sub_id).summary()
+
+@app.get("/monitor/subscriptions/{sub_id}/events")
+def subscription_events(sub_id: str, request: Request):
+    """text/event-stream; reconnect with Last-Event-ID to replay missed events"""
+    sub = _subscription(sub_id)
+    try:
+        last_id = int(request.headers.get("last-event-id") or 0)
+    except ValueError:
+        last_id = 0
+    return StreamingResponse(position_monitor.stream(sub, last_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.delete("/monitor/subscriptions/{sub_id}")
+def delete_subscription(sub_id: str):
+    if not position_monitor.unsubscribe(sub_id):
+        raise HTTPException(status_code=404, detail=f"Subscription {sub_id} not found")
+    return {"id": sub_id, "deleted": True}
+
+def settle_signal(sig: SignalItem) -> dict:
+    """Success / fail / timeout evaluation for one open signal (settled ones are skipped)"""
+    if sig.signal_result != "进行中":
+        return {
+            "code": sig.code,
+            "signal_result": sig.signal_result,
+            "action": "SKIP",
+            "reason": "已结算",
+            "record_id": sig.record_id
+        }
+    
+    try:
+        code = sig.code
+        # V14: Consistent market detection with check_positions
+        is_hk = sig.market.upper() == "HK" or security_master.detect_market(code) == "HK"
+        market = "HK" if is_hk else "CN"
+        entry = sig.entry_price
+        stop = sig.stop_loss
+        target = sig.take_profit
+        today = datetime.datetime.now(TZ).date()
+        
+        # V15: Trading days, not calendar days (a holiday week no longer eats the timeout)
         try:
-            code = pos.code
-            is_hk = len(str(code)) == 5 or pos.market == "HK"
-            
-            if is_hk:
-                df = DataFetcher.get_hk_share_history(code)
-            else:
-                df = DataFetcher.get_a_share_history(code)
-            
-            # V10.3: Spot-Only Fallback Logic
-            realtime_price = DataFetcher.get_realtime_price(code, "HK" if is_hk else "CN")
-            
-            if df.empty:
-                if realtime_price > 0:
-                    current_price = realtime_price
-                    atr = current_price * 0.03 # Default ATR
-                else:
-                    results.append({
+            signal_date = datetime.datetime.strptime(sig.signal_date, "%Y-%m-%d")
+            days_held = trading_calendar.trading_days_between(signal_date, today, market)
+        except:
+            signal_date = None
+            days_held = 0
+        
+        # V14: Calculate timeout before evaluation chain
+        timeout_days = 30 if is_hk else 20
+        
+        # V15: Persisted progress - only bars after the last evaluated one are scanned
+        store = get_settlement_store() if config.SETTLEMENT_STATE and signal_date else None
+        key = sig.record_id or f"{market}:{DataFetcher._normalize_code(code, market)}:{sig.signal_date}"
+        levels = (sig.signal_date, entry, stop, target)
+        state = (store.get(key, levels) if store else None) or initial_state(day_index(signal_date or today))
+        
+        current_price = 0.0
+        if not state["outcome"]:
+            # V13: Use realtime price if available (same as check_positions)
+            current_price = DataFetcher.get_realtime_price(code, market)
+            # No completed bar can be newer than the previous trading day: skip the history fetch then
+            stale = state["last_day"] < day_index(trading_calendar.previous_trading_day(today, market))
+            if stale or current_price <= 0:
+                series = DataFetcher.get_history_series(code, market)
+                if not len(series):
+                    return {
                         "code": code,
+                        "signal_result": "进行中",
                         "action": "ERROR",
-                        "reason": "无法获取数据 (History & Spot Failed)",
-                        "current_price": None,
-                        "new_stop": None
-                    })
-                    continue
-            else:
-                current_price = float(df['close'].iloc[-1])
-                tech = calculate_technicals(df)
-                atr = tech.get('atr14', 0)
-                if not atr or atr <= 0:
-                    atr = current_price * 0.03
-            
-            # Use Realtime if available (Overwrite History Close)
-            if realtime_price > 0:
-                current_price = realtime_price
-            
-            # V12: Fixed variable references (was using undefined names)
-            buy_price = pos.buy_price
-            current_stop = pos.current_stop
-            target = pos.target_price
-            
-            if current_stop > 0 and current_price <= current_stop:
-                action = "SELL_STOP"
-                reason = f"🔴 触发止损 (现价 {current_price:.2f} ≤ 止损 {current_stop:.2f})"
-                pnl = (current_price - buy_price) / buy_price * 100 if buy_price > 0 else 0
-                new_stop = None
-            elif target > 0 and current_price >= target:
-                action = "SELL_TARGET"
-                reason = f"🟢 触发止盈 (现价 {current_price:.2f} ≥ 目标 {target:.2f})"
-                pnl = (current_price - buy_price) / buy_price * 100 if buy_price > 0 else 0
-                new_stop = None
-            else:
-                action = "HOLD"
-                # V10.0: ATR 驱动移动止损
-                atr_multiplier = 2.5 if is_hk else 2.0
-                trailing_stop = current_price - (atr_multiplier * atr)
-                min_trailing = buy_price * 0.93 if buy_price > 0 else trailing_stop
-                trailing_stop = max(trailing_stop, min_trailing)
-                
-                new_stop = max(current_stop, trailing_stop) if current_stop > 0 else trailing_stop
-                
-                if current_stop > 0 and new_stop > current_stop:
-                    reason = f"📈 上调止损 ({current_stop:.2f} → {new_stop:.2f})"
-                else:
-                    reason = f"继续持有 (现价 {current_price:.2f})"
-                
-                pnl = (current_price - buy_price) / buy_price * 100 if buy_price > 0 else 0
-
-            shares = pos.shares if pos.shares > 0 else 0
-            pnl_amount = (current_price - buy_price) * shares if shares > 0 else 0
-            
-            results.append({
-                "code": code,
-                "current_price": safe_round(current_price),
-                "buy_price": safe_round(buy_price),
-                "target_price": safe_round(target) if target > 0 else None,
-                "action": action,
-                "reason": reason,
-                "pnl_percent": safe_round(pnl),
-                "pnl_amount": safe_round(pnl_amount),
-                "new_stop": safe_round(new_stop) if new_stop else None,
-                "record_id": pos.record_id
-            })
-            
-        except Exception as e:
-            logger.error(f"Position check error for {pos.code}: {e}")
-            results.append({
-                "code": pos.code,
-                "action": "ERROR",
-                "reason": str(e),
-                "current_price": None,
-                "new_stop": None
-            })
-    
-    return {"positions": results, "timestamp": datetime.datetime.now().isoformat()}
+                        "reason": "无法获取数据",
+                        "record_id": sig.record_id
+                    }
+                if current_price <= 0:
+                    current_price = float(series.close[-1])
+                completed = scan(series, state, stop, target, before=day_index(today))
+                state = scan(series, completed, stop, target)  # + today's provisional bar
+                if store:
+                    store.put(key, levels, state if state["outcome"] else completed)
+        
+        if not state["outcome"]:
+            outcome = "target" if current_price >= target else "stop" if current_price <= stop else \
+                "timeout" if days_held > timeout_days else None
+            if outcome:
+                state = {**state, "outcome": outcome, "outcome_day": day_index(today),
+                         "exit_price": {"target": target, "stop": stop}.get(outcome, current_price)}
+                if store:
+                    store.put(key, levels, state)
+        
+        outcome = state["outcome"]
+        if not current_price:
+            current_price = state["exit_price"]  # Settled in an earlier run: no quote needed
+        result, action = {"target": ("成功 ✅", "SETTLED"), "stop": ("失败 ❌", "SETTLED"),
+                          "timeout": ("超时 ⏰", "SETTLED")}.get(outcome, ("进行中 ⏳", "PENDING"))
+        pnl = ((state["exit_price"] if outcome else current_price) - entry) / entry * 100
+        settle_date = day_str(state["outcome_day"]) if outcome else None
+        
+        return {
+            "code": code,
+            "signal_result": result,
+            "action": action,
+            "current_price": safe_round(current_price),
+            "pnl_percent": safe_round(pnl),
+            "days_held": days_held,
+            "settle_date": settle_date,
+            "max_high": safe_round(state["max_high"]) if state["max_high"] is not None else None,
+            "min_low": safe_round(state["min_low"]) if state["min_low"] is not None else None,
+            "record_id": sig.record_id
+        }
+        
+    except Exception as e:
+        logger.error(f"Signal settle error for {sig.code}: {e}")
+        return {
+            "code": sig.code,
+            "signal_result": "进行中",
+            "action": "ERROR",
+            "reason": str(e),
+            "record_id": sig.record_id
+        }
+
+def _iter_signals(signals: list):
+    prefetch_quotes([(s.code, s.market) for s in signals if s.signal_result == "进行中"])
+    for sig in signals:
+        yield settle_signal(sig)
 
 @app.post("/settle_signals")
-def settle_signals(req: SignalSettleRequest):
-    results = []
-    
-    for sig in req.signals:
-        if sig.signal_result != "进行中":
-            results.append({
-                "code": sig.code,
-                "signal_result": sig.signal_result,
-                "action": "SKIP",
-                "reason": "已结算",
-                "record_id": sig.record_id
-            })
-            continue
-        
+def settle_signals(req: SignalSettleRequest, request: Request, stream: bool = False):
+    """V15: stream=true (or Accept: application/x-ndjson) emits one NDJSON line per signal"""
+    if wants_stream(request, stream):
+        return ndjson_response(_iter_signals(req.signals))
+    return FastJSONResponse({"signals": list(_iter_signals(req.signals)),
+                             "timestamp": datetime.datetime.now().isoformat()})
+
+def _iter_analyze(req: AnalyzeBatchRequest, profile: str = "full"):
+    prefetch_quotes([(code, req.market) for code in req.codes])
+    for code in req.codes:
         try:
-            code = sig.code
-            # V14: Consistent market detection with check_positions
-            is_hk = len(str(code)) == 5 or sig.market.upper() == "HK"
-            
-            if is_hk:
-                df = DataFetcher.get_hk_share_history(code)
-            else:
-                df = DataFetcher.get_a_share_history(code)
-            
-            if df.empty:
-                results.append({
-                    "code": code,
-                    "signal_result": "进行中",
-                    "action": "ERROR",
-                    "reason": "无法获取数据",
-                    "record_id": sig.record_id
-                })
-                continue
-            
-            current_price = float(df['close'].iloc[-1])
-            
-            # V13: Use realtime price if available (same as check_positions)
-            realtime_price = DataFetcher.get_realtime_price(code, "HK" if is_hk else "CN")
-            if realtime_price > 0:
-                current_price = realtime_price
-            
-            entry = sig.entry_price
-            stop = sig.stop_loss
-            target = sig.take_profit
-            
-            try:
-                signal_date = datetime.datetime.strptime(sig.signal_date, "%Y-%m-%d")
-                days_held = (datetime.datetime.now() - signal_date).days
-            except:
-                days_held = 0
-            
-            # V14: Calculate timeout before evaluation chain
-            timeout_days = 30 if is_hk else 20
-            
-            if current_price >= target:
-                result = "成功 ✅"
-                pnl = (target - entry) / entry * 100
-                action = "SETTLED"
-            elif current_price <= stop:
-                result = "失败 ❌"
-                pnl = (stop - entry) / entry * 100
-                action = "SETTLED"
-            elif days_held > timeout_days:
-                result = "超时 ⏰"
-                pnl = (current_price - entry) / entry * 100
-                action = "SETTLED"
-            else:
-                result = "进行中 ⏳"
-                pnl = (current_price - entry) / entry * 100
-                action = "PENDING"
-            
-            settle_date = datetime.datetime.now().strftime("%Y-%m-%d") if action == "SETTLED" else None
-            
-            results.append({
-                "code": code,
-                "signal_result": result,
-                "action": action,
-                "current_price": safe_round(current_price),
-                "pnl_percent": safe_round(pnl),
-                "days_held": days_held,
-                "settle_date": settle_date,
-                "record_id": sig.record_id
-            })
-            
+            yield shape_analysis(analyze_symbol(code, req.market, req.balance, req.risk, mtf=req.mtf,
+                                                factors=req.factors), profile)
         except Exception as e:
-            logger.error(f"Signal settle error for {sig.code}: {e}")
-            results.append({
-                "code": sig.code,
-                "signal_result": "进行中",
-                "action": "ERROR",
-                "reason": str(e),
-                "record_id": sig.record_id
-            })
-    
-    return {"signals": results, "timestamp": datetime.datetime.now().isoformat()}
+            logger.error(f"Batch analyze error for {code}: {e}")
+            yield {"code": code, "error": str(e)}
+
+@app.post("/analyze_batch")
+def analyze_batch(req: AnalyzeBatchRequest, request: Request, stream: bool = False, profile: str = "full"):
+    """
+    V15: 批量分析 (与 /analyze_full 相同的单票结果, 失败项返回 error)
+    stream=true (或 Accept: application/x-ndjson) 时逐票输出 NDJSON; profile=compact 精简输出
+    """
+    if wants_stream(request, stream):
+        return ndjson_response(_iter_analyze(req, profile))
+    return FastJSONResponse({"results": list(_iter_analyze(req, profile)),
+                             "timestamp": datetime.datetime.now().isoformat()})
+
+# --- V15: Batch Jobs (long-running scans / backfills, polled by n8n) ---
+def _job_symbols(params: dict) -> list:
+    """params.codes (["600519", "HK:00700"]) or the security-master universe of params.market"""
+    market = (params.get("market") or "").upper()
+    codes = params.get("codes") or []
+    if not codes:
+        if market not in ("CN", "HK"):
+            raise ValueError("params.codes or params.market (CN/HK) is required")
+        return [(s.code, s.market) for s in security_master.securities() if s.market == market]
+    items = []
+    for raw in codes:
+        raw = str(raw).strip()
+        if ":" in raw:
+            m, code = raw.split(":", 1)
+            items.append((code.strip(), m.strip().upper()))
+        else:
+            items.append((raw, market if market in ("CN", "HK") else security_master.detect_market(raw)))
+    return items
+
+def _job_label(item) -> str:
+    return f"{item[1]}:{item[0]}"
+
+@job_kind("analyze")
+def _job_analyze(ctx, params: dict) -> dict:
+    items = _job_symbols(params)
+    prefetch_quotes(items)
+    balance = float(params.get("balance", 100000.0))
+    risk = float(params.get("risk", 0.01))
+    profile = params.get("profile", "full")
+    mtf = bool(params.get("mtf", False))
+    factors = bool(params.get("factors", False))
+    return ctx.each(items, lambda item: shape_analysis(analyze_symbol(item[0], item[1], balance, risk, mtf=mtf,
+                                                                      factors=factors), profile),
+                    label=_job_label)
+
+def _job_computed(ctx, items: list, kernel, decorate=None, **params) -> dict:
+    """
+    ctx.each over kernel results from the compute backend (histories loaded here, computed in order).
+    decorate(row) may enrich a result row or drop it by returning None.
+    """
+    results = get_compute_backend().map(kernel, (DataFetcher.get_history_series(code, market)
+                                                 for code, market in items), **params)
+
+    def _next(item):
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        if result is None:
+            return None
+        row = {"code": item[0], "market": item[1], **result}
+        return decorate(row) if decorate else row
+
+    try:
+        return ctx.each(items, _next, label=_job_label)
+    finally:
+        results.close()
+
+@job_kind("screen")
+def _job_screen(ctx, params: dict) -> dict:
+    """
+    Emit only symbols whose trend score reaches params.min_score (default: buy threshold).
+    params.factors attaches factor percentiles; params.min_percentile ({"mom_60": 80, ...}) filters on them.
+    """
+    floors = params.get("min_percentile") or {}
+    unknown = set(floors) - set(factor_names())
+    if unknown:
+        raise ValueError(f"Unknown factors in min_percentile: {', '.join(sorted(unknown))}")
+
+    def _factors(row):
+        ranks = factor_engine.lookup(row["code"], row["market"])
+        pct = (ranks or {}).get("percentiles", {})
+        if any(pct.get(f) is None or pct[f] < float(floor) for f, floor in floors.items()):
+            return None
+        if params.get("factors"):
+            row["factors"] = ranks
+        return row
+
+    return _job_computed(ctx, _job_symbols(params), screen_series,
+                         decorate=_factors if floors or params.get("factors") else None,
+                         min_score=int(params.get("min_score", BUY_SCORE)),
+                         min_bars=int(params.get("min_bars", 60)))
+
+@job_kind("backtest")
+def _job_backtest(ctx, params: dict) -> dict:
+    return _job_computed(ctx, _job_symbols(params), backtest_series,
+                         bars=int(params.get("bars", 0)), min_score=int(params.get("min_score", BUY_SCORE)),
+                         timeout=params.get("timeout"), include_trades=bool(params.get("include_trades", False)))
+
+@job_kind("optimize")
+def _job_optimize(ctx, params: dict) -> dict:
+    """
+    Walk-forward sweep of generate_signal parameters (params.grid, e.g. {"w_ma20": [10, 15, 20]})
+    over params.years of history ending params.end (default today).
+    Results: the ranked parameter sets; summary: per-fold winners and the out-of-sample total.
+    """
+    items = _job_symbols(params)
+    end = datetime.date.fromisoformat(params["end"]) if params.get("end") else datetime.date.today()
+    end_day = (end - datetime.date(1970, 1, 1)).days
+    folds = walk_forward_folds(end_day - int(float(params.get("years", 5)) * 365), end_day + 1,
+                               int(params.get("folds", 4)), int(float(params.get("train_years", 2)) * 365))
+    ctx.set_total(len(items))
+    errors = [0]
+
+    def _on_symbol(result):
+        errors[0] += isinstance(result, Exception)
+        ctx.advance()
+        ctx.check()
+
+    report = run_optimizer((DataFetcher.get_history_series(code, market) for code, market in items),
+                           params.get("grid") or {}, folds, objective=params.get("objective", "expectancy"),
+                           min_trades=int(params.get("min_trades", 30)), top=int(params.get("top", 20)),
+                           timeout=params.get("timeout"), on_symbol=_on_symbol)
+    for row in report.pop("ranking"):
+        ctx.emit(row)
+    return {**report, "errors": errors[0]}
+
+@job_kind("backfill")
+def _job_backfill(ctx, params: dict) -> dict:
+    """Resumable universe backfill into the history store (params.name = checkpoint)"""
+    markets = params.get("markets") or ([params["market"]] if params.get("market") else ["CN", "HK"])
+    codes = _job_symbols(params) if params.get("codes") else None
+    run = Backfill(markets, codes=codes, workers=params.get("workers"), name=params.get("name", "default"),
+                   resume=params.get("resume", True))
+    items = run.pending()
+    ctx.set_total(len(items))
+
+    def _on_result(result):
+        ctx.emit(result)
+        ctx.advance()
+        ctx.check()
+
+    return run.run(items, on_result=_on_result)
+
+@app.post("/jobs")
+def create_job(req: JobRequest):
+    """
+    V15: 提交批量任务 (立即返回 job id, 通过 GET /jobs/{id} 轮询)
+    - analyze: 批量完整分析
+    - screen: 全市场筛选 (trend_score >= min_score)
+    - backtest: 历史信号回测
+    - backfill: 历史数据写入本地存储
+    """
+    try:
+        if req.kind != "backfill" or req.params.get("codes"):
+            _job_symbols(req.params)  # Reject a bad universe now rather than as a failed job
+        return get_job_manager().submit(req.kind, req.params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/jobs")
+def list_jobs(limit: int = 50):
+    return {"jobs": get_job_manager().list(limit), "kinds": get_job_manager().kinds}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, offset: int = 0, limit: int = 500):
+    """进度 + 部分结果 (从 offset 开始, 下次轮询使用 next_offset)"""
+    job = get_job_manager().get(job_id, offset=offset, limit=limit)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return FastJSONResponse(job)
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    manager = get_job_manager()
+    if not manager.cancel(job_id):
+        job = manager.get(job_id, limit=0)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    return manager.get(job_id, limit=0)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Position Monitor
+Clients register positions once; a background cycle re-evaluates every
+subscribed position against one batched quote refresh per market and pushes
+only state changes (SELL_STOP / SELL_TARGET / STOP_RAISED) as server-sent
+events, using the same decision logic as /check_positions.
+Subscriptions and events live in SQLite, so every uvicorn worker on the host
+can create, read and stream them; one worker at a time (lease holder) runs
+the evaluation cycle.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from . import config
+from .fetcher import DataFetcher
+from .quant import calculate_technicals, evaluate_position
+from .security_master import security_master
+from .serialization import dumps
+from .trading_calendar import trading_calendar
+
+logger = logging.getLogger(__name__)
+
+EXITS = ("SELL_STOP", "SELL_TARGET")
+EVALUATOR = "evaluator"  # Lease name of the worker running the cycle
+
+
+class WatchedPosition:
+    """Mutable copy of a registered position; current_stop ratchets as raises are pushed"""
+
+    __slots__ = ("code", "market", "clean_code", "buy_price", "current_stop", "target_price", "shares",
+                 "record_id", "is_hk", "done")
+
+    def __init__(self, pos):
+        self.code = pos.code
+        self.is_hk = pos.market.upper() == "HK" or security_master.detect_market(pos.code) == "HK"
+        self.market = "HK" if self.is_hk else "CN"
+        self.clean_code = DataFetcher._normalize_code(pos.code, self.market)
+        self.buy_price = pos.buy_price
+        self.current_stop = pos.current_stop
+        self.target_price = pos.target_price
+        self.shares = pos.shares
+        self.record_id = pos.record_id
+        self.done = False
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    @classmethod
+    def restore(cls, row: dict) -> "WatchedPosition":
+        pos = cls.__new__(cls)
+        for k in cls.__slots__:
+            setattr(pos, k, row[k])
+        return pos
+
+
+class Subscription:
+    """One subscription as stored: positions with their current state"""
+
+    def __init__(self, sub_id: str, positions: list, created_at: float, last_seen: float):
+        self.id = sub_id
+        self.positions = positions
+        self.created_at = created_at
+        self.last_seen = last_seen
+
+    def summary(self) -> dict:
+        return {"id": self.id, "positions": len(self.positions),
+                "active": sum(1 for p in self.positions if not p.done)}
+
+
+class MonitorStore:
+    """Subscriptions, their event backlog and the evaluator lease (SQLite; shared by every worker on the host)"""
+
+    def __init__(self, path: str = ""):
+        self.path = path or config.data_path("monitor.sqlite")
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""CREATE TABLE IF NOT EXISTS subscriptions (
+            id TEXT PRIMARY KEY, positions TEXT, created_at REAL, last_seen REAL)""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS events (
+            sub_id TEXT, id INTEGER, kind TEXT, data TEXT, PRIMARY KEY (sub_id, id))""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY, owner TEXT, expires_at REAL)""")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _subscription(row) -> Subscription:
+        positions = [WatchedPosition.restore(p) for p in json.loads(row[1])]
+        return Subscription(row[0], positions, row[2], row[3])
+
+    def create(self, sub: Subscription):
+        self._conn().execute("INSERT INTO subscriptions (id, positions, created_at, last_seen) VALUES (?, ?, ?, ?)",
+                             (sub.id, json.dumps([p.to_dict() for p in sub.positions]), sub.created_at,
+                              sub.last_seen))
+
+    def get(self, sub_id: str) -> Subscription:
+        row = self._conn().execute("SELECT id, positions, created_at, last_seen FROM subscriptions WHERE id = ?",
+                                   (sub_id,)).fetchone()
+        return self._subscription(row) if row else None
+
+    def all(self) -> list:
+        rows = self._conn().execute("SELECT id, positions, created_at, last_seen FROM subscriptions").fetchall()
+        return [self._subscription(r) for r in rows]
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM subscriptions").fetchone()[0]
+
+    def save_positions(self, sub: Subscription):
+        self._conn().execute("UPDATE subscriptions SET positions = ? WHERE id = ?",
+                             (json.dumps([p.to_dict() for p in sub.positions]), sub.id))
+
+    def touch(self, sub_id: str) -> bool:
+        """Mark a subscription as listened to; False when it no longer exists"""
+        cur = self._conn().execute("UPDATE subscriptions SET last_seen = ? WHERE id = ?", (time.time(), sub_id))
+        return cur.rowcount > 0
+
+    def exists(self, sub_id: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM subscriptions WHERE id = ?", (sub_id,)).fetchone() is not None
+
+    def delete(self, sub_id: str) -> bool:
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            deleted = conn.execute("DELETE FROM subscriptions WHERE id = ?", (sub_id,)).rowcount > 0
+            conn.execute("DELETE FROM events WHERE sub_id = ?", (sub_id,))
+        return deleted
+
+    def idle(self, before: float) -> list:
+        return [r[0] for r in self._conn().execute("SELECT id FROM subscriptions WHERE last_seen < ?", (before,))]
+
+    def append(self, sub_id: str, kind: str, data: dict) -> int:
+        """Next event id of the subscription (None if it was deleted meanwhile); keeps the last MONITOR_BUFFER"""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM subscriptions WHERE id = ?", (sub_id,)).fetchone() is None:
+                return None
+            event_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM events WHERE sub_id = ?",
+                                    (sub_id,)).fetchone()[0]
+            conn.execute("INSERT INTO events (sub_id, id, kind, data) VALUES (?, ?, ?, ?)",
+                         (sub_id, event_id, kind, dumps(data).decode("utf-8")))
+            conn.execute("DELETE FROM events WHERE sub_id = ? AND id <= ?", (sub_id, event_id - config.MONITOR_BUFFER))
+        return event_id
+
+    def events(self, sub_id: str, after: int = 0) -> list:
+        rows = self._conn().execute("SELECT id, kind, data FROM events WHERE sub_id = ? AND id > ? ORDER BY id",
+                                    (sub_id, after)).fetchall()
+        return [(r[0], r[1], json.loads(r[2])) for r in rows]
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        """Take or renew a lease; False while another live owner holds it"""
+        now = time.time()
+        cur = self._conn().execute(
+            """INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+               ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+               WHERE leases.expires_at < ? OR leases.owner = excluded.owner""",
+            (name, owner, now + ttl, now))
+        return cur.rowcount > 0
+
+    def release(self, name: str, owner: str):
+        self._conn().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+
+def sse(event) -> bytes:
+    event_id, kind, data = event
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (event_id, kind.encode(), dumps(data))
+
+
+class PositionMonitor:
+    """
+    Subscriptions + the evaluation cycle. Every worker with subscriptions runs a background
+    thread while any exist; only the holder of the evaluator lease evaluates, the others stand by.
+    """
+
+    def __init__(self, interval: float = None, store: MonitorStore = None):
+        self.interval = interval or config.MONITOR_INTERVAL
+        self._store = store
+        self._lock = threading.Lock()
+        self._atr = {}  # (market, clean_code) -> (last bar day, atr14)
+        self._wake = threading.Event()
+        self._thread = None
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.evaluating = False
+        self.listeners = 0
+        self.cycles = 0
+        self.events = 0
+        self.last_cycle_ms = 0
+
+    @property
+    def store(self) -> MonitorStore:
+        with self._lock:
+            if self._store is None:
+                self._store = MonitorStore()
+            return self._store
+
+    # --- Subscriptions ---
+    def subscribe(self, positions: list) -> Subscription:
+        now = time.time()
+        sub = Subscription(uuid.uuid4().hex[:12], [WatchedPosition(p) for p in positions], now, now)
+        self.store.create(sub)
+        self._ensure_thread()
+        self._wake.set()  # Evaluate new positions without waiting a full interval
+        return sub
+
+    def get(self, sub_id: str) -> Subscription:
+        return self.store.get(sub_id)
+
+    def unsubscribe(self, sub_id: str) -> bool:
+        return self.store.delete(sub_id)
+
+    def event_log(self, sub_id: str, after: int = 0) -> list:
+        """Buffered events of a subscription as (id, kind, data)"""
+        return self.store.events(sub_id, after)
+
+    def _expire(self, now: float):
+        for sub_id in self.store.idle(now - config.MONITOR_IDLE_TTL):
+            logger.info(f"Position monitor: dropping idle subscription {sub_id}")
+            self.unsubscribe(sub_id)
+
+    # --- Cycle ---
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="position-monitor", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        lease_ttl = max(3 * self.interval, 60)
+        while True:
+            try:
+                if not self.store.count():
+                    self.store.release(EVALUATOR, self.owner)
+                    with self._lock:
+                        self._thread = None
+                        self.evaluating = False
+                    return
+                # One evaluator per host: the others take over once its lease lapses
+                self.evaluating = self.store.acquire(EVALUATOR, self.owner, lease_ttl)
+                if self.evaluating:
+                    self.run_cycle()
+            except Exception as e:
+                logger.error(f"Position monitor cycle failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _atr14(self, pos: WatchedPosition, price: float) -> float:
+        """ATR from the cached daily history; recomputed only when a new daily bar appears"""
+        key = (pos.market, pos.clean_code)
+        series = DataFetcher.get_history_series(pos.clean_code, pos.market)
+        day = int(series.days[-1]) if len(series) else None
+        hit = self._atr.get(key)
+        if hit is None or hit[0] != day:
+            atr = calculate_technicals(series).get('atr14', 0) if day is not None else 0
+            hit = self._atr[key] = (day, atr)
+        return hit[1] if hit[1] and hit[1] > 0 else price * 0.03
+
+    def run_cycle(self, now: float = None) -> int:
+        """One quote round per open market, then evaluate every active position; returns events pushed"""
+        now = time.time() if now is None else now
+        start = time.time()
+        self._expire(now)
+        subs = self.store.all()
+        active = [(s, p) for s in subs for p in s.positions if not p.done]
+        by_market = {}
+        for _, p in active:
+            by_market.setdefault(p.market, set()).add(p.clean_code)
+        prices = {}
+        for market, codes in by_market.items():
+            if config.TRADING_CALENDAR and not trading_calendar.is_open(market, now):
+                continue
+            try:
+                for code, price in DataFetcher.get_realtime_prices(sorted(codes), market).items():
+                    prices[(market, code)] = price
+            except Exception as e:
+                logger.warning(f"Position monitor quotes failed for {market}: {e}")
+
+        pushed = 0
+        changed = {}
+        for sub, pos in active:
+            price = prices.get((pos.market, pos.clean_code), 0.0)
+            if price <= 0:
+                continue
+            try:
+                result = evaluate_position(pos, price, self._atr14(pos, price), pos.is_hk)
+            except Exception as e:
+                logger.warning(f"Position monitor: {pos.code} evaluation failed: {e}")
+                continue
+            kind = self._transition(pos, result)
+            if kind:
+                changed[sub.id] = sub
+                self.store.append(sub.id, kind, {**result, "event": kind, "market": pos.market,
+                                                 "timestamp": datetime.datetime.fromtimestamp(now).isoformat()})
+                pushed += 1
+        for sub in changed.values():
+            self.store.save_positions(sub)
+        self.cycles += 1
+        self.events += pushed
+        self.last_cycle_ms = int((time.time() - start) * 1000)
+        return pushed
+
+    @staticmethod
+    def _transition(pos: WatchedPosition, result: dict) -> str:
+        """Event kind if the evaluation changed the position's state, else None"""
+        if result["action"] in EXITS:
+            pos.done = True
+            return result["action"]
+        new_stop = result["new_stop"]
+        if new_stop and new_stop > round(pos.current_stop, 2):
+            result["previous_stop"] = round(pos.current_stop, 2) if pos.current_stop > 0 else None
+            pos.current_stop = new_stop
+            return "STOP_RAISED"
+        return None
+
+    # --- SSE ---
+    async def stream(self, sub: Subscription, last_event_id: int = 0):
+        """Backlog after last_event_id, then live events polled from the shared store (any worker);
+        heartbeats keep proxies from timing out. Ends after MONITOR_STREAM_MAX seconds
+        (EventSource reconnects with Last-Event-ID) or when the subscription is deleted."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + config.MONITOR_STREAM_MAX
+        self._ensure_thread()  # Take over evaluation if the worker that ran it is gone
+        self.listeners += 1
+        try:
+            yield b"retry: 5000\n\n"
+            last_write = last_touch = loop.time()
+            while True:
+                # last_seen is refreshed once per heartbeat (idle expiry); plain existence checks in between
+                touch = loop.time() - last_touch >= config.MONITOR_HEARTBEAT
+                if touch:
+                    last_touch = loop.time()
+                if not await asyncio.to_thread(self.store.touch if touch else self.store.exists, sub.id):
+                    return  # Unsubscribed
+                for event in await asyncio.to_thread(self.store.events, sub.id, last_event_id):
+                    last_event_id = event[0]
+                    last_write = loop.time()
+                    yield sse(event)
+                if loop.time() - last_write >= config.MONITOR_HEARTBEAT:
+                    last_write = loop.time()
+                    yield b": keepalive\n\n"
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return
+                await asyncio.sleep(min(config.MONITOR_POLL, config.MONITOR_HEARTBEAT, remaining))
+        finally:
+            self.listeners -= 1
+
+    def stats(self) -> dict:
+        subs = self.store.all()
+        return {"subscriptions": len(subs), "positions": sum(len(s.positions) for s in subs),
+                "active": sum(1 for s in subs for p in s.positions if not p.done),
+                "listeners": self.listeners, "evaluator": self.evaluating, "cycles": self.cycles,
+                "events": self.events, "last_cycle_ms": self.last_cycle_ms}
+
+
+position_monitor = PositionMonitor()
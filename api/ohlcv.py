@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Compact OHLCV Container
+Contiguous NumPy columns (int32 day index, float32/float64 prices, float64 volume)
+with a zero-copy DataFrame view for code that still expects pandas.
+28 bytes/bar with float32 prices vs ~48 bytes/bar + object overhead per DataFrame.
+"""
+import struct
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["date", "open", "high", "low", "close", "volume"]
+
+# Binary layout: header | meta (utf-8 "code|market|source") | days i4 | o h l c (f4/f8) | volume f8
+_MAGIC = b"OHL1"
+_HEADER = struct.Struct("<4scIH")  # magic, price dtype char, bars, meta length
+
+
+def period_keys(days: np.ndarray, period: str) -> np.ndarray:
+    """Bucket id per day index: ISO week (Monday start) or calendar month"""
+    if period == "W":
+        return (np.asarray(days, dtype=np.int64) + 3) // 7  # 1970-01-01 was a Thursday
+    if period == "M":
+        return np.asarray(days).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    raise ValueError(f"Unknown period '{period}' (W / M)")
+
+
+class OHLCVSeries:
+    """Daily bars for one symbol, ascending by date, read-only arrays"""
+    __slots__ = ("code", "market", "source", "days", "open", "high", "low", "close", "volume")
+    FIELDS = ("days", "open", "high", "low", "close", "volume")
+
+    def __init__(self, dates, open, high, low, close, volume,
+                 code: str = "", market: str = "", source: str = "",
+                 price_dtype=np.float64):
+        self.code = code
+        self.market = market
+        self.source = source
+        # Days since 1970-01-01 (int32 covers +/- 5.8 million years)
+        self.days = self._freeze(np.asarray(dates).astype("datetime64[D]").astype(np.int32))
+        self.open = self._freeze(np.asarray(open, dtype=price_dtype))
+        self.high = self._freeze(np.asarray(high, dtype=price_dtype))
+        self.low = self._freeze(np.asarray(low, dtype=price_dtype))
+        self.close = self._freeze(np.asarray(close, dtype=price_dtype))
+        self.volume = self._freeze(np.asarray(volume, dtype=np.float64))
+
+    @staticmethod
+    def _freeze(arr: np.ndarray) -> np.ndarray:
+        # Shared by caches and views: callers must never mutate in place
+        arr = np.ascontiguousarray(arr)
+        arr.flags.writeable = False
+        return arr
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, code: str = "", market: str = "", source: str = "",
+                   price_dtype=np.float64) -> "OHLCVSeries":
+        if df is None or df.empty:
+            return cls.empty(code, market, source, price_dtype)
+        return cls(df["date"].to_numpy(), df["open"].to_numpy(), df["high"].to_numpy(),
+                   df["low"].to_numpy(), df["close"].to_numpy(), df["volume"].to_numpy(),
+                   code=code, market=market, source=source, price_dtype=price_dtype)
+
+    @classmethod
+    def wrap(cls, days, open, high, low, close, volume,
+             code: str = "", market: str = "", source: str = "") -> "OHLCVSeries":
+        """Adopt existing column arrays as-is (views over buffers / memmaps: no conversion, no copy)"""
+        out = cls.__new__(cls)
+        out.code, out.market, out.source = code, market, source
+        out.days, out.open, out.high, out.low, out.close, out.volume = days, open, high, low, close, volume
+        return out
+
+    @classmethod
+    def empty(cls, code: str = "", market: str = "", source: str = "", price_dtype=np.float64) -> "OHLCVSeries":
+        z = np.empty(0)
+        return cls(np.empty(0, dtype="datetime64[D]"), z, z, z, z, z,
+                   code=code, market=market, source=source, price_dtype=price_dtype)
+
+    def to_frame(self) -> pd.DataFrame:
+        """DataFrame view in COLUMNS order; price/volume columns share memory with this series"""
+        return pd.DataFrame({
+            "date": self.dates,  # Only the date column is materialised (datetime64[s])
+            "open": self.open, "high": self.high, "low": self.low,
+            "close": self.close, "volume": self.volume,
+        }, columns=COLUMNS, copy=False)
+
+    # --- Binary codec (shared caches / network backends) ---
+    def to_bytes(self) -> bytes:
+        meta = f"{self.code}|{self.market}|{self.source}".encode("utf-8")
+        header = _HEADER.pack(_MAGIC, self.close.dtype.char.encode(), len(self), len(meta))
+        return b"".join([header, meta] + [getattr(self, f).tobytes() for f in self.FIELDS])
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> "OHLCVSeries":
+        """Arrays are read-only views over raw (no copy)"""
+        magic, dtype_char, n, meta_len = _HEADER.unpack_from(raw, 0)
+        if magic != _MAGIC:
+            raise ValueError("Not an OHLCVSeries payload")
+        offset = _HEADER.size
+        code, market, source = bytes(raw[offset:offset + meta_len]).decode("utf-8").split("|", 2)
+        offset += meta_len
+        price_dtype = np.dtype(dtype_char.decode())
+        columns = []
+        for dtype in [np.int32] + [price_dtype] * 4 + [np.float64]:
+            columns.append(np.frombuffer(raw, dtype=dtype, count=n, offset=offset))
+            offset += columns[-1].nbytes
+        return cls.wrap(*columns, code=code, market=market, source=source)
+
+    # --- Helpers ---
+    def __len__(self) -> int:
+        return len(self.days)
+
+    @property
+    def dates(self) -> np.ndarray:
+        return self.days.astype("datetime64[D]")
+
+    @property
+    def last_date(self):
+        return np.datetime64(int(self.days[-1]), "D") if len(self.days) else None
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, f).nbytes for f in self.FIELDS)
+
+    def tail(self, n: int) -> "OHLCVSeries":
+        return self.slice(max(len(self) - n, 0), len(self))
+
+    def slice(self, start: int, stop: int) -> "OHLCVSeries":
+        """Row range as views (no copy)"""
+        return OHLCVSeries.wrap(*(getattr(self, f)[start:stop] for f in self.FIELDS),
+                                code=self.code, market=self.market, source=self.source)
+
+    # --- Timeframes ---
+    def resample(self, period: str) -> "OHLCVSeries":
+        """Weekly ('W') / monthly ('M') bars; each bar is dated on its last trading day"""
+        return self._resample(period)[0]
+
+    def _resample(self, period: str):
+        """(resampled series, index of the first daily bar in the last bucket)"""
+        if not len(self):
+            return OHLCVSeries.wrap(*(getattr(self, f)[:0] for f in self.FIELDS),
+                                    code=self.code, market=self.market, source=self.source), 0
+        keys = period_keys(self.days, period)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+        ends = np.append(starts[1:], len(keys)) - 1
+        out = OHLCVSeries.wrap(
+            self.days[ends], self.open[starts],
+            np.maximum.reduceat(self.high, starts), np.minimum.reduceat(self.low, starts),
+            self.close[ends], np.add.reduceat(self.volume, starts),
+            code=self.code, market=self.market, source=self.source)
+        return out, int(starts[-1])
+
+    def __repr__(self) -> str:
+        span = f"{np.datetime64(int(self.days[0]), 'D')}..{self.last_date}" if len(self) else "empty"
+        return f"OHLCVSeries({self.market}:{self.code}, {len(self)} bars, {span}, {self.close.dtype})"
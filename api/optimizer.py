@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Signal Parameter Optimizer
+Sweeps generate_signal's SIGNAL_PARAMS (plus the entry threshold min_score) over
+a universe with walk-forward train/test folds. Indicators are computed once per
+symbol (backtest.indicator_frame); each parameter set then costs one vectorized
+rescoring of every bar plus the trade walk. Symbols run on the compute backend,
+so a process pool spreads the sweep over all cores.
+"""
+import itertools
+import logging
+import math
+
+import numpy as np
+
+from . import config
+from .backtest import BUY_SCORE, indicator_frame, trade_exit
+from .compute import get_compute_backend
+from .quant import SIGNAL_PARAMS
+
+logger = logging.getLogger(__name__)
+
+OBJECTIVES = ("expectancy", "win_rate", "return")
+_ROUNDED = ("current_price", "ma5", "ma20", "rsi14", "volume_ratio", "atr14", "support_level")
+# Per (param set, fold, train/test): trades, wins, sum of trade returns, sum of log growth
+_TRADES, _WINS, _PNL, _LOG = range(4)
+
+
+def expand_grid(grid: dict) -> list:
+    """{"w_ma20": [10, 15], "min_score": [60, 65]} -> list of parameter dicts (cartesian product)"""
+    if not grid:
+        return [{}]
+    unknown = set(grid) - set(SIGNAL_PARAMS) - {"min_score"}
+    if unknown:
+        raise ValueError(f"Unknown signal parameters: {', '.join(sorted(unknown))}")
+    keys = sorted(grid)
+    values = [v if isinstance(v, (list, tuple)) else [v] for v in (grid[k] for k in keys)]
+    size = math.prod(len(v) for v in values)
+    if size > config.OPTIMIZER_MAX_GRID:
+        raise ValueError(f"Grid has {size} combinations (max {config.OPTIMIZER_MAX_GRID})")
+    return [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+
+
+def walk_forward_folds(start_day: int, end_day: int, folds: int, train_days: int) -> list:
+    """Rolling (train_lo, train_hi, test_lo, test_hi) day-index windows; tests tile [start + train, end)"""
+    test_days = (end_day - start_day - train_days) // folds
+    if folds < 1 or train_days < 1 or test_days < 1:
+        raise ValueError("Date range too short for the requested folds / training window")
+    out = []
+    for k in range(folds):
+        train_lo = start_day + k * test_days
+        test_lo = train_lo + train_days
+        out.append((train_lo, test_lo, test_lo, test_lo + test_days))
+    return out
+
+
+# --- Vectorized generate_signal over precomputed indicator columns ---
+def prepare(series) -> dict:
+    """Indicator columns rounded exactly as calculate_technicals/_tech_at feed generate_signal"""
+    ind = indicator_frame(series)
+    cols = {f: np.nan_to_num(np.round(ind[f].to_numpy(dtype=np.float64), 2), nan=0.0, posinf=0.0, neginf=0.0)
+            for f in _ROUNDED}
+    cols["macd_hist"] = np.nan_to_num(np.round(ind["macd_hist"].to_numpy(dtype=np.float64), 4),
+                                      nan=0.0, posinf=0.0, neginf=0.0)
+    cross = ind["macd_cross"].to_numpy()
+    alignment = ind["ma_alignment"].to_numpy().astype(str)
+    cols["golden"], cols["death"] = cross == "golden", cross == "death"
+    cols["bull"] = np.char.find(alignment, "多头") >= 0
+    cols["bear"] = ~cols["bull"] & (np.char.find(alignment, "空头") >= 0)
+    cols["high"] = ind["high"].to_numpy(dtype=np.float64)
+    cols["low"] = ind["low"].to_numpy(dtype=np.float64)
+    cols["close"] = ind["current_price"].to_numpy(dtype=np.float64)
+    cols["days"] = np.asarray(series.days)
+    return cols
+
+
+def score_bars(cols: dict, P: dict, is_hk: bool) -> tuple:
+    """
+    (trend_score, stop_loss, take_profit) for every bar, as generate_signal(tech_i, is_hk, P) computes
+    them before rounding (np.round differs from round() on near-ties; callers round the bars they use)
+    """
+    p, ma5, ma20 = cols["current_price"], cols["ma5"], cols["ma20"]
+    rsi, vr = cols["rsi14"], cols["volume_ratio"]
+    above5, above20 = p > ma5, p > ma20
+
+    score = 50 + np.where(above5, P["w_ma5"], -P["w_ma5"]) + np.where(above20, P["w_ma20"], -P["w_ma20"])
+    score = score + np.select([cols["golden"], cols["death"], cols["macd_hist"] > 0],
+                              [P["w_macd_cross"], -P["w_macd_cross"], P["w_macd_hist"]], -P["w_macd_hist"])
+    score = score + np.select(
+        [rsi > P["rsi_extreme_high"], rsi > P["rsi_high"], rsi < P["rsi_extreme_low"], rsi < P["rsi_low"]],
+        [-P["w_rsi_extreme_high"], -P["w_rsi_high"], np.where(above5, P["w_rsi_rebound"], P["w_rsi_unstable"]),
+         P["w_rsi_low"]], 0)
+    score = score + np.select(
+        [vr > P["vol_surge"], (vr > P["vol_mild"]) & above5, vr < P["vol_dry"]],
+        [np.where(above5, P["w_vol_surge"], -P["w_vol_surge"]), P["w_vol_mild"], -P["w_vol_dry"]], 0)
+    score = score + np.select([cols["bull"], cols["bear"]], [P["w_alignment"], -P["w_alignment"]], 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vcp = above20 & (ma5 > ma20) & (ma20 > 0) & (np.abs(ma5 - ma20) / ma20 < P["vcp_band"]) \
+              & (vr > P["vol_mild"])
+    score = np.clip(score + np.where(vcp, P["w_vcp"], 0), 0, 100)
+
+    atr = np.where(cols["atr14"] > 0, cols["atr14"], p * 0.03)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        volatility_pct = np.where(p > 0, atr / p * 100, 3.0)
+    multiplier = (P["stop_atr_hk"] if is_hk else P["stop_atr_cn"]) + \
+        np.where(volatility_pct > P["high_vol_pct"], P["high_vol_atr"], 0.0)
+    atr_stop = p - multiplier * atr
+    supp = cols["support_level"]
+    stop = np.where((supp > 0) & (supp < p), np.maximum(atr_stop, supp * 0.98), atr_stop)
+    stop = np.maximum(stop, p * (1 - (P["max_loss_hk"] if is_hk else P["max_loss_cn"])))
+    risk = p - stop
+    rr = np.select([score >= 80, score >= 60], [P["rr_strong"], P["rr_normal"]], P["rr_weak"])
+    target = np.where(risk > 0, p + rr * risk, p * 1.1)
+    return score, stop, target
+
+
+def _trades(cols: dict, score, stop, target, min_score: float, lo: int, hi: int,
+            warmup: int, timeout: int) -> np.ndarray:
+    """Trade returns (fractions) for entries in [lo, hi - 1), exits never looking past hi"""
+    highs, lows, closes = cols["high"], cols["low"], cols["close"]
+    entries = np.flatnonzero(score[:hi - 1] >= min_score)
+    pnl = []
+    i = max(lo, warmup)
+    while True:
+        k = np.searchsorted(entries, i)
+        if k == len(entries):
+            break
+        i = int(entries[k])
+        exit_i, price, _ = trade_exit(highs, lows, closes, i, round(float(stop[i]), 2),
+                                      round(float(target[i]), 2), timeout, hi)
+        pnl.append((price - closes[i]) / closes[i] if closes[i] else 0.0)
+        i = exit_i + 1
+    return np.asarray(pnl, dtype=np.float64)
+
+
+def sweep_series(series, grid: list, folds: list, warmup: int = 60, timeout: int = None) -> np.ndarray:
+    """Compute-backend kernel: per-(param set, fold, train/test) trade totals for one symbol"""
+    out = np.zeros((len(grid), len(folds), 2, 4))
+    if len(series) <= warmup:
+        return out
+    is_hk = series.market == "HK"
+    timeout = timeout or (30 if is_hk else 20)
+    cols = prepare(series)
+    bounds = [tuple(int(x) for x in np.searchsorted(cols["days"], fold)) for fold in folds]
+    for g, overrides in enumerate(grid):
+        overrides = dict(overrides)
+        min_score = overrides.pop("min_score", BUY_SCORE)
+        score, stop, target = score_bars(cols, {**SIGNAL_PARAMS, **overrides}, is_hk)
+        for f, (train_lo, train_hi, test_lo, test_hi) in enumerate(bounds):
+            for split, (lo, hi) in enumerate(((train_lo, train_hi), (test_lo, test_hi))):
+                if hi - lo < 2:
+                    continue
+                pnl = _trades(cols, score, stop, target, min_score, lo, hi, warmup, timeout)
+                if len(pnl):
+                    out[g, f, split] = (len(pnl), (pnl > 0).sum(), pnl.sum(), np.log1p(pnl).sum())
+    return out
+
+
+# --- Report ---
+def _metrics(totals: np.ndarray, symbols: int) -> dict:
+    trades = int(totals[_TRADES])
+    if not trades:
+        return {"trades": 0, "win_rate": 0.0, "expectancy_percent": 0.0, "return_percent": 0.0}
+    return {"trades": trades,
+            "win_rate": round(totals[_WINS] / trades * 100, 2),
+            "expectancy_percent": round(totals[_PNL] / trades * 100, 3),
+            "return_percent": round(math.expm1(totals[_LOG] / max(symbols, 1)) * 100, 2)}
+
+
+def _objective(totals: np.ndarray, symbols: int, objective: str, min_trades: int) -> float:
+    if totals[_TRADES] < max(min_trades, 1):
+        return -math.inf
+    if objective == "win_rate":
+        return totals[_WINS] / totals[_TRADES]
+    if objective == "return":
+        return totals[_LOG] / max(symbols, 1)
+    return totals[_PNL] / totals[_TRADES]
+
+
+def _day(day: int) -> str:
+    return str(np.datetime64(int(day), "D"))
+
+
+def summarize(totals: np.ndarray, grid: list, folds: list, symbols: int, objective: str = "expectancy",
+              min_trades: int = 30, top: int = 20) -> dict:
+    """Per-fold winners on train -> out-of-sample walk-forward result, plus ranking by total train objective"""
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective '{objective}' ({' / '.join(OBJECTIVES)})")
+    fold_reports, oos = [], np.zeros(4)
+    for f, (train_lo, train_hi, test_lo, test_hi) in enumerate(folds):
+        scores = [_objective(totals[g, f, 0], symbols, objective, min_trades) for g in range(len(grid))]
+        best = int(np.argmax(scores))
+        oos += totals[best, f, 1]
+        fold_reports.append({"train": [_day(train_lo), _day(train_hi - 1)], "test": [_day(test_lo), _day(test_hi - 1)],
+                             "best": grid[best], "qualified": bool(np.isfinite(scores[best])),
+                             "train_metrics": _metrics(totals[best, f, 0], symbols),
+                             "test_metrics": _metrics(totals[best, f, 1], symbols)})
+    train, test = totals[:, :, 0].sum(axis=1), totals[:, :, 1].sum(axis=1)
+    keys = [_objective(train[g], symbols, objective, min_trades * len(folds)) for g in range(len(grid))]
+    order = sorted(range(len(grid)), key=lambda g: keys[g], reverse=True)[:top]
+    ranking = [{"rank": r + 1, "params": grid[g], "train": _metrics(train[g], symbols), "test": _metrics(test[g], symbols)}
+               for r, g in enumerate(order)]
+    return {"symbols": symbols, "grid_size": len(grid), "objective": objective, "folds": fold_reports,
+            "walk_forward": _metrics(oos, symbols), "ranking": ranking}
+
+
+def run_optimizer(series, grid: dict, folds: list, objective: str = "expectancy", min_trades: int = 30,
+                  top: int = 20, timeout: int = None, backend=None, on_symbol=None) -> dict:
+    """Sweep `grid` over an iterable of OHLCVSeries; on_symbol(result_or_exception) after each symbol"""
+    combos = expand_grid(grid)
+    totals = np.zeros((len(combos), len(folds), 2, 4))
+    symbols = 0
+    backend = backend or get_compute_backend()
+    for result in backend.map(sweep_series, series, grid=combos, folds=folds, timeout=timeout):
+        if not isinstance(result, Exception):
+            totals += result
+            symbols += bool(result[:, :, :, _TRADES].any())
+        if on_symbol:
+            on_symbol(result)
+    return summarize(totals, combos, folds, symbols, objective, min_trades, top)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Source-Specific Parsers
+Each provider's exact schema -> typed NumPy arrays -> standard OHLCV frame.
+Raise SchemaDrift when the payload does not look as expected; the fetcher
+then falls back to the generic DataFetcher._clean_data.
+"""
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["date", "open", "high", "low", "close", "volume"]
+UTC_OFFSET = 8 * 3600  # Exchange timestamps are local UTC+8 wall time
+LOT_SHARES = 100  # 1 手
+# A-share daily sources counting volume in lots; Baostock / Sina / Yahoo and every HK source count shares
+VOLUME_IN_LOTS = ("efinance", "AkShare", "Tencent", "Qstock", "Pytdx")
+
+
+class MinuteBars(NamedTuple):
+    """Intraday bars as typed arrays; ts = bar end, epoch seconds"""
+    ts: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+
+class SchemaDrift(ValueError):
+    """Provider payload no longer matches the expected schema"""
+
+
+def _dates(values) -> np.ndarray:
+    """ISO strings / datetime.date / datetime64 -> datetime64[D] (explicit day format, no inference)"""
+    try:
+        return np.asarray(values).astype("datetime64[D]")
+    except (ValueError, TypeError) as e:
+        raise SchemaDrift(f"Unparseable dates: {e}")
+
+
+def _numbers(values, dtype) -> np.ndarray:
+    try:
+        return np.asarray(values, dtype=dtype)
+    except (ValueError, TypeError) as e:
+        raise SchemaDrift(f"Unparseable numbers: {e}")
+
+
+def build_frame(dates, opens, highs, lows, closes, volumes, price_dtype=np.float64) -> pd.DataFrame:
+    """Assemble typed columns; sort/dedupe only when the source is not already strictly ascending"""
+    d = _dates(dates)
+    o = _numbers(opens, price_dtype)
+    h = _numbers(highs, price_dtype)
+    lo = _numbers(lows, price_dtype)
+    c = _numbers(closes, price_dtype)
+    v = _numbers(volumes, np.float64)
+    if not (len(d) == len(o) == len(h) == len(lo) == len(c) == len(v)):
+        raise SchemaDrift("Column length mismatch")
+
+    if len(d) > 1 and not (d[1:] > d[:-1]).all():
+        # Keep last occurrence per date (same as drop_duplicates keep='last'), ascending
+        rev = d[::-1]
+        _, first_in_rev = np.unique(rev, return_index=True)
+        idx = len(d) - 1 - first_in_rev
+        d, o, h, lo, c, v = d[idx], o[idx], h[idx], lo[idx], c[idx], v[idx]
+
+    valid = ~(np.isnan(o) | np.isnan(c))
+    if not valid.all():
+        d, o, h, lo, c, v = d[valid], o[valid], h[valid], lo[valid], c[valid], v[valid]
+
+    return pd.DataFrame({
+        "date": d.astype("datetime64[ns]"),
+        "open": o, "high": h, "low": lo, "close": c, "volume": v,
+    }, columns=COLUMNS)
+
+
+def to_shares(df: pd.DataFrame, source: str) -> pd.DataFrame:
+    """Scale a lot-based source's volume to shares, so one series (and one panel) never mixes units"""
+    if source.split("(", 1)[0] in VOLUME_IN_LOTS and "volume" in df.columns:
+        df["volume"] = df["volume"] * LOT_SHARES
+    return df
+
+
+def _require(df: pd.DataFrame, cols):
+    missing = [c for c in cols if c not in df.columns]
+    if missing:
+        raise SchemaDrift(f"Missing columns: {missing}")
+
+
+# --- Providers ---
+def parse_eastmoney(df: pd.DataFrame, price_dtype=np.float64) -> pd.DataFrame:
+    """efinance get_quote_history / AkShare stock_zh_a_hist (Chinese headers, ascending)"""
+    cols = ["日期", "开盘", "最高", "最低", "收盘", "成交量"]
+    _require(df, cols)
+    return build_frame(*(df[c].to_numpy() for c in cols), price_dtype=price_dtype)
+
+
+def parse_english(df: pd.DataFrame, price_dtype=np.float64) -> pd.DataFrame:
+    """Sina stock_zh_a_daily / AkShare stock_hk_daily (lowercase headers, ascending)"""
+    _require(df, COLUMNS)
+    return build_frame(*(df[c].to_numpy() for c in COLUMNS), price_dtype=price_dtype)
+
+
+def parse_tencent(rows: list, price_dtype=np.float64) -> pd.DataFrame:
+    """Tencent fqkline rows: [date, open, close, high, low, volume, ...] as strings"""
+    if not rows or len(rows[0]) < 6:
+        raise SchemaDrift("Unexpected Tencent kline row layout")
+    try:
+        num = np.array([r[1:6] for r in rows], dtype=np.float64)
+    except (ValueError, TypeError) as e:
+        raise SchemaDrift(f"Unparseable Tencent row: {e}")
+    dates = [r[0] for r in rows]
+    return build_frame(dates, num[:, 0], num[:, 2], num[:, 3], num[:, 1], num[:, 4], price_dtype=price_dtype)
+
+
+def parse_pytdx(rows: list, price_dtype=np.float64) -> pd.DataFrame:
+    """Pytdx get_security_bars dicts (datetime 'YYYY-MM-DD HH:MM', ascending)"""
+    if not rows or not {"datetime", "open", "high", "low", "close", "vol"}.issubset(rows[0]):
+        raise SchemaDrift("Unexpected Pytdx bar layout")
+    return build_frame(
+        [r["datetime"][:10] for r in rows],
+        [r["open"] for r in rows], [r["high"] for r in rows],
+        [r["low"] for r in rows], [r["close"] for r in rows],
+        [r["vol"] for r in rows], price_dtype=price_dtype)
+
+
+def parse_baostock(fields: list, rows: list, price_dtype=np.float64) -> pd.DataFrame:
+    """Baostock query_history_k_data_plus rows (all strings, ascending)"""
+    if list(fields) != ["date", "open", "high", "low", "close", "volume"]:
+        raise SchemaDrift(f"Unexpected Baostock fields: {fields}")
+    arr = np.array(rows, dtype=object)
+    if arr.ndim != 2 or arr.shape[1] != 6:
+        raise SchemaDrift("Unexpected Baostock row layout")
+    # Suspended days come back as '' -> NaN, then dropped by build_frame
+    num = np.where(arr[:, 1:] == "", "nan", arr[:, 1:])
+    return build_frame(arr[:, 0].astype(str), *(num[:, i] for i in range(5)), price_dtype=price_dtype)
+
+
+def parse_yahoo(df: pd.DataFrame, price_dtype=np.float64) -> pd.DataFrame:
+    """yfinance Ticker.history (tz-aware DatetimeIndex, capitalised headers)"""
+    _require(df, ["Open", "High", "Low", "Close", "Volume"])
+    if not isinstance(df.index, pd.DatetimeIndex):
+        raise SchemaDrift("Yahoo history without DatetimeIndex")
+    idx = df.index.tz_localize(None) if df.index.tz is not None else df.index
+    return build_frame(idx.to_numpy(), *(df[c].to_numpy() for c in ["Open", "High", "Low", "Close", "Volume"]),
+                       price_dtype=price_dtype)
+
+
+# --- Intraday (minute bars) ---
+def build_minutes(stamps, fmt: str, opens, highs, lows, closes, volumes) -> MinuteBars:
+    """Local 'fmt' timestamps -> epoch seconds; ascending, last row per minute kept, NaN rows dropped"""
+    try:
+        local = pd.to_datetime(pd.Series(stamps, dtype=str), format=fmt).to_numpy().astype("datetime64[s]")
+    except (ValueError, TypeError) as e:
+        raise SchemaDrift(f"Unparseable minute stamps: {e}")
+    ts = local.astype(np.int64) - UTC_OFFSET
+    cols = [_numbers(x, np.float64) for x in (opens, highs, lows, closes, volumes)]
+    if any(len(c) != len(ts) for c in cols):
+        raise SchemaDrift("Column length mismatch")
+    if len(ts) > 1 and not (ts[1:] > ts[:-1]).all():
+        _, first_in_rev = np.unique(ts[::-1], return_index=True)
+        idx = len(ts) - 1 - first_in_rev
+        ts, cols = ts[idx], [c[idx] for c in cols]
+    valid = ~(np.isnan(cols[0]) | np.isnan(cols[3]))
+    if not valid.all():
+        ts, cols = ts[valid], [c[valid] for c in cols]
+    return MinuteBars(ts, *cols)
+
+
+def parse_tencent_minutes(rows: list) -> MinuteBars:
+    """Tencent mkline rows: ['YYYYMMDDHHMM', open, close, high, low, volume, ...] as strings"""
+    if not rows or len(rows[0]) < 6:
+        raise SchemaDrift("Unexpected Tencent minute row layout")
+    try:
+        num = np.array([r[1:6] for r in rows], dtype=np.float64)
+    except (ValueError, TypeError) as e:
+        raise SchemaDrift(f"Unparseable Tencent minute row: {e}")
+    return build_minutes([r[0] for r in rows], "%Y%m%d%H%M", num[:, 0], num[:, 2], num[:, 3], num[:, 1], num[:, 4])
+
+
+def parse_pytdx_minutes(rows: list) -> MinuteBars:
+    """Pytdx get_security_bars (1-/5-minute categories) dicts, datetime 'YYYY-MM-DD HH:MM'"""
+    if not rows or not {"datetime", "open", "high", "low", "close", "vol"}.issubset(rows[0]):
+        raise SchemaDrift("Unexpected Pytdx minute layout")
+    return build_minutes([r["datetime"] for r in rows], "%Y-%m-%d %H:%M",
+                         [r["open"] for r in rows], [r["high"] for r in rows], [r["low"] for r in rows],
+                         [r["close"] for r in rows], [r["vol"] for r in rows])
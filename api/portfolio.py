@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Portfolio Risk
+Correlation-aware sizing over the whole book instead of one symbol at a time.
+Covariance of daily log returns comes from a cached rolling window: the running
+sums (sum r, R R^T) are kept for every symbol seen so far and rolled forward by
+whole days (add the new columns' outer products, subtract the dropped ones), so
+a new request only pays for symbols or days the cache has not seen yet.
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+
+from . import config
+from .fetcher import DataFetcher
+from .intraday import local_day
+from .quant import calculate_technicals, generate_signal, position_size
+from .security_master import security_master
+from .settlement import day_index, day_str
+from .trading_calendar import trading_calendar
+
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS = 252
+MAX_PAIRS = 20  # Correlated pairs listed in warnings
+
+
+def _returns_on(series, axis: np.ndarray) -> np.ndarray:
+    """Daily log returns on axis (len(axis) - 1); suspended days and days before listing count as 0"""
+    if not len(series):
+        return np.zeros(max(len(axis) - 1, 0))
+    pos = np.searchsorted(series.days, axis, side="right") - 1
+    close = np.where(pos >= 0, series.close[np.maximum(pos, 0)], np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = np.diff(np.log(close))
+    return np.nan_to_num(r, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def atr14(series) -> float:
+    """ATR(14) of the latest bar (same definition as calculate_technicals), 0.0 when too short"""
+    if len(series) < 15:
+        return 0.0
+    h, l, c = series.high[-14:], series.low[-14:], series.close[-15:]
+    tr = np.maximum(h - l, np.maximum(np.abs(h - c[:-1]), np.abs(l - c[:-1])))
+    return float(tr.mean())
+
+
+class CovarianceCache:
+    """(code, market) -> row of a rolling covariance over the last `window` completed trading days"""
+
+    def __init__(self, window: int = None, max_symbols: int = None):
+        self.window = window or config.PORTFOLIO_COV_WINDOW
+        self.max_symbols = max_symbols or config.PORTFOLIO_MAX_SYMBOLS
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+        self.rolls = 0
+        self.added = 0
+        self.dropped = 0
+        self._reset()
+
+    def _reset(self):
+        self.keys = []
+        self._index = {}
+        self.axis = np.empty(0, dtype=np.int32)  # window + 1 days; returns sit between neighbours
+        self._r = np.empty((0, 0))               # N x (len(axis) - 1)
+        self._s1 = np.empty(0)
+        self._s2 = np.empty((0, 0))
+        self._since_exact = 0                    # Days rolled since the sums were last recomputed
+
+    def covariance(self, keys: list, loader, today: int = None, peek=None) -> np.ndarray:
+        """
+        Covariance matrix of the given unique (code, market) keys, in order. loader(code, market) returns
+        the cached OHLCVSeries. Bars dated `today` (default: the current local day) are left out
+        until the day is over, so a cached provisional close never enters the sums.
+        Only the requested keys are loaded. When the calendar says a newer day has completed, cached
+        rows of other symbols are rolled from peek(code, market) (bars already in memory, no upstream
+        call); rows it cannot cover are dropped and re-added when next requested.
+        """
+        today = int(local_day(time.time())) if today is None else today
+        with self._lock:
+            series = {k: loader(*k) for k in keys}
+            fresh = [k for k in series if k not in self._index]
+            if not len(self.axis) or len(self.keys) + len(fresh) > self.max_symbols:
+                self._rebuild(series, today)
+            else:
+                if self._roll_due(series, today):
+                    self._roll(series, peek, today)
+                fresh = [k for k in series if k not in self._index]
+                if fresh:
+                    self._add({k: series[k] for k in fresh})
+            w = self._r.shape[1]
+            if w < 2:
+                raise ValueError("Not enough history for a covariance estimate")
+            ix = np.array([self._index[k] for k in series])
+            s1 = self._s1[ix]
+            return (self._s2[np.ix_(ix, ix)] - np.outer(s1, s1) / w) / (w - 1)
+
+    @staticmethod
+    def _last_completed(market: str, today: int) -> int:
+        """Newest trading day of `market` strictly before `today` (day index)"""
+        if not config.TRADING_CALENDAR:
+            return today - 1
+        return day_index(trading_calendar.previous_trading_day(day_str(today), market))
+
+    def _roll_due(self, requested: dict, today: int) -> bool:
+        """A market of the cached or requested symbols has completed a day past the axis"""
+        markets = {m for _, m in self.keys} | {m for _, m in requested}
+        return any(self._last_completed(m, today) > int(self.axis[-1]) for m in markets)
+
+    def _completed_days(self, series: dict, today: int, after: int = None) -> np.ndarray:
+        days = [s.days for s in series.values() if len(s)]
+        if not days:
+            return np.empty(0, dtype=np.int32)
+        days = np.unique(np.concatenate(days))
+        days = days[days < today]
+        return days if after is None else days[days > after]
+
+    def _rebuild(self, series: dict, today: int):
+        self._reset()
+        self.keys = list(series)
+        self._index = {k: i for i, k in enumerate(self.keys)}
+        self.axis = self._completed_days(series, today)[-(self.window + 1):]
+        self._r = np.vstack([_returns_on(s, self.axis) for s in series.values()])
+        self._exact()
+        self.rebuilds += 1
+        logger.info(f"Covariance rebuilt: {len(self.keys)} symbols x {self._r.shape[1]} days")
+
+    def _exact(self):
+        self._s1 = self._r.sum(axis=1)
+        self._s2 = self._r @ self._r.T
+        self._since_exact = 0
+
+    def _roll(self, requested: dict, peek, today: int):
+        """Append completed days newer than the axis; the oldest columns drop out of the window"""
+        if not len(self.axis):
+            return
+        new_days = self._completed_days(requested, today, after=int(self.axis[-1]))
+        k = len(new_days)
+        if not k:
+            return
+        current, stale = {}, []
+        for key in self.keys:
+            s = requested.get(key)
+            if s is None and peek is not None:
+                s = peek(*key)
+                need = min(int(new_days[-1]), self._last_completed(key[1], today))
+                if s is not None and (not len(s) or int(s.days[-1]) < need):
+                    s = None
+            if s is None:
+                stale.append(key)
+            else:
+                current[key] = s
+        if stale:
+            self._drop(stale)
+        if k >= self.window or not self.keys:
+            self._rebuild({**current, **requested}, today)
+            return
+        ext = np.concatenate([self.axis[-1:], new_days])
+        added = np.vstack([_returns_on(current[key], ext) for key in self.keys])
+        drop = max(len(self.axis) + k - (self.window + 1), 0)
+        dropped = self._r[:, :drop]
+        self._r = np.concatenate([self._r[:, drop:], added], axis=1)
+        self.axis = np.concatenate([self.axis, new_days])[-(self.window + 1):]
+        self._since_exact += k
+        if self._since_exact >= self.window:
+            self._exact()  # Bound floating-point drift of the running sums
+        else:
+            self._s1 += added.sum(axis=1) - dropped.sum(axis=1)
+            self._s2 += added @ added.T - dropped @ dropped.T
+        self.rolls += 1
+
+    def _drop(self, keys: list):
+        """Remove rows whose bars for the new days are not in memory (re-added on their next request)"""
+        gone = set(keys)
+        keep = [i for i, k in enumerate(self.keys) if k not in gone]
+        self._r = self._r[keep]
+        self._s1 = self._s1[keep]
+        self._s2 = self._s2[np.ix_(keep, keep)]
+        self.keys = [self.keys[i] for i in keep]
+        self._index = {k: i for i, k in enumerate(self.keys)}
+        self.dropped += len(gone)
+
+    def _add(self, series: dict):
+        """New rows: only their cross products with the cached rows are computed"""
+        rows = np.vstack([_returns_on(s, self.axis) for s in series.values()])
+        cross = rows @ self._r.T
+        self._s2 = np.block([[self._s2, cross.T], [cross, rows @ rows.T]])
+        self._s1 = np.concatenate([self._s1, rows.sum(axis=1)])
+        self._r = np.vstack([self._r, rows])
+        for key in series:
+            self._index[key] = len(self.keys)
+            self.keys.append(key)
+        self.added += len(series)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def stats(self) -> dict:
+        return {"symbols": len(self.keys), "window": self.window, "days": int(self._r.shape[1]),
+                "as_of": str(np.datetime64(int(self.axis[-1]), "D")) if len(self.axis) else None,
+                "rebuilds": self.rebuilds, "rolls": self.rolls, "added": self.added, "dropped": self.dropped}
+
+
+covariance_cache = CovarianceCache()
+
+
+def _resolve(code: str, market: str) -> tuple:
+    market = (market or security_master.detect_market(code)).upper()
+    return DataFetcher._normalize_code(code, market), market
+
+
+def _prices(keys: list, series: dict) -> dict:
+    """Realtime price per key (one batched quote round per market), last close when unavailable"""
+    prices = {}
+    for market in {m for _, m in keys}:
+        codes = [c for c, m in keys if m == market]
+        try:
+            for code, price in DataFetcher.get_realtime_prices(codes, market).items():
+                if price > 0:
+                    prices[(code, market)] = price
+        except Exception as e:
+            logger.warning(f"Portfolio risk: quotes failed for {market}: {e}")
+    for key in keys:
+        if key not in prices and len(series[key]):
+            prices[key] = float(series[key].close[-1])
+    return prices
+
+
+def marginal_scale(rho: float, book_risk: float, budget: float) -> float:
+    """
+    Fraction of a candidate's standalone ATR risk `budget` that raises the book's correlated
+    ATR risk by as much as an uncorrelated position of full size would:
+    solve sqrt(B^2 + x^2 + 2 rho B x) = sqrt(B^2 + b^2) for x. Never above 1 (no leverage
+    for negative correlation); 1 for an empty book.
+    """
+    if budget <= 0:
+        return 0.0
+    x = -rho * book_risk + np.sqrt((rho * book_risk) ** 2 + budget ** 2)
+    return float(min(x / budget, 1.0))
+
+
+def _book_risk(d: np.ndarray, corr: np.ndarray) -> float:
+    return float(np.sqrt(max(d @ corr @ d, 0.0)))
+
+
+def assess_portfolio(holdings: list, candidates: list, balance: float, risk: float,
+                     cache: CovarianceCache = None, loader=None) -> dict:
+    """
+    holdings: objects with code / market / shares / current_stop; candidates: code / market /
+    entry_price / stop_loss (0 = current price / signal stop). Candidates are sized one after
+    another, each against the book including the candidates sized before it.
+    """
+    cache = cache or covariance_cache
+    peek = None
+    if loader is None:
+        loader, peek = DataFetcher.get_history_series, DataFetcher.peek_history_series
+    if not holdings and not candidates:
+        raise ValueError("No positions or candidates")
+    rows = [(_resolve(h.code, h.market), h) for h in holdings]
+    cands = [(_resolve(c.code, c.market), c) for c in candidates]
+    keys = list(dict.fromkeys(k for k, _ in rows + cands))
+    if len(keys) > cache.max_symbols:
+        raise ValueError(f"At most {cache.max_symbols} symbols per request")
+
+    series = {k: loader(*k) for k in keys}
+    cov = cache.covariance(keys, loader, peek=peek)
+    sd = np.sqrt(np.maximum(np.diag(cov), 0.0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = np.nan_to_num(cov / np.outer(sd, sd))
+    np.fill_diagonal(corr, 1.0)
+    index = {k: i for i, k in enumerate(keys)}
+    prices = _prices(keys, series)
+    atr = {}
+    for k in keys:
+        a = atr14(series[k])
+        atr[k] = a if a > 0 else prices.get(k, 0.0) * 0.03
+
+    d = np.zeros(len(keys))       # ATR risk (money) per symbol
+    values = np.zeros(len(keys))  # Market value per symbol
+    positions = []
+    for key, h in rows:
+        price = prices.get(key, 0.0)
+        d[index[key]] += h.shares * atr[key]
+        values[index[key]] += h.shares * price
+        positions.append({"code": h.code, "market": key[1], "shares": h.shares, "price": round(price, 3),
+                          "value": round(h.shares * price, 2), "atr14": round(atr[key], 3),
+                          "atr_risk": round(h.shares * atr[key], 2),
+                          "stop_risk": round(h.shares * max(price - h.current_stop, 0.0), 2)
+                          if h.current_stop > 0 else None})
+    held = d.copy()
+    before = _summary(held, values, corr, cov, balance)
+    contrib = _contributions(held, corr)
+    for row, (key, _) in zip(positions, rows):
+        row["weight_pct"] = round(values[index[key]] / balance * 100, 2) if balance > 0 else None
+        row["risk_share_pct"] = round(contrib[index[key]] * 100, 1)
+
+    sized = []
+    for key, c in cands:
+        j = index[key]
+        price = prices.get(key, 0.0)
+        entry = c.entry_price or price
+        stop = c.stop_loss
+        if stop <= 0:
+            tech = calculate_technicals(series[key])
+            stop = generate_signal(tech, key[1] == "HK")['stop_loss']
+        risk_per_share = entry - stop
+        if risk_per_share <= 0:
+            risk_per_share = atr[key]
+        lot = security_master.lot_size(key[0], key[1])
+        step = lot or 1  # Unknown board lot (HK): sized in single shares, no tradable suggestion
+        standalone = position_size(balance * risk, risk_per_share, step)
+        budget = standalone * atr[key]
+        book_risk = _book_risk(d, corr)
+        rho = float(corr[j] @ d / book_risk) if book_risk > 0 else 0.0
+        scale = marginal_scale(rho, book_risk, budget)
+        shares = int(standalone * scale / step) * step
+        d[j] += shares * atr[key]
+        values[j] += shares * entry
+        row = {"code": c.code, "market": key[1], "price": round(price, 3), "entry": round(entry, 3),
+               "stop_loss": round(stop, 3), "risk_per_share": round(risk_per_share, 3),
+               "standalone_shares": standalone if lot else None, "suggested_shares": shares if lot else None,
+               "lot_size": lot or None, "scale": round(scale, 3), "corr_to_book": round(rho, 3)}
+        if not lot:
+            row["max_shares"] = shares
+        sized.append(row)
+
+    result = {"balance": balance, "window_days": int(cache.stats()["days"]), "positions": positions,
+              "portfolio": before}
+    if cands:
+        result["candidates"] = sized
+        result["with_candidates"] = _summary(d, values, corr, cov, balance)
+    result["warnings"] = _warnings(keys, series, d, values, corr, balance, cache.window)
+    return result
+
+
+def _contributions(d: np.ndarray, corr: np.ndarray) -> np.ndarray:
+    """Share of the correlated ATR risk contributed by each symbol (sums to 1)"""
+    total = d @ corr @ d
+    return d * (corr @ d) / total if total > 0 else np.zeros_like(d)
+
+
+def _summary(d: np.ndarray, values: np.ndarray, corr: np.ndarray, cov: np.ndarray, balance: float) -> dict:
+    risk = _book_risk(d, corr)
+    naive = float(d.sum())
+    value = float(values.sum())
+    variance = max(float(values @ cov @ values), 0.0)
+    held = d > 0
+    n = int(held.sum())
+    pairs = corr[np.ix_(held, held)][np.triu_indices(n, 1)] if n > 1 else np.empty(0)
+    return {"value": round(value, 2), "exposure_pct": round(value / balance * 100, 2) if balance > 0 else None,
+            "atr_risk": round(risk, 2), "atr_risk_uncorrelated": round(naive, 2),
+            "atr_risk_pct": round(risk / balance * 100, 2) if balance > 0 else None,
+            "diversification": round(naive / risk, 3) if risk > 0 else None,
+            "volatility_pct": round(np.sqrt(variance * TRADING_DAYS) / value * 100, 2) if value > 0 else None,
+            "avg_correlation": round(float(pairs.mean()), 3) if len(pairs) else None}
+
+
+def _warnings(keys: list, series: dict, d: np.ndarray, values: np.ndarray, corr: np.ndarray,
+              balance: float, window: int) -> list:
+    """Concentration warnings for the book after candidate sizing"""
+    out = []
+    codes = [k[0] for k in keys]
+    risk = _book_risk(d, corr)
+    if balance > 0 and risk / balance > config.PORTFOLIO_MAX_ATR_RISK:
+        out.append({"type": "atr_risk", "value": round(risk / balance * 100, 2),
+                    "limit": config.PORTFOLIO_MAX_ATR_RISK * 100})
+    if balance > 0:
+        for i in np.flatnonzero(values / balance > config.PORTFOLIO_MAX_WEIGHT):
+            out.append({"type": "weight", "code": codes[i], "value": round(values[i] / balance * 100, 2),
+                        "limit": config.PORTFOLIO_MAX_WEIGHT * 100})
+    contrib = _contributions(d, corr)
+    if (d > 0).sum() > 1:
+        for i in np.flatnonzero(contrib > config.PORTFOLIO_MAX_RISK_SHARE):
+            out.append({"type": "risk_share", "code": codes[i], "value": round(contrib[i] * 100, 1),
+                        "limit": config.PORTFOLIO_MAX_RISK_SHARE * 100})
+    held = np.flatnonzero(d > 0)
+    if len(held) > 1:
+        iu, ju = np.triu_indices(len(held), 1)
+        rho = corr[held[iu], held[ju]]
+        hot = np.flatnonzero(rho >= config.PORTFOLIO_CORR_ALERT)
+        for p in hot[np.argsort(-rho[hot], kind="stable")][:MAX_PAIRS]:
+            out.append({"type": "correlation", "codes": [codes[held[iu[p]]], codes[held[ju[p]]]],
+                        "value": round(float(rho[p]), 3), "limit": config.PORTFOLIO_CORR_ALERT})
+    for i, key in enumerate(keys):
+        if len(series[key]) <= window:
+            out.append({"type": "history", "code": codes[i], "value": len(series[key]), "limit": window + 1})
+    return out
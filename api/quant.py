@@ -21,6 +21,8 @@ def safe_round(val, decimals=2):
 
 
 from .fetcher import DataFetcher
+from .ohlcv import OHLCVSeries
+from .security_master import security_master, HK_ETF_RANGES, A_ETF_PREFIXES
 
 # --- Stock Name & ETF Detection ---
 def get_stock_name(code: str, market: str = "CN") -> str:
@@ -31,29 +33,25 @@ def get_stock_name(code: str, market: str = "CN") -> str:
 def detect_etf(code: str, market: str = "CN") -> bool:
     """
     V10.0: 精确 ETF 检测
+    V15: 证券主表优先 (O(1), 无网络)
     港股: 特定代码区间 + 名称匹配
     A股: 代码前缀匹配
     """
+    sec = security_master.get(code, market)
+    if sec:
+        return sec.instrument_type == "etf"
+
     clean_code = str(code).strip().upper().replace("HK", "").replace("SH", "").replace("SZ", "")
     
     if market == "HK":
         if clean_code.isdigit():
             num = int(clean_code)
             # 港股 ETF 精确代码区间
-            hk_etf_ranges = [
-                (2800, 2849),   # 盈富基金、恒生ETF等
-                (3000, 3199),   # 南方A50、华夏恒生等
-                (7200, 7399),   # 杠杆/反向产品
-                (7500, 7599),   # 杠杆/反向产品
-                (8200, 8299),   # 人民币计价ETF
-                (9000, 9099),   # 人民币计价ETF
-                (9800, 9899),   # 人民币计价ETF
-            ]
-            for low, high in hk_etf_ranges:
+            for low, high in HK_ETF_RANGES:
                 if low <= num <= high:
                     return True
             
-            # 额外：通过名称检测
+            # 额外：通过名称检测 (仅主表未收录时)
             try:
                 name = get_stock_name(code, market)
                 if "ETF" in name.upper():
@@ -62,20 +60,23 @@ def detect_etf(code: str, market: str = "CN") -> bool:
                 pass
     else:
         # A股 ETF 代码规则
-        a_etf_prefixes = ('51', '15', '16', '58', '56', '52')
-        return clean_code.startswith(a_etf_prefixes)
+        return clean_code.startswith(A_ETF_PREFIXES)
     
     return False
 
 
 # --- Technical Indicators ---
-def calculate_technicals(df: pd.DataFrame):
+def calculate_technicals(df):
     """
     V10.0: 技术指标计算
     MA(5/10/20/60), EMA(13/26), RSI(14), ATR(14), MACD, BIAS, 量比
+    V15: Accepts a DataFrame or an OHLCVSeries (zero-copy view)
     """
+    if isinstance(df, OHLCVSeries):
+        df = df.to_frame()
     if df.empty: return {}
-    df = df.sort_values('date')
+    if not df['date'].is_monotonic_increasing:
+        df = df.sort_values('date')
     closes = df['close']
     highs = df['high']
     lows = df['low']
@@ -179,14 +180,46 @@ def calculate_technicals(df: pd.DataFrame):
 
 
 # --- Signal Generation ---
-def generate_signal(tech, is_hk=False):
+# V15: Tunable weights / bands / multipliers (defaults = the hand-set V13 values; see api/optimizer.py)
+SIGNAL_PARAMS = {
+    "w_ma5": 5, "w_ma20": 15,                                   # Price vs MA5 / MA20
+    "w_macd_cross": 15, "w_macd_hist": 5,                       # Golden/death cross, histogram sign
+    "rsi_extreme_high": 80, "w_rsi_extreme_high": 15,
+    "rsi_high": 70, "w_rsi_high": 10,
+    "rsi_extreme_low": 20, "w_rsi_rebound": 15, "w_rsi_unstable": 5,
+    "rsi_low": 30, "w_rsi_low": 10,
+    "vol_surge": 2.0, "w_vol_surge": 10,                        # Volume ratio cutoffs
+    "vol_mild": 1.5, "w_vol_mild": 5,
+    "vol_dry": 0.5, "w_vol_dry": 5,
+    "w_alignment": 10,
+    "vcp_band": 0.03, "w_vcp": 5,
+    "stop_atr_cn": 2.0, "stop_atr_hk": 3.0,                     # ATR stop multipliers
+    "high_vol_pct": 5.0, "high_vol_atr": 0.5,                   # Extra ATR when ATR/price > high_vol_pct
+    "max_loss_cn": 0.10, "max_loss_hk": 0.15,
+    "rr_strong": 3.0, "rr_normal": 2.0, "rr_weak": 1.5,         # R:R by score (>= 80 / >= 60 / below)
+}
+
+
+def signal_params(overrides: dict = None) -> dict:
+    """SIGNAL_PARAMS with overrides applied (unknown keys rejected)"""
+    if not overrides:
+        return SIGNAL_PARAMS
+    unknown = set(overrides) - set(SIGNAL_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown signal parameters: {', '.join(sorted(unknown))}")
+    return {**SIGNAL_PARAMS, **overrides}
+
+
+def generate_signal(tech, is_hk=False, params: dict = None):
     """
     V10.0: 重构信号生成器
     - 对称评分体系 (买卖平衡)
     - MACD 金叉/死叉判断
     - 卖出信号生成
     - 动态 ATR 止损/止盈 (盈亏比 2:1)
+    V15: params overrides SIGNAL_PARAMS (optimizer sweeps)
     """
+    P = signal_params(params)
     score = 50  # 中性起点
     reasons = []
     
@@ -201,87 +234,87 @@ def generate_signal(tech, is_hk=False):
     
     # === 均线系统 (对称 ±) ===
     if p > ma5: 
-        score += 5
+        score += P["w_ma5"]
     else: 
-        score -= 5
+        score -= P["w_ma5"]
     
     if p > ma20: 
-        score += 15
+        score += P["w_ma20"]
         reasons.append("站上月线")
     else: 
-        score -= 15
+        score -= P["w_ma20"]
         reasons.append("跌破月线")
     
     # === MACD (V10.0 新增) ===
     if macd_cross == 'golden':
-        score += 15
+        score += P["w_macd_cross"]
         reasons.append("MACD金叉 🔥")
     elif macd_cross == 'death':
-        score -= 15
+        score -= P["w_macd_cross"]
         reasons.append("MACD死叉 ⚠️")
     elif macd_hist > 0:
-        score += 5
+        score += P["w_macd_hist"]
     else:
-        score -= 5
+        score -= P["w_macd_hist"]
     
     # === RSI (对称 ±) ===
-    if rsi > 80:
-        score -= 15
+    if rsi > P["rsi_extreme_high"]:
+        score -= P["w_rsi_extreme_high"]
         reasons.append("RSI严重超买")
-    elif rsi > 70:
-        score -= 10
+    elif rsi > P["rsi_high"]:
+        score -= P["w_rsi_high"]
         reasons.append("RSI超买")
-    elif rsi < 20:
+    elif rsi < P["rsi_extreme_low"]:
 
         # V13: RSI oversold + stabilization check
 
         if p > ma5:  # Price above MA5 = stabilizing
 
-            score += 15
+            score += P["w_rsi_rebound"]
 
             reasons.append("RSI严重超卖反弹 ✅")
 
         else:
 
-            score += 5
+            score += P["w_rsi_unstable"]
 
             reasons.append("RSI超卖但未企稳 ⚠️")
 
-    elif rsi < 30:
-        score += 10
+    elif rsi < P["rsi_low"]:
+        score += P["w_rsi_low"]
         reasons.append("RSI超卖")
     
     # === 量比 (对称) ===
-    if vol_ratio > 2.0:
+    if vol_ratio > P["vol_surge"]:
         if p > ma5:
-            score += 10
+            score += P["w_vol_surge"]
             reasons.append("放量突破")
         else:
-            score -= 10
+            score -= P["w_vol_surge"]
             reasons.append("放量下跌")
-    elif vol_ratio > 1.5 and p > ma5:
-        score += 5
+    elif vol_ratio > P["vol_mild"] and p > ma5:
+        score += P["w_vol_mild"]
         reasons.append("温和放量")
-    elif vol_ratio < 0.5:
-        score -= 5
+    elif vol_ratio < P["vol_dry"]:
+        score -= P["w_vol_dry"]
         reasons.append("严重缩量")
     
     # === 均线形态 ===
     alignment = tech.get('ma_alignment', '')
     if '多头' in alignment:
-        score += 10
+        score += P["w_alignment"]
         reasons.append("均线多头排列")
     elif '空头' in alignment:
-        score -= 10
+        score -= P["w_alignment"]
         reasons.append("均线空头排列")
     
     # === VCP 粘合突破 (V13: 降低权重 + ATR收缩确认) ===
 
     if p > ma20 and ma5 > ma20 and ma20 > 0:
 
-        if abs(ma5 - ma20) / ma20 < 0.03 and vol_ratio > 1.5:
+        if abs(ma5 - ma20) / ma20 < P["vcp_band"] and vol_ratio > P["vol_mild"]:
 
-            score += 5
+            score += P["w_vcp"]
 
             reasons.append("均线粘合放量突破 (VCP)")
 
@@ -308,14 +341,14 @@ def generate_signal(tech, is_hk=False):
     
     # 港股波动更大，使用更宽的乘数
     if is_hk:
-        stop_multiplier = 3.0
+        stop_multiplier = P["stop_atr_hk"]
     else:
-        stop_multiplier = 2.0
+        stop_multiplier = P["stop_atr_cn"]
     
     # 根据波动率动态调整: 高波动→宽止损
     volatility_pct = (atr / p * 100) if p > 0 else 3.0
-    if volatility_pct > 5:
-        stop_multiplier += 0.5  # 高波动多加 0.5 ATR
+    if volatility_pct > P["high_vol_pct"]:
+        stop_multiplier += P["high_vol_atr"]  # 高波动多加 ATR
     
     atr_stop = p - (stop_multiplier * atr)
     supp = tech.get('support_level', 0)
@@ -327,7 +360,7 @@ def generate_signal(tech, is_hk=False):
         stop_loss = atr_stop
     
     # 确保止损不超过现价的15%
-    max_loss_pct = 0.15 if is_hk else 0.10
+    max_loss_pct = P["max_loss_hk"] if is_hk else P["max_loss_cn"]
     min_stop = p * (1 - max_loss_pct)
     stop_loss = max(stop_loss, min_stop)
     
@@ -336,15 +369,15 @@ def generate_signal(tech, is_hk=False):
 
     if score >= 80:
 
-        rr_ratio = 3.0  # Strong trend: aggressive target
+        rr_ratio = P["rr_strong"]  # Strong trend: aggressive target
 
     elif score >= 60:
 
-        rr_ratio = 2.0  # Normal
+        rr_ratio = P["rr_normal"]  # Normal
 
     else:
 
-        rr_ratio = 1.5  # Weak: conservative
+        rr_ratio = P["rr_weak"]  # Weak: conservative
 
     take_profit = p + (rr_ratio * risk_per_share) if risk_per_share > 0 else p * 1.1
 
@@ -361,3 +394,82 @@ def generate_signal(tech, is_hk=False):
         "support_level": safe_round(supp),
         "resistance_level": safe_round(tech.get('resistance_level', 0))
     }
+
+
+# --- Position Sizing ---
+def position_size(risk_money: float, risk_per_share: float, lot_size: int = 100) -> int:
+    """Whole board lots whose stop-out loses at most risk_money (0 when not even one lot fits)"""
+    if risk_per_share <= 0.0001:
+        return 0
+    shares = int(risk_money / risk_per_share / lot_size) * lot_size
+    return shares if shares >= lot_size else 0
+
+
+# --- Screening ---
+def screen_series(series, min_score: int, min_bars: int = 60) -> dict:
+    """Signal summary when the trend score reaches min_score, else None (compute-backend kernel)"""
+    if len(series) < min_bars:
+        return None
+    tech = calculate_technicals(series)
+    sig = generate_signal(tech, series.market == "HK")
+    if sig['trend_score'] < min_score:
+        return None
+    return {"signal_type": sig['signal'], "trend_score": sig['trend_score'],
+            "current_price": tech['current_price'], "stop_loss": sig['stop_loss'],
+            "take_profit": sig['take_profit'], "signal_reasons": sig['signal_reasons']}
+
+
+# --- Position Evaluation ---
+def evaluate_position(pos, current_price: float, atr: float, is_hk: bool = False,
+                      session_low: float = None) -> dict:
+    """
+    Stop / take-profit / ATR trailing-stop decision for one position at current_price.
+    Shared by /check_positions and the position monitor so both fire identically.
+    """
+    buy_price = pos.buy_price
+    current_stop = pos.current_stop
+    target = pos.target_price
+    pnl = (current_price - buy_price) / buy_price * 100 if buy_price > 0 else 0
+
+    if current_stop > 0 and current_price <= current_stop:
+        action = "SELL_STOP"
+        reason = f"🔴 触发止损 (现价 {current_price:.2f} ≤ 止损 {current_stop:.2f})"
+        new_stop = None
+    elif current_stop > 0 and session_low is not None and session_low <= current_stop:
+        action = "SELL_STOP"
+        reason = f"🔴 盘中触及止损 (最低 {session_low:.2f} ≤ 止损 {current_stop:.2f})"
+        new_stop = None
+    elif target > 0 and current_price >= target:
+        action = "SELL_TARGET"
+        reason = f"🟢 触发止盈 (现价 {current_price:.2f} ≥ 目标 {target:.2f})"
+        new_stop = None
+    else:
+        action = "HOLD"
+        # V10.0: ATR 驱动移动止损
+        atr_multiplier = 2.5 if is_hk else 2.0
+        trailing_stop = current_price - (atr_multiplier * atr)
+        min_trailing = buy_price * 0.93 if buy_price > 0 else trailing_stop
+        trailing_stop = max(trailing_stop, min_trailing)
+
+        new_stop = max(current_stop, trailing_stop) if current_stop > 0 else trailing_stop
+
+        if current_stop > 0 and new_stop > current_stop:
+            reason = f"📈 上调止损 ({current_stop:.2f} → {new_stop:.2f})"
+        else:
+            reason = f"继续持有 (现价 {current_price:.2f})"
+
+    shares = pos.shares if pos.shares > 0 else 0
+    pnl_amount = (current_price - buy_price) * shares if shares > 0 else 0
+
+    return {
+        "code": pos.code,
+        "current_price": safe_round(current_price),
+        "buy_price": safe_round(buy_price),
+        "target_price": safe_round(target) if target > 0 else None,
+        "action": action,
+        "reason": reason,
+        "pnl_percent": safe_round(pnl),
+        "pnl_amount": safe_round(pnl_amount),
+        "new_stop": safe_round(new_stop) if new_stop else None,
+        "record_id": pos.record_id
+    }
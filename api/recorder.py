@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Source Recorder
+Record every raw upstream response and replay it offline with original latency
+"""
+import datetime
+import gzip
+import logging
+import pickle
+import threading
+import time
+from collections import defaultdict
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayMiss(LookupError):
+    """Replay archive has no response for this (provider, symbol)"""
+
+
+class RecordedSourceError(Exception):
+    """Replayed upstream failure (the original call raised)"""
+
+
+class SourceRecorder:
+    """
+    Archive layout: one gzip stream of pickled records, appended as they happen.
+    Each record = {provider, symbol, ts, latency, ok, payload}
+    - record: call upstream, store the raw response (or the error), return it
+    - replay: serve stored responses per (provider, symbol) in original order,
+      sleeping the observed latency * speed
+    - off: plain passthrough
+    """
+
+    def __init__(self, mode: str = "off", path: str = "", speed: float = 1.0):
+        if mode not in ("off", "record", "replay"):
+            raise ValueError(f"Unknown record mode: {mode}")
+        self.mode = mode
+        self.path = path
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._fh = None
+        self._replay = defaultdict(list)
+        self._cursor = defaultdict(int)
+
+        if mode == "record":
+            if not self.path:
+                stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                self.path = config.data_path("recordings", f"{stamp}.rec.gz")
+            self._fh = gzip.open(self.path, "ab")
+            logger.info(f"📼 Recording upstream responses to {self.path}")
+        elif mode == "replay":
+            count = self.load(self.path)
+            logger.info(f"📼 Replaying {count} upstream responses from {self.path}")
+
+    @classmethod
+    def from_env(cls) -> "SourceRecorder":
+        try:
+            return cls(config.RECORD_MODE, config.RECORD_PATH, config.REPLAY_SPEED)
+        except Exception as e:
+            logger.error(f"Recorder disabled: {e}")
+            return cls("off")
+
+    # --- Archive IO ---
+    @staticmethod
+    def iter_records(path: str):
+        with gzip.open(path, "rb") as fh:
+            while True:
+                try:
+                    yield pickle.load(fh)
+                except EOFError:
+                    return
+
+    def load(self, path: str) -> int:
+        count = 0
+        for rec in self.iter_records(path):
+            self._replay[(rec["provider"], rec["symbol"])].append(rec)
+            count += 1
+        return count
+
+    def _write(self, rec: dict):
+        with self._lock:
+            pickle.dump(rec, self._fh, protocol=pickle.HIGHEST_PROTOCOL)
+            self._fh.flush()  # Sync flush: archive stays readable if the process dies
+
+    def close(self):
+        with self._lock:
+            if self._fh:
+                self._fh.close()
+                self._fh = None
+
+    # --- Call Wrapper ---
+    def call(self, provider: str, symbol: str, func, *args, **kwargs):
+        if self.mode == "replay":
+            return self._serve(provider, symbol)
+        if self.mode == "off":
+            return func(*args, **kwargs)
+
+        ts = time.time()
+        start = time.perf_counter()
+        try:
+            payload = func(*args, **kwargs)
+        except Exception as e:
+            self._write({"provider": provider, "symbol": symbol, "ts": ts,
+                         "latency": time.perf_counter() - start, "ok": False,
+                         "payload": f"{type(e).__name__}: {e}"})
+            raise
+        self._write({"provider": provider, "symbol": symbol, "ts": ts,
+                     "latency": time.perf_counter() - start, "ok": True,
+                     "payload": payload})
+        return payload
+
+    def _serve(self, provider: str, symbol: str):
+        key = (provider, symbol)
+        with self._lock:
+            records = self._replay.get(key)
+            if not records:
+                raise ReplayMiss(f"No recorded response for {provider}/{symbol}")
+            idx = self._cursor[key]
+            # Past the end: keep serving the last observed response
+            rec = records[min(idx, len(records) - 1)]
+            self._cursor[key] = idx + 1
+
+        if self.speed > 0 and rec["latency"] > 0:
+            time.sleep(rec["latency"] * self.speed)
+        if not rec["ok"]:
+            raise RecordedSourceError(rec["payload"])
+        payload = rec["payload"]
+        # Callers mutate DataFrames in place (rename/reset_index)
+        return payload.copy() if hasattr(payload, "copy") else payload
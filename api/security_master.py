@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Security Master
+Persistent (code, market, name, instrument type, board, lot size) table,
+loaded once into an in-memory index for O(1) lookups on the request path.
+Downloads live in DataFetcher.refresh_security_master (network + record/replay).
+"""
+import logging
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# 港股 ETF 精确代码区间 (shared with quant.detect_etf)
+HK_ETF_RANGES = [
+    (2800, 2849),   # 盈富基金、恒生ETF等
+    (3000, 3199),   # 南方A50、华夏恒生等
+    (7200, 7399),   # 杠杆/反向产品
+    (7500, 7599),   # 杠杆/反向产品
+    (8200, 8299),   # 人民币计价ETF
+    (9000, 9099),   # 人民币计价ETF
+    (9800, 9899),   # 人民币计价ETF
+]
+# A股 ETF 代码规则
+A_ETF_PREFIXES = ('51', '15', '16', '58', '56', '52')
+
+
+class Security(NamedTuple):
+    code: str
+    market: str           # CN / HK
+    name: str
+    instrument_type: str  # stock / etf
+    board: str            # SH-Main / SZ-Main / ChiNext / STAR / BSE / HK-Main / HK-GEM
+    lot_size: int         # Board lot; 0 = unknown (HK feeds without a lot field)
+
+
+def normalize_code(code: str, market: str) -> str:
+    clean_code = str(code).strip().upper().replace("HK", "").replace("SH", "").replace("SZ", "")
+    if market == "HK" and clean_code.isdigit():
+        clean_code = f"{int(clean_code):05d}"
+    return clean_code
+
+
+def classify(code: str, market: str, name: str = "", is_etf: Optional[bool] = None, lot_size: int = 0) -> Security:
+    """Build a Security from code rules (board, lot size, ETF ranges); HK lots come from upstream (lot_size)"""
+    code = normalize_code(code, market)
+    if market == "HK":
+        num = int(code) if code.isdigit() else -1
+        if is_etf is None:
+            is_etf = any(low <= num <= high for low, high in HK_ETF_RANGES) or "ETF" in name.upper()
+        board = "HK-GEM" if code.startswith("08") and not is_etf else "HK-Main"
+        lot_size = max(int(lot_size or 0), 0)  # Varies per HK stock (100-2000+): no rule to guess it from
+    else:
+        if is_etf is None:
+            is_etf = code.startswith(A_ETF_PREFIXES)
+        if code.startswith(("688", "689")):
+            board, lot_size = "STAR", 200
+        elif code.startswith(("300", "301")):
+            board, lot_size = "ChiNext", 100
+        elif code.startswith(("4", "8", "92")):
+            board, lot_size = "BSE", 100
+        elif code.startswith(("5", "6")):
+            board, lot_size = "SH-Main", 100
+        else:
+            board, lot_size = "SZ-Main", 100
+    return Security(code, market, name or code, "etf" if is_etf else "stock", board, lot_size)
+
+
+class SecurityMaster:
+    """SQLite-backed table + dict index; replace() swaps the whole index atomically"""
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self._index = {}          # (market, code) -> Security
+        self._counts = {}         # market -> number of securities
+        self._updated_at = 0.0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+
+    # --- Persistence ---
+    def _connect(self) -> sqlite3.Connection:
+        if not self.path:
+            self.path = config.data_path("security_master.sqlite")
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("""CREATE TABLE IF NOT EXISTS securities (
+            code TEXT, market TEXT, name TEXT, instrument_type TEXT, board TEXT, lot_size INTEGER,
+            PRIMARY KEY (market, code))""")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        return conn
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                with self._connect() as conn:
+                    rows = conn.execute("SELECT code, market, name, instrument_type, board, lot_size FROM securities").fetchall()
+                    meta = conn.execute("SELECT value FROM meta WHERE key = 'updated_at'").fetchone()
+                self._index = {(r[1], r[0]): Security(*r) for r in rows}
+                self._counts = self._count(self._index)
+                self._updated_at = float(meta[0]) if meta else 0.0
+                logger.info(f"Security master loaded: {len(self._index)} securities")
+            except Exception as e:
+                logger.warning(f"Security master load failed: {e}")
+            self._loaded = True
+
+    def replace(self, securities: list):
+        """Persist a fresh snapshot and swap the in-memory index"""
+        index = {(s.market, s.code): s for s in securities}
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM securities")
+            conn.executemany("INSERT OR REPLACE INTO securities VALUES (?, ?, ?, ?, ?, ?)", list(index.values()))
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('updated_at', ?)", (str(now),))
+        with self._lock:
+            self._index = index
+            self._counts = self._count(index)
+            self._updated_at = now
+            self._loaded = True
+
+    @staticmethod
+    def _count(index: dict) -> dict:
+        counts = {}
+        for market, _ in index:
+            counts[market] = counts.get(market, 0) + 1
+        return counts
+
+    # --- Lookups (no network) ---
+    def __len__(self) -> int:
+        self.load()
+        return len(self._index)
+
+    def count(self, market: str) -> int:
+        self.load()
+        return self._counts.get(market, 0)
+
+    @property
+    def age(self) -> float:
+        self.load()
+        return time.time() - self._updated_at if self._updated_at else float("inf")
+
+    def securities(self) -> list:
+        self.load()
+        return list(self._index.values())
+
+    def get(self, code: str, market: str) -> Optional[Security]:
+        self.load()
+        return self._index.get((market, normalize_code(code, market)))
+
+    def detect_market(self, code: str) -> str:
+        """Explicit prefix > master membership > 5-digit rule"""
+        raw = str(code).strip().upper()
+        if raw.startswith("HK"):
+            return "HK"
+        if raw.startswith(("SH", "SZ")):
+            return "CN"
+        self.load()
+        clean_code = normalize_code(raw, "CN")
+        if len(clean_code) == 6 and ("CN", clean_code) in self._index:
+            return "CN"
+        # A 6-digit code is never HK: 000001 must not match HK 00001 when CN misses it (new listing, failed refresh)
+        if len(clean_code) <= 5 and ("HK", normalize_code(raw, "HK")) in self._index:
+            return "HK"
+        return "HK" if len(clean_code) == 5 else "CN"
+
+    def lot_size(self, code: str, market: str) -> int:
+        sec = self.get(code, market)
+        return sec.lot_size if sec else classify(code, market).lot_size
+
+    # --- Background refresh ---
+    def start_background_refresh(self, refresher, interval: float = 86400):
+        """Run refresher() now if stale, then once per interval (daemon thread)"""
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return
+
+        def _loop():
+            while True:
+                if self.age >= interval:
+                    try:
+                        refresher()
+                    except Exception as e:
+                        logger.warning(f"Security master refresh failed: {e}")
+                time.sleep(max(min(interval - self.age, interval), 60))
+
+        self._refresh_thread = threading.Thread(target=_loop, name="security-master", daemon=True)
+        self._refresh_thread.start()
+
+
+security_master = SecurityMaster()
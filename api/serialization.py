@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Response Serialization & Compression
+FastJSONResponse: orjson (NumPy scalars/arrays natively) with a stdlib fallback.
+CompressionMiddleware: br (if brotli is installed) or gzip per Accept-Encoding;
+whole bodies are compressed once, streamed bodies (NDJSON) chunk by chunk with a
+flush so each line still reaches the client immediately.
+"""
+import gzip
+import json
+import math
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+from . import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _default(value):
+    # NumPy scalars / arrays / datetimes (stdlib path; orjson handles these natively)
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if hasattr(value, "item"):
+        return value.item()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _finite(value):
+    """stdlib json writes NaN/Infinity (invalid JSON); orjson writes null - match it"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: _finite(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(v) for v in value]
+    return value
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(_finite(content), ensure_ascii=False, separators=(",", ":"),
+                      default=_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """Drop-in JSONResponse: compact separators, NumPy support, ~5-10x faster with orjson"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+# --- Compression ---
+_COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/")
+
+
+def choose_encoding(accept_encoding: str) -> str:
+    """'br' > 'gzip' > '' according to the client's Accept-Encoding (q=0 means refused)"""
+    offered = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip()] = q
+    if brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return ""
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=config.BROTLI_QUALITY)
+        else:
+            self._obj = zlib.compressobj(config.GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._obj.process(data) + self._obj.flush()
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._obj.finish() if self.encoding == "br" else self._obj.flush()
+
+    @staticmethod
+    def whole(encoding: str, data: bytes) -> bytes:
+        if encoding == "br":
+            return brotli.compress(data, quality=config.BROTLI_QUALITY)
+        return gzip.compress(data, compresslevel=config.GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """Pure ASGI (no body buffering for streams): negotiates br/gzip for JSON and text responses"""
+
+    def __init__(self, app, minimum_size: int = None):
+        self.app = app
+        self.minimum_size = config.COMPRESS_MIN_SIZE if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def _send(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                ctype = headers.get("content-type", "")
+                if "content-encoding" in headers or not ctype.startswith(_COMPRESSIBLE) \
+                        or ctype.startswith("text/event-stream"):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message  # Decide once the first body chunk shows its size
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body, more = message.get("body", b""), message.get("more_body", False)
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                if not more and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if not more:
+                    body = _Compressor.whole(encoding, body)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    start_message = None
+                    return
+                del headers["Content-Length"]
+                compressor = _Compressor(encoding)
+                await send(start_message)
+                start_message = None
+
+            if compressor is None:
+                await send(message)
+                return
+            data = compressor.chunk(body) if body else b""
+            if not more:
+                data += compressor.finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, _send)
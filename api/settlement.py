@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Incremental Signal Settlement
+Per-signal progress (last evaluated bar, running max high / min low since the
+signal, outcome once the stop or target is touched) is persisted in SQLite, so
+each /settle_signals run only folds in bars newer than the previous run - and
+skips the history fetch entirely when no completed bar can have appeared since.
+"""
+import datetime
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from . import config
+
+OPEN = None  # outcome of a signal still in progress
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def day_index(day) -> int:
+    """date / datetime -> days since 1970-01-01 (as OHLCVSeries.days)"""
+    day = day.date() if isinstance(day, datetime.datetime) else day
+    return (day - EPOCH).days
+
+
+def day_str(index: int) -> str:
+    return (EPOCH + datetime.timedelta(days=int(index))).isoformat()
+
+
+def initial_state(signal_day: int) -> dict:
+    return {"last_day": signal_day, "max_high": None, "min_low": None, "bars": 0,
+            "outcome": OPEN, "outcome_day": None, "exit_price": None}
+
+
+def scan(series, state: dict, stop: float, target: float, before: int = None) -> dict:
+    """
+    Fold bars after state["last_day"] (and before day `before`) into the running extrema,
+    stopping at the first stop / target touch (stop wins when one bar touches both, as in the backtest)
+    """
+    if state["outcome"]:
+        return state
+    days = series.days
+    lo = int(np.searchsorted(days, state["last_day"], side="right"))
+    hi = len(days) if before is None else int(np.searchsorted(days, before, side="left"))
+    if hi <= lo:
+        return state
+    highs, lows = series.high[lo:hi], series.low[lo:hi]
+    hit_stop, hit_target = lows <= stop, highs >= target
+    first_stop = int(np.argmax(hit_stop)) if hit_stop.any() else None
+    first_target = int(np.argmax(hit_target)) if hit_target.any() else None
+    outcome, end = OPEN, hi - lo
+    if first_stop is not None and (first_target is None or first_stop <= first_target):
+        outcome, end = "stop", first_stop + 1
+    elif first_target is not None:
+        outcome, end = "target", first_target + 1
+    max_high, min_low = float(highs[:end].max()), float(lows[:end].min())
+    return {"last_day": int(days[lo + end - 1]),
+            "max_high": max_high if state["max_high"] is None else max(state["max_high"], max_high),
+            "min_low": min_low if state["min_low"] is None else min(state["min_low"], min_low),
+            "bars": state["bars"] + end, "outcome": outcome,
+            "outcome_day": int(days[lo + end - 1]) if outcome else None,
+            "exit_price": (stop if outcome == "stop" else target) if outcome else None}
+
+
+class SettlementStore:
+    """signal key -> settlement state (SQLite; shared by every worker on the host)"""
+
+    def __init__(self, path: str = ""):
+        self.path = path or config.data_path("settlement.sqlite")
+        self._local = threading.local()
+        self.reads = 0
+        self.hits = 0
+        self.writes = 0
+        conn = self._conn()
+        conn.execute("""CREATE TABLE IF NOT EXISTS signal_state (
+            key TEXT PRIMARY KEY, levels TEXT, state TEXT, updated_at REAL)""")
+        conn.execute("DELETE FROM signal_state WHERE updated_at < ?",
+                     (time.time() - config.SETTLEMENT_RETENTION_DAYS * 86400,))
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _levels(levels: tuple) -> str:
+        return json.dumps([round(float(v), 6) if isinstance(v, float) else v for v in levels])
+
+    def get(self, key: str, levels: tuple) -> dict:
+        """Stored state, or None when absent or saved for different levels (the signal was edited)"""
+        self.reads += 1
+        row = self._conn().execute("SELECT levels, state FROM signal_state WHERE key = ?", (key,)).fetchone()
+        if row is None or row[0] != self._levels(levels):
+            return None
+        self.hits += 1
+        return json.loads(row[1])
+
+    def put(self, key: str, levels: tuple, state: dict):
+        self.writes += 1
+        self._conn().execute("INSERT OR REPLACE INTO signal_state (key, levels, state, updated_at) VALUES (?, ?, ?, ?)",
+                             (key, self._levels(levels), json.dumps(state), time.time()))
+
+    def stats(self) -> dict:
+        count = self._conn().execute("SELECT COUNT(*) FROM signal_state").fetchone()[0]
+        return {"signals": count, "reads": self.reads, "hits": self.hits, "writes": self.writes}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_settlement_store() -> SettlementStore:
+    """Process-wide store (table opened on first use)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SettlementStore()
+        return _store
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Memory-Mapped History Store
+One fixed-width column file per field (days.i4, open/high/low/close, volume.f8)
+plus a per-symbol offset index. Reads are NumPy views over np.memmap, so
+every process shares the OS page cache instead of deserialising copies.
+
+Stored bars never move once written: a dividend/split found by update() only
+appends (ex_day, ratio) to the symbol's factor table, and qfq/hfq prices are
+produced on read with one vectorized multiply.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from . import config
+from .ohlcv import OHLCVSeries
+
+logger = logging.getLogger(__name__)
+
+
+def _family(source: str) -> str:
+    """'Pytdx(119.147.212.81)' -> 'Pytdx' (same upstream whichever server answered)"""
+    return (source or "").split("(", 1)[0]
+
+
+class HistoryStore:
+    """
+    Append-only: rewriting a symbol appends a new segment and repoints the index;
+    dead segments are reclaimed by compact() (automatic once garbage > live rows).
+    Writers serialise on an flock; readers never lock.
+    """
+
+    def __init__(self, root: str = "", price_dtype: str = None):
+        self.root = root or os.path.dirname(config.data_path("history_store", "index.json"))
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.RLock()
+        self._index = None
+        self._index_mtime = None
+        self._maps = {}
+        self._mapped = (None, 0)  # (generation, rows)
+        idx = self._read_index()
+        self.price_dtype = np.dtype(idx.get("dtype") or price_dtype or config.PRICE_DTYPE)
+        if not idx.get("dtype"):
+            idx["dtype"] = self.price_dtype.name
+            self._write_index(idx)
+
+    # --- Layout ---
+    def _dtype(self, field: str) -> np.dtype:
+        if field == "days":
+            return np.dtype(np.int32)
+        if field == "volume":
+            return np.dtype(np.float64)
+        return self.price_dtype
+
+    def _path(self, field: str, generation: int = 0) -> str:
+        """Column file of one compaction generation (generation 0 keeps the original names)"""
+        suffix = f".g{generation}" if generation else ""
+        return os.path.join(self.root, f"{field}{suffix}.{self._dtype(field).str[1:]}")
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.root, "index.json")
+
+    @staticmethod
+    def key(code: str, market: str) -> str:
+        return f"{market}:{code}"
+
+    # Index entry: [offset, length, source, updated_at, factors] (factors: [[ex_day, ratio], ...])
+    @staticmethod
+    def _factors(entry: list) -> list:
+        return entry[4] if len(entry) > 4 else []
+
+    # --- Index ---
+    def _read_index(self) -> dict:
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {"dtype": None, "rows": 0, "garbage": 0, "generation": 0, "shares_since": 0, "symbols": {}}
+
+    def _write_index(self, idx: dict):
+        tmp = f"{self._index_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(idx, fh, separators=(",", ":"))
+        os.replace(tmp, self._index_path)  # Atomic: readers see old or new, never partial
+
+    def _current_index(self) -> dict:
+        """Reload only when another process/thread replaced the index file"""
+        try:
+            mtime = os.stat(self._index_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if self._index is None or mtime != self._index_mtime:
+            self._index = self._read_index()
+            self._index_mtime = mtime
+        return self._index
+
+    def _columns(self, idx: dict) -> dict:
+        """Memory maps covering idx['rows'] rows (remapped after growth or compaction)"""
+        state = (idx["generation"], idx["rows"])
+        if self._mapped != state:
+            self._maps = {}
+            if idx["rows"] > 0:
+                for f in OHLCVSeries.FIELDS:
+                    self._maps[f] = np.memmap(self._path(f, idx["generation"]), dtype=self._dtype(f), mode="r",
+                                              shape=(idx["rows"],))
+            self._mapped = state
+        return self._maps
+
+    # --- Reads (zero-copy) ---
+    def __contains__(self, item) -> bool:
+        code, market = item
+        return self.key(code, market) in self._current_index()["symbols"]
+
+    def info(self, code: str, market: str):
+        """(rows, source, updated_at) or None"""
+        entry = self._current_index()["symbols"].get(self.key(code, market))
+        return (entry[1], entry[2], entry[3]) if entry else None
+
+    def factors(self, code: str, market: str) -> list:
+        """[[ex_day, ratio], ...]: bars before ex_day are multiplied by ratio for qfq"""
+        entry = self._current_index()["symbols"].get(self.key(code, market))
+        return [list(f) for f in self._factors(entry)] if entry else []
+
+    @staticmethod
+    def _scale(factors: list, days: np.ndarray) -> np.ndarray:
+        """Per-bar qfq multiplier: product of every ratio whose ex_day is after the bar"""
+        ex_days = np.array([f[0] for f in factors], dtype=np.int32)
+        suffix = np.append(np.cumprod(np.array([f[1] for f in factors])[::-1])[::-1], 1.0)
+        return suffix[np.searchsorted(ex_days, days, side="right")]
+
+    def read(self, code: str, market: str, adjust: str = "qfq"):
+        """
+        OHLCVSeries for one symbol (None if absent). adjust: 'qfq' (what the sources serve),
+        'hfq' (history fixed, latest bars scaled) or None (bars as stored).
+        Without corporate actions every mode returns read-only views into the shared mapping.
+        """
+        with self._lock:
+            try:
+                idx = self._current_index()
+                entry, cols = self._entry_columns(idx, code, market)
+            except FileNotFoundError:
+                # Compaction retired this index's generation between our index read and the mapping
+                self._index = None
+                idx = self._current_index()
+                entry, cols = self._entry_columns(idx, code, market)
+            if not entry:
+                return None
+            offset, length, source = entry[:3]
+            factors = self._factors(entry)
+        if length == 0:
+            return OHLCVSeries.empty(code, market, source, self.price_dtype)
+        series = OHLCVSeries.wrap(*(cols[f][offset:offset + length] for f in OHLCVSeries.FIELDS),
+                                  code=code, market=market, source=source)
+        if not factors or adjust is None:
+            return series
+        scale = self._scale(factors, series.days)
+        if adjust == "hfq":
+            scale = scale / np.prod([f[1] for f in factors])  # Divides out every action: stored anchor kept
+        elif adjust != "qfq":
+            raise ValueError(f"Unknown adjust mode '{adjust}' (qfq / hfq / None)")
+        prices = (OHLCVSeries._freeze((getattr(series, f) * scale).astype(self.price_dtype))
+                  for f in ("open", "high", "low", "close"))
+        return OHLCVSeries.wrap(series.days, *prices, series.volume, code=code, market=market, source=source)
+
+    def _entry_columns(self, idx: dict, code: str, market: str) -> tuple:
+        entry = idx["symbols"].get(self.key(code, market))
+        return entry, (self._columns(idx) if entry else None)
+
+    def symbols(self, market: str = None) -> list:
+        keys = self._current_index()["symbols"].keys()
+        return [k.split(":", 1)[1] for k in keys if market is None or k.startswith(f"{market}:")]
+
+    def panel(self, field: str, codes: list, market: str, length: int) -> np.ndarray:
+        """(len(codes), length) matrix of the last `length` bars per symbol, NaN-padded on the left"""
+        out = np.full((len(codes), length), np.nan)
+        for i, code in enumerate(codes):
+            series = self.read(code, market)
+            if series is not None and len(series):
+                values = getattr(series, field)[-length:]
+                out[i, length - len(values):] = values
+        return out
+
+    # --- Writes ---
+    @contextmanager
+    def _write_lock(self):
+        with self._lock, open(os.path.join(self.root, ".lock"), "w") as lock_fh:
+            fcntl.flock(lock_fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_fh, fcntl.LOCK_UN)
+
+    def write(self, series: OHLCVSeries):
+        self.write_many([series])
+
+    def write_many(self, batch: list):
+        """Append segments for several symbols under one lock + one index rewrite (factors reset)"""
+        batch = [s for s in batch if s is not None]
+        if not batch:
+            return
+        with self._write_lock():
+            idx = self._read_index()
+            self._append_locked(idx, [(s, []) for s in batch])
+
+    def _append_locked(self, idx: dict, segments: list):
+        """segments: [(OHLCVSeries, factors)] -> new segments + index entries, then one index write"""
+        rows = idx["rows"]
+        for f in OHLCVSeries.FIELDS:
+            path = self._path(f, idx["generation"])
+            itemsize = self._dtype(f).itemsize
+            with open(path, "ab") as fh:
+                # A crashed writer may have left unindexed tail rows: cut back to the index
+                if fh.tell() != rows * itemsize:
+                    fh.truncate(rows * itemsize)
+                    fh.seek(rows * itemsize)
+                for s, _ in segments:
+                    fh.write(np.ascontiguousarray(getattr(s, f), dtype=self._dtype(f)).tobytes())
+        now = time.time()
+        for s, factors in segments:
+            key = self.key(s.code, s.market)
+            old = idx["symbols"].get(key)
+            if old:
+                idx["garbage"] += old[1]
+            idx["symbols"][key] = [rows, len(s), s.source, now] + ([factors] if factors else [])
+            rows += len(s)
+        idx["rows"] = rows
+        self._write_index(idx)
+        if idx["garbage"] > max(rows - idx["garbage"], 100_000):
+            self._compact_locked(idx)
+
+    @staticmethod
+    def _digest(values: np.ndarray) -> bytes:
+        return hashlib.blake2b(np.round(np.asarray(values, dtype=np.float64), 2).tobytes(), digest_size=8).digest()
+
+    def update(self, series: OHLCVSeries, check_bars: int = None) -> str:
+        """
+        Merge a freshly fetched qfq series into the stored bars. The overlapping recent
+        bars are compared by checksum first; a mismatch that is one constant ratio
+        before some day is a corporate action and only appends [ex_day, ratio] to the
+        factor table. Anything else (revised data, gap) rewrites the symbol.
+        Returns 'new' / 'unchanged' / 'appended' / 'adjusted' / 'rewritten'.
+        """
+        if series is None or not len(series):
+            return "unchanged"
+        check_bars = check_bars or config.ADJUST_CHECK_BARS
+        key = self.key(series.code, series.market)
+        with self._write_lock():
+            idx = self._read_index()
+            entry = idx["symbols"].get(key)
+            if not entry or not entry[1]:
+                self._append_locked(idx, [(series, [])])
+                return "new"
+            # Stores older than volume normalisation hold lots: each symbol is rewritten on its next update
+            shares_since = idx.setdefault("shares_since", time.time())
+            if _family(entry[2]) != _family(series.source) or entry[3] < shares_since:
+                # Sources round and adjust differently: never splice two of them together
+                self._append_locked(idx, [(series, [])])
+                return "rewritten"
+            offset, length = entry[0], entry[1]
+            factors = [list(f) for f in self._factors(entry)]
+            cols = self._columns(idx)
+            days = np.asarray(cols["days"][offset:offset + length])
+            # The last stored bar may have been a partial session bar: it is replaced, not compared
+            keep = length - 1 if days[-1] in series.days else length
+            window = slice(max(keep - check_bars, 0), keep)
+            common, i_old, i_new = np.intersect1d(days[window], series.days, assume_unique=True,
+                                                  return_indices=True)
+            if keep and not len(common):
+                self._append_locked(idx, [(series, [])])
+                return "rewritten"
+
+            action = "unchanged"
+            if len(common):
+                old = np.asarray(cols["close"][offset:offset + length][window][i_old], dtype=np.float64)
+                if factors:
+                    old = old * self._scale(factors, common)
+                new = series.close[i_new].astype(np.float64)
+                if self._digest(old) != self._digest(new):
+                    moved = ~np.isclose(new, old, rtol=1e-3, atol=0.011)
+                    if moved.any():
+                        last = np.flatnonzero(moved)[-1]
+                        ratio = float(np.median(new[:last + 1] / old[:last + 1]))
+                        if not moved[:last + 1].all() or \
+                                not np.isclose(old[:last + 1] * ratio, new[:last + 1], rtol=1e-3, atol=0.011).all():
+                            self._append_locked(idx, [(series, [])])
+                            return "rewritten"
+                        after = common[last]
+                        if keep < length and last == len(common) - 1:
+                            # Partial last bar moved by the same ratio too: the ex-date is later still
+                            prev = float(cols["close"][offset + keep]) * self._scale(factors, days[keep:])[0]
+                            cur = float(series.close[np.searchsorted(series.days, days[keep])])
+                            if np.isclose(prev * ratio, cur, rtol=1e-3, atol=0.011) and \
+                                    not np.isclose(prev, cur, rtol=1e-3, atol=0.011):
+                                after = days[keep]
+                        later = series.days[series.days > after]
+                        if not len(later):
+                            self._append_locked(idx, [(series, [])])
+                            return "rewritten"
+                        factors.append([int(later[0]), round(ratio, 8)])
+                        action = "adjusted"
+
+            tail = series.days > days[keep - 1] if keep else np.ones(len(series), dtype=bool)
+            if keep == length - 1 and tail.sum() == 1 and all(
+                    np.isclose(getattr(series, f)[tail][0], cols[f][offset + keep]) for f in OHLCVSeries.FIELDS):
+                keep, tail = length, np.zeros(len(series), dtype=bool)  # Re-fetched last bar is final already
+            if keep == length and not tail.any():
+                entry[3] = time.time()
+                if action == "adjusted":
+                    entry[4:] = [factors]
+                self._write_index(idx)
+                return action
+            # Fetched bars are qfq as of now: store them de-scaled so every factor applies uniformly
+            unscale = self._scale(factors, series.days[tail]) if factors else 1.0
+            merged = OHLCVSeries.wrap(
+                *(np.concatenate([np.asarray(cols[f][offset:offset + keep]),
+                                  np.asarray(getattr(series, f)[tail] / (1.0 if f in ("days", "volume") else unscale),
+                                             dtype=self._dtype(f))])
+                  for f in OHLCVSeries.FIELDS),
+                code=series.code, market=series.market, source=series.source)
+            self._append_locked(idx, [(merged, factors)])
+            return "adjusted" if action == "adjusted" else "appended"
+
+    def compact(self):
+        with self._write_lock():
+            self._compact_locked(self._read_index())
+
+    def _compact_locked(self, idx: dict):
+        """
+        Rewrite live segments contiguously into the next generation's files; the atomic index
+        write switches readers over, then the old generation is unlinked (existing mappings stay valid)
+        """
+        start = time.perf_counter()
+        live = sorted(idx["symbols"].items(), key=lambda kv: kv[1][0])
+        old_gen, new_gen = idx["generation"], idx["generation"] + 1
+        old_maps = {}
+        if idx["rows"]:
+            old_maps = {f: np.memmap(self._path(f, old_gen), dtype=self._dtype(f), mode="r", shape=(idx["rows"],))
+                        for f in OHLCVSeries.FIELDS}
+        new_symbols, rows = {}, 0
+        for f in OHLCVSeries.FIELDS:
+            with open(self._path(f, new_gen), "wb") as fh:
+                for _, (offset, length, *_) in live:
+                    fh.write(np.asarray(old_maps[f][offset:offset + length]).tobytes())
+                fh.flush()
+                os.fsync(fh.fileno())
+        for key, (offset, length, *rest) in live:
+            new_symbols[key] = [rows, length, *rest]
+            rows += length
+        del old_maps
+        idx.update({"rows": rows, "garbage": 0, "generation": new_gen, "symbols": new_symbols})
+        self._write_index(idx)
+        for f in OHLCVSeries.FIELDS:
+            try:
+                os.remove(self._path(f, old_gen))
+            except FileNotFoundError:
+                pass
+        logger.info(f"History store compacted: {len(live)} symbols, {rows} rows "
+                    f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def stats(self) -> dict:
+        idx = self._current_index()
+        return {"symbols": len(idx["symbols"]), "rows": idx["rows"], "garbage_rows": idx["garbage"],
+                "adjusted_symbols": sum(1 for e in idx["symbols"].values() if self._factors(e)),
+                "dtype": self.price_dtype.name, "root": self.root}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> HistoryStore:
+    """Process-wide store (created on first use)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+        return _store
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Multi-Timeframe Bars
+Weekly/monthly OHLCV resampled from the cached daily series (no upstream call).
+Resampled bars are cached per symbol; when new dailies arrive only the last,
+still-forming bucket is recomputed.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from . import config
+from .fetcher import DataFetcher
+from .ohlcv import OHLCVSeries
+from .quant import calculate_technicals, generate_signal
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"W": "weekly", "M": "monthly"}
+
+
+class TimeframeCache:
+    """(market, code, period) -> resampled series + the daily prefix it was built from"""
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or config.HISTORY_CACHE_MAX * len(PERIODS)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (bars, daily_len, bucket_start, first_day, first_close, last_close)
+        self.hits = 0
+        self.incremental = 0
+        self.full = 0
+
+    def get(self, daily: OHLCVSeries, period: str) -> OHLCVSeries:
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period '{period}' ({' / '.join(PERIODS)})")
+        n = len(daily)
+        if not n:
+            return daily.resample(period)
+        key = (daily.market, daily.code, period)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+        if entry and self._same_prefix(daily, entry):
+            bars, daily_len, bucket_start, _, _, last_close = entry
+            if n == daily_len and daily.close[-1] == last_close:
+                self.hits += 1
+                return bars
+            # New/replaced dailies only touch buckets from the last cached one onwards
+            tail, tail_start = daily.slice(bucket_start, n)._resample(period)
+            bars = OHLCVSeries.wrap(*(np.concatenate([getattr(bars, f)[:-1], getattr(tail, f)])
+                                      for f in OHLCVSeries.FIELDS),
+                                    code=daily.code, market=daily.market, source=daily.source)
+            bucket_start += tail_start
+            self.incremental += 1
+        else:
+            bars, bucket_start = daily._resample(period)
+            self.full += 1
+        with self._lock:
+            self._entries[key] = (bars, n, bucket_start, int(daily.days[0]), float(daily.close[0]),
+                                  float(daily.close[-1]))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return bars
+
+    @staticmethod
+    def _same_prefix(daily: OHLCVSeries, entry: tuple) -> bool:
+        """Same history start, not rescaled by a corporate action, not shorter than before"""
+        _, daily_len, bucket_start, first_day, first_close, _ = entry
+        return (len(daily) >= daily_len and int(daily.days[0]) == first_day
+                and float(daily.close[0]) == first_close)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "incremental": self.incremental,
+                "full": self.full}
+
+
+timeframe_cache = TimeframeCache()
+
+
+def get_timeframe(code: str, market: str = "CN", period: str = "W") -> OHLCVSeries:
+    """Weekly/monthly bars from the cached daily history"""
+    return timeframe_cache.get(DataFetcher.get_history_series(code, market), period)
+
+
+def _direction(score: float) -> int:
+    return 1 if score >= 55 else -1 if score <= 45 else 0
+
+
+def multi_timeframe(daily: OHLCVSeries, is_hk: bool, daily_score: float) -> dict:
+    """
+    calculate_technicals + generate_signal per higher timeframe, plus whether they
+    confirm the daily trend ('confirmed' / 'conflict' / 'neutral')
+    """
+    block = {}
+    directions = []
+    for period, name in PERIODS.items():
+        bars = timeframe_cache.get(daily, period)
+        tech = calculate_technicals(bars)
+        if not tech:
+            block[name] = None
+            continue
+        sig = generate_signal(tech, is_hk)
+        block[name] = {
+            "bars": len(bars),
+            "trend_score": sig['trend_score'],
+            "signal_type": sig['signal'],
+            "ma_alignment": tech['ma_alignment'],
+            "macd_cross": tech['macd_cross'],
+            "rsi14": tech['rsi14'],
+            "above_ma20": bool(tech['ma20']) and tech['current_price'] > tech['ma20'],
+        }
+        directions.append(_direction(sig['trend_score']))
+    daily_dir = _direction(daily_score)
+    if not daily_dir or not directions:
+        confirmation = "neutral"
+    elif directions[0] == -daily_dir or all(d == -daily_dir for d in directions):
+        confirmation = "conflict"
+    elif directions[0] == daily_dir:
+        confirmation = "confirmed"
+    else:
+        confirmation = "neutral"
+    block["confirmation"] = confirmation
+    return block
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Trading Calendar
+CN (SSE/SZSE) and HK (HKEX) trading days and session times. Holidays are seeded
+offline below; DataFetcher.refresh_trading_calendar() replaces whole years from
+upstream and persists them, so lookups never touch the network.
+Drives history/quote freshness (no refetch while no new bar can exist) and
+trading-day counting for signal timeouts.
+"""
+import datetime
+import logging
+import sqlite3
+import threading
+import time
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Both exchanges run on UTC+8 all year (no DST)
+TZ = datetime.timezone(datetime.timedelta(hours=8))
+
+# Continuous sessions (local time); HK half days keep only the morning session
+SESSIONS = {
+    "CN": [(datetime.time(9, 30), datetime.time(11, 30)), (datetime.time(13, 0), datetime.time(15, 0))],
+    "HK": [(datetime.time(9, 30), datetime.time(12, 0)), (datetime.time(13, 0), datetime.time(16, 0))],
+}
+
+
+def _days(*isodates: str) -> set:
+    return {datetime.date.fromisoformat(d) for d in isodates}
+
+
+# Weekday closures only (weekends are always closed, make-up Saturdays do not trade)
+SEED_HOLIDAYS = {
+    "CN": _days(
+        "2024-01-01", "2024-02-09", "2024-02-12", "2024-02-13", "2024-02-14", "2024-02-15", "2024-02-16",
+        "2024-04-04", "2024-04-05", "2024-05-01", "2024-05-02", "2024-05-03", "2024-06-10",
+        "2024-09-16", "2024-09-17", "2024-10-01", "2024-10-02", "2024-10-03", "2024-10-04", "2024-10-07",
+        "2025-01-01", "2025-01-28", "2025-01-29", "2025-01-30", "2025-01-31", "2025-02-03", "2025-02-04",
+        "2025-04-04", "2025-05-01", "2025-05-02", "2025-05-05", "2025-06-02",
+        "2025-10-01", "2025-10-02", "2025-10-03", "2025-10-06", "2025-10-07", "2025-10-08",
+        "2026-01-01", "2026-01-02", "2026-02-16", "2026-02-17", "2026-02-18", "2026-02-19", "2026-02-20",
+        "2026-02-23", "2026-04-06", "2026-05-01", "2026-05-04", "2026-05-05", "2026-06-19",
+        "2026-09-25", "2026-10-01", "2026-10-02", "2026-10-05", "2026-10-06", "2026-10-07",
+    ),
+    "HK": _days(
+        "2024-01-01", "2024-02-12", "2024-02-13", "2024-03-29", "2024-04-01", "2024-04-04", "2024-05-01",
+        "2024-05-15", "2024-06-10", "2024-07-01", "2024-09-18", "2024-10-01", "2024-10-11",
+        "2024-12-25", "2024-12-26",
+        "2025-01-01", "2025-01-29", "2025-01-30", "2025-01-31", "2025-04-04", "2025-04-18", "2025-04-21",
+        "2025-05-01", "2025-05-05", "2025-07-01", "2025-10-01", "2025-10-07", "2025-10-29",
+        "2025-12-25", "2025-12-26",
+        "2026-01-01", "2026-02-17", "2026-02-18", "2026-02-19", "2026-04-03", "2026-04-06", "2026-04-07",
+        "2026-05-01", "2026-05-25", "2026-06-19", "2026-07-01", "2026-10-01", "2026-10-19", "2026-12-25",
+    ),
+}
+SEED_HALF_DAYS = {
+    "CN": set(),
+    "HK": _days("2024-02-09", "2024-12-24", "2024-12-31", "2025-01-28", "2025-12-24", "2025-12-31",
+                "2026-02-16", "2026-12-24", "2026-12-31"),
+}
+
+
+def _as_date(value) -> datetime.date:
+    if isinstance(value, datetime.datetime):
+        return value.astimezone(TZ).date() if value.tzinfo else value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+def _local(ts: float = None) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(time.time() if ts is None else ts, TZ)
+
+
+class TradingCalendar:
+    """Seeded holiday sets + persisted overrides (whole years) -> O(1) day checks"""
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self._holidays = {m: set(days) for m, days in SEED_HOLIDAYS.items()}
+        self._half_days = {m: set(days) for m, days in SEED_HALF_DAYS.items()}
+        self._years = {m: set() for m in SESSIONS}  # Years replaced from upstream
+        self._updated_at = 0.0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    # --- Persistence ---
+    def _connect(self) -> sqlite3.Connection:
+        if not self.path:
+            self.path = config.data_path("trading_calendar.sqlite")
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("CREATE TABLE IF NOT EXISTS closures (market TEXT, day TEXT, half INTEGER, PRIMARY KEY (market, day))")
+        conn.execute("CREATE TABLE IF NOT EXISTS years (market TEXT, year INTEGER, updated_at REAL, PRIMARY KEY (market, year))")
+        return conn
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                with self._connect() as conn:
+                    years = conn.execute("SELECT market, year, updated_at FROM years").fetchall()
+                    rows = conn.execute("SELECT market, day, half FROM closures").fetchall()
+                for market, year, updated_at in years:
+                    self._drop_year(market, year)
+                    self._updated_at = max(self._updated_at, updated_at)
+                for market, day, half in rows:
+                    (self._half_days if half else self._holidays)[market].add(datetime.date.fromisoformat(day))
+            except Exception as e:
+                logger.warning(f"Trading calendar load failed, using seed: {e}")
+            self._loaded = True
+
+    def _drop_year(self, market: str, year: int):
+        self._years[market].add(year)
+        self._holidays[market] = {d for d in self._holidays[market] if d.year != year}
+        self._half_days[market] = {d for d in self._half_days[market] if d.year != year}
+
+    def replace_years(self, market: str, years: list, holidays: list, half_days: list = ()):
+        """Authoritative closures for whole years (upstream refresh or manual correction)"""
+        self.load()
+        holidays = {_as_date(d) for d in holidays if _as_date(d).year in years and _as_date(d).weekday() < 5}
+        half_days = {_as_date(d) for d in half_days if _as_date(d).year in years}
+        now = time.time()
+        with self._connect() as conn:
+            for year in years:
+                conn.execute("DELETE FROM closures WHERE market = ? AND day LIKE ?", (market, f"{year}-%"))
+                conn.execute("INSERT OR REPLACE INTO years VALUES (?, ?, ?)", (market, year, now))
+            conn.executemany("INSERT OR REPLACE INTO closures VALUES (?, ?, 0)",
+                             [(market, d.isoformat()) for d in holidays])
+            conn.executemany("INSERT OR REPLACE INTO closures VALUES (?, ?, 1)",
+                             [(market, d.isoformat()) for d in half_days])
+        with self._lock:
+            for year in years:
+                self._drop_year(market, year)
+            self._holidays[market] |= holidays
+            self._half_days[market] |= half_days
+            self._updated_at = now
+
+    @property
+    def age(self) -> float:
+        self.load()
+        return time.time() - self._updated_at if self._updated_at else float("inf")
+
+    # --- Days ---
+    def is_trading_day(self, day, market: str = "CN") -> bool:
+        self.load()
+        day = _as_date(day)
+        return day.weekday() < 5 and day not in self._holidays[market]
+
+    def next_trading_day(self, day, market: str = "CN") -> datetime.date:
+        day = _as_date(day) + datetime.timedelta(days=1)
+        while not self.is_trading_day(day, market):
+            day += datetime.timedelta(days=1)
+        return day
+
+    def previous_trading_day(self, day, market: str = "CN") -> datetime.date:
+        day = _as_date(day) - datetime.timedelta(days=1)
+        while not self.is_trading_day(day, market):
+            day -= datetime.timedelta(days=1)
+        return day
+
+    def trading_days_between(self, start, end, market: str = "CN") -> int:
+        """Trading days in (start, end] - e.g. bars elapsed since a signal date"""
+        start, end = _as_date(start), _as_date(end)
+        if end <= start:
+            return 0
+        days = (end - start).days
+        weeks, rest = divmod(days, 7)
+        count = weeks * 5 + sum(1 for i in range(1, rest + 1)
+                                if (start + datetime.timedelta(days=i)).weekday() < 5)
+        self.load()
+        return count - sum(1 for d in self._holidays[market] if start < d <= end and d.weekday() < 5)
+
+    # --- Sessions ---
+    def sessions(self, day, market: str = "CN") -> list:
+        """[(open_ts, close_ts)] epoch seconds for one day ([] when closed)"""
+        day = _as_date(day)
+        if not self.is_trading_day(day, market):
+            return []
+        spans = SESSIONS[market][:1] if day in self._half_days[market] else SESSIONS[market]
+        return [(datetime.datetime.combine(day, o, TZ).timestamp(), datetime.datetime.combine(day, c, TZ).timestamp())
+                for o, c in spans]
+
+    def is_open(self, market: str = "CN", ts: float = None) -> bool:
+        ts = time.time() if ts is None else ts
+        return any(o <= ts < c for o, c in self.sessions(_local(ts), market))
+
+    def next_open(self, market: str = "CN", ts: float = None) -> float:
+        ts = time.time() if ts is None else ts
+        day = _local(ts).date()
+        for o, _ in self.sessions(day, market):
+            if o > ts:
+                return o
+        return self.sessions(self.next_trading_day(day, market), market)[0][0]
+
+    def next_close(self, market: str = "CN", ts: float = None) -> float:
+        """Close of the first trading day ending after ts (when the next daily bar is final)"""
+        ts = time.time() if ts is None else ts
+        day = _local(ts).date()
+        spans = self.sessions(day, market)
+        if spans and spans[-1][1] > ts:
+            return spans[-1][1]
+        return self.sessions(self.next_trading_day(day, market), market)[-1][1]
+
+    def last_close(self, market: str = "CN", ts: float = None) -> float:
+        ts = time.time() if ts is None else ts
+        day = _local(ts).date()
+        spans = self.sessions(day, market)
+        if spans and spans[-1][1] <= ts:
+            return spans[-1][1]
+        return self.sessions(self.previous_trading_day(day, market), market)[-1][1]
+
+    # --- Freshness ---
+    def _publishing(self, market: str, ts: float) -> bool:
+        """In session, or the closing prices are still being published"""
+        return self.is_open(market, ts) or ts - self.last_close(market, ts) < config.CALENDAR_CLOSE_GRACE
+
+    def _settling(self, market: str, ts: float) -> bool:
+        """Today's bar is partial: from the first open to the last close + grace (lunch break included)"""
+        spans = self.sessions(_local(ts).date(), market)
+        if spans and spans[0][0] <= ts < spans[-1][1] + config.CALENDAR_CLOSE_GRACE:
+            return True
+        return self._publishing(market, ts)
+
+    def history_ttl(self, market: str, fetched_at: float) -> float:
+        """Seconds daily bars fetched at fetched_at stay valid: until the next close outside trading days"""
+        if not config.TRADING_CALENDAR or self._settling(market, fetched_at):
+            return config.HISTORY_CACHE_TTL
+        return self.next_close(market, fetched_at) + config.CALENDAR_CLOSE_GRACE - fetched_at
+
+    def quote_ttl(self, market: str, fetched_at: float, default: float) -> float:
+        """Seconds a spot price stays valid: `default` in session, until the next open otherwise (lunch too)"""
+        if not config.TRADING_CALENDAR or self._publishing(market, fetched_at):
+            return default
+        return max(self.next_open(market, fetched_at) - fetched_at, default)
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {m: {"open": self.is_open(m, now), "next_open": _local(self.next_open(m, now)).isoformat(),
+                    "next_close": _local(self.next_close(m, now)).isoformat(),
+                    "upstream_years": sorted(self._years[m])}
+                for m in SESSIONS}
+
+
+trading_calendar = TradingCalendar()
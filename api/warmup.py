@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+V15 Startup Warmup
+Preload security master, quotes and histories for the configured watchlist
+so the first scheduled workflow run never pays cold-start latency.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import config
+from .fetcher import DataFetcher
+from .security_master import security_master
+from .trading_calendar import trading_calendar
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_STEPS = ("quotes", "histories")  # Failing either leaves the instance degraded (not ready)
+
+
+def parse_watchlist(raw: str) -> list:
+    """'600519, HK:00700, 09988' -> [('600519', 'CN'), ('00700', 'HK'), ('09988', 'HK')]"""
+    items = []
+    for token in raw.replace(";", ",").split(","):
+        token = token.strip()
+        if not token:
+            continue
+        if ":" in token:
+            market, code = token.split(":", 1)
+            items.append((code.strip(), market.strip().upper()))
+        else:
+            items.append((token, security_master.detect_market(token)))
+    return items
+
+
+class Warmup:
+    """Background warmup with progress snapshot for /ready"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.state = {
+            "status": "idle",     # idle / running / ready / degraded
+            "started_at": None,
+            "finished_at": None,
+            "steps": {},
+            "histories": {"total": 0, "done": 0, "failed": []},
+        }
+
+    @property
+    def ready(self) -> bool:
+        return self.state["status"] == "ready"
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snap = {k: (dict(v) if isinstance(v, dict) else v) for k, v in self.state.items()}
+            snap["histories"]["failed"] = list(self.state["histories"]["failed"])
+        if snap["started_at"]:
+            end = snap["finished_at"] or time.time()
+            snap["elapsed_ms"] = int((end - snap["started_at"]) * 1000)
+        snap["ready"] = snap["status"] == "ready"
+        return snap
+
+    def start(self, watchlist: list = None, workers: int = None):
+        if self._thread and self._thread.is_alive():
+            return
+        if watchlist is None:
+            watchlist = parse_watchlist(config.WARMUP_WATCHLIST)
+        workers = workers or config.WARMUP_WORKERS
+        with self._lock:
+            self.state["status"] = "running"
+            self.state["started_at"] = time.time()
+            self.state["histories"]["total"] = len(watchlist)
+        self._thread = threading.Thread(target=self.run, args=(watchlist, workers), name="warmup", daemon=True)
+        self._thread.start()
+
+    def _step(self, name: str, func):
+        start = time.perf_counter()
+        try:
+            detail = func()
+            status = "ok"
+        except Exception as e:
+            logger.warning(f"Warmup step {name} failed: {e}")
+            detail, status = str(e), "failed"
+        with self._lock:
+            self.state["steps"][name] = {"status": status, "ms": int((time.perf_counter() - start) * 1000),
+                                         "detail": detail}
+
+    def run(self, watchlist: list, workers: int):
+        logger.info(f"🔥 Warmup started ({len(watchlist)} symbols, {workers} workers)")
+
+        def _master():
+            try:
+                if security_master.age >= 86400:
+                    DataFetcher.refresh_security_master()
+            finally:
+                # Daily refresh loop takes over (and retries) even when the first load failed
+                security_master.start_background_refresh(DataFetcher.refresh_security_master)
+            return len(security_master)
+
+        def _calendar():
+            # Exchanges publish next year's closures once a year; monthly is plenty
+            if trading_calendar.age >= 30 * 86400:
+                DataFetcher.refresh_trading_calendar()
+            return trading_calendar.stats()
+
+        def _quotes():
+            by_market = {}
+            for code, market in watchlist:
+                by_market.setdefault(market, []).append(code)
+            got = {m: sum(1 for p in DataFetcher.get_realtime_prices(codes, m).values() if p > 0)
+                   for m, codes in by_market.items()}
+            if watchlist and not sum(got.values()):
+                raise RuntimeError("No quote for any watchlist symbol")
+            return got
+
+        def _histories():
+            with self._lock:
+                progress = self.state["histories"]
+                todo = watchlist
+                if progress["done"]:  # Retry: only the symbols that failed last time
+                    failed = set(progress["failed"])
+                    todo = [(code, market) for code, market in watchlist if f"{market}:{code}" in failed]
+                    progress["done"] -= len(todo)
+                    progress["failed"] = []
+            loaded = self._histories(todo, workers)
+            if watchlist and not loaded:
+                raise RuntimeError("No history for any watchlist symbol")
+            return loaded
+
+        def _names():
+            return sum(1 for code, market in watchlist if DataFetcher.get_stock_name(code, market) != code)
+
+        self._step("security_master", _master)
+        self._step("trading_calendar", _calendar)
+        self._step("tdx_servers", DataFetcher.rank_tdx_servers)
+        self._step("quotes", _quotes)
+        self._step("names", _names)
+        self._step("histories", _histories)
+
+        required = {"quotes": _quotes, "histories": _histories}
+        while True:
+            with self._lock:
+                failed = [n for n in REQUIRED_STEPS if self.state["steps"][n]["status"] != "ok"]
+                self.state["status"] = "degraded" if failed else "ready"
+                self.state["finished_at"] = time.time()
+            if not failed:
+                break
+            # A transient upstream outage at boot must not leave /ready at 503 for the process lifetime
+            logger.error(f"🔥 Warmup degraded, not ready: {', '.join(failed)} failed "
+                         f"(retrying in {config.WARMUP_RETRY:g}s)")
+            time.sleep(config.WARMUP_RETRY)
+            for name in failed:
+                self._step(name, required[name])
+        logger.info(f"🔥 Warmup finished: {self.snapshot()['histories']}")
+
+    def _histories(self, watchlist: list, workers: int) -> int:
+        if not watchlist:
+            return 0
+        with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="warmup") as pool:
+            futures = {pool.submit(DataFetcher.get_history_series, code, market): (code, market)
+                       for code, market in watchlist}
+            for fut in as_completed(futures):
+                code, market = futures[fut]
+                try:
+                    ok = len(fut.result()) > 0
+                except Exception as e:
+                    logger.warning(f"Warmup history failed for {code}: {e}")
+                    ok = False
+                with self._lock:
+                    self.state["histories"]["done"] += 1
+                    if not ok:
+                        self.state["histories"]["failed"].append(f"{market}:{code}")
+        return self.state["histories"]["done"] - len(self.state["histories"]["failed"])
+
+
+warmup = Warmup()
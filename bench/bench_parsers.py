@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: source-specific parsers vs generic DataFetcher._clean_data
+Usage: python -m bench.bench_parsers [bars]
+"""
+import sys
+import os
+import datetime
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import parsers
+from api.fetcher import DataFetcher, _tencent_frame
+
+
+def make_payloads(n: int):
+    start = datetime.date(2010, 1, 1)
+    dates = [(start + datetime.timedelta(days=i)).isoformat() for i in range(n)]
+    px = 10 + np.cumsum(np.random.default_rng(0).normal(0, 0.1, n))
+    tencent = [[d, f"{p:.2f}", f"{p + .1:.2f}", f"{p + .3:.2f}", f"{p - .3:.2f}", f"{1e5 + i:.3f}"]
+               for i, (d, p) in enumerate(zip(dates, px))]
+    eastmoney = pd.DataFrame({'日期': dates, '开盘': px, '收盘': px + .1, '最高': px + .3,
+                              '最低': px - .3, '成交量': np.arange(n) + 100000, '成交额': px * 1e5})
+    baostock = [[d, f"{p:.4f}", f"{p + .3:.4f}", f"{p - .3:.4f}", f"{p + .1:.4f}", str(100000 + i)]
+                for i, (d, p) in enumerate(zip(dates, px))]
+    return tencent, eastmoney, baostock
+
+
+def bench(label, generic, fast, number):
+    g = min(timeit.repeat(generic, number=number, repeat=5)) / number * 1e3
+    f = min(timeit.repeat(fast, number=number, repeat=5)) / number * 1e3
+    print(f"{label:<12} generic {g:8.3f} ms   specific {f:8.3f} ms   speedup {g / f:5.1f}x")
+
+
+def main():
+    bars = int(sys.argv[1]) if len(sys.argv) > 1 else 320
+    tencent, eastmoney, baostock = make_payloads(bars)
+    fields = ["date", "open", "high", "low", "close", "volume"]
+    print(f"{bars} bars per symbol")
+    bench("Tencent", lambda: DataFetcher._clean_data(_tencent_frame(tencent)),
+          lambda: parsers.parse_tencent(tencent), 50)
+    bench("EastMoney", lambda: DataFetcher._clean_data(eastmoney.copy()),
+          lambda: parsers.parse_eastmoney(eastmoney), 50)
+    bench("Baostock", lambda: DataFetcher._clean_data(pd.DataFrame(baostock, columns=fields)),
+          lambda: parsers.parse_baostock(fields, baostock), 50)
+
+
+if __name__ == "__main__":
+    main()
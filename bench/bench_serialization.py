@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: FastAPI default JSON (jsonable_encoder + json.dumps) vs FastJSONResponse,
+full vs compact analyze profile, and gzip/br cost per response size
+Usage: python -m bench.bench_serialization [max_results]
+"""
+import sys
+import os
+import gzip
+import timeit
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import config, serialization
+from api.fetcher import DataFetcher
+from api.main import analyze_symbol, compact_analysis
+from api.serialization import FastJSONResponse
+
+
+def make_result(seed: int) -> dict:
+    """One real /analyze_full body built from synthetic bars (no network)"""
+    n = 320
+    close = 20 + np.cumsum(np.random.default_rng(seed).normal(0, 0.3, n))
+    df = pd.DataFrame({'date': pd.bdate_range("2023-01-02", periods=n), 'open': close, 'high': close + .3,
+                       'low': close - .3, 'close': close, 'volume': np.full(n, 1e5)})
+    with patch.object(DataFetcher, "get_a_share_history", return_value=df), \
+            patch.object(DataFetcher, "get_stock_name", return_value="浦发银行"), \
+            patch.object(DataFetcher, "get_realtime_price", return_value=0.0):
+        return analyze_symbol(f"{600000 + seed:06d}", "CN")
+
+
+def per_call_ms(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e3
+
+
+def main():
+    max_results = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    fulls = [make_result(i) for i in range(max_results)]  # Distinct symbols: realistic compression ratios
+    compacts = [compact_analysis(r) for r in fulls]
+    engine = "orjson" if serialization.orjson else "stdlib"
+    print(f"FastJSONResponse engine: {engine}; brotli: {'yes' if serialization.brotli else 'no'}")
+    print(f"{'results':>8} {'profile':>8} {'bytes':>10} {'default ms':>11} {'fast ms':>9} {'speedup':>8} "
+          f"{'gzip ms':>8} {'gzip %':>7} {'br ms':>7} {'br %':>6}")
+    size = 1
+    while size <= max_results:
+        for profile, items in (("full", fulls), ("compact", compacts)):
+            payload = {"results": items[:size], "timestamp": "2026-01-02T16:40:00"}
+            number = max(1, 2000 // size)
+            default = per_call_ms(lambda: JSONResponse(jsonable_encoder(payload)).body, number)
+            fast = per_call_ms(lambda: FastJSONResponse(payload).body, number)
+            body = FastJSONResponse(payload).body
+            gz_ms = per_call_ms(lambda: gzip.compress(body, compresslevel=config.GZIP_LEVEL), number)
+            gz_pct = len(gzip.compress(body, compresslevel=config.GZIP_LEVEL)) / len(body) * 100
+            if serialization.brotli:
+                br = serialization.brotli
+                br_ms = per_call_ms(lambda: br.compress(body, quality=config.BROTLI_QUALITY), number)
+                br_pct = len(br.compress(body, quality=config.BROTLI_QUALITY)) / len(body) * 100
+                br_cols = f"{br_ms:7.3f} {br_pct:5.1f}%"
+            else:
+                br_cols = f"{'-':>7} {'-':>6}"
+            print(f"{size:>8} {profile:>8} {len(body):>10} {default:11.3f} {fast:9.3f} {default / fast:7.1f}x "
+                  f"{gz_ms:8.3f} {gz_pct:6.1f}% {br_cols}")
+        size *= 10
+
+
+if __name__ == "__main__":
+    main()
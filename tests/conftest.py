@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Keep on-disk artefacts (security master, caches, stores) out of the repo during tests
+os.environ.setdefault("QUANT_DATA_DIR", tempfile.mkdtemp(prefix="quant-test-"))
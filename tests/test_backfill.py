@@ -0,0 +1,110 @@
+import sys
+import os
+import threading
+import time
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import config
+from api.backfill import Backfill
+from api.fetcher import DataFetcher
+from api.ohlcv import OHLCVSeries
+from api.store import HistoryStore
+
+
+def _fake_download(code, market):
+    if code == "000002":
+        return None
+    n = 30
+    return OHLCVSeries(np.arange(n).astype("datetime64[D]"), np.ones(n), np.ones(n), np.ones(n),
+                       np.full(n, float(len(code))), np.ones(n), code=code, market=market,
+                       source="Tencent" if market == "CN" else "Yahoo-HK")
+
+
+class TestBackfill:
+
+    def test_run_writes_store_and_reports(self, tmp_path):
+        store = HistoryStore(str(tmp_path))
+        items = [("600000", "CN"), ("000001", "CN"), ("000002", "CN"), ("00700", "HK")]
+        with patch.object(DataFetcher, "download_history", side_effect=_fake_download):
+            report = Backfill(codes=items, name="t-run", store=store, resume=False, workers=3).run()
+        assert report["completed"] == 3 and report["failed"] == 1
+        assert report["by_source"] == {"Tencent": 2, "Yahoo-HK": 1}
+        assert report["failed_symbols"] == ["CN:000002"]
+        assert report["symbols_per_sec"] > 0
+        assert len(store.read("00700", "HK")) == 30
+
+    def test_resume_skips_completed_and_retries_failed(self, tmp_path):
+        store = HistoryStore(str(tmp_path))
+        items = [("600000", "CN"), ("000002", "CN")]
+        with patch.object(DataFetcher, "download_history", side_effect=_fake_download):
+            Backfill(codes=items, name="t-resume", store=store, resume=False).run()
+        resumed = Backfill(codes=items, name="t-resume", store=store)
+        assert resumed.pending() == [("000002", "CN")]
+        assert Backfill(codes=items, name="t-resume", store=store, resume=False).pending() == items
+
+    def test_abort_keeps_progress_checkpointed(self, tmp_path):
+        store = HistoryStore(str(tmp_path))
+        items = [(f"6000{i:02d}", "CN") for i in range(20)]
+        seen = []
+
+        def _stop_after_five(result):
+            seen.append(result)
+            if len(seen) == 5:
+                raise RuntimeError("cancelled")
+
+        with patch.object(DataFetcher, "download_history", side_effect=_fake_download):
+            with pytest.raises(RuntimeError):
+                Backfill(codes=items, name="t-abort", store=store, resume=False, workers=1).run(
+                    on_result=_stop_after_five)
+        resumed = Backfill(codes=items, name="t-abort", store=store)
+        assert 5 <= len(resumed.state["done"]) < 20
+        assert len(resumed.pending()) == 20 - len(resumed.state["done"])
+        for key in resumed.state["done"]:
+            assert store.read(key.split(":")[1], "CN") is not None
+
+    def test_universe_falls_back_to_security_master(self):
+        with patch.object(DataFetcher, "_refresh_spot", side_effect=RuntimeError("down")), \
+                patch("api.backfill.security_master") as master:
+            master.securities.return_value = [type("S", (), {"code": "00700", "market": "HK"})()]
+            assert Backfill.universe("HK") == ["00700"]
+
+
+class TestProviderLimits:
+
+    def test_concurrency_capped_per_provider(self):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def _call():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            return "ok"
+
+        with patch.object(config, "PROVIDER_CONCURRENCY", "CapTest=2"):
+            threads = [threading.Thread(target=DataFetcher._source, args=(f"CapTest(host{i})", "x", _call))
+                       for i in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        assert peak[0] == 2
+        assert DataFetcher.source_stats()["CapTest"]["calls"] == 8
+
+    def test_errors_counted_and_provider_tracked_per_thread(self):
+        def _fail():
+            raise ConnectionError("refused")
+
+        with pytest.raises(ConnectionError):
+            DataFetcher._source("ErrTest", "x", _fail)
+        assert DataFetcher.source_stats()["ErrTest"]["errors"] == 1
+        DataFetcher._source("OkTest", "x", lambda: 1)
+        assert DataFetcher._local.provider == "OkTest"
@@ -0,0 +1,49 @@
+import sys
+import os
+import numpy as np
+import pandas as pd
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.backtest import indicator_frame, run_backtest, _tech_at
+from api.ohlcv import OHLCVSeries
+from api.quant import calculate_technicals
+
+
+def _frame(n=400, seed=7):
+    rng = np.random.default_rng(seed)
+    close = 20 + np.cumsum(rng.normal(0.02, 0.4, n))
+    return pd.DataFrame({
+        'date': pd.bdate_range("2022-01-03", periods=n),
+        'open': close + rng.normal(0, 0.1, n), 'high': close + np.abs(rng.normal(0.3, 0.1, n)),
+        'low': close - np.abs(rng.normal(0.3, 0.1, n)), 'close': close,
+        'volume': rng.uniform(5e4, 2e5, n),
+    })
+
+
+class TestBacktest:
+
+    def test_indicator_rows_match_calculate_technicals(self):
+        df = _frame()
+        ind = indicator_frame(df)
+        cols = {c: ind[c].to_numpy() for c in ind.columns}
+        for i in (4, 30, 61, 250, len(df) - 1):
+            assert _tech_at(cols, i) == calculate_technicals(df.iloc[:i + 1]), i
+
+    def test_trades_do_not_overlap_and_stats(self):
+        series = OHLCVSeries.from_frame(_frame(), code="600000", market="CN")
+        result = run_backtest(series, min_score=55)
+        trades = result["trades"]
+        assert result["bars"] == 400
+        assert result["trade_count"] == len(trades) > 0
+        for prev, nxt in zip(trades, trades[1:]):
+            assert prev["exit_date"] < nxt["entry_date"]
+        assert all(t["bars_held"] <= 20 for t in trades)
+        assert {t["result"] for t in trades} <= {"stop", "target", "timeout", "open"}
+        assert result["max_drawdown_percent"] <= 0 <= result["exposure_percent"] <= 100
+
+    def test_no_signal_no_trades(self):
+        df = _frame()
+        result = run_backtest(df, min_score=101)
+        assert result["trade_count"] == 0 and result["total_return_percent"] == 0.0
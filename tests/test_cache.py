@@ -0,0 +1,210 @@
+import sys
+import os
+import pickle
+import time
+import threading
+import socket
+import socketserver
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+import pytest
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import cache
+from api.cache import (SQLiteBackend, RedisBackend, CacheBackend, CacheUnavailable,
+                       get_or_compute, encode_frame, decode_frame)
+from api.ohlcv import OHLCVSeries
+
+
+def _series(dtype=np.float64):
+    n = 50
+    close = np.linspace(10, 15, n)
+    return OHLCVSeries(np.arange(19000, 19000 + n).astype("datetime64[D]"), close, close + 1, close - 1,
+                       close, np.full(n, 1e6), code="600519", market="CN", source="efinance", price_dtype=dtype)
+
+
+class TestSharedCache:
+
+    def test_series_binary_roundtrip(self):
+        for dtype in (np.float64, np.float32):
+            s = _series(dtype)
+            raw = s.to_bytes()
+            back = OHLCVSeries.from_bytes(raw)
+            assert (back.code, back.market, back.source) == ("600519", "CN", "efinance")
+            assert back.close.dtype == dtype
+            np.testing.assert_array_equal(back.days, s.days)
+            np.testing.assert_array_equal(back.close, s.close)
+            assert len(raw) < s.nbytes + 64
+
+    def test_sqlite_get_set_expiry(self, tmp_path):
+        backend = SQLiteBackend(str(tmp_path / "c.sqlite"))
+        backend.set("k", b"v", ttl=60)
+        backend.set("old", b"v", ttl=-1)
+        assert backend.get("k") == b"v"
+        assert backend.get("old") is None
+        # A second handle (another worker) sees the same data
+        assert SQLiteBackend(str(tmp_path / "c.sqlite")).get("k") == b"v"
+
+    def test_lease_owner_unique_across_hosts(self, tmp_path):
+        backend = SQLiteBackend(str(tmp_path / "c.sqlite"))
+        assert backend.acquire("lease:k", 10)
+        mine = cache._process_id
+        # Same PID and thread in another container must not release our lease
+        with patch.object(cache, "_process_id", (os.getpid(), "other-host:1:0123456789ab")):
+            backend.release("lease:k")
+            assert not backend.acquire("lease:k", 10)
+        assert cache._process_id == mine and socket.gethostname() in cache._owner_id()
+        backend.release("lease:k")
+        assert backend.acquire("lease:k", 10)
+
+    def test_single_flight_across_workers(self, tmp_path):
+        path = str(tmp_path / "c.sqlite")
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.3)
+            return _series()
+
+        results = []
+
+        def worker():
+            backend = SQLiteBackend(path)  # Each thread = separate lease owner
+            results.append(get_or_compute(backend, "hist:CN:600519", 60, compute,
+                                          encode=OHLCVSeries.to_bytes, decode=OHLCVSeries.from_bytes))
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        assert len(calls) == 1
+        assert all(len(r) == 50 for r in results)
+
+    def test_local_backend_passthrough(self):
+        df = pd.DataFrame({'最新价': [1.0]}, index=['600000'])
+        assert get_or_compute(CacheBackend(), "spot:CN", 30, lambda: df, encode_frame, decode_frame) is df
+        assert decode_frame(encode_frame(df)).equals(df)
+
+    def test_frame_codec_is_data_only(self):
+        df = pd.DataFrame({'名称': ['浦发银行', None], '最新价': [10.5, np.nan], '涨跌幅': [1.2, -0.5]},
+                          index=pd.Index(['600000', '600004'], name='代码'))
+        back = decode_frame(encode_frame(df))
+        assert list(back.columns) == list(df.columns) and back.index.name == '代码'
+        assert back.loc['600000', '名称'] == '浦发银行' and np.isnan(back.loc['600004', '最新价'])
+        with pytest.raises(ValueError):
+            decode_frame(pickle.dumps(df))
+
+
+# --- Local stand-in for a Redis server (GET / SET NX PX / DEL / PING) ---
+
+class _StandInRedis(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        self.store = {}
+        self.lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), _RespHandler)
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            size = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def handle(self):
+        srv = self.server
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            cmd = args[0].upper()
+            now = time.time()
+            with srv.lock:
+                for k, (_, exp) in list(srv.store.items()):
+                    if exp and exp <= now:
+                        del srv.store[k]
+                if cmd == b"PING":
+                    reply = b"+PONG\r\n"
+                elif cmd == b"GET":
+                    item = srv.store.get(args[1])
+                    reply = b"$-1\r\n" if item is None else b"$%d\r\n%s\r\n" % (len(item[0]), item[0])
+                elif cmd == b"SET":
+                    opts = [a.upper() for a in args[3:]]
+                    exp = now + int(args[3 + opts.index(b"PX") + 1]) / 1000 if b"PX" in opts else None
+                    if b"NX" in opts and args[1] in srv.store:
+                        reply = b"$-1\r\n"
+                    else:
+                        srv.store[args[1]] = (args[2], exp)
+                        reply = b"+OK\r\n"
+                elif cmd == b"DEL":
+                    reply = b":%d\r\n" % int(srv.store.pop(args[1], None) is not None)
+                else:
+                    reply = b"-ERR unknown command\r\n"
+            self.wfile.write(reply)
+
+
+class TestRedisBackend:
+
+    def setup_method(self):
+        self.server = _StandInRedis()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "redis://127.0.0.1:%d/0" % self.server.server_address[1]
+
+    def teardown_method(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_set_and_lease(self):
+        backend = RedisBackend(self.url)
+        raw = _series().to_bytes()
+        backend.set("hist:CN:600519", raw, ttl=60)
+        assert OHLCVSeries.from_bytes(backend.get("hist:CN:600519")).code == "600519"
+        assert backend.get("missing") is None
+
+        assert backend.acquire("lease:k", 10)
+        other = {}
+        t = threading.Thread(target=lambda: other.update(ok=backend.acquire("lease:k", 10)))
+        t.start(); t.join()
+        assert other["ok"] is False
+        backend.release("lease:k")  # EVAL unsupported here -> GET + DEL fallback
+        assert b"quant:lease:k" not in self.server.store
+
+    def test_stampede_single_fetch(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.3)
+            return _series()
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(get_or_compute(
+            RedisBackend(self.url), "hist:CN:600519", 60, compute,
+            encode=OHLCVSeries.to_bytes, decode=OHLCVSeries.from_bytes))) for _ in range(6)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        assert len(calls) == 1 and len(results) == 6
+
+    def test_degrades_when_server_down(self):
+        backend = RedisBackend(self.url, retry_after=60)
+        self.server.shutdown()
+        self.server.server_close()
+        value = get_or_compute(backend, "hist:CN:600519", 60, _series,
+                               encode=OHLCVSeries.to_bytes, decode=OHLCVSeries.from_bytes)
+        assert len(value) == 50
+        assert backend.stats()["available"] is False
+        start = time.time()
+        try:
+            backend.get("x")
+        except CacheUnavailable:
+            pass
+        assert time.time() - start < 0.05  # Marked down: no connect attempt per request
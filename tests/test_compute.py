@@ -0,0 +1,99 @@
+import sys
+import os
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from multiprocessing import shared_memory
+
+from api import compute, main
+from api.backtest import backtest_series
+from api.compute import ComputeBackend
+from api.fetcher import DataFetcher
+from api.jobs import JobManager
+from api.ohlcv import OHLCVSeries
+from api.quant import screen_series
+
+
+def _series(code: str, n: int, seed: int) -> OHLCVSeries:
+    close = 20 + np.cumsum(np.random.default_rng(seed).normal(0.05, 0.4, n))
+    days = np.arange(19000, 19000 + n, dtype=np.int32)
+    return OHLCVSeries.wrap(days, close - 0.1, close + 0.3, close - 0.3, close,
+                            np.random.default_rng(seed).uniform(1e5, 2e5, n), code, "CN", "test")
+
+
+UNIVERSE = [_series(f"6000{i:02d}", 150 + 10 * i, i) for i in range(7)] + [_series("600099", 0, 0)]
+PARAMS = {"min_score": 0, "bars": 120}
+
+
+def _plain(results: list) -> list:
+    return [repr(r) if isinstance(r, Exception) else r for r in results]
+
+
+class TestComputeBackend:
+
+    def test_modes_agree_in_order(self):
+        expected = [compute._call(backtest_series, s, PARAMS) for s in UNIVERSE]
+        assert isinstance(expected[-1], ValueError)
+        for mode in ("inline", "thread"):
+            backend = ComputeBackend(mode, workers=2, shard_size=3)
+            assert _plain(backend.map(backtest_series, UNIVERSE, **PARAMS)) == _plain(expected)
+            backend.shutdown()
+
+    def test_process_pool_reads_shared_memory(self):
+        names = []
+        pack = compute._pack
+
+        def _tracking(shard):
+            block, layout = pack(shard)
+            names.append(block.name)
+            return block, layout
+
+        backend = ComputeBackend("process", workers=2, shard_size=3)
+        try:
+            with patch.object(compute, "_pack", side_effect=_tracking):
+                got = list(backend.map(screen_series, UNIVERSE, min_score=0, min_bars=100))
+        finally:
+            backend.shutdown()
+        assert _plain(got) == _plain([screen_series(s, min_score=0, min_bars=100) for s in UNIVERSE])
+        assert len(names) == 3 and backend.stats()["shards"] == 3
+        for name in names:  # Every block unlinked once its shard came back
+            with pytest.raises(FileNotFoundError):
+                shared_memory.SharedMemory(name=name)
+
+    def test_pack_roundtrip_is_zero_copy_view(self):
+        block, layout = compute._pack(UNIVERSE[:2])
+        try:
+            results = compute._run_shared(lambda s: (s.code, s.close.base is not None, s.close.sum()),
+                                          block.name, layout, {})
+        finally:
+            ComputeBackend._release(block)
+        assert [r[0] for r in results] == ["600000", "600001"]
+        assert all(r[1] for r in results)
+        np.testing.assert_allclose([r[2] for r in results], [UNIVERSE[0].close.sum(), UNIVERSE[1].close.sum()])
+
+    def test_unknown_mode(self):
+        with pytest.raises(ValueError):
+            ComputeBackend("gpu")
+
+
+class TestComputedJobs:
+
+    def test_screen_job_results_match_across_backends(self, tmp_path):
+        by_code = {s.code: s for s in UNIVERSE}
+        params = {"codes": list(by_code), "market": "CN", "min_score": 0, "min_bars": 100}
+        outputs = []
+        for mode in ("inline", "thread"):
+            manager = JobManager(str(tmp_path / f"{mode}.sqlite"), workers=1,
+                                 handlers={"screen": main._job_screen})
+            with patch.object(main, "get_compute_backend", return_value=ComputeBackend(mode, workers=2, shard_size=2)), \
+                    patch.object(DataFetcher, "get_history_series", side_effect=lambda c, m: by_code[c]):
+                job = manager.wait(manager.submit("screen", params)["id"])
+            assert job["summary"] == {"processed": 8, "emitted": 7, "errors": 0}
+            outputs.append(manager.get(job["id"])["results"])
+        assert outputs[0] == outputs[1]
+        assert [r["code"] for r in outputs[0]] == list(by_code)[:7]
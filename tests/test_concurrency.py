@@ -0,0 +1,122 @@
+import sys
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+import requests
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import config
+from api.concurrency import ERROR, OK, THROTTLE, TIMEOUT, TRANSPORT, AdaptiveLimiter, classify
+from api.fetcher import DataFetcher
+
+
+def _burst(limiter: AdaptiveLimiter, calls: int, outcome: str = OK):
+    """Fill every slot, then release them together (one window of saturated calls)"""
+    for _ in range(calls):
+        tokens = [limiter.acquire() for _ in range(limiter.slots)]
+        for token in tokens:
+            limiter.release(token, outcome)
+
+
+class TestClassify:
+
+    def test_outcomes(self):
+        response = requests.Response()
+        response.status_code = 429
+        assert classify(requests.HTTPError(response=response)) == THROTTLE
+        assert classify(RuntimeError("HTTP 429 Too Many Requests")) == THROTTLE
+        assert classify(requests.ReadTimeout()) == TIMEOUT
+        assert classify(TimeoutError()) == TIMEOUT
+        assert classify(ConnectionResetError()) == TRANSPORT
+        assert classify(requests.ConnectionError()) == TRANSPORT
+        assert classify(ValueError("No data")) == ERROR
+
+
+class TestAdaptiveLimiter:
+
+    def test_additive_increase_up_to_ceiling(self):
+        limiter = AdaptiveLimiter("t", 2, 6, adaptive=True)
+        _burst(limiter, 3)
+        assert limiter.slots == 3
+        _burst(limiter, 50)
+        assert limiter.slots == 6 and limiter.stats()["increases"] == 4
+
+    def test_no_growth_while_idle_below_limit(self):
+        limiter = AdaptiveLimiter("t", 4, 16, adaptive=True)
+        for _ in range(100):
+            limiter.release(limiter.acquire())
+        assert limiter.slots == 4
+
+    def test_multiplicative_decrease_once_per_window(self):
+        limiter = AdaptiveLimiter("t", 8, 16, adaptive=True)
+        tokens = [limiter.acquire() for _ in range(8)]
+        for token in tokens:
+            limiter.release(token, THROTTLE)
+        assert limiter.slots == 4 and limiter.stats()["decreases"] == 1
+        limiter.release(limiter.acquire(), TIMEOUT)
+        assert limiter.slots == 2
+        for _ in range(5):
+            limiter.release(limiter.acquire(), TRANSPORT)
+        stats = limiter.stats()
+        assert limiter.slots == 1 and stats["throttled"] == 8 and stats["dropped"] == 5
+
+    def test_data_errors_do_not_back_off_but_stop_growth(self):
+        limiter = AdaptiveLimiter("t", 2, 8, adaptive=True)
+        _burst(limiter, 2, ERROR)
+        assert limiter.slots == 2 and limiter.stats()["errors"] == 4
+        _burst(limiter, 1)
+        assert limiter.slots == 2  # Recent error rate still above QUANT_PROVIDER_ERROR_RATE
+
+    def test_slow_calls_do_not_grow(self):
+        limiter = AdaptiveLimiter("t", 1, 8, adaptive=True)
+        limiter.baseline_ms = 0.001
+        token = limiter.acquire()
+        time.sleep(0.01)
+        limiter.release(token)
+        assert limiter.slots == 1 and limiter.stats()["increases"] == 0
+
+    def test_fixed_when_not_adaptive(self):
+        limiter = AdaptiveLimiter("t", 3, 3, adaptive=False)
+        _burst(limiter, 10)
+        _burst(limiter, 1, TIMEOUT)
+        assert limiter.slots == 3 and limiter.stats()["adaptive"] is False
+
+
+class TestFetcherLimits:
+
+    def test_throttled_provider_backs_off(self):
+        def _throttled():
+            raise RuntimeError("429 Too Many Requests")
+
+        with patch.object(config, "PROVIDER_CONCURRENCY", "Throttled=8"):
+            for _ in range(2):
+                with pytest.raises(RuntimeError):
+                    DataFetcher._source("Throttled(host)", "x", _throttled)
+        stats = DataFetcher.source_stats()["Throttled"]
+        assert stats["ceiling"] == 8 and stats["throttled"] == 2
+        assert stats["limit"] == max(int(min(config.PROVIDER_CONCURRENCY_DEFAULT, 8) * config.PROVIDER_BACKOFF ** 2), 1)
+
+    def test_healthy_provider_ramps_up_under_load(self):
+        barrier = threading.Barrier(2)
+
+        def _call():
+            try:
+                barrier.wait(timeout=0.05)
+            except threading.BrokenBarrierError:
+                pass
+            return "ok"
+
+        with patch.object(config, "PROVIDER_CONCURRENCY", "Ramp=6"), \
+                patch.object(config, "PROVIDER_CONCURRENCY_DEFAULT", 2):
+            for _ in range(30):
+                threads = [threading.Thread(target=DataFetcher._source, args=("Ramp", "x", _call)) for _ in range(6)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+        assert DataFetcher.source_stats()["Ramp"]["limit"] > 2
@@ -0,0 +1,185 @@
+import sys
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import config, main
+from api.compute import ComputeBackend
+from api.factors import FactorEngine, align_panel, compute_factors, factor_names, percentiles
+from api.fetcher import DataFetcher
+from api.jobs import JobManager
+from api.ohlcv import OHLCVSeries
+from api.store import HistoryStore
+
+
+def _series(code: str, n: int = 300, start: str = "2023-01-02", drift: float = 0.0, seed: int = 0) -> OHLCVSeries:
+    close = 20 * np.exp(np.cumsum(np.random.default_rng(seed).normal(drift, 0.02, n)))
+    df = pd.DataFrame({'date': pd.bdate_range(start, periods=n), 'open': close, 'high': close * 1.01,
+                       'low': close * 0.99, 'close': close,
+                       'volume': np.random.default_rng(seed + 1).uniform(1e5, 2e5, n)})
+    return OHLCVSeries.from_frame(df, code=code, market="CN", source="test")
+
+
+class TestPanel:
+
+    def test_suspended_days_carry_close_forward(self):
+        full = _series("600000", 30)
+        keep = np.r_[0:10, 13:30]
+        gap = OHLCVSeries.wrap(*(getattr(full, f)[keep] for f in OHLCVSeries.FIELDS), code="000001", market="CN")
+        axis, close, value = align_panel([full, gap], 30)
+        np.testing.assert_array_equal(axis, full.days)
+        np.testing.assert_array_equal(close[1, 10:13], np.full(3, full.close[9]))
+        assert (value[1, 10:13] == 0).all() and value[1, 9] > 0
+
+    def test_late_listing_stays_nan(self):
+        old, new = _series("600000", 100), _series("688001", 40, start="2023-04-17")
+        axis, close, _ = align_panel([old, new], 100)
+        assert len(axis) == 100 and np.isnan(close[1, :60]).all() and not np.isnan(close[1, 60:]).any()
+
+
+class TestComputeFactors:
+
+    def test_matches_pandas_reference(self):
+        series = [_series(str(600000 + i), seed=i, drift=0.001 * i) for i in range(6)]
+        axis, close, value = align_panel(series, config.FACTOR_LOOKBACK)
+        got = compute_factors(close, value)
+
+        df = pd.DataFrame(close.T)
+        logret = np.log(df).diff()
+        bench = logret.mean(axis=1)
+        for w in (20, 60, 120):
+            np.testing.assert_allclose(got[f"mom_{w}"], (df.iloc[-1] / df.iloc[-1 - w] - 1).to_numpy() * 100)
+        np.testing.assert_allclose(got["vol_20"], logret.tail(20).std().to_numpy() * np.sqrt(252) * 100)
+        excess = logret.tail(60).sum() - bench.tail(60).sum()
+        np.testing.assert_allclose(got["rs_60"], np.expm1(excess.to_numpy()) * 100)
+        np.testing.assert_allclose(got["amount_20"], pd.DataFrame(value.T).tail(20).mean().to_numpy())
+
+    def test_short_history_is_nan(self):
+        axis, close, value = align_panel([_series("600000", 300), _series("688001", 50, start="2024-01-01")],
+                                         config.FACTOR_LOOKBACK)
+        got = compute_factors(close, value)
+        assert not np.isnan(got["mom_20"][1]) and np.isnan(got["mom_60"][1]) and np.isnan(got["rs_60"][1])
+        assert not np.isnan(got["mom_120"][0])
+
+    def test_percentiles(self):
+        pct = percentiles(np.array([[1.0], [3.0], [np.nan], [2.0]]))
+        np.testing.assert_allclose(pct[[0, 1, 3], 0], [100 / 3, 100, 200 / 3])
+        assert np.isnan(pct[2, 0])
+
+
+class TestFactorEngine:
+
+    def _engine(self, tmp_path) -> FactorEngine:
+        store = HistoryStore(str(tmp_path))
+        store.write_many([_series(str(600000 + i), seed=i, drift=0.002 * i) for i in range(5)])
+        return FactorEngine(store)
+
+    def test_snapshot_built_once_and_ranked(self, tmp_path):
+        engine = self._engine(tmp_path)
+        with patch.object(config, "FACTOR_BENCHMARK_CN", ""):
+            snap = engine.snapshot("CN")
+            assert engine.snapshot("CN") is snap and engine.builds == 1
+            top = snap.top("mom_120", 2)
+            row = engine.lookup("600004", "CN")
+        assert snap.names == factor_names() and snap.benchmark == "composite"
+        assert [r["code"] for r in top] == ["600004", "600003"]
+        assert row["universe"] == 5 and row["percentiles"]["mom_120"] == 100.0
+        assert engine.lookup("000001", "CN") is None
+
+    def test_benchmark_failure_falls_back_to_composite(self, tmp_path):
+        engine = self._engine(tmp_path)
+        with patch.object(DataFetcher, "_source", side_effect=RuntimeError("down")):
+            assert engine.snapshot("CN").benchmark == "composite"
+
+    def test_index_benchmark_aligned_to_axis(self, tmp_path):
+        engine = self._engine(tmp_path)
+        index = _series("sh000300", 300, seed=99)
+        df = pd.DataFrame({'date': index.dates, 'close': index.close})
+        with patch.object(DataFetcher, "_source", return_value=df):
+            snap = engine.snapshot("CN")
+        assert snap.benchmark == config.FACTOR_BENCHMARK_CN
+        store = engine.store
+        close = np.vstack([store.read(c, "CN").close for c in snap.codes])
+        excess = np.log(close[:, -1] / close[:, -61]) - np.log(index.close[-1] / index.close[-61])
+        np.testing.assert_allclose(snap.values[:, snap.names.index("rs_60")], np.expm1(excess) * 100)
+
+
+    def test_stale_snapshot_served_while_rebuilding(self, tmp_path):
+        engine = self._engine(tmp_path)
+        with patch.object(config, "FACTOR_BENCHMARK_CN", ""):
+            old = engine.snapshot("CN")
+        old.computed_at -= 30 * 86400
+        release = threading.Event()
+        build = engine.build
+
+        def slow_build(market):
+            release.wait(5)
+            return build(market)
+
+        with patch.object(config, "FACTOR_BENCHMARK_CN", ""), patch.object(engine, "build", side_effect=slow_build):
+            assert engine.snapshot("CN") is old and engine.snapshot("CN") is old  # No caller blocks
+            assert engine.stats()["building"] == ["CN"]
+            release.set()
+            for _ in range(100):
+                if engine.snapshot("CN") is not old:
+                    break
+                time.sleep(0.02)
+        assert engine.snapshot("CN") is not old and engine.builds == 2
+
+    def test_index_downloaded_once_per_day(self, tmp_path):
+        engine = self._engine(tmp_path)
+        index = _series("sh000300", 300, seed=99)
+        df = pd.DataFrame({'date': index.dates, 'close': index.close})
+        with patch.object(DataFetcher, "_source", return_value=df) as source:
+            engine.build("CN")
+            engine.build("CN")
+        assert source.call_count == 1
+
+
+class TestAnalyzeAndEndpoint:
+
+    def test_analyze_attaches_factor_ranks(self):
+        series = _series("600000")
+        ranks = {"as_of": "2024-02-23", "universe": 5, "values": {}, "percentiles": {"mom_60": 80.0}}
+        with patch.object(DataFetcher, "get_history_series", return_value=series), \
+                patch.object(DataFetcher, "get_stock_name", return_value="浦发银行"), \
+                patch.object(DataFetcher, "get_realtime_price", return_value=0.0), \
+                patch.object(main.factor_engine, "lookup", return_value=ranks) as lookup:
+            plain = main.analyze_symbol("600000", "CN")
+            result = main.analyze_symbol("600000", "CN", factors=True)
+        assert "factors" not in plain and result["factors"] == ranks
+        lookup.assert_called_once_with("600000", "CN")
+
+    def test_factors_endpoint(self, tmp_path):
+        engine = TestFactorEngine()._engine(tmp_path)
+        client = TestClient(main.app)
+        with patch.object(main, "API_KEY", "test-key"), patch.object(main, "factor_engine", engine), \
+                patch.object(config, "FACTOR_BENCHMARK_CN", ""):
+            ranked = client.get("/factors?factor=mom_120&top=3", headers={"X-API-Key": "test-key"})
+            one = client.get("/factors?code=600001", headers={"X-API-Key": "test-key"})
+            bad = client.get("/factors?factor=nope", headers={"X-API-Key": "test-key"})
+            missing = client.get("/factors?code=000001", headers={"X-API-Key": "test-key"})
+        assert ranked.status_code == 200 and len(ranked.json()["ranked"]) == 3
+        assert one.json()["percentiles"]["mom_120"] is not None
+        assert bad.status_code == 400 and missing.status_code == 404
+
+    def test_screen_job_filters_on_percentiles(self, tmp_path):
+        engine = TestFactorEngine()._engine(tmp_path)
+        manager = JobManager(str(tmp_path / "jobs.sqlite"), workers=1, handlers={"screen": main._job_screen})
+        params = {"codes": [str(600000 + i) for i in range(5)], "market": "CN", "min_score": -100,
+                  "min_bars": 100, "factors": True, "min_percentile": {"mom_120": 70}}
+        with patch.object(main, "factor_engine", engine), patch.object(config, "FACTOR_BENCHMARK_CN", ""), \
+                patch.object(main, "get_compute_backend", return_value=ComputeBackend("inline")), \
+                patch.object(DataFetcher, "get_history_series", side_effect=lambda c, m: engine.store.read(c, m)):
+            job = manager.wait(manager.submit("screen", params)["id"])
+        results = manager.get(job["id"])["results"]
+        assert sorted(r["code"] for r in results) == ["600003", "600004"]
+        assert all(r["factors"]["percentiles"]["mom_120"] >= 70 for r in results)
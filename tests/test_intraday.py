@@ -0,0 +1,132 @@
+import sys
+import os
+import time
+import datetime
+from unittest.mock import patch
+
+import numpy as np
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import main, parsers
+from api.fetcher import DataFetcher
+from api.intraday import IntradayFeed, MinuteRing, local_day
+from api.ohlcv import OHLCVSeries
+from api.parsers import MinuteBars, SchemaDrift
+from api.trading_calendar import TZ
+
+import pytest
+
+DAY0 = 1727659800  # 2024-09-30 09:30 (UTC+8)
+
+
+def _minutes(start: int, n: int, seed: int = 3) -> MinuteBars:
+    close = 10 + np.cumsum(np.random.default_rng(seed).normal(0, 0.02, n))
+    return MinuteBars(start + 60 * np.arange(n, dtype=np.int64), close - 0.01, close + 0.02,
+                      close - 0.02, close, np.full(n, 100.0))
+
+
+def _aggregate(bars: MinuteBars) -> tuple:
+    return bars.open[0], bars.high.max(), bars.low.min(), bars.close[-1], bars.volume.sum()
+
+
+class TestMinuteParsers:
+
+    def test_tencent_rows(self):
+        rows = [["202409300931", "10.00", "10.05", "10.08", "9.99", "1200.00", {}],
+                ["202409300932", "10.05", "10.02", "10.06", "10.01", "800.00", {}]]
+        bars = parsers.parse_tencent_minutes(rows)
+        assert bars.ts[0] == DAY0 + 60 and local_day(bars.ts[0]) == np.datetime64("2024-09-30", "D").astype(int)
+        assert bars.close.tolist() == [10.05, 10.02] and bars.high[0] == 10.08
+
+    def test_pytdx_rows_deduplicated(self):
+        rows = [{"datetime": "2024-09-30 09:31", "open": 10, "high": 11, "low": 9, "close": 10.5, "vol": 1},
+                {"datetime": "2024-09-30 09:31", "open": 10, "high": 11, "low": 9, "close": 10.6, "vol": 2}]
+        bars = parsers.parse_pytdx_minutes(rows)
+        assert len(bars.ts) == 1 and bars.close[0] == 10.6
+
+    def test_layout_drift(self):
+        with pytest.raises(SchemaDrift):
+            parsers.parse_tencent_minutes([["202409300931", "10.0"]])
+        with pytest.raises(SchemaDrift):
+            parsers.parse_pytdx_minutes([{"time": "09:31"}])
+
+
+class TestMinuteRing:
+
+    def test_incremental_partial_day_matches_full_aggregate(self):
+        bars = _minutes(DAY0, 240)
+        ring = MinuteRing(capacity=100)
+        for lo in range(0, 240, 37):
+            ring.extend(MinuteBars(*(c[max(lo - 1, 0):lo + 37] for c in bars)))  # Overlaps one bar
+        day = ring.partial_day()
+        np.testing.assert_allclose([day["open"], day["high"], day["low"], day["close"], day["volume"]],
+                                   _aggregate(bars))
+        assert len(ring) == 100 and ring.bars().ts[-1] == bars.ts[-1]
+        np.testing.assert_array_equal(ring.bars().close, bars.close[-100:])
+
+    def test_forming_bar_is_revised_not_double_counted(self):
+        ring = MinuteRing(capacity=10)
+        ring.extend(_minutes(DAY0, 3))
+        revised = _minutes(DAY0 + 120, 1)._replace(high=np.array([99.0]), volume=np.array([500.0]))
+        assert ring.extend(revised) == 0
+        assert ring.partial_day()["high"] == 99.0 and ring.partial_day()["volume"] == 700.0
+
+    def test_new_day_resets_aggregate(self):
+        ring = MinuteRing(capacity=50)
+        ring.extend(_minutes(DAY0, 10))
+        ring.extend(_minutes(DAY0 + 86400, 2, seed=9))
+        today = _minutes(DAY0 + 86400, 2, seed=9)
+        assert ring.partial_day()["volume"] == 200.0 and ring.partial_day()["open"] == today.open[0]
+
+
+class TestIntradayFeed:
+
+    def _daily(self, last_day: int) -> OHLCVSeries:
+        days = np.arange(last_day - 59, last_day + 1, dtype=np.int32)
+        close = np.linspace(9, 10, 60)
+        return OHLCVSeries.wrap(days, close, close + 0.1, close - 0.1, close, np.full(60, 1e5),
+                                "600000", "CN", "test")
+
+    def test_live_series_replaces_todays_bar_and_pulls_incrementally(self):
+        now = time.time()
+        today = int(local_day(now))
+        bars = _minutes(int(now) - 600, 10)
+        feed = IntradayFeed(period=1, capacity=500)
+        with patch.object(DataFetcher, "get_minute_bars", return_value=bars) as pull, \
+                patch.object(DataFetcher, "get_history_series", return_value=self._daily(today)):
+            series = feed.live_series("600000", "CN")
+            feed.live_series("600000", "CN")
+        assert pull.call_count == 1  # Second call inside INTRADAY_TTL
+        assert len(series) == 60 and series.days[-1] == today
+        assert series.close[-1] == bars.close[-1] and series.low[-1] == bars.low.min()
+        feed.ring("600000", "CN", refresh=False).updated_at = 1.0
+        with patch.object(DataFetcher, "get_minute_bars", return_value=bars) as pull:
+            feed.ring("600000", "CN")
+        assert pull.call_args[0][3] < 10  # Only the minutes since the newest bar
+
+    def _check(self, bars: MinuteBars, now: float, stop_set_at: str) -> dict:
+        pos = main.PositionItem(code="600000", market="CN", buy_price=9.5, current_stop=9.0,
+                                target_price=12.0, stop_set_at=stop_set_at)
+        feed = IntradayFeed(period=1)
+        with patch.object(main, "intraday_feed", feed), \
+                patch.object(DataFetcher, "get_minute_bars", return_value=bars), \
+                patch.object(DataFetcher, "get_history_series", return_value=self._daily(int(local_day(now)) - 1)), \
+                patch.object(DataFetcher, "get_realtime_price", return_value=0.0):
+            return main.check_position(pos, intraday=True)
+
+    def test_session_low_fires_stop(self):
+        now = time.time()
+        bars = _minutes(int(now) - 300, 5)
+        bars.low[1] = 8.0
+        result = self._check(bars, now, datetime.datetime.fromtimestamp(now - 3600, TZ).isoformat())
+        assert result["action"] == "SELL_STOP" and result["session"]["low"] == 8.0
+
+    def test_dip_before_stop_was_moved_is_ignored(self):
+        now = time.time()
+        bars = _minutes(int(now) - 300, 5)
+        bars.low[1] = 8.0  # Bar ending at -240 s: before the stop was raised at -200 s
+        moved = datetime.datetime.fromtimestamp(now - 200, TZ).isoformat()
+        assert self._check(bars, now, moved)["action"] == "HOLD"
+        assert self._check(bars, now, "")["action"] == "HOLD"  # Unknown stop age: price check only
@@ -0,0 +1,117 @@
+import sys
+import os
+import threading
+import time
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.jobs import JobManager, JobCancelled
+
+
+def _manager(tmp_path, handlers):
+    return JobManager(str(tmp_path / "jobs.sqlite"), workers=2, handlers=handlers)
+
+
+class TestJobManager:
+
+    def test_progress_and_partial_results(self, tmp_path):
+        def square(ctx, params):
+            return ctx.each(params["values"], lambda v: {"v": v * v} if v != 3 else None)
+
+        manager = _manager(tmp_path, {"square": square})
+        job = manager.submit("square", {"values": [1, 2, 3, 4]})
+        assert job["status"] in ("queued", "running", "succeeded")
+        done = manager.wait(job["id"])
+        assert done["status"] == "succeeded"
+        assert done["progress"] == {"done": 4, "total": 4, "percent": 100.0}
+        assert done["summary"] == {"processed": 4, "emitted": 3, "errors": 0}
+
+        page = manager.get(job["id"], offset=1, limit=1)
+        assert page["results"] == [{"v": 4}] and page["next_offset"] == 2
+        assert manager.get(job["id"], offset=page["next_offset"])["results"] == [{"v": 16}]
+
+    def test_item_errors_do_not_fail_job(self, tmp_path):
+        def boom(v):
+            if v == 2:
+                raise ValueError("bad item")
+            return {"v": v}
+
+        manager = _manager(tmp_path, {"k": lambda ctx, p: ctx.each([1, 2, 3], boom)})
+        job = manager.wait(manager.submit("k")["id"])
+        assert job["summary"]["errors"] == 1
+        assert {"item": "2", "error": "bad item"} in manager.get(job["id"])["results"]
+
+    def test_handler_exception_fails_job(self, tmp_path):
+        def broken(ctx, params):
+            raise RuntimeError("no universe")
+
+        manager = _manager(tmp_path, {"broken": broken})
+        job = manager.wait(manager.submit("broken")["id"])
+        assert job["status"] == "failed" and job["error"] == "no universe"
+
+    def test_cancel_running_job(self, tmp_path):
+        started = threading.Event()
+        raised = []
+
+        def slow(ctx, params):
+            def _item(v):
+                started.set()
+                time.sleep(0.05)
+                return {"v": v}
+            try:
+                return ctx.each(list(range(200)), _item)
+            except JobCancelled:
+                raised.append(True)  # Not swallowed as a per-item error
+                raise
+
+        manager = _manager(tmp_path, {"slow": slow})
+        job_id = manager.submit("slow")["id"]
+        assert started.wait(5)
+        assert manager.cancel(job_id)
+        job = manager.wait(job_id, timeout=10)
+        assert job["status"] == "cancelled"
+        assert 0 < job["progress"]["done"] < 200
+        assert raised == [True]
+
+    def test_cancel_queued_job_never_runs(self, tmp_path):
+        gate = threading.Event()
+        ran = []
+
+        def block(ctx, params):
+            gate.wait(5)
+            return {}
+
+        def record(ctx, params):
+            ran.append(True)
+            return {}
+
+        manager = JobManager(str(tmp_path / "jobs.sqlite"), workers=1, handlers={"block": block, "record": record})
+        first = manager.submit("block")["id"]
+        queued = manager.submit("record")["id"]
+        assert manager.cancel(queued)
+        gate.set()
+        manager.wait(first)
+        assert manager.wait(queued)["status"] == "cancelled"
+        time.sleep(0.05)
+        assert ran == []
+
+    def test_unknown_kind_rejected(self, tmp_path):
+        manager = _manager(tmp_path, {"a": lambda ctx, p: {}})
+        try:
+            manager.submit("nope")
+            assert False, "expected ValueError"
+        except ValueError as e:
+            assert "available: a" in str(e)
+
+    def test_jobs_of_dead_owner_marked_interrupted(self, tmp_path):
+        manager = _manager(tmp_path, {"a": lambda ctx, p: {}})
+        conn = manager._conn()
+        conn.execute("INSERT INTO jobs (id, kind, params, status, owner, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                     ("stale", "a", "{}", "running", f"{manager.owner.rsplit(':', 1)[0]}:{os.getpid()}", time.time()))
+        conn.execute("INSERT INTO jobs (id, kind, params, status, owner, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                     ("remote", "a", "{}", "running", "other-host:1", time.time()))
+        reopened = _manager(tmp_path, {"a": lambda ctx, p: {}})
+        assert reopened.get("stale")["status"] == "failed"
+        assert reopened.get("stale")["error"] == "Interrupted by restart"
+        assert reopened.get("remote")["status"] == "running"
@@ -0,0 +1,106 @@
+import sys
+import os
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from api import config, main
+from api.fetcher import DataFetcher
+from api.monitor import MonitorStore, PositionMonitor
+from api.ohlcv import OHLCVSeries
+
+HEADERS = {"X-API-Key": "test-key"}
+POSITIONS = [{"code": "600000", "buy_price": 10.0, "current_stop": 9.7, "target_price": 12.0, "record_id": "a"},
+             {"code": "000001", "buy_price": 10.0, "current_stop": 9.7, "target_price": 11.0, "record_id": "b"}]
+
+
+def _series(n: int = 60) -> OHLCVSeries:
+    close = np.linspace(9, 10, n)
+    return OHLCVSeries.wrap(np.arange(19000, 19000 + n, dtype=np.int32), close, close + 0.1, close - 0.1,
+                            close, np.full(n, 1e5), "600000", "CN", "test")
+
+
+class TestPositionMonitor:
+
+    @pytest.fixture(autouse=True)
+    def _setup(self, tmp_path):
+        self.path = str(tmp_path / "monitor.sqlite")
+        self.prices = {"600000": 10.0, "000001": 10.0}
+        self.monitor = PositionMonitor(interval=60, store=MonitorStore(self.path))
+        self.patches = [patch.object(config, "TRADING_CALENDAR", False),
+                        patch.object(PositionMonitor, "_run", lambda self: None),
+                        patch.object(DataFetcher, "get_history_series", return_value=_series()),
+                        patch.object(DataFetcher, "get_realtime_prices",
+                                     side_effect=lambda codes, m: {c: self.prices[c] for c in codes})]
+        for p in self.patches:
+            p.start()
+        yield
+        for p in self.patches:
+            p.stop()
+
+    def _subscribe(self):
+        return self.monitor.subscribe([main.PositionItem(**p) for p in POSITIONS])
+
+    def test_only_state_changes_are_pushed(self):
+        sub = self._subscribe()
+        assert self.monitor.run_cycle() == 0        # Trailing stop below both current stops
+        self.prices["600000"] = 11.5
+        assert self.monitor.run_cycle() == 1
+        raised = self.monitor.event_log(sub.id)[-1]
+        assert raised[1] == "STOP_RAISED" and raised[2]["previous_stop"] == 9.7
+        assert self.monitor.run_cycle() == 0        # Same price: stop already ratcheted
+        self.prices["000001"] = 11.2
+        self.prices["600000"] = raised[2]["new_stop"] - 0.01
+        assert self.monitor.run_cycle() == 2
+        assert {e[1] for e in self.monitor.event_log(sub.id)[-2:]} == {"SELL_STOP", "SELL_TARGET"}
+        assert self.monitor.run_cycle() == 0 and self.monitor.get(sub.id).summary()["active"] == 0
+
+    def test_one_quote_round_per_market(self):
+        for _ in range(3):
+            self._subscribe()
+        self.monitor.run_cycle()
+        assert DataFetcher.get_realtime_prices.call_count == 1
+        assert sorted(DataFetcher.get_realtime_prices.call_args[0][0]) == ["000001", "600000"]
+
+    def test_matches_check_positions(self):
+        self.prices["600000"] = 11.5
+        sub = self._subscribe()
+        self.monitor.run_cycle()
+        with patch.object(DataFetcher, "get_a_share_history", return_value=_series().to_frame()), \
+                patch.object(DataFetcher, "get_realtime_price", return_value=11.5):
+            checked = main.check_position(main.PositionItem(**POSITIONS[0]))
+        assert [e[2]["new_stop"] for e in self.monitor.event_log(sub.id)] == [checked["new_stop"]]
+
+    def test_sse_stream_replays_after_last_event_id(self):
+        with patch.object(main, "API_KEY", "test-key"), patch.object(main, "position_monitor", self.monitor), \
+                patch.object(config, "MONITOR_STREAM_MAX", 0.2), patch.object(config, "MONITOR_HEARTBEAT", 0.05):
+            client = TestClient(main.app)
+            created = client.post("/monitor/subscriptions", json={"positions": POSITIONS}, headers=HEADERS).json()
+            self.prices.update({"600000": 11.5, "000001": 8.0})
+            self.monitor.run_cycle()
+            body = client.get(created["events"], headers=HEADERS)
+            assert body.headers["content-type"].startswith("text/event-stream")
+            assert body.text.count("\nevent: ") == 2 and ": keepalive" in body.text
+            replay = client.get(created["events"], headers={**HEADERS, "Last-Event-ID": "1"}).text
+            assert replay.count("\nevent: ") == 1 and "id: 2\n" in replay
+            assert client.delete(f"/monitor/subscriptions/{created['id']}", headers=HEADERS).json()["deleted"]
+            assert client.get(created["events"], headers=HEADERS).status_code == 404
+
+    def test_shared_between_workers_with_one_evaluator(self):
+        other = PositionMonitor(interval=60, store=MonitorStore(self.path))  # Another uvicorn worker
+        sub = self._subscribe()
+        assert other.get(sub.id).summary()["positions"] == 2
+        assert self.monitor.store.acquire("evaluator", self.monitor.owner, 60)
+        assert not other.store.acquire("evaluator", other.owner, 60)
+        self.prices["600000"] = 11.5
+        self.monitor.run_cycle()
+        assert [e[1] for e in other.event_log(sub.id)] == ["STOP_RAISED"]
+        assert other.get(sub.id).positions[0].current_stop > 9.7  # Ratcheted stop persisted
+        assert other.unsubscribe(sub.id) and self.monitor.get(sub.id) is None
+        self.monitor.store.release("evaluator", self.monitor.owner)
+        assert other.store.acquire("evaluator", other.owner, 60)
@@ -0,0 +1,55 @@
+import sys
+import os
+import numpy as np
+import pandas as pd
+from unittest.mock import patch
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.ohlcv import OHLCVSeries, COLUMNS
+from api.fetcher import DataFetcher
+from api.quant import calculate_technicals
+
+
+def _frame(n=300):
+    close = 10 + np.cumsum(np.random.default_rng(1).normal(0, 0.1, n))
+    return pd.DataFrame({
+        'date': pd.date_range("2023-01-01", periods=n),
+        'open': close, 'high': close + 0.2, 'low': close - 0.2,
+        'close': close, 'volume': np.full(n, 1e5),
+    })
+
+
+class TestOHLCVSeries:
+
+    def test_zero_copy_view_and_layout(self):
+        series = OHLCVSeries.from_frame(_frame(), code="600000", market="CN")
+        view = series.to_frame()
+        assert list(view.columns) == COLUMNS
+        for col in ['open', 'high', 'low', 'close', 'volume']:
+            assert np.shares_memory(view[col].to_numpy(), getattr(series, col))
+        assert not series.close.flags.writeable
+
+    def test_float32_memory_footprint(self):
+        df = _frame()
+        series = OHLCVSeries.from_frame(df, price_dtype=np.float32)
+        assert series.close.dtype == np.float32
+        assert series.days.dtype == np.int32
+        assert series.nbytes == len(df) * 28  # 4 (day) + 4 * 4 (prices) + 8 (volume)
+        assert series.nbytes < df.memory_usage(deep=True).sum() * 0.6
+
+    def test_technicals_accept_series(self):
+        df = _frame()
+        from_df = calculate_technicals(df)
+        from_series = calculate_technicals(OHLCVSeries.from_frame(df))
+        assert from_df == from_series
+
+    def test_history_cache_hit(self):
+        DataFetcher._history_cache.clear()
+        with patch.object(DataFetcher, '_fetch_a_share_history', return_value=_frame()) as fetch:
+            first = DataFetcher.get_a_share_history("600000")
+            second = DataFetcher.get_a_share_history("sh600000")
+        assert fetch.call_count == 1
+        assert len(first) == len(second) == 300
+        DataFetcher._history_cache.clear()
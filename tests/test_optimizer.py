@@ -0,0 +1,112 @@
+import sys
+import os
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import main
+from api.backtest import indicator_frame, run_backtest, _tech_at
+from api.compute import ComputeBackend
+from api.fetcher import DataFetcher
+from api.jobs import JobManager
+from api.ohlcv import OHLCVSeries
+from api.optimizer import (expand_grid, prepare, run_optimizer, score_bars, summarize, sweep_series,
+                           walk_forward_folds)
+from api.quant import SIGNAL_PARAMS, generate_signal
+
+
+def _series(seed: int = 11, n: int = 700, market: str = "CN") -> OHLCVSeries:
+    rng = np.random.default_rng(seed)
+    close = 30 + np.cumsum(rng.normal(0.03, 0.6, n))
+    days = np.arange(18000, 18000 + n, dtype=np.int32)
+    return OHLCVSeries.wrap(days, close - 0.2, close + rng.uniform(0.1, 0.8, n), close - rng.uniform(0.1, 0.8, n),
+                            close, rng.uniform(1e5, 5e5, n), f"60{seed:04d}", market, "test")
+
+
+TUNED = {**SIGNAL_PARAMS, "w_ma20": 20, "rsi_high": 65, "vol_surge": 1.8, "stop_atr_cn": 1.5, "stop_atr_hk": 2.5,
+         "rr_normal": 2.5, "high_vol_pct": 2.0}
+
+
+class TestVectorizedSignal:
+
+    @pytest.mark.parametrize("params,market", [(SIGNAL_PARAMS, "CN"), (TUNED, "HK")])
+    def test_matches_generate_signal_per_bar(self, params, market):
+        series = _series(market=market)
+        cols = prepare(series)
+        score, stop, target = score_bars(cols, params, market == "HK")
+        ind = indicator_frame(series)
+        raw = {c: ind[c].to_numpy() for c in ind.columns}
+        for i in range(0, len(series), 7):
+            sig = generate_signal(_tech_at(raw, i), market == "HK", params)
+            assert (int(score[i]), round(float(stop[i]), 2), round(float(target[i]), 2)) == \
+                (sig["trend_score"], sig["stop_loss"], sig["take_profit"])
+
+    def test_default_params_unchanged(self):
+        tech = _tech_at({c: v.to_numpy() for c, v in indicator_frame(_series()).items()}, 400)
+        assert generate_signal(tech) == generate_signal(tech, params={})
+        with pytest.raises(ValueError):
+            generate_signal(tech, params={"w_unknown": 1})
+
+
+class TestSweep:
+
+    def test_single_window_matches_run_backtest(self):
+        series = _series()
+        fold = [(int(series.days[0]), int(series.days[0]), int(series.days[0]), int(series.days[-1]) + 1)]
+        totals = sweep_series(series, [{"min_score": 55}], fold)
+        trades = run_backtest(series, min_score=55)["trades"]
+        assert totals[0, 0, 1, 0] == len(trades)
+        assert totals[0, 0, 1, 2] * 100 == pytest.approx(sum(t["pnl_percent"] for t in trades), abs=0.01 * len(trades))
+
+    def test_folds_do_not_overlap_and_tile_the_test_range(self):
+        folds = walk_forward_folds(0, 1000, 4, 400)
+        assert [f[2] for f in folds] == [400, 550, 700, 850] and folds[-1][3] == 1000
+        assert all(f[1] == f[2] for f in folds)
+        with pytest.raises(ValueError):
+            walk_forward_folds(0, 100, 4, 400)
+
+    def test_grid_validation(self):
+        assert len(expand_grid({"w_ma20": [10, 15], "min_score": [60, 65, 70]})) == 6
+        with pytest.raises(ValueError):
+            expand_grid({"nope": [1]})
+
+    def test_report_ranks_and_walks_forward(self):
+        universe = [_series(seed) for seed in range(4)]
+        folds = walk_forward_folds(18000, 18700, 2, 300)
+        grid = {"min_score": [55, 65], "stop_atr_cn": [1.5, 2.5]}
+        seen = []
+        report = run_optimizer(universe, grid, folds, min_trades=1, backend=ComputeBackend("thread", workers=2,
+                                                                                           shard_size=1),
+                               on_symbol=seen.append)
+        assert len(seen) == 4 and report["grid_size"] == 4
+        assert len(report["folds"]) == 2 and report["ranking"][0]["rank"] == 1
+        keys = [r["train"]["expectancy_percent"] for r in report["ranking"] if r["train"]["trades"]]
+        assert keys == sorted(keys, reverse=True)
+        oos = sum(f["test_metrics"]["trades"] for f in report["folds"])
+        assert report["walk_forward"]["trades"] == oos
+
+    def test_min_trades_disqualifies(self):
+        totals = np.zeros((2, 1, 2, 4))
+        totals[0, 0, 0] = (2, 2, 0.2, 0.18)   # Great but too few trades
+        totals[1, 0, 0] = (50, 30, 0.5, 0.45)
+        report = summarize(totals, [{"a": 1}, {"a": 2}], [(0, 10, 10, 20)], symbols=1, min_trades=10)
+        assert report["folds"][0]["best"] == {"a": 2} and report["ranking"][0]["params"] == {"a": 2}
+
+
+class TestOptimizeJob:
+
+    def test_job_emits_ranking(self, tmp_path):
+        universe = {s.code: s for s in (_series(seed) for seed in range(3))}
+        manager = JobManager(str(tmp_path / "jobs.sqlite"), workers=1, handlers={"optimize": main._job_optimize})
+        params = {"codes": list(universe), "market": "CN", "grid": {"min_score": [55, 65]}, "years": 1.8,
+                  "train_years": 1, "folds": 2, "min_trades": 1,
+                  "end": str(np.datetime64(18699, "D"))}
+        with patch.object(DataFetcher, "get_history_series", side_effect=lambda c, m: universe[c]):
+            job = manager.wait(manager.submit("optimize", params)["id"])
+        assert job["status"] == "succeeded", job
+        assert job["progress"]["done"] == 3 and job["summary"]["grid_size"] == 2
+        assert [r["rank"] for r in manager.get(job["id"])["results"]] == [1, 2]
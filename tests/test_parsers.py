@@ -0,0 +1,80 @@
+import sys
+import os
+import datetime
+import pytest
+import numpy as np
+import pandas as pd
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import parsers
+from api.fetcher import DataFetcher, _tencent_frame
+
+
+def _tencent_rows(n=40):
+    start = datetime.date(2024, 1, 1)
+    return [[(start + datetime.timedelta(days=i)).isoformat(),
+             f"{10 + i * 0.1:.2f}", f"{10.5 + i * 0.1:.2f}", f"{11 + i * 0.1:.2f}",
+             f"{9.5 + i * 0.1:.2f}", f"{1000 + i}.000"] for i in range(n)]
+
+
+def _assert_same(fast, generic):
+    generic = generic[parsers.COLUMNS].reset_index(drop=True)
+    assert list(fast.columns) == parsers.COLUMNS
+    assert (fast['date'].values == generic['date'].values).all()
+    for col in ['open', 'high', 'low', 'close', 'volume']:
+        np.testing.assert_allclose(fast[col].to_numpy(), generic[col].to_numpy(dtype=float))
+
+
+class TestParsers:
+
+    def test_tencent_matches_generic(self):
+        rows = _tencent_rows()
+        _assert_same(parsers.parse_tencent(rows), DataFetcher._clean_data(_tencent_frame(rows)))
+
+    def test_eastmoney_matches_generic(self):
+        df = pd.DataFrame({
+            '日期': pd.date_range("2024-01-01", periods=40).strftime("%Y-%m-%d"),
+            '开盘': np.linspace(10, 14, 40), '收盘': np.linspace(10.5, 14.5, 40),
+            '最高': np.linspace(11, 15, 40), '最低': np.linspace(9, 13, 40),
+            '成交量': np.arange(40) + 1000, '换手率': 0.5,
+        })
+        _assert_same(parsers.parse_eastmoney(df), DataFetcher._clean_data(df.copy()))
+
+    def test_baostock_suspended_day_dropped(self):
+        fields = ["date", "open", "high", "low", "close", "volume"]
+        rows = [["2024-01-02", "10", "11", "9", "10.5", "1000"],
+                ["2024-01-03", "", "", "", "", ""],
+                ["2024-01-04", "10.5", "11.5", "10", "11", "1200"]]
+        df = parsers.parse_baostock(fields, rows)
+        assert len(df) == 2
+        assert df['close'].tolist() == [10.5, 11.0]
+
+    def test_unordered_input_sorted_and_deduped(self):
+        rows = _tencent_rows(5)
+        shuffled = [rows[3], rows[1], rows[0], rows[4], rows[2], rows[1][:1] + ["99"] * 5]
+        df = parsers.parse_tencent(shuffled)
+        assert df['date'].is_monotonic_increasing
+        assert len(df) == 5
+        assert df['open'].iloc[1] == 99.0  # keep='last'
+
+    def test_float32_option(self):
+        df = parsers.parse_tencent(_tencent_rows(), price_dtype=np.float32)
+        assert df['close'].dtype == np.float32
+
+    def test_schema_drift_falls_back_to_generic(self):
+        df = pd.DataFrame({'Date': ['2024-01-02', '2024-01-03'], 'Open': [1, 2], 'Close': [1, 2],
+                           'High': [1, 2], 'Low': [1, 2], 'Volume': [1, 2]})
+        with pytest.raises(parsers.SchemaDrift):
+            parsers.parse_eastmoney(df)
+        out = DataFetcher._parse("efinance", parsers.parse_eastmoney, lambda: df.copy(), df)
+        assert len(out) == 2 and set(parsers.COLUMNS) == set(out.columns)
+
+    def test_volume_normalised_to_shares(self):
+        rows = _tencent_rows(5)
+        lots = DataFetcher._parse("Tencent", parsers.parse_tencent, lambda: _tencent_frame(rows), rows)
+        hk = DataFetcher._parse("Tencent-HK", parsers.parse_tencent, lambda: _tencent_frame(rows), rows)
+        np.testing.assert_allclose(lots['volume'], hk['volume'] * parsers.LOT_SHARES)
+        pytdx = DataFetcher._parse("Pytdx(1.2.3.4)", parsers.parse_tencent, lambda: _tencent_frame(rows), rows)
+        np.testing.assert_allclose(pytdx['volume'], lots['volume'])
@@ -0,0 +1,177 @@
+import sys
+import os
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import main
+from api.fetcher import DataFetcher
+from api.ohlcv import OHLCVSeries
+from api.portfolio import CovarianceCache, assess_portfolio, atr14, marginal_scale
+from api.quant import calculate_technicals
+
+N = 300
+FACTOR = np.random.default_rng(0).normal(0, 0.015, N)  # Common market move
+
+
+def _series(code: str, beta: float, seed: int, n: int = N, market: str = "CN") -> OHLCVSeries:
+    r = beta * FACTOR[:n] + np.random.default_rng(seed).normal(0, 0.006, n)
+    close = 20 * np.exp(np.cumsum(r))
+    df = pd.DataFrame({'date': pd.bdate_range("2023-01-02", periods=n), 'open': close, 'high': close * 1.01,
+                       'low': close * 0.99, 'close': close, 'volume': np.full(n, 1e5)})
+    return OHLCVSeries.from_frame(df, code=code, market=market, source="test")
+
+
+UNIVERSE = {("600000", "CN"): _series("600000", 1.0, 1), ("600001", "CN"): _series("600001", 1.0, 2),
+            ("600002", "CN"): _series("600002", 0.0, 3), ("000001", "CN"): _series("000001", -0.5, 4)}
+
+
+def _loader(limit: int = None):
+    def load(code, market):
+        s = UNIVERSE[(code, market)]
+        return s.slice(0, limit) if limit else s
+    return load
+
+
+def _reference(keys: list, days: int, window: int) -> np.ndarray:
+    close = np.vstack([UNIVERSE[k].close[:days] for k in keys])
+    return np.cov(np.diff(np.log(close), axis=1)[:, -window:])
+
+
+TODAY = int(UNIVERSE[("600000", "CN")].days[-1]) + 1
+
+
+class TestCovarianceCache:
+
+    def test_matches_numpy(self):
+        keys = list(UNIVERSE)
+        cov = CovarianceCache(window=60).covariance(keys, _loader(), today=TODAY)
+        np.testing.assert_allclose(cov, _reference(keys, N, 60), rtol=1e-9, atol=1e-14)
+
+    def test_rolled_forward_equals_rebuild(self):
+        keys = list(UNIVERSE)
+        cache = CovarianceCache(window=60)
+        cache.covariance(keys, _loader(200), today=TODAY)
+        for days in (201, 205, 230, 270):
+            cov = cache.covariance(keys, _loader(days), today=TODAY)
+            np.testing.assert_allclose(cov, _reference(keys, days, 60), rtol=1e-8, atol=1e-14)
+        assert cache.rebuilds == 1 and cache.rolls == 4
+
+    def test_new_symbols_added_without_rebuild(self):
+        keys = list(UNIVERSE)
+        cache = CovarianceCache(window=60)
+        cache.covariance(keys[:2], _loader(), today=TODAY)
+        cov = cache.covariance(keys[::-1], _loader(), today=TODAY)
+        np.testing.assert_allclose(cov, _reference(keys[::-1], N, 60), rtol=1e-9, atol=1e-14)
+        assert cache.rebuilds == 1 and cache.added == 2 and cache.stats()["symbols"] == 4
+
+    def test_todays_bar_left_out(self):
+        keys = list(UNIVERSE)
+        last = int(UNIVERSE[keys[0]].days[-1])
+        cov = CovarianceCache(window=60).covariance(keys, _loader(), today=last)
+        np.testing.assert_allclose(cov, _reference(keys, N - 1, 60), rtol=1e-9, atol=1e-14)
+
+    def test_same_day_loads_only_requested(self):
+        keys = list(UNIVERSE)
+        cache = CovarianceCache(window=60)
+        cache.covariance(keys, _loader(), today=TODAY)
+        calls = []
+
+        def load(code, market):
+            calls.append(code)
+            return UNIVERSE[(code, market)]
+
+        with patch.object(CovarianceCache, "_last_completed", return_value=TODAY - 1):
+            cache.covariance(keys[:1], load, today=TODAY)
+        assert calls == [keys[0][0]] and cache.rolls == 0
+
+    def test_roll_uses_peek_and_drops_uncovered_rows(self):
+        keys = list(UNIVERSE)
+        cache = CovarianceCache(window=60)
+        cache.covariance(keys, _loader(200), today=TODAY)
+        new_day = int(UNIVERSE[keys[0]].days[200])
+        in_memory = {k: UNIVERSE[k].slice(0, 201) for k in keys[:3]}  # keys[3] not in memory
+        with patch.object(CovarianceCache, "_last_completed", return_value=new_day):
+            cov = cache.covariance(keys[:2], _loader(201), today=TODAY, peek=lambda c, m: in_memory.get((c, m)))
+        np.testing.assert_allclose(cov, _reference(keys[:2], 201, 60), rtol=1e-8, atol=1e-14)
+        assert cache.rolls == 1 and cache.dropped == 1 and cache.keys == keys[:3]
+        with patch.object(CovarianceCache, "_last_completed", return_value=new_day):
+            cov = cache.covariance(keys, _loader(201), today=TODAY)
+        np.testing.assert_allclose(cov, _reference(keys, 201, 60), rtol=1e-8, atol=1e-14)
+        assert cache.rebuilds == 1 and cache.added == 1
+
+    def test_universe_cap_rebuilds(self):
+        keys = list(UNIVERSE)
+        cache = CovarianceCache(window=60, max_symbols=3)
+        cache.covariance(keys[:2], _loader(), today=TODAY)
+        cache.covariance(keys[2:], _loader(), today=TODAY)
+        assert cache.rebuilds == 2 and cache.keys == keys[2:]
+
+
+class TestSizing:
+
+    def test_marginal_scale(self):
+        assert marginal_scale(0.5, 0.0, 100) == 1.0
+        assert marginal_scale(0.0, 500, 100) == 1.0
+        assert marginal_scale(-0.8, 500, 100) == 1.0
+        assert marginal_scale(0.9, 500, 100) < marginal_scale(0.3, 500, 100) < 1.0
+        assert marginal_scale(0.5, 500, 0) == 0.0
+
+    def test_atr_matches_technicals(self):
+        s = UNIVERSE[("600000", "CN")]
+        assert round(atr14(s), 2) == calculate_technicals(s)['atr14']
+
+    def test_correlated_candidate_sized_down(self):
+        holdings = [SimpleNamespace(code="600000", market="CN", shares=2000, current_stop=0.0)]
+        candidates = [SimpleNamespace(code="600001", market="CN", entry_price=0.0, stop_loss=15.0),
+                      SimpleNamespace(code="600002", market="CN", entry_price=0.0, stop_loss=15.0)]
+        with patch.object(DataFetcher, "get_realtime_prices", return_value={}), \
+                patch("api.portfolio.local_day", return_value=TODAY):
+            result = assess_portfolio(holdings, candidates, 100000.0, 0.01,
+                                      cache=CovarianceCache(window=120), loader=_loader())
+        correlated, independent = result["candidates"]
+        assert correlated["corr_to_book"] > 0.5 and abs(independent["corr_to_book"]) < 0.3
+        assert correlated["suggested_shares"] < correlated["standalone_shares"]
+        assert correlated["scale"] < independent["scale"]
+        assert result["positions"][0]["risk_share_pct"] == 100.0
+        assert result["with_candidates"]["atr_risk"] < result["with_candidates"]["atr_risk_uncorrelated"]
+        assert result["portfolio"]["atr_risk"] == result["positions"][0]["atr_risk"]
+
+    def test_unknown_board_lot_gets_no_lot_suggestion(self):
+        holdings = [SimpleNamespace(code="600000", market="CN", shares=2000, current_stop=0.0)]
+        candidates = [SimpleNamespace(code="600002", market="CN", entry_price=0.0, stop_loss=15.0)]
+        with patch.object(DataFetcher, "get_realtime_prices", return_value={}), \
+                patch("api.portfolio.local_day", return_value=TODAY), \
+                patch("api.portfolio.security_master.lot_size", return_value=0):
+            result = assess_portfolio(holdings, candidates, 100000.0, 0.01,
+                                      cache=CovarianceCache(window=120), loader=_loader())
+        row = result["candidates"][0]
+        assert row["suggested_shares"] is None and row["lot_size"] is None and row["max_shares"] > 0
+
+    def test_concentration_warnings(self):
+        holdings = [SimpleNamespace(code="600000", market="CN", shares=3000, current_stop=0.0),
+                    SimpleNamespace(code="600001", market="CN", shares=3000, current_stop=0.0),
+                    SimpleNamespace(code="600002", market="CN", shares=100, current_stop=0.0)]
+        with patch.object(DataFetcher, "get_realtime_prices", return_value={}), \
+                patch("api.portfolio.local_day", return_value=TODAY):
+            result = assess_portfolio(holdings, [], 100000.0, 0.01,
+                                      cache=CovarianceCache(window=120), loader=_loader())
+        kinds = {(w["type"], w.get("code") or tuple(w["codes"])) for w in result["warnings"]}
+        assert ("correlation", ("600000", "600001")) in kinds
+        assert ("risk_share", "600000") in kinds and ("risk_share", "600002") not in kinds
+        assert any(t == "weight" for t, _ in kinds)
+
+
+class TestEndpoint:
+
+    def test_rejects_empty_book(self):
+        client = TestClient(main.app)
+        with patch.object(main, "API_KEY", "test-key"):
+            resp = client.post("/portfolio_risk", json={"positions": []}, headers={"X-API-Key": "test-key"})
+        assert resp.status_code == 400
@@ -0,0 +1,63 @@
+import sys
+import os
+import pandas as pd
+from unittest.mock import patch
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import config
+from api.fetcher import DataFetcher, _parse_tencent_quotes
+
+
+def _tencent_payload(symbols):
+    return "\n".join(f'v_{s}="1~名称~{s[2:]}~{10 + i}.50~10.00~0";' for i, s in enumerate(symbols))
+
+
+class TestBatchedQuotes:
+
+    def setup_method(self):
+        DataFetcher._quote_cache.clear()
+        for m in ("CN", "HK"):
+            DataFetcher._spot_cache[m] = {"data": pd.DataFrame(), "time": 0}
+
+    def test_parse_tencent_quotes(self):
+        text = 'v_sh600000="1~浦发银行~600000~10.52~10.50";\nv_hk00700="100~腾讯控股~00700~382.200~380";\nv_sz000002="1~停牌~000002~0.00~0";'
+        assert _parse_tencent_quotes(text) == {"sh600000": 10.52, "hk00700": 382.2}
+
+    def test_chunked_by_url_length(self):
+        urls = []
+
+        def fake_source(provider, symbol, func, url):
+            urls.append(url)
+            return _tencent_payload(symbol.split(","))
+
+        codes = [f"{600000 + i}" for i in range(300)]
+        with patch.object(DataFetcher, '_source', side_effect=fake_source):
+            prices = DataFetcher.get_realtime_prices(codes, "CN")
+
+        assert len(urls) > 1
+        assert all(len(u) <= config.QUOTE_URL_MAX for u in urls)
+        assert len(prices) == 300 and all(p > 0 for p in prices.values())
+
+    def test_quote_cache_serves_single_lookups(self):
+        with patch.object(DataFetcher, '_source', side_effect=lambda p, s, f, url: _tencent_payload(s.split(","))) as src:
+            DataFetcher.get_realtime_prices(["600000", "000001"], "CN")
+            assert DataFetcher.get_realtime_price("sz000001", "CN") == 11.5
+        assert src.call_count == 1
+
+    def test_quote_cache_is_bounded(self):
+        with patch.object(config, "HISTORY_CACHE_MAX", 3), \
+             patch.object(DataFetcher, '_source', side_effect=lambda p, s, f, url: _tencent_payload(s.split(","))):
+            DataFetcher.get_realtime_prices(["600000", "600001"], "CN")
+            DataFetcher.get_realtime_prices(["600000"], "CN")  # Hit keeps it recent
+            DataFetcher.get_realtime_prices(["600002", "600003"], "CN")
+        assert list(DataFetcher._quote_cache) == [("CN", "600000"), ("CN", "600002"), ("CN", "600003")]
+
+    def test_large_watchlist_uses_spot_dump(self):
+        spot = pd.DataFrame({'代码': ['600000', '000001'], '名称': ['浦发银行', '平安银行'], '最新价': [10.5, 11.2]})
+        with patch.object(DataFetcher, '_use_batched_quotes', return_value=False), \
+             patch.object(DataFetcher, '_source', return_value=spot) as src:
+            prices = DataFetcher.get_realtime_prices(["600000", "000001"], "CN")
+        assert prices == {"600000": 10.5, "000001": 11.2}
+        assert src.call_args[0][0] == "AkShare-Spot"
@@ -0,0 +1,55 @@
+import sys
+import os
+import time
+import pytest
+import pandas as pd
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.recorder import SourceRecorder, ReplayMiss, RecordedSourceError
+
+
+class TestSourceRecorder:
+
+    def test_record_then_replay(self, tmp_path):
+        path = str(tmp_path / "day.rec.gz")
+        rec = SourceRecorder("record", path)
+
+        def slow_source(symbol):
+            time.sleep(0.05)
+            return pd.DataFrame({"date": ["2024-01-02"], "close": [float(symbol)]})
+
+        def broken_source():
+            raise ConnectionError("push2.eastmoney.com unreachable")
+
+        rec.call("AkShare", "600000", slow_source, "1")
+        rec.call("AkShare", "600000", slow_source, "2")
+        with pytest.raises(ConnectionError):
+            rec.call("Tencent", "sh600000", broken_source)
+        rec.close()
+
+        replay = SourceRecorder("replay", path, speed=1.0)
+        start = time.perf_counter()
+        first = replay.call("AkShare", "600000", slow_source, "ignored")
+        assert time.perf_counter() - start >= 0.04  # Original latency reproduced
+        assert first["close"].iloc[0] == 1.0
+        assert replay.call("AkShare", "600000", slow_source, "ignored")["close"].iloc[0] == 2.0
+        # Exhausted: keeps serving the last observed response
+        assert replay.call("AkShare", "600000", slow_source, "ignored")["close"].iloc[0] == 2.0
+
+        with pytest.raises(RecordedSourceError):
+            replay.call("Tencent", "sh600000", broken_source)
+        with pytest.raises(ReplayMiss):
+            replay.call("Sina", "sh600000", slow_source, "1")
+
+    def test_replay_returns_copies(self, tmp_path):
+        path = str(tmp_path / "day.rec.gz")
+        rec = SourceRecorder("record", path)
+        rec.call("AkShare", "600000", lambda: pd.DataFrame({"日期": ["2024-01-02"]}))
+        rec.close()
+
+        replay = SourceRecorder("replay", path, speed=0)
+        df = replay.call("AkShare", "600000", None)
+        df.rename(columns={"日期": "date"}, inplace=True)
+        assert "日期" in replay.call("AkShare", "600000", None).columns
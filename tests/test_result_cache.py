@@ -0,0 +1,102 @@
+import sys
+import os
+from unittest.mock import patch
+
+import numpy as np
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from api import main
+from api.cache import CacheBackend, ResultCache
+from api.fetcher import DataFetcher
+from api.ohlcv import OHLCVSeries
+
+HEADERS = {"X-API-Key": "test-key"}
+REQUEST = {"code": "600000", "market": "CN", "balance": 100000, "risk": 0.01}
+
+
+def _series(n: int = 80) -> OHLCVSeries:
+    close = 10 + np.cumsum(np.random.default_rng(7).normal(0, 0.1, n))
+    days = np.arange(19000, 19000 + n, dtype=np.int32)
+    return OHLCVSeries.wrap(days, close, close + 0.1, close - 0.1, close, np.full(n, 1e5),
+                            "600000", "CN", "test")
+
+
+class TestResultCache:
+
+    def test_etag_depends_on_every_part(self):
+        tag = ResultCache.etag("600000", "CN", "2024-01-02", 10.0)
+        assert tag.startswith('"') and tag.endswith('"')
+        assert tag == ResultCache.etag("600000", "CN", "2024-01-02", 10.0)
+        assert tag != ResultCache.etag("600000", "CN", "2024-01-03", 10.0)
+        assert tag != ResultCache.etag("600000", "CN", "2024-01-02", 10.01)
+
+    def test_lru_eviction_and_ttl(self):
+        cache = ResultCache(CacheBackend(), max_entries=2, ttl=60)
+        for i in range(3):
+            cache.put(f'"{i}"', b"%d" % i)
+        assert cache.get('"0"') is None
+        assert cache.get('"2"') == b"2"
+        cache.ttl = 0
+        with patch("api.cache.time.time", return_value=1e12):
+            assert cache.get('"2"') is None
+        assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+class TestAnalyzeFullETag:
+
+    def setup_method(self):
+        self.series = _series()
+        self.price = 10.5
+        self.calls = 0
+
+        def _analyze(code, market, balance, risk, mtf=False, factors=False):
+            self.calls += 1
+            return {"code": code, "market": market, "price": self.price}
+
+        self.patches = [patch.object(main, "API_KEY", "test-key"),
+                        patch.object(main, "analysis_cache", ResultCache(CacheBackend(), prefix="test")),
+                        patch.object(main, "analyze_symbol", side_effect=_analyze),
+                        patch.object(DataFetcher, "get_history_series", side_effect=lambda c, m: self.series),
+                        patch.object(DataFetcher, "get_realtime_price", side_effect=lambda c, m: self.price)]
+        for p in self.patches:
+            p.start()
+        self.client = TestClient(main.app)
+
+    def teardown_method(self):
+        for p in self.patches:
+            p.stop()
+
+    def test_repeat_is_served_from_cache(self):
+        first = self.client.post("/analyze_full", json=REQUEST, headers=HEADERS)
+        second = self.client.post("/analyze_full", json=REQUEST, headers=HEADERS)
+        assert first.headers["x-cache"] == "MISS" and second.headers["x-cache"] == "HIT"
+        assert first.headers["etag"] == second.headers["etag"]
+        assert first.content == second.content
+        assert self.calls == 1
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.post("/analyze_full", json=REQUEST, headers=HEADERS).headers["etag"]
+        resp = self.client.post("/analyze_full", json=REQUEST, headers={**HEADERS, "If-None-Match": etag})
+        assert resp.status_code == 304
+        assert resp.content == b"" and resp.headers["etag"] == etag
+        assert self.calls == 1
+
+    def test_new_price_or_bar_invalidates(self):
+        etag = self.client.post("/analyze_full", json=REQUEST, headers=HEADERS).headers["etag"]
+        self.price = 10.6
+        moved = self.client.post("/analyze_full", json=REQUEST, headers={**HEADERS, "If-None-Match": etag})
+        assert moved.status_code == 200 and moved.headers["etag"] != etag
+        assert moved.json()["price"] == 10.6
+        self.series = _series(81)
+        new_bar = self.client.post("/analyze_full", json=REQUEST, headers=HEADERS)
+        assert new_bar.headers["etag"] not in (etag, moved.headers["etag"])
+        assert self.calls == 3
+
+    def test_sizing_params_and_profile_are_part_of_the_key(self):
+        base = self.client.post("/analyze_full", json=REQUEST, headers=HEADERS).headers["etag"]
+        risk = self.client.post("/analyze_full", json={**REQUEST, "risk": 0.02}, headers=HEADERS).headers["etag"]
+        compact = self.client.post("/analyze_full?profile=compact", json=REQUEST, headers=HEADERS).headers["etag"]
+        assert len({base, risk, compact}) == 3
@@ -0,0 +1,81 @@
+import sys
+import os
+from unittest.mock import patch
+
+import pandas as pd
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import fetcher
+from api.security_master import SecurityMaster, classify
+
+
+class TestSecurityMaster:
+
+    def _master(self, tmp_path):
+        master = SecurityMaster(str(tmp_path / "master.sqlite"))
+        master.replace([
+            classify("600519", "CN", "贵州茅台"),
+            classify("688981", "CN", "中芯国际"),
+            classify("510300", "CN", "沪深300ETF", is_etf=True),
+            classify("700", "HK", "腾讯控股"),
+            classify("03033", "HK", "南方恒生科技"),
+        ])
+        return master
+
+    def test_classification(self, tmp_path):
+        master = self._master(tmp_path)
+        assert master.get("sh600519", "CN").board == "SH-Main"
+        assert master.lot_size("688981", "CN") == 200
+        assert master.get("510300", "CN").instrument_type == "etf"
+        assert master.get("00700", "HK").name == "腾讯控股"
+        assert master.get("3033", "HK").instrument_type == "etf"  # Code range rule
+        assert master.lot_size("00700", "HK") == 0  # HK board lots are not guessed
+
+    def test_persisted_and_reloaded(self, tmp_path):
+        self._master(tmp_path)
+        reloaded = SecurityMaster(str(tmp_path / "master.sqlite"))
+        assert len(reloaded) == 5
+        assert reloaded.age < 60
+
+    def test_detect_market(self, tmp_path):
+        master = self._master(tmp_path)
+        assert master.detect_market("600519") == "CN"
+        assert master.detect_market("700") == "HK"       # Known HK code, not 5 digits
+        assert master.detect_market("09988") == "HK"     # Unknown: 5-digit rule
+        assert master.detect_market("000001") == "CN"
+        assert master.detect_market("HK00700") == "HK"
+
+    def test_stock_name_never_goes_upstream(self, tmp_path):
+        master = self._master(tmp_path)
+        with patch.object(fetcher, "security_master", master), \
+                patch.object(fetcher.DataFetcher, "_source") as source:
+            assert fetcher.DataFetcher.get_stock_name("600519", "CN") == "贵州茅台"
+            assert fetcher.DataFetcher.get_stock_name("601398", "CN") == "601398"
+        source.assert_not_called()
+
+    def test_six_digit_code_never_matches_hk(self, tmp_path):
+        master = SecurityMaster(str(tmp_path / "master.sqlite"))
+        master.replace([classify("00001", "HK", "长和"), classify("02594", "HK", "比亚迪股份")])
+        assert master.detect_market("000001") == "CN"
+        assert master.detect_market("002594") == "CN"
+        assert master.detect_market("1") == "HK"
+
+
+class TestRefresh:
+
+    def test_refresh_from_stubbed_sources(self, tmp_path):
+        master = SecurityMaster(str(tmp_path / "master.sqlite"))
+        names = pd.DataFrame({"code": ["600519", "688981"], "name": ["贵州茅台", "中芯国际"]})
+        etfs = pd.DataFrame({"代码": ["510300"], "名称": ["沪深300ETF"]})
+        hk = pd.DataFrame({"代码": ["00700", "00005"], "名称": ["腾讯控股", "汇丰控股"], "每手股数": [100, 400]})
+        with patch.object(fetcher, "security_master", master), \
+                patch.object(fetcher.ak, "stock_info_a_code_name", return_value=names), \
+                patch.object(fetcher.ak, "fund_etf_spot_em", return_value=etfs), \
+                patch.object(fetcher.ak, "stock_hk_spot_em", return_value=hk):
+            fetcher.DataFetcher.refresh_security_master()
+        assert len(master) == 5 and master.lot_size("5", "HK") == 400
+        assert master.lot_size("688981", "CN") == 200
+        assert master.get("510300", "CN").instrument_type == "etf"
+        assert master.get("700", "HK").name == "腾讯控股"
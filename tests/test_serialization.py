@@ -0,0 +1,107 @@
+import sys
+import os
+import gzip
+import json
+import zlib
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from api import serialization
+from api.serialization import FastJSONResponse, CompressionMiddleware, choose_encoding, dumps
+from api.main import compact_analysis
+
+PAYLOAD = {"price": np.float32(1.5), "bars": np.int64(3), "closes": np.array([1.0, 2.0]),
+           "rsi": float("nan"), "name": "贵州茅台"}
+EXPECTED = {"price": 1.5, "bars": 3, "closes": [1.0, 2.0], "rsi": None, "name": "贵州茅台"}
+
+
+def _app():
+    app = FastAPI(default_response_class=FastJSONResponse)
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/big")
+    def big():
+        return FastJSONResponse({"rows": [{"code": f"{i:06d}", "close": 10.0 + i} for i in range(200)]})
+
+    @app.get("/small")
+    def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse((dumps({"i": i}) + b"\n" for i in range(50)), media_type="application/x-ndjson")
+
+    return TestClient(app)
+
+
+class TestSerialization:
+
+    def test_numpy_and_nan(self):
+        assert json.loads(dumps(PAYLOAD)) == EXPECTED
+
+    def test_stdlib_fallback_matches(self):
+        with patch.object(serialization, "orjson", None):
+            raw = dumps(PAYLOAD)
+        assert json.loads(raw) == EXPECTED
+        assert "贵州茅台".encode() in raw
+
+    def test_choose_encoding(self):
+        assert choose_encoding("gzip, deflate") == "gzip"
+        assert choose_encoding("gzip;q=0, identity") == ""
+        assert choose_encoding("") == ""
+        with patch.object(serialization, "brotli", None):
+            assert choose_encoding("br, gzip") == "gzip"
+
+    def test_gzip_whole_body_and_small_bodies_raw(self):
+        client = _app()
+        resp = client.get("/big", headers={"Accept-Encoding": "gzip"})
+        assert resp.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in resp.headers["vary"]
+        assert len(resp.json()["rows"]) == 200
+        small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in small.headers and small.json() == {"ok": True}
+
+    def test_streamed_body_compressed_incrementally(self):
+        client = _app()
+        with patch.object(serialization, "brotli", None):
+            resp = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        assert resp.headers["content-encoding"] == "gzip"
+        assert "content-length" not in resp.headers
+        lines = [json.loads(line) for line in resp.text.splitlines()]
+        assert [r["i"] for r in lines] == list(range(50))
+
+    def test_sync_flush_makes_each_chunk_decodable(self):
+        comp = serialization._Compressor("gzip")
+        dec = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        assert dec.decompress(comp.chunk(b'{"i":0}\n')) == b'{"i":0}\n'
+        assert dec.decompress(comp.chunk(b'{"i":1}\n') + comp.finish()) == b'{"i":1}\n'
+
+    def test_brotli_when_available(self):
+        pytest.importorskip("brotli")
+        resp = _app().get("/big", headers={"Accept-Encoding": "gzip, br"})
+        assert resp.headers["content-encoding"] == "br"
+        assert len(resp.json()["rows"]) == 200
+
+    def test_gzip_is_deterministic(self):
+        data = b"x" * 2000
+        assert serialization._Compressor.whole("gzip", data) == serialization._Compressor.whole("gzip", data)
+        assert gzip.decompress(serialization._Compressor.whole("gzip", data)) == data
+
+
+class TestCompactProfile:
+
+    def test_drops_duplicated_blocks(self):
+        full = {"code": "600000", "current_price": 10.0, "rsi14": 55.0, "trend_score": 70,
+                "technical": {"current_price": 10.0, "rsi14": 55.0, "ma5": 9.9, "ma60": 9.0, "trend_score": 70},
+                "signal": {"signal": "买入 🟢", "trend_score": 70}, "prompt_data": {"price_info": "..."}}
+        compact = compact_analysis(full)
+        assert compact == {"code": "600000", "current_price": 10.0, "rsi14": 55.0, "trend_score": 70,
+                           "technical": {"ma5": 9.9, "ma60": 9.0}}
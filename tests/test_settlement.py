@@ -0,0 +1,115 @@
+import sys
+import os
+import datetime
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import main
+from api.fetcher import DataFetcher
+from api.ohlcv import OHLCVSeries
+from api.settlement import SettlementStore, day_index, initial_state, scan
+from api.trading_calendar import TZ, trading_calendar
+
+TODAY = datetime.datetime.now(TZ).date()
+
+
+def _series(highs, lows, end: datetime.date = TODAY - datetime.timedelta(days=1)) -> OHLCVSeries:
+    n = len(highs)
+    highs, lows = np.asarray(highs, dtype=float), np.asarray(lows, dtype=float)
+    df = pd.DataFrame({'date': pd.date_range(end=pd.Timestamp(end), periods=n), 'open': (highs + lows) / 2,
+                       'high': highs, 'low': lows, 'close': (highs + lows) / 2, 'volume': np.full(n, 1e5)})
+    return OHLCVSeries.from_frame(df, code="600000", market="CN", source="test")
+
+
+def _signal(signal_date: datetime.date, record_id: str = "rec1", **levels) -> main.SignalItem:
+    return main.SignalItem(code="600000", market="CN", signal_date=signal_date.isoformat(), record_id=record_id,
+                           **{"entry_price": 10.0, "stop_loss": 9.0, "take_profit": 12.0, **levels})
+
+
+class TestScan:
+
+    def test_incremental_equals_full(self):
+        s = _series(10 + np.sin(np.arange(30)) * 0.5, 9.5 + np.sin(np.arange(30)) * 0.5)
+        start = initial_state(int(s.days[0]))
+        full = scan(s, start, stop=5.0, target=20.0)
+        step = start
+        for cut in (5, 6, 17, 30):
+            step = scan(s.slice(0, cut), step, stop=5.0, target=20.0)
+        assert step == full and full["bars"] == 29 and full["outcome"] is None
+        assert full["max_high"] == float(s.high[1:].max()) and full["min_low"] == float(s.low[1:].min())
+
+    def test_first_touch_wins_and_stop_wins_ties(self):
+        s = _series([10, 10.5, 12.5, 13], [9.8, 9.9, 8.5, 11])
+        state = scan(s, initial_state(int(s.days[0])), stop=9.0, target=12.0)
+        assert state["outcome"] == "stop" and state["exit_price"] == 9.0 and state["bars"] == 2
+        assert state["last_day"] == state["outcome_day"] == int(s.days[2])
+        assert scan(s, state, stop=9.0, target=12.0) is state
+
+    def test_before_excludes_provisional_bar(self):
+        s = _series([10, 10.2, 11], [9.8, 9.9, 10], end=TODAY)
+        state = scan(s, initial_state(int(s.days[0])), stop=9.0, target=12.0, before=day_index(TODAY))
+        assert state["last_day"] == int(s.days[1]) and state["max_high"] == 10.2
+
+
+class TestSettlementStore:
+
+    def test_roundtrip_and_edited_levels(self, tmp_path):
+        store = SettlementStore(str(tmp_path / "settle.sqlite"))
+        state = {**initial_state(19000), "max_high": 10.5}
+        store.put("rec1", ("2024-01-02", 10.0, 9.0, 12.0), state)
+        assert store.get("rec1", ("2024-01-02", 10.0, 9.0, 12.0)) == state
+        assert store.get("rec1", ("2024-01-02", 10.0, 9.5, 12.0)) is None
+        assert store.stats()["signals"] == 1
+
+
+class TestSettleSignal:
+
+    def _run(self, store, sig, series, price):
+        with patch.object(main, "get_settlement_store", return_value=store), \
+                patch.object(trading_calendar, "previous_trading_day",
+                             return_value=TODAY - datetime.timedelta(days=1)), \
+                patch.object(DataFetcher, "get_history_series", return_value=series) as history, \
+                patch.object(DataFetcher, "get_realtime_price", return_value=price) as quote:
+            return main.settle_signal(sig), history.call_count, quote.call_count
+
+    def test_only_new_bars_fetched(self, tmp_path):
+        store = SettlementStore(str(tmp_path / "settle.sqlite"))
+        bars = _series([10.2] * 8, [9.6] * 8)
+        sig = _signal(TODAY - datetime.timedelta(days=10))
+        levels = (sig.signal_date, 10.0, 9.0, 12.0)
+
+        row, fetched, _ = self._run(store, sig, bars, 10.1)
+        assert row["action"] == "PENDING" and fetched == 1 and row["max_high"] == 10.2
+        # Same day again: state covers every completed bar, the realtime quote is enough
+        row, fetched, _ = self._run(store, sig, bars, 10.3)
+        assert row["action"] == "PENDING" and fetched == 0 and row["pnl_percent"] == 3.0
+        # One bar behind (as on the next trading day): only that bar is folded into the stored extrema
+        state = store.get("rec1", levels)
+        store.put("rec1", levels, {**state, "last_day": int(bars.days[-2])})
+        newer = _series([10.2] * 7 + [11.5], [9.6] * 7 + [9.4])
+        row, fetched, _ = self._run(store, sig, newer, 10.3)
+        assert fetched == 1 and row["max_high"] == 11.5 and row["min_low"] == 9.4
+        assert store.get("rec1", levels)["bars"] == state["bars"] + 1
+
+    def test_settled_outcome_replayed_without_fetching(self, tmp_path):
+        store = SettlementStore(str(tmp_path / "settle.sqlite"))
+        bars = _series([10.2, 12.4, 10.0], [9.6, 10.1, 9.5])
+        sig = _signal(TODAY - datetime.timedelta(days=4))
+        first, _, _ = self._run(store, sig, bars, 10.0)
+        again, fetched, quoted = self._run(store, sig, bars, 10.0)
+        assert first["action"] == again["action"] == "SETTLED" and first["signal_result"] == "成功 ✅"
+        assert again["settle_date"] == str(bars.dates[1].astype(str)) and again["pnl_percent"] == 20.0
+        assert fetched == 0 and quoted == 0
+
+    def test_realtime_touch_settles(self, tmp_path):
+        store = SettlementStore(str(tmp_path / "settle.sqlite"))
+        sig = _signal(TODAY - datetime.timedelta(days=1), record_id="")
+        row, fetched, _ = self._run(store, sig, _series([10.2], [9.9]), 8.8)
+        assert row["signal_result"] == "失败 ❌" and row["pnl_percent"] == -10.0 and fetched == 0
+        assert row["settle_date"] == TODAY.isoformat()
+        assert store.get(f"CN:600000:{sig.signal_date}", (sig.signal_date, 10.0, 9.0, 12.0))["outcome"] == "stop"
@@ -0,0 +1,230 @@
+import sys
+import os
+import time
+import json
+import numpy as np
+import pandas as pd
+from unittest.mock import patch
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import config
+from api.ohlcv import OHLCVSeries
+from api.store import HistoryStore
+from api.fetcher import DataFetcher
+from api.quant import calculate_technicals
+
+
+def _series(code, n=250, start=10.0, market="CN"):
+    close = start + np.cumsum(np.random.default_rng(len(code) + n).normal(0, 0.1, n))
+    df = pd.DataFrame({
+        'date': pd.date_range("2023-01-02", periods=n),
+        'open': close, 'high': close + 0.2, 'low': close - 0.2,
+        'close': close, 'volume': np.full(n, 1e5),
+    })
+    return OHLCVSeries.from_frame(df, code=code, market=market, source="test")
+
+
+class TestHistoryStore:
+
+    def test_reads_are_memmap_views(self, tmp_path):
+        store = HistoryStore(str(tmp_path))
+        a, b = _series("600000"), _series("000001", n=120)
+        store.write_many([a, b])
+
+        got = store.read("000001", "CN")
+        assert len(got) == 120 and got.source == "test"
+        np.testing.assert_array_equal(got.close, b.close)
+        np.testing.assert_array_equal(got.days, b.days)
+        assert isinstance(got.close.base, np.memmap) or isinstance(got.close, np.memmap)
+        assert not got.close.flags.writeable
+        # Both symbols live in the same column file: views share one mapping
+        assert np.shares_memory(store.read("600000", "CN").close.base, got.close)
+        assert store.read("600519", "CN") is None
+
+    def test_rewrite_and_compact(self, tmp_path):
+        store = HistoryStore(str(tmp_path))
+        store.write(_series("600000", n=100))
+        store.write(_series("000001", n=50))
+        store.write(_series("600000", n=110, start=20))
+        assert store.stats()["garbage_rows"] == 100
+        held = store.read("600000", "CN")  # Mapping taken before compaction stays valid
+
+        store.compact()
+        stats = store.stats()
+        assert stats["rows"] == 160 and stats["garbage_rows"] == 0
+        got = store.read("600000", "CN")
+        assert len(got) == 110 and got.close[0] > 19
+        np.testing.assert_array_equal(got.close, held.close)
+        assert len(store.read("000001", "CN")) == 50
+
+    def test_reader_with_pre_compaction_index_never_maps_new_files(self, tmp_path):
+        writer = HistoryStore(str(tmp_path))
+        writer.write(_series("600000", n=100))
+        writer.write(_series("000001", n=50))
+        writer.write(_series("600000", n=110, start=20))
+        reader = HistoryStore(str(tmp_path))
+        stale = json.loads(json.dumps(reader._current_index()))
+        writer.compact()
+        assert not os.path.exists(os.path.join(str(tmp_path), "close.f8"))  # Old generation unlinked
+        calls = []
+        current = reader._current_index
+
+        def racing_index():
+            calls.append(1)
+            return stale if len(calls) == 1 else current()
+
+        with patch.object(reader, "_current_index", side_effect=racing_index):
+            got = reader.read("000001", "CN")
+        np.testing.assert_array_equal(got.close, _series("000001", n=50).close)
+        assert len(calls) == 2
+
+    def test_unindexed_tail_from_crashed_writer_is_discarded(self, tmp_path):
+        store = HistoryStore(str(tmp_path))
+        store.write(_series("600000", n=10))
+        with open(os.path.join(str(tmp_path), "close.f8"), "ab") as fh:
+            fh.write(b"\0" * 24)  # Half-finished append, index never updated
+        store.write(_series("000001", n=5))
+        np.testing.assert_array_equal(store.read("000001", "CN").close, _series("000001", n=5).close)
+
+    def test_second_instance_sees_writes(self, tmp_path):
+        reader = HistoryStore(str(tmp_path))
+        writer = HistoryStore(str(tmp_path))
+        writer.write(_series("00700", market="HK"))
+        time.sleep(0.01)
+        writer.write(_series("09988", n=80, market="HK"))
+        assert len(reader.read("09988", "HK")) == 80
+        assert sorted(reader.symbols("HK")) == ["00700", "09988"]
+
+    def test_dtype_fixed_at_creation(self, tmp_path):
+        HistoryStore(str(tmp_path), price_dtype="float32").write(_series("600000"))
+        reopened = HistoryStore(str(tmp_path), price_dtype="float64")
+        assert reopened.read("600000", "CN").close.dtype == np.float32
+
+    def test_panel_pads_short_histories(self, tmp_path):
+        store = HistoryStore(str(tmp_path))
+        store.write_many([_series("600000", n=300), _series("000001", n=20)])
+        panel = store.panel("close", ["600000", "000001", "600519"], "CN", 60)
+        assert panel.shape == (3, 60)
+        assert np.isnan(panel[1, :40]).all() and not np.isnan(panel[1, 40:]).any()
+        assert np.isnan(panel[2]).all()
+
+    def test_technicals_on_stored_series(self, tmp_path):
+        store = HistoryStore(str(tmp_path))
+        store.write(_series("600000"))
+        result = calculate_technicals(store.read("600000", "CN"))
+        assert result['current_price'] == round(float(_series("600000").close[-1]), 2)
+        assert 'ma20' in result
+
+
+class TestFetcherStoreTier:
+
+    def test_write_through_then_served_from_store(self, tmp_path):
+        store = HistoryStore(str(tmp_path))
+        fetched = _series("600000").to_frame()
+        DataFetcher._history_cache.clear()
+        with patch.object(config, "HISTORY_STORE", True), \
+                patch("api.fetcher.get_store", return_value=store), \
+                patch.object(DataFetcher, "_fetch_a_share_history", return_value=fetched) as fetch:
+            first = DataFetcher.get_history_series("600000", "CN")
+            DataFetcher._history_cache.clear()
+            second = DataFetcher.get_history_series("600000", "CN")
+        assert fetch.call_count == 1
+        assert len(first) == len(second) == 250
+        assert isinstance(second.close.base, np.memmap) or isinstance(second.close, np.memmap)
+
+    def test_stale_store_used_when_sources_fail(self, tmp_path):
+        store = HistoryStore(str(tmp_path))
+        store.write(_series("600000"))
+        DataFetcher._history_cache.clear()
+        with patch.object(config, "HISTORY_STORE", True), patch.object(config, "HISTORY_CACHE_TTL", 0), \
+                patch.object(config, "TRADING_CALENDAR", False), \
+                patch("api.fetcher.get_store", return_value=store), \
+                patch.object(DataFetcher, "_fetch_a_share_history", return_value=pd.DataFrame()):
+            series = DataFetcher.get_history_series("600000", "CN")
+        DataFetcher._history_cache.clear()
+        assert len(series) == 250
+
+
+def _qfq(raw: np.ndarray, n: int, ex: dict, code="600000") -> OHLCVSeries:
+    """First n bars of raw closes forward-adjusted for the ex-dates {index: ratio} among them (2 dp)"""
+    scale = np.ones(n)
+    for i, ratio in ex.items():
+        if i < n:
+            scale[:i] *= ratio
+    close = np.round(raw[:n] * scale, 2)
+    df = pd.DataFrame({'date': pd.date_range("2024-01-01", periods=n), 'open': close, 'high': close,
+                       'low': close, 'close': close, 'volume': np.full(n, 1e5)})
+    return OHLCVSeries.from_frame(df, code=code, market="CN", source="test")
+
+
+class TestAdjustmentFactors:
+    raw = np.round(20 + np.cumsum(np.random.default_rng(3).normal(0, 0.2, 300)), 2)
+
+    def test_refetch_of_same_bars_touches_index_only(self, tmp_path):
+        store = HistoryStore(str(tmp_path))
+        assert store.update(_qfq(self.raw, 200, {})) == "new"
+        assert store.update(_qfq(self.raw, 200, {})) == "unchanged"
+        assert store.stats()["rows"] == 200 and store.stats()["garbage_rows"] == 0
+
+    def test_new_bars_are_appended(self, tmp_path):
+        store = HistoryStore(str(tmp_path))
+        store.update(_qfq(self.raw, 200, {}))
+        assert store.update(_qfq(self.raw, 203, {})) == "appended"
+        got = store.read("600000", "CN")
+        assert len(got) == 203
+        np.testing.assert_allclose(got.close, _qfq(self.raw, 203, {}).close)
+
+    def test_dividend_only_adds_a_factor(self, tmp_path):
+        store = HistoryStore(str(tmp_path))
+        before = _qfq(self.raw, 200, {})
+        store.update(before)
+        after = _qfq(self.raw, 202, {200: 0.97})  # Ex-date is the first new bar
+        assert store.update(after) == "adjusted"
+        (ex_day, ratio), = store.factors("600000", "CN")
+        assert ex_day == int(after.days[200]) and abs(ratio - 0.97) < 1e-3
+        np.testing.assert_allclose(store.read("600000", "CN").close, after.close, atol=0.011)
+        # Stored bars did not move: hfq keeps the original history, unadjusted view is the stored base
+        np.testing.assert_allclose(store.read("600000", "CN", adjust="hfq").close[:200], before.close, atol=0.011)
+        np.testing.assert_array_equal(store.read("600000", "CN", adjust=None).close[:199], before.close[:199])
+        assert store.stats()["adjusted_symbols"] == 1
+
+    def test_second_action_and_compaction_keep_factors(self, tmp_path):
+        store = HistoryStore(str(tmp_path))
+        store.update(_qfq(self.raw, 200, {}))
+        store.update(_qfq(self.raw, 210, {200: 0.97}))
+        latest = _qfq(self.raw, 260, {200: 0.97, 250: 0.5})  # Dividend then 2-for-1 split
+        assert store.update(latest) == "adjusted"
+        store.compact()
+        assert len(store.factors("600000", "CN")) == 2
+        np.testing.assert_allclose(store.read("600000", "CN").close, latest.close, atol=0.011)
+
+    def test_other_source_is_never_spliced(self, tmp_path):
+        store = HistoryStore(str(tmp_path))
+        lots = _qfq(self.raw, 200, {})
+        store.update(OHLCVSeries.wrap(lots.days, lots.open, lots.high, lots.low, lots.close,
+                                      np.full(200, 1000.0), code="600000", market="CN", source="efinance"))
+        shares = _qfq(self.raw, 203, {})
+        shares = OHLCVSeries.wrap(shares.days, shares.open, shares.high, shares.low, shares.close,
+                                  np.full(203, 100000.0), code="600000", market="CN", source="Baostock")
+        assert store.update(shares) == "rewritten"
+        assert store.read("600000", "CN").volume.tolist() == [100000.0] * 203
+
+    def test_store_from_before_share_volumes_is_rewritten(self, tmp_path):
+        store = HistoryStore(str(tmp_path))
+        store.update(_qfq(self.raw, 200, {}))
+        idx = store._read_index()
+        idx["symbols"]["CN:600000"][3] = 1.0
+        del idx["shares_since"]  # Index written before volumes were normalised
+        store._write_index(idx)
+        assert store.update(_qfq(self.raw, 200, {})) == "rewritten"
+        assert store.update(_qfq(self.raw, 201, {})) == "appended"
+
+    def test_revised_history_is_rewritten(self, tmp_path):
+        store = HistoryStore(str(tmp_path))
+        store.update(_qfq(self.raw, 200, {}))
+        revised = _qfq(self.raw * np.random.default_rng(9).uniform(0.9, 1.1, 300), 201, {})
+        assert store.update(revised) == "rewritten"
+        assert store.factors("600000", "CN") == []
+        np.testing.assert_array_equal(store.read("600000", "CN").close, revised.close)
@@ -0,0 +1,72 @@
+import sys
+import os
+import json
+from unittest.mock import patch
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from api import main
+
+HEADERS = {"X-API-Key": "test-key"}
+POSITIONS = {"positions": [
+    {"code": "600000", "buy_price": 10, "current_stop": 9, "target_price": 12, "record_id": "a"},
+    {"code": "000001", "buy_price": 10, "current_stop": 9, "target_price": 12, "record_id": "b"},
+]}
+
+
+def _fake_check(pos, intraday=False):
+    return {"code": pos.code, "action": "HOLD", "record_id": pos.record_id}
+
+
+def _lines(resp):
+    return [json.loads(line) for line in resp.text.splitlines() if line]
+
+
+class TestNDJSONStreaming:
+
+    def setup_method(self):
+        self.patches = [patch.object(main, "API_KEY", "test-key"),
+                        patch.object(main, "prefetch_quotes", lambda items: None)]
+        for p in self.patches:
+            p.start()
+        self.client = TestClient(main.app)
+
+    def teardown_method(self):
+        for p in self.patches:
+            p.stop()
+
+    def test_stream_matches_buffered_response(self):
+        with patch.object(main, "check_position", side_effect=_fake_check):
+            buffered = self.client.post("/check_positions", json=POSITIONS, headers=HEADERS).json()
+            streamed = self.client.post("/check_positions?stream=true", json=POSITIONS, headers=HEADERS)
+        assert streamed.headers["content-type"].startswith("application/x-ndjson")
+        lines = _lines(streamed)
+        assert lines[:-1] == buffered["positions"]
+        assert lines[-1]["done"] is True and lines[-1]["count"] == 2
+
+    def test_accept_header_opts_in(self):
+        with patch.object(main, "settle_signal", side_effect=lambda s: {"code": s.code, "action": "SKIP"}):
+            resp = self.client.post("/settle_signals", headers={**HEADERS, "Accept": "application/x-ndjson"},
+                                    json={"signals": [{"code": "600000", "signal_date": "2024-01-02", "entry_price": 1,
+                                                       "stop_loss": 0.9, "take_profit": 1.2}]})
+        assert _lines(resp)[0] == {"code": "600000", "action": "SKIP"}
+
+    def test_results_emitted_before_batch_finishes(self):
+        produced = []
+
+        def _analyze(code, market, balance, risk, mtf=False, factors=False):
+            produced.append(code)
+            if code == "bad":
+                raise ValueError("No data found")
+            return {"code": code}
+
+        with patch.object(main, "analyze_symbol", side_effect=_analyze):
+            results = main._iter_analyze(main.AnalyzeBatchRequest(codes=["600000", "bad", "000001"]))
+            assert next(results) == {"code": "600000"}
+            assert produced == ["600000"]  # Later symbols not computed yet
+            assert list(results) == [{"code": "bad", "error": "No data found"}, {"code": "000001"}]
+
+            resp = self.client.post("/analyze_batch", headers=HEADERS, json={"codes": ["600000", "bad"]})
+        assert [r["code"] for r in resp.json()["results"]] == ["600000", "bad"]
@@ -0,0 +1,98 @@
+import sys
+import os
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import main
+from api.fetcher import DataFetcher
+from api.ohlcv import OHLCVSeries
+from api.quant import calculate_technicals
+from api.timeframes import TimeframeCache, multi_timeframe
+
+
+def _frame(n: int = 400, seed: int = 5) -> pd.DataFrame:
+    close = 20 + np.cumsum(np.random.default_rng(seed).normal(0.02, 0.3, n))
+    return pd.DataFrame({'date': pd.bdate_range("2024-01-01", periods=n), 'open': close - 0.1,
+                         'high': close + 0.3, 'low': close - 0.3, 'close': close,
+                         'volume': np.random.default_rng(seed).uniform(1e5, 2e5, n)})
+
+
+def _series(n: int = 400) -> OHLCVSeries:
+    return OHLCVSeries.from_frame(_frame(n), code="600000", market="CN", source="test")
+
+
+class TestResample:
+
+    def test_matches_pandas(self):
+        df = _frame()
+        rules = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+        for period, rule in (("W", "W"), ("M", "ME")):
+            got = OHLCVSeries.from_frame(df).resample(period)
+            ref = df.set_index('date').resample(rule).agg(rules).dropna()
+            assert len(got) == len(ref)
+            for col in rules:
+                np.testing.assert_allclose(getattr(got, col), ref[col].to_numpy())
+
+    def test_bars_dated_on_last_trading_day(self):
+        weekly = _series(10).resample("W")
+        assert list(weekly.dates.astype(str)) == ["2024-01-05", "2024-01-12"]
+
+    def test_technicals_run_on_weekly_bars(self):
+        tech = calculate_technicals(_series().resample("W"))
+        assert tech['current_price'] == round(float(_series().close[-1]), 2) and tech['ma20'] > 0
+
+
+class TestTimeframeCache:
+
+    def test_incremental_update_equals_full_resample(self):
+        cache = TimeframeCache()
+        full = _series(400)
+        cache.get(full.slice(0, 300), "W")
+        for n in (301, 302, 310, 400):
+            got = cache.get(full.slice(0, n), "W")
+            expected = full.slice(0, n).resample("W")
+            for f in OHLCVSeries.FIELDS:
+                np.testing.assert_array_equal(getattr(got, f), getattr(expected, f))
+        assert cache.stats()["full"] == 1 and cache.stats()["incremental"] == 4
+        cache.get(full, "W")
+        assert cache.stats()["hits"] == 1
+
+    def test_replaced_last_bar_and_rescaled_history(self):
+        cache = TimeframeCache()
+        df = _frame(300)
+        cache.get(OHLCVSeries.from_frame(df, code="600000", market="CN"), "M")
+        df.loc[299, 'close'] += 1.0  # Partial session bar finalised
+        got = cache.get(OHLCVSeries.from_frame(df, code="600000", market="CN"), "M")
+        assert got.close[-1] == df['close'].iloc[-1]
+        df[['open', 'high', 'low', 'close']] *= 0.97  # Dividend: qfq rescales everything
+        got = cache.get(OHLCVSeries.from_frame(df, code="600000", market="CN"), "M")
+        np.testing.assert_allclose(got.close[0], df.set_index('date')['close'].resample('ME').last().iloc[0])
+        assert cache.stats()["full"] == 2
+
+
+class TestMultiTimeframeBlock:
+
+    def test_block_shape_and_confirmation(self):
+        block = multi_timeframe(_series(), is_hk=False, daily_score=75)
+        assert set(block) == {"weekly", "monthly", "confirmation"}
+        assert block["weekly"]["bars"] == len(_series().resample("W"))
+        assert block["confirmation"] in ("confirmed", "conflict", "neutral")
+        assert multi_timeframe(_series(), is_hk=False, daily_score=50)["confirmation"] == "neutral"
+
+    def test_analyze_symbol_mtf_needs_no_extra_fetch(self):
+        series = _series()
+        with patch.object(DataFetcher, "get_history_series", return_value=series), \
+                patch.object(DataFetcher, "download_history") as download, \
+                patch.object(DataFetcher, "get_stock_name", return_value="浦发银行"), \
+                patch.object(DataFetcher, "get_realtime_price", return_value=0.0):
+            plain = main.analyze_symbol("600000", "CN")
+            result = main.analyze_symbol("600000", "CN", mtf=True)
+        download.assert_not_called()
+        assert "mtf" not in plain
+        assert result["mtf"]["weekly"]["trend_score"] >= 0
+        assert {k: v for k, v in result.items() if k != "mtf"} == plain
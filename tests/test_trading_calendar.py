@@ -0,0 +1,69 @@
+import sys
+import os
+import datetime
+from unittest.mock import patch
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import config
+from api.trading_calendar import TradingCalendar, TZ
+
+
+def _ts(text: str) -> float:
+    return datetime.datetime.fromisoformat(text).replace(tzinfo=TZ).timestamp()
+
+
+class TestTradingCalendar:
+
+    def _calendar(self, tmp_path):
+        return TradingCalendar(str(tmp_path / "calendar.sqlite"))
+
+    def test_trading_days(self, tmp_path):
+        cal = self._calendar(tmp_path)
+        assert cal.is_trading_day("2025-09-30", "CN")
+        assert not cal.is_trading_day("2025-10-01", "CN")      # National Day
+        assert not cal.is_trading_day("2025-09-28", "CN")      # Make-up Sunday still closed
+        assert cal.is_trading_day("2025-10-02", "HK") and not cal.is_trading_day("2025-10-29", "HK")
+        assert cal.next_trading_day("2025-09-30", "CN") == datetime.date(2025, 10, 9)
+        assert cal.previous_trading_day("2025-10-09", "CN") == datetime.date(2025, 9, 30)
+
+    def test_trading_days_between_skips_holidays(self, tmp_path):
+        cal = self._calendar(tmp_path)
+        assert cal.trading_days_between("2025-09-26", "2025-10-10", "CN") == 4  # 29, 30, 9, 10
+        assert cal.trading_days_between("2025-09-26", "2025-10-10", "HK") == 8  # Only Oct 1 and 7 closed
+        assert cal.trading_days_between("2025-10-10", "2025-09-26", "CN") == 0
+        naive = sum(1 for i in range(1, 400) if cal.is_trading_day(datetime.date(2025, 1, 1) + datetime.timedelta(i)))
+        assert cal.trading_days_between("2025-01-01", datetime.date(2025, 1, 1) + datetime.timedelta(399)) == naive
+
+    def test_sessions(self, tmp_path):
+        cal = self._calendar(tmp_path)
+        assert cal.is_open("CN", _ts("2025-09-30T10:00"))
+        assert not cal.is_open("CN", _ts("2025-09-30T12:00"))  # Lunch break
+        assert cal.is_open("HK", _ts("2025-09-30T15:30")) and not cal.is_open("CN", _ts("2025-09-30T15:30"))
+        assert not cal.is_open("HK", _ts("2025-12-24T14:00"))  # Half day
+        assert cal.next_open("CN", _ts("2025-09-30T16:00")) == _ts("2025-10-09T09:30")
+        assert cal.next_close("CN", _ts("2025-09-30T16:00")) == _ts("2025-10-09T15:00")
+        assert cal.last_close("CN", _ts("2025-10-09T10:00")) == _ts("2025-09-30T15:00")
+
+    def test_ttls_follow_sessions(self, tmp_path):
+        cal = self._calendar(tmp_path)
+        with patch.object(config, "TRADING_CALENDAR", True):
+            assert cal.history_ttl("CN", _ts("2025-09-30T10:00")) == config.HISTORY_CACHE_TTL
+            assert cal.history_ttl("CN", _ts("2025-09-30T15:05")) == config.HISTORY_CACHE_TTL  # Close grace
+            assert cal.history_ttl("CN", _ts("2025-09-30T12:00")) == config.HISTORY_CACHE_TTL  # Lunch: bar still partial
+            friday = _ts("2025-09-26T20:00")
+            assert cal.history_ttl("CN", friday) == _ts("2025-09-29T15:00") + config.CALENDAR_CLOSE_GRACE - friday
+            assert cal.quote_ttl("CN", _ts("2025-09-30T10:00"), 30) == 30
+            assert cal.quote_ttl("CN", _ts("2025-09-30T20:00"), 30) == _ts("2025-10-09T09:30") - _ts("2025-09-30T20:00")
+        with patch.object(config, "TRADING_CALENDAR", False):
+            assert cal.quote_ttl("CN", friday, 30) == 30
+
+    def test_replace_years_persists(self, tmp_path):
+        cal = self._calendar(tmp_path)
+        cal.replace_years("HK", [2025], ["2025-01-01", "2025-06-02"], half_days=["2025-12-31"])
+        reloaded = self._calendar(tmp_path)
+        assert not reloaded.is_trading_day("2025-06-02", "HK")
+        assert reloaded.is_trading_day("2025-10-29", "HK")     # Seed entry for 2025 replaced
+        assert not reloaded.is_trading_day("2024-12-25", "HK")  # Other years keep the seed
+        assert reloaded.age < 60
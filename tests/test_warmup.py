@@ -0,0 +1,95 @@
+import sys
+import os
+import time
+import numpy as np
+from unittest.mock import patch
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import config
+from api.warmup import Warmup, parse_watchlist
+from api.ohlcv import OHLCVSeries
+from api.fetcher import DataFetcher
+
+
+class TestWarmup:
+
+    def test_parse_watchlist(self):
+        assert parse_watchlist("600519, HK:700 ;09988,,") == [
+            ("600519", "CN"), ("700", "HK"), ("09988", "HK")]
+
+    def test_run_reports_progress(self):
+        ok = OHLCVSeries(np.array(["2024-01-02"], dtype="datetime64[D]"), [1.0], [1.0], [1.0], [1.0], [1.0])
+
+        def fake_history(code, market):
+            return ok if code != "000002" else OHLCVSeries.empty()
+
+        w = Warmup()
+        with patch.object(DataFetcher, 'get_history_series', side_effect=fake_history), \
+             patch.object(DataFetcher, 'get_realtime_prices', return_value={"600519": 1700.0}), \
+             patch.object(DataFetcher, 'get_stock_name', side_effect=lambda c, m: "名称"), \
+             patch.object(DataFetcher, 'rank_tdx_servers', return_value=[]), \
+             patch('api.warmup.security_master') as master:
+            master.age = 0
+            assert not w.ready
+            w.start([("600519", "CN"), ("000002", "CN"), ("00700", "HK")], workers=2)
+            w._thread.join(timeout=5)
+
+        snap = w.snapshot()
+        assert snap["ready"] and snap["status"] == "ready"
+        assert snap["histories"] == {"total": 3, "done": 3, "failed": ["CN:000002"]}
+        assert snap["steps"]["quotes"]["status"] == "ok"
+        assert snap["steps"]["histories"]["detail"] == 2
+
+    def _run(self, w, watchlist, history, prices, until):
+        with patch.object(DataFetcher, 'get_history_series', side_effect=history), \
+             patch.object(DataFetcher, 'get_realtime_prices', side_effect=prices), \
+             patch.object(DataFetcher, 'get_stock_name', side_effect=lambda c, m: c), \
+             patch.object(DataFetcher, 'rank_tdx_servers', return_value=[]), \
+             patch('api.warmup.security_master') as master:
+            master.age = 0
+            w.start(watchlist, workers=2)
+            deadline = time.time() + 5
+            while w.snapshot()["status"] not in until and time.time() < deadline:
+                time.sleep(0.01)
+        return w.snapshot()
+
+    def test_degraded_when_required_steps_fail(self):
+        def down(*args):
+            raise RuntimeError("down")
+
+        with patch.object(config, "WARMUP_RETRY", 3600):
+            snap = self._run(Warmup(), [("600519", "CN"), ("00700", "HK")], down, down, ("degraded",))
+        assert not snap["ready"] and snap["status"] == "degraded"
+        assert snap["steps"]["quotes"]["status"] == "failed"
+        assert snap["steps"]["histories"]["status"] == "failed"
+        assert sorted(snap["histories"]["failed"]) == ["CN:600519", "HK:00700"]
+
+    def test_recovers_once_a_retry_succeeds(self):
+        ok = OHLCVSeries(np.array(["2024-01-02"], dtype="datetime64[D]"), [1.0], [1.0], [1.0], [1.0], [1.0])
+        calls = []
+
+        def flaky_history(code, market):
+            calls.append(code)
+            if len(calls) <= 2:
+                raise RuntimeError("down")
+            return ok
+
+        with patch.object(config, "WARMUP_RETRY", 0.01):
+            snap = self._run(Warmup(), [("600519", "CN"), ("000002", "CN")], flaky_history,
+                             lambda codes, m: {c: 1.0 for c in codes}, ("ready",))
+        assert snap["ready"] and snap["histories"] == {"total": 2, "done": 2, "failed": []}
+        assert sorted(calls) == ["000002", "000002", "600519", "600519"]
+
+    def test_master_refresh_loop_starts_when_first_refresh_fails(self):
+        w = Warmup()
+        with patch.object(DataFetcher, 'refresh_security_master', side_effect=RuntimeError("down")) as refresh, \
+             patch.object(DataFetcher, 'refresh_trading_calendar'), \
+             patch.object(DataFetcher, 'rank_tdx_servers', return_value=[]), \
+             patch('api.warmup.security_master') as master:
+            master.age = float("inf")
+            master.__len__.return_value = 0
+            w.run([], workers=1)
+        assert w.snapshot()["steps"]["security_master"]["status"] == "failed"
+        master.start_background_refresh.assert_called_once_with(refresh)